@@ -440,7 +440,9 @@ class BudgetV5Service:
             lignes_src = cur.execute("""
                 SELECT lb.*,
                     COALESCE(a.nom, '') AS application_nom,
-                    COALESCE(p.code || ' - ' || p.nom, '') AS projet_nom
+                    COALESCE(p.code || ' - ' || p.nom, '') AS projet_nom,
+                    (SELECT COUNT(*) FROM bons_commande bc
+                     WHERE bc.ligne_budgetaire_id = lb.id) AS nb_bc
                 FROM lignes_budgetaires lb
                 JOIN budgets_annuels ba ON ba.id=lb.budget_id
                 LEFT JOIN applications a ON a.id=lb.application_id
@@ -456,10 +458,7 @@ class BudgetV5Service:
                 solde    = float(src.get('montant_solde') or 0)
                 taux     = (engage / vote * 100) if vote > 0 else 0
 
-                # Compter les BC lies
-                nb_bc = (cur.execute(
-                    "SELECT COUNT(*) FROM bons_commande WHERE ligne_budgetaire_id=?",
-                    (src['id'],)).fetchone() or [0])[0]
+                nb_bc    = src.get('nb_bc') or 0
 
                 # Calcul suggestion N+1
                 if solde < 0:
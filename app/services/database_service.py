@@ -9,6 +9,29 @@ from app.database.schema import init_database
 
 logger = logging.getLogger(__name__)
 
+# Écouteurs appelés pour chaque instruction SQL exécutée sur la connexion :
+#   fn(event, duree_s, query)  avec event = 'query' (durée non mesurée : None)
+# Branchés via sqlite3.set_trace_callback uniquement s'il y a un écouteur
+# (traçage des tests, voir sql_trace_service) : aucun coût sinon.
+_listeners = []
+
+
+def add_listener(fn):
+    if fn not in _listeners:
+        _listeners.append(fn)
+    inst = DatabaseService._instance
+    if inst is not None and inst._connection is not None:
+        inst._connection.set_trace_callback(_on_statement)
+
+
+def _on_statement(query):
+    for fn in _listeners:
+        try:
+            fn('query', None, query)
+        except Exception:
+            pass
+
+
 class DatabaseService:
     """Service singleton pour gérer la connexion à la base de données."""
     
@@ -39,6 +62,8 @@ class DatabaseService:
             
             # Activer les foreign keys
             self._connection.execute("PRAGMA foreign_keys = ON")
+            if _listeners:
+                self._connection.set_trace_callback(_on_statement)
             
             # Initialiser le schéma
             init_database(self._connection)
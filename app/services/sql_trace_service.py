@@ -0,0 +1,19 @@
+"""
+Traçage des requêtes SQL et budgets d'allers-retours (détection N+1).
+
+Même module que l'application web : webapp/backend/app/services/
+sql_trace_service.py est exécuté ici tel quel (SqlTrace, max_queries,
+fingerprint…). Les instructions arrivent par database_service.add_listener(),
+branché sur sqlite3.set_trace_callback : chaque instruction exécutée sur la
+connexion, y compris via conn.cursor() direct, sans mesure de durée.
+
+    with max_queries(4, repetitions=1):
+        BudgetV5Service().get_apercu_n1(1, 2026, 2027)
+"""
+import os
+
+_PARTAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                        'webapp', 'backend', 'app', 'services', 'sql_trace_service.py')
+
+with open(_PARTAGE, encoding='utf-8') as _f:
+    exec(compile(_f.read(), os.path.normpath(_PARTAGE), 'exec'))
@@ -0,0 +1,233 @@
+# Contrôle d'admission des routes lourdes (exports, fiches, analyse PDF)
+"""
+Chaque classe de routes lourdes a un nombre de places d'exécution commun à
+tous les workers, une file d'attente bornée et un plafond par utilisateur :
+
+    export    /export/budget, /tpe/export, /projets/fiches.zip
+    document  /projet/<id>/fiche_word, /projet/<id>/fiche_html
+    pdf       /bon_commande/parse_pdf
+
+Une place est un fichier verrou (flock) dans ADMISSION_DIR : partagée entre
+les workers Gunicorn d'un même hôte, libérée par le noyau si le worker meurt,
+et sans connexion PostgreSQL monopolisée. Sans fcntl (Windows, serveur de
+dev), les places sont des verrous du processus.
+
+Demande refusée → 429 + Retry-After :
+  - l'utilisateur occupe déjà toutes ses places de la classe ;
+  - la file d'attente de la classe est pleine ;
+  - aucune place libérée dans ADMISSION_ATTENTE secondes.
+Les routes interactives ne passent pas par ici et gardent leurs threads.
+
+Configuration : ADMISSION_<CLASSE>="places,file,par_utilisateur",
+par ex. ADMISSION_EXPORT="2,4,1".
+"""
+import functools
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from flask import g, jsonify, make_response
+
+from app.services import timing_service
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_DIR     = os.getenv('ADMISSION_DIR') or os.path.join(tempfile.gettempdir(), 'bmp-admission')
+ADMISSION_ATTENTE = float(os.getenv('ADMISSION_ATTENTE', '10'))   # secondes en file au plus
+_SONDE            = 0.05                                          # secondes entre deux essais
+
+_DEFAUTS = {
+    'export':   (2, 4, 1),
+    'document': (4, 8, 2),
+    'pdf':      (2, 4, 1),
+}
+
+
+def _config(classe, defaut):
+    valeur = os.getenv(f'ADMISSION_{classe.upper()}')
+    if not valeur:
+        return defaut
+    try:
+        places, file, par_user = (int(v) for v in valeur.split(','))
+        return max(1, places), max(0, file), max(1, par_user)
+    except ValueError:
+        logger.warning("ADMISSION_%s=%r ignoré (attendu : places,file,par_utilisateur)",
+                       classe.upper(), valeur)
+        return defaut
+
+
+CLASSES = {classe: _config(classe, d) for classe, d in _DEFAUTS.items()}
+
+
+# ── Places (verrous) ────────────────────────────────────────────────────────
+
+_locaux = {}
+_locaux_lock = threading.Lock()
+
+
+class _Place:
+    """Verrou non bloquant sur un nom : flock inter-processus, ou verrou local."""
+
+    def __init__(self, nom):
+        self.nom = nom
+        self._fd = None
+        self._lock = None
+
+    def prendre(self):
+        if fcntl is None:
+            with _locaux_lock:
+                lock = _locaux.setdefault(self.nom, threading.Lock())
+            if lock.acquire(blocking=False):
+                self._lock = lock
+                return True
+            return False
+        os.makedirs(ADMISSION_DIR, exist_ok=True)
+        fd = os.open(os.path.join(ADMISSION_DIR, self.nom + '.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def rendre(self):
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+        if self._fd is not None:
+            os.close(self._fd)     # libère le flock
+            self._fd = None
+
+
+def _une_place(prefixe, n):
+    """Première place libre parmi n (ordre aléatoire), ou None."""
+    for i in random.sample(range(n), n):
+        place = _Place(f"{prefixe}.{i}")
+        if place.prendre():
+            return place
+    return None
+
+
+# ── État du processus (métriques, Retry-After) ─────────────────────────────
+
+_etat_lock = threading.Lock()
+_en_cours = {c: 0 for c in CLASSES}
+_en_attente = {c: 0 for c in CLASSES}
+_duree_moy = {c: 5.0 for c in CLASSES}   # moyenne glissante, secondes
+
+
+def etat():
+    """{classe: (en cours, en attente)} pour ce processus."""
+    with _etat_lock:
+        return {c: (_en_cours[c], _en_attente[c]) for c in CLASSES}
+
+
+def _compter(compteur, classe, delta):
+    with _etat_lock:
+        compteur[classe] += delta
+
+
+def _retry_after(classe):
+    with _etat_lock:
+        return max(1, round(_duree_moy[classe]))
+
+
+def _terminer(classe, debut):
+    with _etat_lock:
+        _en_cours[classe] -= 1
+        _duree_moy[classe] = 0.8 * _duree_moy[classe] + 0.2 * (time.monotonic() - debut)
+
+
+class Refus(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def admettre(classe, user_id):
+    """
+    Places (exécution, utilisateur) obtenues pour la classe, après attente
+    éventuelle en file. Refus si la demande ne peut pas être admise.
+    """
+    places, file, par_user = CLASSES[classe]
+    perso = _une_place(f"{classe}.u{user_id}", par_user)
+    if perso is None:
+        raise Refus("Traitement déjà en cours pour cet utilisateur, réessayez plus tard",
+                    _retry_after(classe))
+    try:
+        execution = _une_place(classe, places)
+        if execution is None:
+            execution = _attendre(classe, places, file)
+        return execution, perso
+    except Exception:
+        perso.rendre()
+        raise
+
+
+def _attendre(classe, places, file):
+    ticket = _une_place(f"{classe}.file", file) if file else None
+    if ticket is None:
+        raise Refus("Serveur occupé, réessayez plus tard", _retry_after(classe))
+    _compter(_en_attente, classe, 1)
+    try:
+        fin = time.monotonic() + ADMISSION_ATTENTE
+        while time.monotonic() < fin:
+            time.sleep(_SONDE)
+            execution = _une_place(classe, places)
+            if execution is not None:
+                return execution
+        raise Refus("Serveur occupé, réessayez plus tard", _retry_after(classe))
+    finally:
+        _compter(_en_attente, classe, -1)
+        ticket.rendre()
+
+
+def limite(classe):
+    """
+    Décorateur (après require_auth) : exécute la vue dans une place de la
+    classe. La place est rendue à la fermeture de la réponse, pour couvrir
+    aussi les réponses en flux (archive ZIP).
+    """
+    if classe not in CLASSES:
+        raise ValueError(f"Classe d'admission inconnue : {classe}")
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            debut = time.monotonic()
+            try:
+                execution, perso = admettre(classe, (g.get('user') or {}).get('sub'))
+            except Refus as e:
+                resp = make_response(jsonify({"success": False, "error": str(e)}), 429)
+                resp.headers['Retry-After'] = str(e.retry_after)
+                return resp
+            t = timing_service.current()
+            if t is not None:
+                t['admission'] = time.monotonic() - debut
+            _compter(_en_cours, classe, 1)
+            debut = time.monotonic()
+
+            def liberer():
+                execution.rendre()
+                perso.rendre()
+                _terminer(classe, debut)
+
+            try:
+                resp = make_response(f(*args, **kwargs))
+            except BaseException:
+                liberer()
+                raise
+            resp.call_on_close(liberer)
+            return resp
+        wrapper.admission = classe      # lu par batch_service.valider
+        return wrapper
+    return decorator
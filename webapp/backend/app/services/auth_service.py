@@ -19,6 +19,11 @@ else:
     logger.warning("SECRET_KEY non défini — clé dérivée utilisée. Ajoutez SECRET_KEY dans .env.")
 
 EXPIRY_HOURS = int(os.getenv('JWT_EXPIRY_HOURS', '8'))
+# Ticket d'ouverture du flux /api/events : EventSource ne peut pas envoyer
+# d'en-tête Authorization, le ticket passe donc dans l'URL (journaux d'accès).
+# Il n'ouvre que ce flux et expire vite, contrairement au JWT de session.
+TICKET_AUDIENCE = 'bmp-events'
+TICKET_SECONDES = int(os.getenv('SSE_TICKET_SECONDES', '60'))
 
 
 class AuthService:
@@ -72,6 +77,28 @@ class AuthService:
         except jwt.InvalidTokenError:
             return None
 
+    # ── TICKET DE FLUX SSE ──────────────────────────────────
+
+    def emettre_ticket(self, user: dict) -> str:
+        """Ticket à usage unique de destination (aud) pour ouvrir /api/events."""
+        now = datetime.now(timezone.utc)
+        return jwt.encode({
+            'sub':  str(user['sub']),
+            'role': user.get('role'),
+            'aud':  TICKET_AUDIENCE,
+            'iat':  now,
+            'exp':  now + timedelta(seconds=TICKET_SECONDES),
+        }, SECRET_KEY, algorithm='HS256')
+
+    def verifier_ticket(self, ticket: str):
+        try:
+            payload = jwt.decode(ticket, SECRET_KEY, algorithms=['HS256'],
+                                 audience=TICKET_AUDIENCE)
+            payload['sub'] = int(payload['sub'])
+            return payload
+        except jwt.InvalidTokenError:
+            return None
+
     # ── USER CRUD (admin only) ───────────────────────────────
 
     def get_all_users(self):
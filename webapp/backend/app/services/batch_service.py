@@ -0,0 +1,137 @@
+# Exécution groupée de sous-requêtes GET (POST /api/batch)
+"""
+Une requête /api/batch porte une liste de GET exécutés dans le processus,
+avec le cycle complet de Flask (hooks de timing, métriques, gestion
+d'erreurs), sans repasser par le réseau. L'utilisateur est authentifié une
+seule fois : son jeton décodé est transmis aux sous-requêtes par l'environ
+WSGI (ENVIRON_USER), que require_auth reprend sans revérifier le JWT ni
+relire le compte. Une clé d'environ ne peut pas venir d'un en-tête HTTP.
+
+Seules les vues JSON sont groupables : une sous-requête est mise en mémoire
+en entier (Response.from_app(buffered=True)) et passerait hors de sa classe
+d'admission. Les vues à classe d'admission (exports, documents, PDF) et
+celles marquées @hors_lot (fichiers téléchargés) sont refusées dès valider().
+
+Réponse : les corps JSON des sous-requêtes sont recopiés tels quels (pas de
+désérialisation / resérialisation), avec le statut de chacune.
+"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Response
+
+from app.services.database_service import pool_bounds
+
+logger = logging.getLogger(__name__)
+
+ENVIRON_USER  = 'bmp.batch.user'
+BATCH_MAX     = int(os.getenv('BATCH_MAX', '20'))
+BATCH_THREADS = int(os.getenv('BATCH_THREADS', '4'))
+
+# Routes qui n'ont pas de sens dans un lot (récursion, flux sans fin)
+_EXCLUES = ('/batch', '/events')
+
+_executor = None
+_executor_pid = None
+
+
+def hors_lot(f):
+    """Décorateur de route : vue non JSON (fichier), refusée dans un lot."""
+    f.hors_lot = True
+    return f
+
+
+def _vue(app, base):
+    """Vue Flask servant GET /api<base>, None si aucune route ne correspond."""
+    try:
+        endpoint, _ = app.url_map.bind('localhost').match('/api' + base, method='GET')
+    except HTTPException:
+        return None                  # 404 / 405 rendus par la sous-requête
+    return app.view_functions.get(endpoint)
+
+
+def valider(items, app=None):
+    """
+    [(id, chemin)] à partir de la liste reçue : chaînes ("/dashboard") ou
+    objets {"id": …, "path": "/dashboard", "method": "GET"}. ValueError sinon.
+    Avec app, les routes d'export, de document et de fichier sont refusées.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("requests : liste de sous-requêtes attendue")
+    if len(items) > BATCH_MAX:
+        raise ValueError(f"{len(items)} sous-requêtes (maximum {BATCH_MAX})")
+    out = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'path': item}
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise ValueError(f"Sous-requête {i} : path manquant")
+        if (item.get('method') or 'GET').upper() != 'GET':
+            raise ValueError(f"Sous-requête {i} : seules les requêtes GET sont acceptées")
+        chemin = item['path']
+        base = chemin.split('?', 1)[0]
+        if not chemin.startswith('/') or chemin.startswith('//') or '://' in base:
+            raise ValueError(f"Sous-requête {i} : chemin relatif à /api attendu")
+        if any(base == e or base.startswith(e + '/') for e in _EXCLUES):
+            raise ValueError(f"Sous-requête {i} : {base} ne peut pas être groupé")
+        vue = _vue(app, base) if app is not None else None
+        if getattr(vue, 'admission', None) or getattr(vue, 'hors_lot', False):
+            raise ValueError(f"Sous-requête {i} : {base} n'est pas une route JSON groupable")
+        out.append((item.get('id', chemin), chemin))
+    return out
+
+
+def _sous_requete(app, chemin, user, headers):
+    """(statut, corps JSON brut ou None, erreur) d'un GET /api<chemin>."""
+    path, _, query = chemin.partition('?')
+    environ = EnvironBuilder(path='/api' + path, query_string=query, method='GET',
+                             headers=headers).get_environ()
+    environ[ENVIRON_USER] = user
+    try:
+        # Contexte applicatif neuf : g propre à la sous-requête (et non
+        # partagé avec la requête /batch quand on reste dans son thread)
+        with app.app_context():
+            resp = Response.from_app(app.wsgi_app, environ, buffered=True)
+    except Exception as e:
+        logger.exception("Sous-requête %s en échec", chemin)
+        return 500, None, str(e)
+    if resp.mimetype != 'application/json':
+        return resp.status_code, None, "Réponse non JSON"
+    return resp.status_code, resp.get_data(), None
+
+
+def _pool():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        # Pas plus de threads que de connexions dans le pool du worker
+        _executor = ThreadPoolExecutor(max_workers=max(1, min(BATCH_THREADS, pool_bounds()[1])),
+                                       thread_name_prefix='bmp-batch')
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def executer(app, items, user, headers, parallele=False):
+    """[(id, chemin, statut, corps, erreur)] dans l'ordre des sous-requêtes."""
+    if parallele and len(items) > 1:
+        futures = [_pool().submit(_sous_requete, app, chemin, user, headers)
+                   for _, chemin in items]
+        resultats = [f.result() for f in futures]
+    else:
+        resultats = [_sous_requete(app, chemin, user, headers) for _, chemin in items]
+    return [(id_, chemin) + r for (id_, chemin), r in zip(items, resultats)]
+
+
+def serialiser(resultats):
+    """Corps JSON de la réponse /batch, en recopiant les corps bruts."""
+    parties = []
+    for id_, chemin, statut, corps, erreur in resultats:
+        tete = json.dumps({'id': id_, 'path': chemin, 'status': statut}, ensure_ascii=False)[:-1]
+        if corps is not None:
+            parties.append(tete + ', "body": ' + corps.decode('utf-8').strip() + '}')
+        else:
+            parties.append(tete + ', "body": null, "error": ' + json.dumps(erreur, ensure_ascii=False) + '}')
+    return '{"responses": [' + ', '.join(parties) + ']}'
@@ -1,6 +1,8 @@
 # Service bon de commande pour usage web
 import logging
 from app.services.database_service import DatabaseService
+from app.services.etag_service import empreinte, horodatage, version_sql
+from app.services.fields_service import Projection
 
 def _d(row):
     if row is None:
@@ -9,23 +11,70 @@ def _d(row):
 
 logger = logging.getLogger(__name__)
 
+# Liste des BC (GET /bon_commande, ?fields=) : admin et périmètre restreint
+# partagent les mêmes jointures et la même liste blanche de champs.
+LISTE = Projection(
+    'bc',
+    colonnes=('id', 'numero_bc', 'objet', 'fournisseur_id', 'projet_id', 'contrat_id',
+              'entite_id', 'ligne_budgetaire_id', 'montant_ht', 'montant_ttc', 'montant_engage',
+              'statut', 'valide', 'impute', 'budget_impute', 'date_validation',
+              'date_imputation', 'date_solde', 'date_creation', 'date_maj', 'created_by_id',
+              'motif_refus'),
+    calculees={
+        'fournisseur_nom': 'f.nom',
+        'entite_code':     'e.code',
+        'entite_nom':      'e.nom',
+        'projet_nom':      'p.nom',
+        'numero_contrat':  'c.numero_contrat',
+        'createur_nom':    "u.nom || ' ' || COALESCE(u.prenom,'')",
+        'ligne_libelle':   'lb.libelle',
+    },
+    defaut=('id', 'numero_bc', 'objet', 'fournisseur_id', 'fournisseur_nom', 'entite_id',
+            'entite_code', 'entite_nom', 'projet_id', 'projet_nom', 'contrat_id',
+            'numero_contrat', 'ligne_budgetaire_id', 'montant_ht', 'montant_ttc',
+            'montant_engage', 'statut', 'date_creation', 'created_by_id', 'createur_nom'),
+)
+LISTE_FROM = (
+    "FROM bons_commande bc "
+    "LEFT JOIN fournisseurs f ON f.id = bc.fournisseur_id "
+    "LEFT JOIN entites e ON e.id = bc.entite_id "
+    "LEFT JOIN projets p ON p.id = bc.projet_id "
+    "LEFT JOIN contrats c ON c.id = bc.contrat_id "
+    "LEFT JOIN utilisateurs u ON u.id = bc.created_by_id "
+    "LEFT JOIN lignes_budgetaires lb ON lb.id = bc.ligne_budgetaire_id "
+)
+
+# Version de la fiche (GET /bon_commande/<id>, ETag) : BC + lignes jointes
+VERSION = version_sql(
+    horodatage('bc.date_maj'),
+    empreinte(horodatage('f.date_maj'), "fournisseurs f WHERE f.id = bc.fournisseur_id"),
+    empreinte(horodatage('e.date_maj'), "entites e WHERE e.id = bc.entite_id"),
+    empreinte(horodatage('c.date_maj'), "contrats c WHERE c.id = bc.contrat_id"),
+    empreinte(horodatage('lb.date_maj'), "lignes_budgetaires lb WHERE lb.id = bc.ligne_budgetaire_id"),
+)
+
+
 
 class BonCommandeService:
     def __init__(self):
         self.db = DatabaseService()
 
-    def get_all_bons_commande(self, filters=None):
+    def version(self, bc_id, acces='true', params=()):
+        """
+        Sonde de version de la fiche (etag_service) : {'version', 'autorise'},
+        None si la ligne n'existe pas. acces : condition SQL sur bc.
+        """
+        return self.db.fetch_one(
+            f"SELECT {VERSION} AS version, COALESCE(({acces}), false) AS autorise "
+            "FROM bons_commande bc WHERE bc.id = %s",
+            list(params) + [bc_id]
+        )
+
+    def get_all_bons_commande(self, filters=None, champs=None):
+        """champs : projection LISTE (None = enregistrement complet)."""
         try:
-            query = (
-                "SELECT bc.*, f.nom as fournisseur_nom, e.code as entite_code, e.nom as entite_nom, "
-                "c.numero_contrat, lb.libelle as ligne_libelle "
-                "FROM bons_commande bc "
-                "LEFT JOIN fournisseurs f ON f.id = bc.fournisseur_id "
-                "LEFT JOIN entites e ON e.id = bc.entite_id "
-                "LEFT JOIN contrats c ON c.id = bc.contrat_id "
-                "LEFT JOIN lignes_budgetaires lb ON lb.id = bc.ligne_budgetaire_id "
-                "WHERE 1=1"
-            )
+            cols = LISTE.select(champs) if champs else LISTE.tout()
+            query = f"SELECT {cols} {LISTE_FROM}WHERE 1=1"
             params = []
             if filters:
                 if filters.get('statut'):
@@ -0,0 +1,93 @@
+# Cache mémoire versionné pour usage web
+import threading
+from collections import OrderedDict
+
+# Registre de tous les caches créés (exposé pour la supervision)
+_registry = {}
+_registry_lock = threading.Lock()
+
+# Écouteurs appelés à chaque lecture : fn(nom_cache, hit)
+_listeners = []
+
+
+def add_listener(fn):
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def _notify(name, hit):
+    for fn in _listeners:
+        try:
+            fn(name, hit)
+        except Exception:
+            pass
+
+
+class VersionedCache:
+    """
+    Cache LRU borné, local au processus (un par worker Gunicorn).
+    Chaque entrée est associée à un jeton de version calculé par l'appelant
+    (ex. MAX(updated_at) d'une table) : si la version change, l'entrée est
+    considérée comme périmée et recalculée.
+    """
+
+    def __init__(self, name, max_entries=128):
+        self.name = name
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _registry[name] = self
+
+    def get(self, key, version):
+        """Retourne la valeur en cache pour (key, version), ou None."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                value = None
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+        _notify(self.name, value is not None)
+        return value
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._data[key] = (version, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Supprime une entrée, ou vide tout le cache si key est None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries':  len(self._data),
+                'hits':     self.hits,
+                'misses':   self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+def get_cache(name, max_entries=128):
+    """Retourne le cache nommé, en le créant au premier appel."""
+    with _registry_lock:
+        cache = _registry.get(name)
+        if cache is None:
+            cache = VersionedCache(name, max_entries)
+        return cache
+
+
+def all_caches():
+    return dict(_registry)
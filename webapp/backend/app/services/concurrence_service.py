@@ -0,0 +1,92 @@
+# Exécution concurrente des requêtes SQL indépendantes d'une route
+"""
+Les routes d'agrégation (dashboard, référentiels, gantt) enchaînaient des
+requêtes indépendantes : leur latence était la somme des allers-retours.
+rassembler(f1, f2, …), l'équivalent d'asyncio.gather pour du code bloquant,
+exécute les appels sur un pool de threads du worker, chacun avec sa propre
+connexion du pool PostgreSQL, et rend les résultats dans l'ordre.
+
+    projets, lignes = concurrence_service.rassembler(
+        projet_service.get_all, budget_service.get_lignes)
+
+Chaque appel hérite du contexte de la requête HTTP : accumulateur
+Server-Timing, échéance et annulation (deadline_service), trace SQL
+(sql_trace_service). Hors requête, ou depuis un thread du pool (pas
+d'attente imbriquée sur le même pool), les appels s'exécutent en séquence.
+Pas d'appel dans DatabaseService.transaction() : chaque appel emprunte sa
+propre connexion.
+
+SQL_PARALLELE : threads par worker (0 = exécution en séquence), borné par
+la taille du pool de connexions du worker.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, has_app_context
+
+from app.services import deadline_service, sql_trace_service, timing_service
+from app.services.database_service import pool_bounds
+
+logger = logging.getLogger(__name__)
+
+SQL_PARALLELE = int(os.getenv('SQL_PARALLELE', '4'))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def _marquer_thread():
+    _local.dans_pool = True
+
+
+def _pool():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, min(SQL_PARALLELE, pool_bounds()[1])),
+                    thread_name_prefix='bmp-sql', initializer=_marquer_thread)
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _executer(contexte, appel):
+    app, timing, requete, thread_id = contexte
+    with app.app_context(), deadline_service.heritee(requete), sql_trace_service.relais(thread_id):
+        if timing is not None:
+            g.timing = timing
+        return appel()
+
+
+def _issue(appel):
+    try:
+        return True, appel()
+    except Exception as e:
+        return False, e
+
+
+def rassembler(*appels, return_exceptions=False):
+    """
+    Résultats des appels (fonctions sans argument) dans l'ordre, comme
+    asyncio.gather : tous les appels vont à leur terme, puis la première
+    exception est levée. return_exceptions : l'exception d'un appel est
+    rendue à sa place.
+    """
+    if (len(appels) < 2 or SQL_PARALLELE <= 0 or not has_app_context()
+            or getattr(_local, 'dans_pool', False)):
+        issues = [_issue(a) for a in appels]
+    else:
+        contexte = (current_app._get_current_object(), timing_service.current(),
+                    deadline_service.courante(), threading.get_ident())
+        futures = [_pool().submit(_executer, contexte, a) for a in appels]
+        issues = [_issue(f.result) for f in futures]
+    if not return_exceptions:
+        for ok, valeur in issues:
+            if not ok:
+                raise valeur
+    return [valeur for _, valeur in issues]
@@ -1,7 +1,8 @@
 # Service contrat pour usage web
 import logging
-from datetime import date as _date
 from app.services.database_service import DatabaseService
+from app.services.etag_service import empreinte, horodatage, version_sql
+from app.services.fields_service import Projection
 
 def _d(row):
     if row is None:
@@ -11,76 +12,138 @@ def _d(row):
 logger = logging.getLogger(__name__)
 
 
-def _compute_alerte(row):
-    date_fin = row.get('date_fin')
-    statut = row.get('statut', '')
-    if not date_fin:
-        row['niveau_alerte'] = 'OK'
-        row['jours_restants'] = None
-        return row
-    if isinstance(date_fin, str):
-        try:
-            from datetime import datetime
-            date_fin_dt = datetime.strptime(date_fin[:10], '%Y-%m-%d').date()
-        except Exception:
-            row['niveau_alerte'] = 'OK'
-            row['jours_restants'] = None
-            return row
-    else:
-        date_fin_dt = date_fin
-    jours = (date_fin_dt - _date.today()).days
-    row['jours_restants'] = jours
-    if statut in ('RESILIE', 'TERMINE'):
-        row['niveau_alerte'] = 'OK'
-    elif jours < 0:
-        row['niveau_alerte'] = 'EXPIRE'
-    elif jours <= 30:
-        row['niveau_alerte'] = 'CRITIQUE'
-    elif jours <= 90:
-        row['niveau_alerte'] = 'ATTENTION'
-    elif jours <= 180:
-        row['niveau_alerte'] = 'INFO'
-    else:
-        row['niveau_alerte'] = 'OK'
-    return row
+# Niveau d'alerte et jours restants calculés côté SQL (alias c = contrats).
+# Seuils : expiré < 0 j, CRITIQUE <= 30 j, ATTENTION <= 90 j, INFO <= 180 j.
+ALERTE_JOURS = 180
+
+_JOURS_SQL = "(c.date_fin::date - CURRENT_DATE)"
+_NIVEAU_SQL = (
+    "CASE "
+    "  WHEN c.date_fin IS NULL OR c.statut IN ('RESILIE', 'TERMINE') THEN 'OK' "
+    f"  WHEN {_JOURS_SQL} < 0 THEN 'EXPIRE' "
+    f"  WHEN {_JOURS_SQL} <= 30 THEN 'CRITIQUE' "
+    f"  WHEN {_JOURS_SQL} <= 90 THEN 'ATTENTION' "
+    f"  WHEN {_JOURS_SQL} <= {ALERTE_JOURS} THEN 'INFO' "
+    "  ELSE 'OK' END"
+)
+ALERTE_COLS = f"{_JOURS_SQL} AS jours_restants, {_NIVEAU_SQL} AS niveau_alerte"
+
+# Liste des contrats (GET /contrat, ?fields=)
+LISTE = Projection(
+    'c',
+    colonnes=('id', 'numero_contrat', 'objet', 'fournisseur_id', 'projet_id',
+              'montant_initial_ht', 'montant_total_ht', 'montant_ttc', 'montant_engage',
+              'nombre_reconductions', 'date_debut', 'date_fin', 'statut', 'type_marche',
+              'date_creation', 'date_maj', 'created_by_id'),
+    calculees={
+        'fournisseur_nom': 'f.nom',
+        'createur_nom':    "u.nom || ' ' || COALESCE(u.prenom,'')",
+        'jours_restants':  _JOURS_SQL,
+        'niveau_alerte':   _NIVEAU_SQL,
+    },
+    defaut=('id', 'numero_contrat', 'objet', 'fournisseur_id', 'fournisseur_nom', 'projet_id',
+            'montant_total_ht', 'montant_ttc', 'montant_engage', 'date_debut', 'date_fin',
+            'statut', 'type_marche', 'date_creation', 'created_by_id', 'createur_nom',
+            'jours_restants', 'niveau_alerte'),
+)
+LISTE_FROM = (
+    "FROM contrats c "
+    "LEFT JOIN fournisseurs f ON f.id = c.fournisseur_id "
+    "LEFT JOIN utilisateurs u ON u.id = c.created_by_id "
+)
+
+# Version de la fiche (GET /contrat/<id>, ETag) : contrat, fournisseur, BC
+# rattachés ; jours restants et niveau d'alerte dépendent de la date du jour
+VERSION = version_sql(
+    horodatage('c.date_maj'),
+    'CURRENT_DATE',
+    empreinte(horodatage('f.date_maj'), "fournisseurs f WHERE f.id = c.fournisseur_id"),
+    empreinte(f"{horodatage('bc.date_maj')} + {horodatage('lb.date_maj')}",
+              "bons_commande bc LEFT JOIN lignes_budgetaires lb ON lb.id = bc.ligne_budgetaire_id "
+              "WHERE bc.contrat_id = c.id"),
+)
+
+
+# Prédicat des contrats en alerte : pas de cast sur c.date_fin pour rester
+# compatible avec l'index partiel idx_contrats_alerte_fin (statut ACTIF/RECONDUIT).
+ALERTE_WHERE = (
+    "c.statut IN ('ACTIF', 'RECONDUIT') "
+    f"AND c.date_fin <= CURRENT_DATE + {ALERTE_JOURS}"
+)
 
 
 class ContratService:
     def __init__(self):
         self.db = DatabaseService()
 
-    def get_all(self):
+    def version(self, contrat_id, acces='true', params=()):
+        """
+        Sonde de version de la fiche (etag_service) : {'version', 'autorise'},
+        None si la ligne n'existe pas. acces : condition SQL sur c.
+        """
+        return self.db.fetch_one(
+            f"SELECT {VERSION} AS version, COALESCE(({acces}), false) AS autorise "
+            "FROM contrats c WHERE c.id = %s",
+            list(params) + [contrat_id]
+        )
+
+    def get_all(self, champs=None):
+        """champs : projection LISTE (None = enregistrement complet)."""
         try:
-            rows = self.db.fetch_all(
-                "SELECT c.*, f.nom as fournisseur_nom "
-                "FROM contrats c "
-                "LEFT JOIN fournisseurs f ON f.id = c.fournisseur_id "
-                "ORDER BY c.date_fin ASC"
-            )
-            return [_compute_alerte(_d(r)) for r in rows] if rows else []
+            cols = LISTE.select(champs) if champs else LISTE.tout()
+            rows = self.db.fetch_all(f"SELECT {cols} {LISTE_FROM}ORDER BY c.date_fin ASC")
+            return [_d(r) for r in rows] if rows else []
         except Exception as ex:
             logger.warning(f"Erreur contrats: {ex}")
             return []
 
-    def get_alertes(self):
+    def get_alertes(self, where='1=1', params=None, limit=None):
+        """
+        Contrats actifs/reconduits arrivant à échéance sous ALERTE_JOURS jours
+        (ou expirés), triés par date de fin.
+        where/params : filtre de visibilité supplémentaire sur l'alias c.
+        """
+        params = list(params or [])
+        query = (
+            f"SELECT c.*, f.nom as fournisseur_nom, {ALERTE_COLS} "
+            "FROM contrats c "
+            "LEFT JOIN fournisseurs f ON f.id = c.fournisseur_id "
+            f"WHERE {ALERTE_WHERE} AND ({where}) "
+            "ORDER BY c.date_fin ASC"
+        )
+        if limit:
+            query += " LIMIT %s"
+            params.append(int(limit))
+        try:
+            rows = self.db.fetch_all(query, params)
+            return [_d(r) for r in rows] if rows else []
+        except Exception as ex:
+            logger.warning(f"Erreur alertes contrats: {ex}")
+            return []
+
+    def get_alertes_counts(self, where='1=1', params=None):
+        """Nombre de contrats en alerte par niveau (sans charger les lignes)."""
+        counts = {'EXPIRE': 0, 'CRITIQUE': 0, 'ATTENTION': 0, 'INFO': 0}
         try:
             rows = self.db.fetch_all(
-                "SELECT c.*, f.nom as fournisseur_nom "
+                f"SELECT {_NIVEAU_SQL} AS niveau, COUNT(*) AS n "
                 "FROM contrats c "
-                "LEFT JOIN fournisseurs f ON f.id = c.fournisseur_id "
-                "WHERE c.statut IN ('ACTIF', 'RECONDUIT') "
-                "AND c.date_fin::date <= CURRENT_DATE + INTERVAL '180 days' "
-                "ORDER BY c.date_fin ASC"
+                f"WHERE {ALERTE_WHERE} AND ({where}) "
+                "GROUP BY 1",
+                list(params or [])
             )
-            return [_compute_alerte(_d(r)) for r in rows] if rows else []
+            for r in rows or []:
+                r = _d(r)
+                counts[r['niveau']] = int(r['n'])
         except Exception as ex:
-            logger.warning(f"Erreur alertes contrats: {ex}")
-            return []
+            logger.warning(f"Erreur comptage alertes contrats: {ex}")
+        return counts
 
     def get_by_id(self, contrat_id):
         try:
             row = self.db.fetch_one(
-                "SELECT c.*, f.nom as fournisseur_nom, f.email as fournisseur_email, "
+                f"SELECT c.*, {ALERTE_COLS}, "
+                "f.nom as fournisseur_nom, f.email as fournisseur_email, "
                 "f.telephone as fournisseur_telephone, f.contact_principal as fournisseur_contact, "
                 "f.adresse as fournisseur_adresse, f.ville as fournisseur_ville "
                 "FROM contrats c "
@@ -90,7 +153,7 @@ class ContratService:
             )
             if not row:
                 return None
-            c = _compute_alerte(_d(row))
+            c = _d(row)
             bcs = self.db.fetch_all(
                 "SELECT bc.id, bc.numero_bc, bc.objet, bc.montant_ht, bc.montant_ttc, "
                 "bc.statut, bc.date_creation, bc.date_validation, "
@@ -1,6 +1,10 @@
 import os
 import logging
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
 import psycopg2.pool
 
@@ -13,7 +17,138 @@ DB_USER = os.getenv('DB_USER', 'admin')
 DB_PASS = os.getenv('DB_PASS', '')
 
 _POOL_MIN = int(os.getenv('DB_POOL_MIN', '2'))
-_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+_POOL_ATTENTE = float(os.getenv('DB_POOL_TIMEOUT', '10'))   # secondes d'attente d'une connexion
+
+
+def pool_bounds():
+    """
+    (minconn, maxconn) du pool de ce processus.
+    DB_POOL_MAX est le budget global de connexions : il est réparti entre les
+    DB_POOL_WORKERS workers Gunicorn (renseignés par gunicorn.conf.py). La part
+    de chaque worker inclut la connexion d'écoute LISTEN ouverte hors pool par
+    events_service. ValueError si le budget ne couvre pas, par worker, cette
+    connexion plus une par thread (DB_POOL_THREADS) : jamais de dépassement
+    silencieux du budget, ni de threads en file sur le pool.
+    """
+    budget  = int(os.getenv('DB_POOL_MAX', '10'))   # lu à l'appel : défaut posé par gunicorn.conf.py
+    workers = max(1, int(os.getenv('DB_POOL_WORKERS', '1')))
+    threads = max(1, int(os.getenv('DB_POOL_THREADS', '1')))
+    maxconn = budget // workers - 1
+    if maxconn < threads:
+        raise ValueError(
+            f"DB_POOL_MAX={budget} insuffisant pour {workers} worker(s) de {threads} "
+            f"thread(s) : au moins {workers * (threads + 1)} (une connexion par thread "
+            "et l'écoute LISTEN de chaque worker)")
+    return min(_POOL_MIN, maxconn), maxconn
+
+
+# Requêtes fréquentes préparées sur chaque connexion au démarrage du worker :
+# le PREPARE charge les caches catalogue du backend PostgreSQL (tables,
+# index, types) avant la première vraie requête.
+WARMUP_STATEMENTS = {
+    'warm_login': (
+        "SELECT id, nom, prenom, email, login, mot_de_passe, role, service_id, actif "
+        "FROM utilisateurs WHERE login = $1"
+    ),
+    'warm_notifications': "SELECT * FROM notifications ORDER BY date_creation DESC LIMIT 50",
+    'warm_projets': (
+        "SELECT p.*, s.nom, s.code FROM projets p "
+        "LEFT JOIN services s ON s.id = p.service_id WHERE p.id = $1"
+    ),
+    'warm_taches': "SELECT * FROM taches WHERE projet_id = $1",
+    'warm_bons_commande': "SELECT * FROM bons_commande WHERE projet_id = $1",
+    'warm_contrats': "SELECT * FROM contrats WHERE statut IN ('ACTIF', 'RECONDUIT')",
+}
+
+# État du préchauffage de ce processus (exposé par /api/health/ready)
+warmup_state = {'ready': False, 'pid': None, 'connexions': 0,
+                'prepared': 0, 'duree_ms': None, 'erreur': None}
+
+
+# ── Instrumentation ─────────────────────────────────────────────────────────
+# Écouteurs appelés après chaque requête SQL et chaque attente de connexion :
+#   fn(event, duree_s, query)  avec event = 'query' | 'pool_wait'
+# (supervision /api/metrics ; un écouteur ne doit jamais lever d'exception)
+_listeners = []
+
+
+def add_listener(fn):
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def _notify(event, duree, query=None):
+    for fn in _listeners:
+        try:
+            fn(event, duree, query)
+        except Exception:
+            pass
+
+
+# Garde d'exécution (deadline_service) : debut(conn) est appelée avant chaque
+# requête SQL et retourne un préfixe (SET LOCAL …) ou lève si la requête HTTP
+# a dépassé son échéance ; fin() est appelée après.
+_garde = None
+
+
+def set_garde(garde):
+    global _garde
+    _garde = garde
+
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        garde = _garde
+        prefixe = garde.debut(self.connection) if garde is not None else None
+        debut = time.perf_counter()
+        try:
+            return super().execute(prefixe + query if prefixe and isinstance(query, str) else query,
+                                   vars)
+        finally:
+            if garde is not None:
+                garde.fin()
+            _notify('query', time.perf_counter() - debut, query)
+
+
+class _TimedCursor(_TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class _TimedDictCursor(_TimedCursorMixin, psycopg2.extras.RealDictCursor):
+    pass
+
+
+class PoolSature(psycopg2.pool.PoolError):
+    """Aucune connexion du pool libérée dans DB_POOL_TIMEOUT secondes."""
+
+
+class _BlockingPool(psycopg2.pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool dont getconn() attend qu'une connexion soit rendue
+    (au plus DB_POOL_TIMEOUT secondes, puis PoolSature) au lieu de lever
+    PoolError dès que maxconn connexions sont empruntées : le nombre de
+    connexions ouvertes par le worker ne dépasse jamais maxconn.
+    Les clés de psycopg2 (getconn(key)) ne sont pas utilisées ici.
+    """
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._places = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None, timeout=None):
+        attente = _POOL_ATTENTE if timeout is None else timeout
+        if not self._places.acquire(timeout=attente):
+            raise PoolSature(f"Aucune connexion PostgreSQL libre depuis {attente:g} s "
+                             f"({self.maxconn} empruntées)")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._places.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        super().putconn(conn, key, close)   # lève si la connexion n'est pas de ce pool
+        self._places.release()
 
 
 class DatabaseService:
@@ -21,7 +156,9 @@ class DatabaseService:
     Service d'accès PostgreSQL basé sur un ThreadedConnectionPool.
     Thread-safe : chaque opération emprunte une connexion du pool et la restitue.
     """
-    _pool: psycopg2.pool.ThreadedConnectionPool | None = None
+    _pool: _BlockingPool | None = None
+    _pool_pid: int | None = None
+    _pool_lock = threading.Lock()
 
     def __new__(cls):
         # Singleton sur la classe, pas sur la connexion
@@ -34,32 +171,45 @@ class DatabaseService:
             self._init_pool()
 
     def _init_pool(self):
+        minconn, maxconn = pool_bounds()
         try:
-            DatabaseService._pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=_POOL_MIN,
-                maxconn=_POOL_MAX,
+            DatabaseService._pool = _BlockingPool(
+                minconn=minconn,
+                maxconn=maxconn,
                 host=DB_HOST, port=int(DB_PORT),
                 dbname=DB_NAME, user=DB_USER, password=DB_PASS,
                 connect_timeout=10,
                 options='-c statement_timeout=20000',
             )
-            logger.info(f"Pool PostgreSQL initialisé ({_POOL_MIN}–{_POOL_MAX} connexions)")
+            DatabaseService._pool_pid = os.getpid()
+            logger.info(f"Pool PostgreSQL initialisé ({minconn}–{maxconn} connexions)")
         except Exception as e:
             logger.error(f"Erreur initialisation pool PostgreSQL: {e}")
             raise
 
+    @staticmethod
+    def _pool_valide():
+        pool = DatabaseService._pool
+        return pool is not None and not pool.closed and DatabaseService._pool_pid == os.getpid()
+
     def _get_conn(self):
-        """Emprunte une connexion au pool, réinitialise si nécessaire."""
-        if DatabaseService._pool is None:
-            self._init_pool()
+        """
+        Emprunte une connexion au pool ; attend qu'une connexion soit rendue
+        si toutes sont empruntées (PoolSature après DB_POOL_TIMEOUT). Le pool
+        n'est recréé que s'il est fermé ou hérité du processus parent (fork),
+        jamais parce qu'il est épuisé.
+        """
+        if not self._pool_valide():
+            with DatabaseService._pool_lock:
+                if not self._pool_valide():
+                    DatabaseService._pool = None
+                    self._init_pool()
+        pool = DatabaseService._pool
+        debut = time.perf_counter()
         try:
-            return DatabaseService._pool.getconn()
-        except psycopg2.pool.PoolError:
-            # Pool épuisé ou fermé — forcer la réinitialisation
-            logger.warning("Pool épuisé ou fermé, réinitialisation…")
-            DatabaseService._pool = None
-            self._init_pool()
-            return DatabaseService._pool.getconn()
+            return pool.getconn()
+        finally:
+            _notify('pool_wait', time.perf_counter() - debut)
 
     def _put_conn(self, conn, broken=False):
         """Restitue la connexion au pool."""
@@ -68,10 +218,19 @@ class DatabaseService:
         except Exception:
             pass
 
+    @staticmethod
+    def pool_stats():
+        """Taille et occupation du pool de ce processus (None si non créé)."""
+        pool = DatabaseService._pool
+        if pool is None or pool.closed:
+            return None
+        return {'max': pool.maxconn, 'open': len(pool._pool) + len(pool._used),
+                'in_use': len(pool._used)}
+
     def fetch_all(self, query, params=None):
         conn = self._get_conn()
         try:
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            with conn.cursor(cursor_factory=_TimedDictCursor) as cur:
                 cur.execute(query, params or [])
                 rows = [dict(r) for r in cur.fetchall()]
         except Exception:
@@ -89,7 +248,7 @@ class DatabaseService:
     def fetch_one(self, query, params=None):
         conn = self._get_conn()
         try:
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            with conn.cursor(cursor_factory=_TimedDictCursor) as cur:
                 cur.execute(query, params or [])
                 row = cur.fetchone()
                 result = dict(row) if row else None
@@ -109,7 +268,7 @@ class DatabaseService:
         """Exécute une requête d'écriture (INSERT/UPDATE/DELETE/DDL) et commit."""
         conn = self._get_conn()
         try:
-            with conn.cursor() as cur:
+            with conn.cursor(cursor_factory=_TimedCursor) as cur:
                 cur.execute(query, params or [])
             conn.commit()
         except Exception:
@@ -127,7 +286,7 @@ class DatabaseService:
         """Exécute un INSERT ... RETURNING et retourne la première ligne."""
         conn = self._get_conn()
         try:
-            with conn.cursor() as cur:
+            with conn.cursor(cursor_factory=_TimedCursor) as cur:
                 cur.execute(query, params or [])
                 result = cur.fetchone()
             conn.commit()
@@ -143,6 +302,70 @@ class DatabaseService:
             self._put_conn(conn)
         return result
 
+    @contextmanager
+    def transaction(self):
+        """
+        Transaction explicite sur une seule connexion du pool :
+            with db.transaction() as cur:
+                cur.execute(...)
+        Commit à la sortie du bloc, rollback si une exception est levée.
+        Le curseur retourne des dict (RealDictCursor).
+        """
+        conn = self._get_conn()
+        try:
+            with conn.cursor(cursor_factory=_TimedDictCursor) as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                self._put_conn(conn, broken=True)
+                raise
+            self._put_conn(conn)
+            raise
+        else:
+            self._put_conn(conn)
+
+    def warm_up(self, statements=None):
+        """
+        Préchauffage d'un worker : (re)crée le pool de ce processus, ouvre ses
+        minconn connexions et y prépare les requêtes fréquentes.
+        Une requête en échec (table absente…) est ignorée.
+        """
+        debut = time.monotonic()
+        statements = WARMUP_STATEMENTS if statements is None else statements
+        warmup_state.update(ready=False, pid=os.getpid(), erreur=None)
+        try:
+            # Un pool hérité du processus parent n'est pas utilisable après fork
+            with DatabaseService._pool_lock:
+                if not self._pool_valide():
+                    DatabaseService._pool = None
+                    self._init_pool()
+            minconn, _ = pool_bounds()
+            conns = [self._get_conn() for _ in range(minconn)]
+            prepared = 0
+            for conn in conns:
+                with conn.cursor(cursor_factory=_TimedCursor) as cur:
+                    for name, sql in statements.items():
+                        try:
+                            cur.execute(f"PREPARE {name} AS {sql}")
+                            prepared += 1
+                        except psycopg2.Error as e:
+                            conn.rollback()
+                            logger.debug("Préchauffage %s ignoré : %s", name, e)
+                conn.commit()
+            for conn in conns:
+                self._put_conn(conn)
+            warmup_state.update(ready=True, connexions=len(conns), prepared=prepared,
+                                duree_ms=int((time.monotonic() - debut) * 1000))
+            logger.info("Worker %s préchauffé : %d connexion(s), %d requête(s) préparée(s)",
+                        os.getpid(), len(conns), prepared)
+        except Exception as e:
+            warmup_state['erreur'] = str(e)
+            logger.error(f"Préchauffage du pool en échec : {e}")
+        return dict(warmup_state)
+
 
 # Singleton partagé entre tous les services
 db_service = DatabaseService()
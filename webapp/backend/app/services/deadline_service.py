@@ -0,0 +1,241 @@
+# Budget de temps par route et annulation des requêtes SQL abandonnées
+"""
+Chaque requête HTTP reçoit une échéance : REQUEST_BUDGET secondes, ou le
+budget déclaré sur la route (@budget(secondes)). DatabaseService consulte
+cette échéance avant chaque requête SQL :
+
+  - échéance dépassée → DelaiDepasse sans rien envoyer au serveur ;
+  - sinon la requête part précédée de SET LOCAL statement_timeout = <temps
+    restant> (même aller-retour, portée limitée à la transaction) : une
+    consultation rapide n'hérite plus des 20 s d'un export.
+
+Un veilleur par processus surveille les requêtes SQL en cours et appelle
+connection.cancel() quand le client HTTP s'est déconnecté (socket Gunicorn
+fermée : navigation vers une autre page, onglet fermé, nginx qui abandonne)
+ou que l'échéance est dépassée. La requête annulée libère aussitôt sa
+connexion du pool ; les requêtes SQL suivantes de la même requête HTTP
+échouent sans être envoyées.
+
+Pool du worker saturé (aucune connexion rendue dans DB_POOL_TIMEOUT
+secondes, database_service.PoolSature) → 503 + Retry-After.
+
+Sous-requêtes de /api/batch : échéance bornée par celle du lot, socket du lot.
+Appels de concurrence_service.rassembler : échéance de la requête HTTP.
+"""
+import contextlib
+import logging
+import os
+import select
+import socket
+import ssl
+import threading
+import time
+
+import psycopg2.extensions
+from flask import current_app, g, jsonify, request
+
+from app.services import database_service
+
+logger = logging.getLogger(__name__)
+
+REQUEST_BUDGET = float(os.getenv('REQUEST_BUDGET', '20'))        # secondes
+VEILLE_INTERVALLE = float(os.getenv('VEILLE_INTERVALLE', '0.25'))  # secondes
+_GRACE = 1.0   # marge laissée à statement_timeout avant cancel() sur échéance
+
+
+class DelaiDepasse(psycopg2.extensions.QueryCanceledError):
+    """Requête SQL refusée ou annulée : échéance dépassée ou client parti."""
+
+
+def budget(secondes):
+    """Décorateur de route : budget de temps de la requête HTTP (secondes)."""
+    def decorator(f):
+        f.budget_sql = secondes
+        return f
+    return decorator
+
+
+class _Requete:
+    __slots__ = ('route', 'echeance', 'socket', 'abandonnee')
+
+    def __init__(self, route, echeance, sock):
+        self.route = route
+        self.echeance = echeance
+        self.socket = sock
+        self.abandonnee = False
+
+
+_local = threading.local()
+
+
+def _pile():
+    pile = getattr(_local, 'pile', None)
+    if pile is None:
+        pile = _local.pile = []
+    return pile
+
+
+def courante():
+    """Requête HTTP en cours dans ce thread, ou None (hors requête)."""
+    pile = _pile()
+    return pile[-1] if pile else None
+
+
+@contextlib.contextmanager
+def heritee(requete):
+    """Échéance d'une requête HTTP reprise par un autre thread (concurrence_service)."""
+    if requete is None:
+        yield
+        return
+    pile = _pile()
+    pile.append(requete)
+    try:
+        yield
+    finally:
+        pile.remove(requete)
+
+
+# ── Garde appelée par DatabaseService ──────────────────────────────────────
+
+class _EnVol:
+    __slots__ = ('requete', 'conn', 'annulee')
+
+    def __init__(self, requete, conn):
+        self.requete = requete
+        self.conn = conn
+        self.annulee = False
+
+
+_en_vol = {}            # ident du thread → _EnVol
+_en_vol_lock = threading.Lock()
+
+
+class _Garde:
+    def debut(self, conn):
+        r = courante()
+        if r is None:
+            return None
+        if r.abandonnee:
+            raise DelaiDepasse("Client déconnecté : requête abandonnée")
+        reste = r.echeance - time.monotonic()
+        if reste <= 0:
+            raise DelaiDepasse("Délai de traitement dépassé")
+        with _en_vol_lock:
+            _en_vol[threading.get_ident()] = _EnVol(r, conn)
+        _demarrer_veilleur()
+        return f"SET LOCAL statement_timeout = {max(1, int(reste * 1000))}; "
+
+    def fin(self):
+        with _en_vol_lock:
+            _en_vol.pop(threading.get_ident(), None)
+
+
+# ── Veilleur ────────────────────────────────────────────────────────────────
+
+_veilleur = None
+_veilleur_pid = None
+_veilleur_lock = threading.Lock()
+
+
+def _deconnecte(sock):
+    """Vrai si le client a fermé la connexion (EOF ou erreur sur la socket)."""
+    try:
+        lisible, _, _ = select.select([sock], [], [], 0)
+        if not lisible:
+            return False
+        # Données lisibles : requête suivante (keep-alive) ou fin de flux
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except (BlockingIOError, InterruptedError):
+        return False
+    except (OSError, ValueError):
+        return True
+
+
+def _examiner():
+    maintenant = time.monotonic()
+    with _en_vol_lock:
+        # Verrou tenu pendant cancel() : la requête SQL ne peut pas se
+        # terminer et sa connexion repartir vers une autre requête entre-temps
+        for vol in _en_vol.values():
+            if vol.annulee:
+                continue
+            r = vol.requete
+            if r.socket is not None and _deconnecte(r.socket):
+                r.abandonnee = True
+                motif = "client déconnecté"
+            elif maintenant > r.echeance + _GRACE:
+                motif = "échéance dépassée"
+            else:
+                continue
+            vol.annulee = True
+            logger.warning("Requête SQL annulée (%s) : %s", motif, r.route)
+            try:
+                vol.conn.cancel()
+            except Exception as e:
+                logger.warning("Annulation impossible : %s", e)
+
+
+def _veiller():
+    while True:
+        time.sleep(VEILLE_INTERVALLE)
+        try:
+            _examiner()
+        except Exception:
+            logger.exception("Veilleur des requêtes SQL")
+
+
+def _demarrer_veilleur():
+    global _veilleur, _veilleur_pid
+    if _veilleur is not None and _veilleur_pid == os.getpid():
+        return
+    with _veilleur_lock:
+        if _veilleur is None or _veilleur_pid != os.getpid() or not _veilleur.is_alive():
+            _veilleur = threading.Thread(target=_veiller, name='bmp-veilleur-sql', daemon=True)
+            _veilleur.start()
+            _veilleur_pid = os.getpid()
+
+
+# ── Hooks ───────────────────────────────────────────────────────────────────
+
+def _before():
+    view = current_app.view_functions.get(request.endpoint)
+    secondes = getattr(view, 'budget_sql', None) or REQUEST_BUDGET
+    parent = courante()
+    sock = request.environ.get('gunicorn.socket')
+    if isinstance(sock, ssl.SSLSocket):
+        sock = None   # MSG_PEEK impossible sur une socket TLS
+    r = _Requete(request.path, time.monotonic() + secondes, sock)
+    if parent is not None:
+        r.echeance = min(r.echeance, parent.echeance)
+        r.socket = r.socket or parent.socket
+    _pile().append(r)
+    g._deadline = r
+
+
+def _teardown(exc):
+    r = g.pop('_deadline', None)
+    if r is not None:
+        pile = _pile()
+        if r in pile:
+            pile.remove(r)
+
+
+def _delai_depasse(e):
+    logger.warning("%s : %s", request.path, e)
+    return jsonify({"success": False, "error": "Délai de traitement dépassé"}), 504
+
+
+def _pool_sature(e):
+    logger.warning("%s : %s", request.path, e)
+    resp = jsonify({"success": False, "error": "Serveur surchargé, réessayez"})
+    resp.headers['Retry-After'] = '1'
+    return resp, 503
+
+
+def register_deadline(bp):
+    """Échéance par requête + annulation SQL sur un blueprint."""
+    database_service.set_garde(_Garde())
+    bp.before_request(_before)
+    bp.teardown_request(_teardown)
+    bp.register_error_handler(psycopg2.extensions.QueryCanceledError, _delai_depasse)
+    bp.register_error_handler(database_service.PoolSature, _pool_sature)
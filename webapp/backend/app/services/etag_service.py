@@ -0,0 +1,52 @@
+# Requêtes conditionnelles des fiches (ETag / If-None-Match)
+"""
+Les fiches projet, BC, contrat et tâche (GET /<ressource>/<id>) commencent
+par une sonde de version : une seule requête indexée qui lit l'horodatage de
+la ligne, de ses lignes filles et des lignes référencées dont la fiche
+affiche des colonnes (triggers : migrations 0015 et 0016), avec le contrôle
+d'accès. Si la version est dans If-None-Match, la route répond 304 sans
+assembler la fiche.
+
+Empreinte d'un ensemble de lignes : COUNT + SUM des horodatages, et non
+MAX : une transaction longue valide des lignes datées de son début (now()),
+parfois avant le MAX courant ; la somme change quand même. Tables de liaison
+sans horodatage (équipe, prestataires, contacts, documents du projet) :
+COUNT + SUM(id), elles ne changent que par ajout ou retrait de lignes.
+
+ETag faible (W/"…") : même contenu, pas forcément les mêmes octets.
+Cache-Control: private, no-cache : le navigateur garde la fiche et la
+revalide à chaque ouverture (fetch envoie If-None-Match de lui-même).
+Pas de Last-Modified : une date ne suffit pas à dater une fiche dont les
+lignes filles peuvent valider une date antérieure (cf. ci-dessus).
+"""
+from flask import make_response, request
+
+
+def horodatage(col):
+    """Horodatage SQL en secondes (0 si NULL), sommable."""
+    return f"COALESCE(EXTRACT(EPOCH FROM {col}), 0)"
+
+
+def empreinte(valeur, source):
+    """Sous-requête 'nombre/somme' de valeur sur source (« table … WHERE … »)."""
+    return f"(SELECT COUNT(*) || '/' || COALESCE(SUM({valeur}), 0) FROM {source})"
+
+
+def version_sql(*parties):
+    """Expression SQL de la version : md5 des parties (NULL → '-')."""
+    return ("md5(concat_ws(':', " +
+            ', '.join(f"COALESCE(({p})::text, '-')" for p in parties) + "))")
+
+
+def non_modifie(version):
+    """Réponse 304 si If-None-Match contient la version, sinon None."""
+    if not version or not request.if_none_match.contains_weak(version):
+        return None
+    return marquer(make_response('', 304), version)
+
+
+def marquer(resp, version):
+    """ETag + Cache-Control de revalidation sur la réponse de la fiche."""
+    resp.set_etag(version, weak=True)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
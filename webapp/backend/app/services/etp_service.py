@@ -0,0 +1,124 @@
+# Service charge / ETP pour usage web
+import logging
+from datetime import date
+from app.services.database_service import DatabaseService
+from app.services.cache_service import get_cache
+from app.services.etag_service import empreinte, horodatage
+
+def _d(row):
+    if row is None:
+        return None
+    return dict(row) if hasattr(row, 'keys') else row
+
+logger = logging.getLogger(__name__)
+
+HEURES_AN = 1540  # 1 ETP = ~220 jours * 7h
+
+# Granularités autorisées → unité PostgreSQL (date_trunc / interval)
+GRAINS = {'week': 'week', 'month': 'month', 'quarter': 'quarter'}
+
+_cube_cache = get_cache('etp_cube', max_entries=64)
+
+
+class EtpService:
+    def __init__(self):
+        self.db = DatabaseService()
+
+    def taches_version(self):
+        """
+        Jeton de version du cube : tâches (insert / update / delete) et tables
+        jointes pour les libellés et le rattachement (projets, services,
+        utilisateurs). service_id n'est pas suivi par le déclencheur
+        trg_touch_utilisateur : empreinte des rattachements en plus de date_maj.
+        """
+        row = self.db.fetch_one(
+            "SELECT COUNT(*) AS n, MAX(id) AS max_id, MAX(updated_at)::text AS maj, "
+            f"  {empreinte(horodatage('p.updated_at'), 'projets p')} AS v_projets, "
+            f"  {empreinte(horodatage('s.date_maj'), 'services s')} AS v_services, "
+            f"  {empreinte(horodatage('u.date_maj'), 'utilisateurs u')} AS v_utilisateurs, "
+            "  (SELECT md5(COALESCE(string_agg(u.id || ':' || COALESCE(u.service_id, 0), ',' "
+            "     ORDER BY u.id), '')) FROM utilisateurs u) AS v_rattachements "
+            "FROM taches"
+        )
+        if not row:
+            return None
+        return tuple(row.values())
+
+    def get_cube(self, grain='month', annee=None, where='1=1', params=None, scope=None):
+        """
+        Répartit estimation_heures de chaque tâche ouverte sur les périodes
+        (semaine / mois / trimestre) couvertes par date_debut → date_echeance,
+        au prorata des jours, et agrège par période × personne × service × projet.
+        Dates manquantes : bornes de l'année (même règle que ETPView desktop).
+        where/params : filtre de visibilité sur l'alias t (taches).
+        scope        : clé de cache du périmètre de visibilité.
+        """
+        unit = GRAINS.get(grain)
+        if not unit:
+            raise ValueError(f"Granularité invalide : {grain}")
+        annee = int(annee or date.today().year)
+        params = list(params or [])
+
+        version = self.taches_version()
+        key = (unit, annee, scope)
+        cached = _cube_cache.get(key, version)
+        if cached is not None:
+            return cached
+
+        rows = self.db.fetch_all(
+            "WITH bornes AS (SELECT %s::date AS debut, %s::date AS fin), "
+            "t AS ( "
+            "  SELECT t.id, t.projet_id, t.assignee_id, "
+            "    t.estimation_heures::numeric AS heures, "
+            "    GREATEST(COALESCE(t.date_debut, b.debut), b.debut) AS d0, "
+            "    GREATEST(GREATEST(COALESCE(t.date_debut, b.debut), b.debut), "
+            "             LEAST(COALESCE(t.date_echeance, b.fin), b.fin)) AS d1 "
+            "  FROM taches t CROSS JOIN bornes b "
+            "  WHERE COALESCE(t.estimation_heures, 0) > 0 "
+            "    AND t.statut NOT IN ('Terminé', 'Annulé') "
+            "    AND COALESCE(t.date_debut, b.debut) <= b.fin "
+            "    AND COALESCE(t.date_echeance, b.fin) >= b.debut "
+            f"    AND ({where}) "
+            "), "
+            "buckets AS ( "
+            "  SELECT t.id, t.projet_id, t.assignee_id, "
+            "    g::date AS periode, "
+            "    t.heures * ( "
+            f"      LEAST(t.d1, (g + INTERVAL '1 {unit}' - INTERVAL '1 day')::date) "
+            "      - GREATEST(t.d0, g::date) + 1 "
+            "    ) / (t.d1 - t.d0 + 1) AS heures "
+            f"  FROM t, generate_series(date_trunc('{unit}', t.d0), t.d1, INTERVAL '1 {unit}') g "
+            ") "
+            "SELECT b.periode, b.assignee_id, "
+            "  TRIM(COALESCE(u.prenom,'') || ' ' || COALESCE(u.nom,'')) AS personne, "
+            "  u.service_id, s.code AS service_code, s.nom AS service_nom, "
+            "  b.projet_id, p.code AS projet_code, p.nom AS projet_nom, "
+            "  ROUND(SUM(b.heures), 2) AS heures, COUNT(DISTINCT b.id) AS nb_taches "
+            "FROM buckets b "
+            "LEFT JOIN utilisateurs u ON u.id = b.assignee_id "
+            "LEFT JOIN services s ON s.id = u.service_id "
+            "LEFT JOIN projets p ON p.id = b.projet_id "
+            "GROUP BY b.periode, b.assignee_id, u.prenom, u.nom, u.service_id, "
+            "  s.code, s.nom, b.projet_id, p.code, p.nom "
+            "ORDER BY b.periode, personne, p.code",
+            [date(annee, 1, 1), date(annee, 12, 31)] + params
+        ) or []
+
+        cellules = []
+        periodes = {}
+        for r in rows:
+            c = _d(r)
+            c['periode'] = str(c['periode'])
+            c['heures'] = float(c.get('heures') or 0)
+            periodes[c['periode']] = periodes.get(c['periode'], 0.0) + c['heures']
+            cellules.append(c)
+
+        result = {
+            'grain':     unit,
+            'annee':     annee,
+            'heures_an': HEURES_AN,
+            'periodes':  [{'periode': k, 'heures': round(v, 2)} for k, v in sorted(periodes.items())],
+            'cellules':  cellules,
+        }
+        _cube_cache.set(key, version, result)
+        return result
@@ -0,0 +1,251 @@
+# Flux d'événements temps réel (Server-Sent Events) alimenté par LISTEN/NOTIFY
+"""
+Les triggers de la migration 0014 écrivent chaque événement dans la table
+evenements puis le publient sur le canal bmp_evenements (pg_notify). Chaque
+worker ouvre UNE connexion dédiée (hors pool) qui écoute ce canal et répartit
+les événements entre les flux SSE ouverts dans le processus (une file par flux).
+
+    notification  → destinataire seulement (user_id ; NULL = admins)
+    bc/tache/contrat → tous les flux : le client recharge la vue affichée
+
+À la reconnexion, Last-Event-ID permet de rejouer les événements manqués
+depuis la table (conservés SSE_RETENTION secondes) ; si l'écart est trop
+grand, un événement `resync` demande au client de tout recharger.
+
+Un flux occupe un thread (worker gthread) mais aucune connexion du pool :
+SSE_FLUX_MAX borne les flux simultanés du worker pour laisser des threads aux
+requêtes ordinaires (au-delà, /api/events répond 503 avec `retry:`). La
+connexion d'écoute est décomptée du budget DB_POOL_MAX (pool_bounds).
+"""
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from app.services import database_service, sync_service
+from app.services.database_service import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+CANAL          = 'bmp_evenements'
+SSE_HEARTBEAT  = int(os.getenv('SSE_HEARTBEAT', '15'))     # secondes
+SSE_DUREE_MAX  = int(os.getenv('SSE_DUREE_MAX', '300'))    # le client se reconnecte ensuite
+SSE_RETENTION  = int(os.getenv('SSE_RETENTION', '3600'))   # secondes
+SSE_FILE_MAX   = int(os.getenv('SSE_FILE_MAX', '500'))     # événements en attente par flux
+SSE_REJEU_MAX  = 500
+SSE_RETRY_MS   = 3000
+SSE_FLUX_MAX   = int(os.getenv('SSE_FLUX_MAX', '8'))       # flux simultanés par worker
+SSE_PLEIN_MS   = 15000                                     # retry: suggéré quand plein
+
+
+class Abonnement:
+    """Un flux SSE ouvert : file d'événements filtrée pour un utilisateur."""
+
+    def __init__(self, user_id, admin):
+        self.user_id = user_id
+        self.admin = admin
+        self.file = queue.Queue(maxsize=SSE_FILE_MAX)
+        self.resync = False     # file débordée ou écoute interrompue
+
+    def concerne(self, evt):
+        if evt.get('type') != 'notification':
+            return True
+        if evt.get('user_id') is None:
+            return self.admin
+        return evt.get('user_id') == self.user_id
+
+    def pousser(self, evt):
+        if not self.concerne(evt):
+            return
+        try:
+            self.file.put_nowait(evt)
+        except queue.Full:
+            self.resync = True
+
+
+_abonnements = set()
+_abonnements_lock = threading.Lock()
+_ecouteur = None
+_ecouteur_lock = threading.Lock()
+
+
+def _diffuser(evt):
+    with _abonnements_lock:
+        abonnes = list(_abonnements)
+    for ab in abonnes:
+        ab.pousser(evt)
+
+
+def _signaler_resync():
+    with _abonnements_lock:
+        for ab in _abonnements:
+            ab.resync = True
+
+
+def _connexion_ecoute():
+    conn = psycopg2.connect(
+        host=database_service.DB_HOST, port=int(database_service.DB_PORT),
+        dbname=database_service.DB_NAME, user=database_service.DB_USER,
+        password=database_service.DB_PASS, connect_timeout=10,
+        application_name='bmp-evenements',
+    )
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with conn.cursor() as cur:
+        cur.execute(f"LISTEN {CANAL}")
+    return conn
+
+
+def _purger(conn):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM evenements WHERE date_creation < NOW() - %s * INTERVAL '1 second'",
+                    [SSE_RETENTION])
+        # Tombstones de la synchronisation incrémentale des listes (?since=)
+        cur.execute("DELETE FROM deleted_rows WHERE deleted_at < NOW() - %s * INTERVAL '1 second'",
+                    [sync_service.SYNC_RETENTION])
+
+
+def _ecouter():
+    """Boucle du thread d'écoute : reconnexion automatique, purge périodique."""
+    reprise = False
+    prochaine_purge = 0
+    while True:
+        conn = None
+        try:
+            conn = _connexion_ecoute()
+            if reprise:
+                # Des NOTIFY ont pu être perdus pendant la coupure
+                _signaler_resync()
+            reprise = True
+            while True:
+                if select.select([conn], [], [], 5) != ([], [], []):
+                    conn.poll()
+                    while conn.notifies:
+                        n = conn.notifies.pop(0)
+                        try:
+                            _diffuser(json.loads(n.payload))
+                        except ValueError:
+                            logger.warning("Événement illisible : %r", n.payload[:200])
+                if time.monotonic() >= prochaine_purge:
+                    _purger(conn)
+                    prochaine_purge = time.monotonic() + 600
+        except Exception as e:
+            logger.warning("Écoute %s interrompue (%s), reconnexion dans 5 s", CANAL, e)
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def demarrer_ecoute():
+    """Démarre le thread d'écoute du processus courant (idempotent, après fork)."""
+    global _ecouteur
+    with _ecouteur_lock:
+        if _ecouteur is None or not _ecouteur.is_alive():
+            _ecouteur = threading.Thread(target=_ecouter, name='bmp-evenements', daemon=True)
+            _ecouteur.start()
+
+
+def abonner(user_id, admin):
+    """Inscrit un flux ; None si le worker a déjà SSE_FLUX_MAX flux ouverts."""
+    demarrer_ecoute()
+    ab = Abonnement(user_id, admin)
+    with _abonnements_lock:
+        if len(_abonnements) >= SSE_FLUX_MAX:
+            return None
+        _abonnements.add(ab)
+    return ab
+
+
+def desabonner(ab):
+    with _abonnements_lock:
+        _abonnements.discard(ab)
+
+
+def nb_abonnes():
+    with _abonnements_lock:
+        return len(_abonnements)
+
+
+# ── Rejeu et format SSE ─────────────────────────────────────────────────────
+
+def rejouer(dernier_id, user_id, admin):
+    """
+    Événements postérieurs à dernier_id visibles par l'utilisateur.
+    Retourne (événements, resync) : resync si des événements ont été purgés
+    ou sont trop nombreux pour être rejoués un par un.
+    """
+    db = DatabaseService()
+    plus_ancien = (db.fetch_one("SELECT MIN(id) AS id FROM evenements") or {}).get('id')
+    if (plus_ancien is None and dernier_id > 0) or (plus_ancien or 0) > dernier_id + 1:
+        return [], True
+    rows = db.fetch_all(
+        "SELECT id, type, op, ref_id, user_id, date_creation FROM evenements "
+        "WHERE id > %s AND (type <> 'notification' OR user_id = %s OR (user_id IS NULL AND %s)) "
+        "ORDER BY id LIMIT %s",
+        [dernier_id, user_id, admin, SSE_REJEU_MAX + 1]
+    )
+    if len(rows) > SSE_REJEU_MAX:
+        return [], True
+    evts = [dict(r) for r in rows]
+    for evt in evts:
+        if evt.get('date_creation') is not None:
+            evt['date_creation'] = evt['date_creation'].isoformat()   # comme row_to_json
+    return evts, False
+
+
+def format_sse(evt=None, event=None, commentaire=None):
+    """Message SSE (text/event-stream)."""
+    if commentaire is not None:
+        return f": {commentaire}\n\n"
+    lignes = []
+    if evt is not None and evt.get('id') is not None:
+        lignes.append(f"id: {evt['id']}")
+    lignes.append(f"event: {event or evt.get('type', 'message')}")
+    lignes.append("data: " + json.dumps(evt or {}, default=str, separators=(',', ':')))
+    return '\n'.join(lignes) + '\n\n'
+
+
+def flux(ab, dernier_id=None):
+    """
+    Générateur du flux SSE d'un abonnement (déjà inscrit, pour ne rien perdre
+    entre le rejeu et l'écoute). Heartbeat toutes les SSE_HEARTBEAT secondes,
+    fin après SSE_DUREE_MAX : EventSource se reconnecte avec Last-Event-ID.
+    """
+    try:
+        yield format_sse(commentaire='ok') + f"retry: {SSE_RETRY_MS}\n\n"
+        vu = dernier_id or 0
+        if dernier_id is not None:
+            evts, resync = rejouer(dernier_id, ab.user_id, ab.admin)
+            if resync:
+                yield format_sse({}, event='resync')
+            for evt in evts:
+                yield format_sse(evt)
+                vu = max(vu, evt['id'])
+        fin = time.monotonic() + SSE_DUREE_MAX
+        while time.monotonic() < fin:
+            if ab.resync:
+                ab.resync = False
+                while not ab.file.empty():
+                    vu = max(vu, ab.file.get_nowait().get('id') or 0)
+                yield format_sse({'id': vu} if vu else {}, event='resync')
+                continue
+            try:
+                evt = ab.file.get(timeout=min(SSE_HEARTBEAT, max(fin - time.monotonic(), 0.1)))
+            except queue.Empty:
+                yield format_sse(commentaire='ping')
+                continue
+            if (evt.get('id') or 0) <= vu:
+                continue   # déjà envoyé par le rejeu
+            vu = evt['id']
+            yield format_sse(evt)
+    finally:
+        desabonner(ab)
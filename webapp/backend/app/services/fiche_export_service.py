@@ -0,0 +1,251 @@
+"""
+fiche_export_service.py
+Export groupé des fiches projet dans une archive ZIP :
+  - données préchargées par fiche_projet_web_service.prefetch_fiches_pg()
+  - rendu parallèle dans un pool de processus (python-docx est CPU-bound)
+  - ZIP produit en flux, entrée par entrée, au fil des rendus terminés
+  - mémoire bornée (nombre de rendus en vol limité) et délai global par export
+  - rendus en cours interrompus dans le processus fils : délai par fiche,
+    délai de l'export dépassé ou client déconnecté (drapeau d'arrêt)
+"""
+import io
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+FICHES_ZIP_MAX     = int(os.getenv('FICHES_ZIP_MAX', '200'))
+FICHES_ZIP_WORKERS = int(os.getenv('FICHES_ZIP_WORKERS', str(min(4, os.cpu_count() or 1))))
+FICHES_ZIP_TIMEOUT = int(os.getenv('FICHES_ZIP_TIMEOUT', '120'))  # secondes par export
+FICHES_RENDU_TIMEOUT = int(os.getenv('FICHES_RENDU_TIMEOUT', '30'))  # secondes par fiche
+_SCRUTATION = 0.25  # secondes entre deux vérifications dans le processus fils
+
+FORMATS = {'docx': 'docx', 'html': 'html'}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Rendus soumis au pool et non terminés, tous exports confondus (supervision)
+_en_attente = 0
+_en_attente_lock = threading.Lock()
+
+
+def _compter(delta):
+    global _en_attente
+    with _en_attente_lock:
+        _en_attente += delta
+
+
+def rendus_en_attente():
+    """Profondeur de la file des rendus de fiches de ce processus."""
+    return _en_attente
+
+
+def _get_pool():
+    """Pool de processus partagé par le worker (contexte spawn : sûr après fork Gunicorn)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=FICHES_ZIP_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _reset_pool():
+    """Abandonne un pool cassé (processus fils tué) ; le prochain appel en recrée un."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+class RenduInterrompu(BaseException):
+    """Rendu arrêté ; BaseException pour traverser les `except Exception` du rendu."""
+
+
+@contextmanager
+def _interruptible(arret=None, echeance=None):
+    """
+    Interrompt le bloc (RenduInterrompu) dès que le fichier drapeau `arret`
+    existe ou que `echeance` (time.time()) est passée. Vérification par
+    SIGALRM toutes les _SCRUTATION s : le rendu python-docx ne rend jamais la
+    main d'ici là, et le processus du pool reste réutilisable. Sans effet hors
+    du thread principal ou sans setitimer (Windows).
+    """
+    if (not hasattr(signal, 'setitimer')
+            or threading.current_thread() is not threading.main_thread()):
+        yield
+        return
+
+    def verifier(signum, frame):
+        if echeance is not None and time.time() >= echeance:
+            raise RenduInterrompu("délai dépassé")
+        if arret is not None and os.path.exists(arret):
+            raise RenduInterrompu("export interrompu")
+
+    precedent = signal.signal(signal.SIGALRM, verifier)
+    signal.setitimer(signal.ITIMER_REAL, _SCRUTATION, _SCRUTATION)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, precedent)
+
+
+def rendre_fiche(fmt: str, projet_id: int, data: dict, arret=None, echeance=None) -> bytes:
+    """
+    Rendu d'une fiche (exécuté dans un processus du pool), interrompu après
+    FICHES_RENDU_TIMEOUT s, à `echeance` (fin de l'export) ou si le drapeau
+    `arret` est posé.
+    """
+    limite = time.time() + FICHES_RENDU_TIMEOUT
+    echeance = limite if echeance is None else min(echeance, limite)
+    with _interruptible(arret, echeance):
+        if fmt == 'html':
+            from app.services.fiche_projet_html_service import generer_fiche_html
+            return generer_fiche_html(data, projet_id).encode('utf-8')
+        from app.services.fiche_projet_web_service import generer_fiche_projet
+        buf = io.BytesIO()
+        generer_fiche_projet(data, buf)
+        return buf.getvalue()
+
+
+def _poser_drapeau(arret):
+    """Pose le drapeau d'arrêt d'un export, retiré une fois vu par les rendus."""
+    try:
+        open(arret, 'w').close()
+    except OSError as e:
+        logger.warning("Drapeau d'arrêt %s non posé : %s", arret, e)
+        return
+    t = threading.Timer(_SCRUTATION * 20, _retirer_drapeau, [arret])
+    t.daemon = True
+    t.start()
+
+
+def _retirer_drapeau(arret):
+    try:
+        os.remove(arret)
+    except OSError:
+        pass
+
+
+class _ZipSink(io.RawIOBase):
+    """Flux non positionnable : zipfile y écrit, le générateur le vide."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _nom_entree(code, projet_id, ext, deja_pris):
+    base = re.sub(r'[^\w.-]', '_', str(code or f'PRJ{projet_id}'))
+    nom = f"fiche_projet_{base}.{ext}"
+    if nom in deja_pris:
+        nom = f"fiche_projet_{base}_{projet_id}.{ext}"
+    deja_pris.add(nom)
+    return nom
+
+
+def iter_fiches_zip(bundles: dict, fmt: str = 'docx'):
+    """
+    Générateur des octets du ZIP des fiches.
+    bundles : {projet_id: bundle} retourné par prefetch_fiches_pg()
+    Les fiches en échec ou non rendues avant FICHES_ZIP_TIMEOUT (ou
+    FICHES_RENDU_TIMEOUT pour une fiche) sont listées dans une entrée
+    ERREURS.txt. À l'arrêt (délai, client déconnecté), les rendus en cours
+    sont interrompus par le drapeau d'arrêt de l'export.
+    """
+    ext = FORMATS[fmt]
+    if fmt == 'html':
+        from app.services.fiche_projet_html_service import donnees_fiche_html_depuis_bundle as build
+    else:
+        from app.services.fiche_projet_web_service import donnees_fiche_depuis_bundle as build
+
+    pool     = _get_pool()
+    sink     = _ZipSink()
+    zf       = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED)
+    todo     = list(bundles.items())
+    pending  = {}
+    noms     = set()
+    erreurs  = []
+    deadline = time.monotonic() + FICHES_ZIP_TIMEOUT
+    echeance = time.time() + FICHES_ZIP_TIMEOUT   # même délai, horloge des processus fils
+    arret    = os.path.join(tempfile.gettempdir(), f"bmp_fiches_{uuid.uuid4().hex}.arret")
+    try:
+        while todo or pending:
+            # Au plus 2 rendus en attente par processus : mémoire bornée
+            while todo and len(pending) < FICHES_ZIP_WORKERS * 2:
+                pid, b = todo.pop(0)
+                args = (rendre_fiche, fmt, pid, build(b), arret, echeance)
+                try:
+                    fut = pool.submit(*args)
+                except BrokenProcessPool:
+                    _reset_pool()
+                    pool = _get_pool()
+                    fut = pool.submit(*args)
+                # Nom réservé à la soumission : indépendant de l'ordre des rendus
+                code = b['projet'].get('code')
+                pending[fut] = (pid, code, _nom_entree(code, pid, ext, noms))
+                _compter(1)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(list(pending), timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pid, code, nom = pending.pop(fut)
+                _compter(-1)
+                try:
+                    zf.writestr(nom, fut.result())
+                except RenduInterrompu as e:
+                    logger.warning("Fiche %s interrompue : %s", pid, e)
+                    erreurs.append(f"{code or pid} : {e}")
+                except Exception as e:
+                    logger.warning("Fiche %s non générée : %s", pid, e)
+                    erreurs.append(f"{code or pid} : {e}")
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+        for pid, code, _ in pending.values():
+            erreurs.append(f"{code or pid} : délai dépassé")
+        for pid, b in todo:
+            erreurs.append(f"{b['projet'].get('code') or pid} : délai dépassé")
+        if erreurs:
+            zf.writestr('ERREURS.txt', '\n'.join(erreurs))
+        zf.close()
+        yield sink.drain()
+    finally:
+        # Client déconnecté ou délai dépassé : libérer le pool. cancel() ne
+        # retire que les rendus pas encore démarrés ; le drapeau interrompt
+        # ceux en cours dans les processus fils.
+        for fut in pending:
+            fut.cancel()
+        if pending:
+            _poser_drapeau(arret)
+        _compter(-len(pending))
@@ -840,87 +840,35 @@ window.addEventListener('message', function(e) {{
 # ─────────────────────────────────────────────────────────────────────────────
 # Point d'entrée web — charge les données depuis PostgreSQL
 # ─────────────────────────────────────────────────────────────────────────────
-def generer_fiche_html_depuis_id_pg(projet_id: int, db) -> str:
-    proj_row = db.fetch_one(
-        "SELECT p.*, s.nom as service_nom "
-        "FROM projets p LEFT JOIN services s ON s.id=p.service_id "
-        "WHERE p.id=%s", [projet_id]
-    )
-    if not proj_row:
-        raise ValueError(f"Projet {projet_id} introuvable")
-
-    proj = dict(proj_row)
+def donnees_fiche_html_depuis_bundle(bundle: dict) -> dict:
+    """Construit le dict attendu par generer_fiche_html() à partir d'un bundle
+    préchargé par fiche_projet_web_service.prefetch_fiches_pg()."""
+    proj = bundle['projet']
 
     def sg(k, default=''):
         v = proj.get(k)
         return v if v is not None else default
 
-    # Tâches
-    taches_rows = db.fetch_all(
-        "SELECT titre, statut, date_echeance, estimation_heures, type_tache, rapport_reunion "
-        "FROM taches WHERE projet_id=%s ORDER BY date_echeance", [projet_id]
-    ) or []
     taches = [{'titre': r.get('titre') or '', 'statut': r.get('statut') or '',
                'echeance': _fmt_date(r.get('date_echeance')),
                'heures': f"{int(r.get('estimation_heures') or 0)}h",
                'type_tache': r.get('type_tache') or 'autre',
-               'rapport_reunion': r.get('rapport_reunion') or ''} for r in taches_rows]
+               'rapport_reunion': r.get('rapport_reunion') or ''} for r in bundle['taches']]
 
-    # Bons de commande
-    bcs_rows = db.fetch_all(
-        "SELECT numero_bc, objet, statut, montant_ttc FROM bons_commande "
-        "WHERE projet_id=%s ORDER BY date_creation DESC LIMIT 8", [projet_id]
-    ) or []
+    bcs_rows = bundle['bcs']
     bcs_str = '\n'.join(
         f"• {r.get('numero_bc','')} — {(r.get('objet') or '')[:35]} "
         f"({r.get('statut','')}) — {_fmt_eur(r.get('montant_ttc'))}"
         for r in bcs_rows
     ) if bcs_rows else 'Aucun BC lié'
 
-    def _contact_nom(contact_id):
-        if not contact_id: return ''
-        try:
-            r = db.fetch_one(
-                "SELECT COALESCE(prenom,'') || ' ' || COALESCE(nom,'') AS n "
-                "FROM contacts WHERE id=%s", [contact_id]
-            )
-            return (r.get('n') or '').strip() if r else ''
-        except: return ''
+    noms        = bundle['noms_contacts']
+    chef        = noms.get(proj.get('chef_projet_contact_id'), '')
+    responsable = noms.get(proj.get('responsable_contact_id'), '')
 
-    chef        = _contact_nom(sg('chef_projet_contact_id') or None)
-    responsable = _contact_nom(sg('responsable_contact_id') or None)
-
-    equipe = ''
-    try:
-        rows = db.fetch_all(
-            "SELECT COALESCE(pe.membre_label, TRIM(COALESCE(u.prenom,'') || ' ' || COALESCE(u.nom,''))) AS n "
-            "FROM projet_equipe pe LEFT JOIN utilisateurs u ON u.id=pe.utilisateur_id "
-            "WHERE pe.projet_id=%s", [projet_id]
-        ) or []
-        equipe = ', '.join(r.get('n') for r in rows if r.get('n'))
-    except: pass
-
-    contacts = []
-    try:
-        rows = db.fetch_all(
-            "SELECT COALESCE(pc.role,'') AS role, "
-            "  COALESCE(pc.contact_libre, TRIM(COALESCE(c.prenom,'') || ' ' || COALESCE(c.nom,''))) AS nom, "
-            "  COALESCE(c.fonction,'') AS fonction, COALESCE(c.email,'') AS email "
-            "FROM projet_contacts pc LEFT JOIN contacts c ON c.id=pc.contact_id "
-            "WHERE pc.projet_id=%s", [projet_id]
-        ) or []
-        contacts = [dict(r) for r in rows]
-    except: pass
-
-    prestataires = ''
-    try:
-        rows = db.fetch_all(
-            "SELECT f.nom FROM projet_prestataires pp "
-            "JOIN fournisseurs f ON f.id=pp.fournisseur_id "
-            "WHERE pp.projet_id=%s", [projet_id]
-        ) or []
-        prestataires = ', '.join(r.get('nom','') for r in rows if r.get('nom'))
-    except: pass
+    equipe       = ', '.join(r.get('n') for r in bundle['equipe'] if r.get('n'))
+    contacts     = [dict(r) for r in bundle['contacts']]
+    prestataires = ', '.join(r.get('nom','') for r in bundle['prestataires'] if r.get('nom'))
 
     data = {
         'code':                   sg('code'),
@@ -965,5 +913,12 @@ def generer_fiche_html_depuis_id_pg(projet_id: int, db) -> str:
         'triangle_tensions':      sg('triangle_tensions'),
         'arbitrage':              sg('arbitrage'),
     }
+    return data
+
 
-    return generer_fiche_html(data, projet_id)
+def generer_fiche_html_depuis_id_pg(projet_id: int, db) -> str:
+    from app.services.fiche_projet_web_service import prefetch_fiches_pg
+    bundle = prefetch_fiches_pg([projet_id], db).get(int(projet_id))
+    if not bundle:
+        raise ValueError(f"Projet {projet_id} introuvable")
+    return generer_fiche_html(donnees_fiche_html_depuis_bundle(bundle), projet_id)
@@ -8,6 +8,7 @@ Utilise python-docx — codes couleurs identiques au modèle DSI :
   #BFBFBF gris moyen → sous-sections
   #F2F2F2 gris léger → alternance lignes
 """
+import io
 import os
 import logging
 from datetime import datetime
@@ -236,11 +237,11 @@ def _fmt_date(d):
 # ─────────────────────────────────────────────────────────────────────────────
 # GÉNÉRATION WORD
 # ─────────────────────────────────────────────────────────────────────────────
-def generer_fiche_projet(data: dict, output_path: str) -> str:
+def generer_fiche_projet(data: dict, output_path) -> str:
     """
     Génère le fichier Word de la fiche projet.
     data        : dict avec toutes les infos du projet
-    output_path : chemin de sortie du .docx
+    output_path : chemin de sortie du .docx, ou flux binaire (io.BytesIO)
     """
     from docx import Document
     from docx.shared import Pt, Twips, RGBColor
@@ -589,117 +590,162 @@ def generer_fiche_projet(data: dict, output_path: str) -> str:
     run.font.color.rgb = RGBColor(*_rgb(GRAY2))
 
     doc.save(output_path)
-    logger.info(f"Fiche projet générée : {output_path}")
+    if isinstance(output_path, str):
+        logger.info(f"Fiche projet générée : {output_path}")
     return output_path
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Point d'entrée web (charge les données depuis PostgreSQL)
 # ─────────────────────────────────────────────────────────────────────────────
-def generer_fiche_depuis_id_pg(projet_id: int, output_dir: str, db) -> str:
+def fiche_version_pg(projet_id: int, db):
     """
-    Charge le projet depuis PostgreSQL et génère la fiche Word.
-    db         : instance DatabaseService
-    output_dir : dossier temporaire de sortie
-    Retourne le chemin du fichier .docx créé.
+    Jeton de version de la fiche : même empreinte que l'ETag de la fiche
+    projet (projet_service.VERSION : projet, service, contacts, tâches, BC et
+    fournisseurs, équipe, prestataires, documents ; sommes d'horodatages,
+    voir etag_service), plus la date du jour imprimée dans le pied de page.
+    Retourne None si le projet n'existe pas.
     """
-    proj_row = db.fetch_one(
-        "SELECT p.*, s.nom as service_nom "
-        "FROM projets p LEFT JOIN services s ON s.id=p.service_id "
-        "WHERE p.id=%s", [projet_id]
-    )
-    if not proj_row:
-        raise ValueError(f"Projet {projet_id} introuvable")
+    from app.services.projet_service import VERSION
+    row = db.fetch_one(f"SELECT {VERSION} AS version FROM projets p WHERE p.id = %s", [projet_id])
+    if not row:
+        return None
+    return datetime.now().strftime('%Y-%m-%d'), row['version']
 
-    proj = dict(proj_row)
 
-    def sg(k, default=''):
-        v = proj.get(k)
-        return v if v is not None else default
+def prefetch_fiches_pg(projet_ids, db) -> dict:
+    """
+    Charge en quelques requêtes ensemblistes (= ANY) toutes les données
+    nécessaires aux fiches d'une liste de projets.
+    Retourne {projet_id: {'projet', 'taches', 'bcs', 'equipe', 'contacts',
+    'prestataires', 'noms_contacts'}} — projets introuvables absents.
+    """
+    ids = sorted({int(i) for i in projet_ids})
+    if not ids:
+        return {}
+    bundles = {}
+    for r in db.fetch_all(
+        "SELECT p.*, s.nom as service_nom "
+        "FROM projets p LEFT JOIN services s ON s.id=p.service_id "
+        "WHERE p.id = ANY(%s)", [ids]
+    ) or []:
+        bundles[r['id']] = {'projet': dict(r), 'taches': [], 'bcs': [], 'equipe': [],
+                            'contacts': [], 'prestataires': [], 'noms_contacts': {}}
+    if not bundles:
+        return {}
+    ids = list(bundles)
 
     # ── Tâches ────────────────────────────────────────────────────────────────
-    taches_rows = db.fetch_all(
-        "SELECT titre, statut, date_echeance, estimation_heures "
-        "FROM taches WHERE projet_id=%s ORDER BY date_echeance",
-        [projet_id]
-    ) or []
-    taches = [{
-        'titre':    r.get('titre') or '',
-        'statut':   r.get('statut') or '',
-        'echeance': _fmt_date(r.get('date_echeance')),
-        'heures':   f"{int(r.get('estimation_heures') or 0)}h",
-    } for r in taches_rows]
-
-    # ── Bons de commande ──────────────────────────────────────────────────────
-    bcs_rows = db.fetch_all(
-        "SELECT numero_bc, objet, statut, montant_ttc FROM bons_commande "
-        "WHERE projet_id=%s ORDER BY date_creation DESC LIMIT 8",
-        [projet_id]
-    ) or []
-    if bcs_rows:
-        bcs_str = '\n'.join(
-            f"• {r.get('numero_bc', '')} — {(r.get('objet') or '')[:35]} "
-            f"({r.get('statut', '')}) — {_fmt_eur(r.get('montant_ttc'))}"
-            for r in bcs_rows
-        )
-    else:
-        bcs_str = 'Aucun BC lié'
+    for r in db.fetch_all(
+        "SELECT projet_id, titre, statut, date_echeance, estimation_heures, "
+        "type_tache, rapport_reunion "
+        "FROM taches WHERE projet_id = ANY(%s) ORDER BY projet_id, date_echeance",
+        [ids]
+    ) or []:
+        bundles[r['projet_id']]['taches'].append(r)
+
+    # ── Bons de commande (8 plus récents par projet) ──────────────────────────
+    for r in db.fetch_all(
+        "SELECT projet_id, numero_bc, objet, statut, montant_ttc FROM ("
+        "  SELECT bc.*, ROW_NUMBER() OVER ("
+        "    PARTITION BY bc.projet_id ORDER BY bc.date_creation DESC) AS rn "
+        "  FROM bons_commande bc WHERE bc.projet_id = ANY(%s)"
+        ") x WHERE rn <= 8 ORDER BY projet_id, rn",
+        [ids]
+    ) or []:
+        bundles[r['projet_id']]['bcs'].append(r)
 
     # ── Chef de projet & responsable ──────────────────────────────────────────
-    def _contact_nom(contact_id):
-        if not contact_id:
-            return ''
+    contact_ids = sorted({
+        b['projet'].get(col) for b in bundles.values()
+        for col in ('chef_projet_contact_id', 'responsable_contact_id')
+        if b['projet'].get(col)
+    })
+    if contact_ids:
         try:
-            r = db.fetch_one(
-                "SELECT COALESCE(prenom,'') || ' ' || COALESCE(nom,'') AS n "
-                "FROM contacts WHERE id=%s", [contact_id]
-            )
-            return (r.get('n') or '').strip() if r else ''
+            noms = {
+                r['id']: (r.get('n') or '').strip()
+                for r in db.fetch_all(
+                    "SELECT id, COALESCE(prenom,'') || ' ' || COALESCE(nom,'') AS n "
+                    "FROM contacts WHERE id = ANY(%s)", [contact_ids]
+                ) or []
+            }
+            for b in bundles.values():
+                b['noms_contacts'] = noms
         except Exception:
-            return ''
-
-    chef      = _contact_nom(sg('chef_projet_contact_id') or None)
-    responsable = _contact_nom(sg('responsable_contact_id') or None)
+            pass
 
     # ── Équipe (membres) ──────────────────────────────────────────────────────
-    equipe = ''
     try:
-        rows = db.fetch_all(
-            "SELECT COALESCE(pe.membre_label, TRIM(COALESCE(u.prenom,'') || ' ' || COALESCE(u.nom,''))) AS n "
+        for r in db.fetch_all(
+            "SELECT pe.projet_id, "
+            "  COALESCE(pe.membre_label, TRIM(COALESCE(u.prenom,'') || ' ' || COALESCE(u.nom,''))) AS n "
             "FROM projet_equipe pe LEFT JOIN utilisateurs u ON u.id=pe.utilisateur_id "
-            "WHERE pe.projet_id=%s", [projet_id]
-        ) or []
-        equipe = ', '.join(r.get('n') for r in rows if r.get('n'))
+            "WHERE pe.projet_id = ANY(%s)", [ids]
+        ) or []:
+            bundles[r['projet_id']]['equipe'].append(r)
     except Exception:
         pass
 
     # ── Contacts externes ─────────────────────────────────────────────────────
-    contacts = []
     try:
-        rows = db.fetch_all(
-            "SELECT COALESCE(pc.role,'') AS role, "
+        for r in db.fetch_all(
+            "SELECT pc.projet_id, COALESCE(pc.role,'') AS role, "
             "  COALESCE(pc.contact_libre, TRIM(COALESCE(c.prenom,'') || ' ' || COALESCE(c.nom,''))) AS nom, "
             "  COALESCE(c.fonction,'') AS fonction, COALESCE(c.email,'') AS email "
             "FROM projet_contacts pc LEFT JOIN contacts c ON c.id=pc.contact_id "
-            "WHERE pc.projet_id=%s", [projet_id]
-        ) or []
-        contacts = [dict(r) for r in rows]
+            "WHERE pc.projet_id = ANY(%s)", [ids]
+        ) or []:
+            r = dict(r)
+            bundles[r.pop('projet_id')]['contacts'].append(r)
     except Exception:
         pass
 
     # ── Prestataires ──────────────────────────────────────────────────────────
-    prestataires = ''
     try:
-        rows = db.fetch_all(
-            "SELECT f.nom FROM projet_prestataires pp "
+        for r in db.fetch_all(
+            "SELECT pp.projet_id, f.nom FROM projet_prestataires pp "
             "JOIN fournisseurs f ON f.id=pp.fournisseur_id "
-            "WHERE pp.projet_id=%s", [projet_id]
-        ) or []
-        prestataires = ', '.join(r.get('nom', '') for r in rows if r.get('nom'))
+            "WHERE pp.projet_id = ANY(%s)", [ids]
+        ) or []:
+            bundles[r['projet_id']]['prestataires'].append(r)
     except Exception:
         pass
 
-    data = {
+    return bundles
+
+
+def donnees_fiche_depuis_bundle(bundle: dict) -> dict:
+    """Construit le dict attendu par generer_fiche_projet() à partir d'un bundle préchargé."""
+    proj = bundle['projet']
+
+    def sg(k, default=''):
+        v = proj.get(k)
+        return v if v is not None else default
+
+    taches = [{
+        'titre':    r.get('titre') or '',
+        'statut':   r.get('statut') or '',
+        'echeance': _fmt_date(r.get('date_echeance')),
+        'heures':   f"{int(r.get('estimation_heures') or 0)}h",
+    } for r in bundle['taches']]
+
+    if bundle['bcs']:
+        bcs_str = '\n'.join(
+            f"• {r.get('numero_bc', '')} — {(r.get('objet') or '')[:35]} "
+            f"({r.get('statut', '')}) — {_fmt_eur(r.get('montant_ttc'))}"
+            for r in bundle['bcs']
+        )
+    else:
+        bcs_str = 'Aucun BC lié'
+
+    noms = bundle['noms_contacts']
+    chef        = noms.get(proj.get('chef_projet_contact_id'), '')
+    responsable = noms.get(proj.get('responsable_contact_id'), '')
+    equipe       = ', '.join(r.get('n') for r in bundle['equipe'] if r.get('n'))
+    prestataires = ', '.join(r.get('nom', '') for r in bundle['prestataires'] if r.get('nom'))
+
+    return {
         'code':               sg('code'),
         'nom':                sg('nom'),
         'statut':             sg('statut'),
@@ -729,13 +775,40 @@ def generer_fiche_depuis_id_pg(projet_id: int, output_dir: str, db) -> str:
         'solutions':          sg('solutions'),
         'financement':        sg('financement'),
         'taches':             taches,
-        'contacts':           contacts,
+        'contacts':           [dict(c) for c in bundle['contacts']],
         'registre_risques':   sg('registre_risques'),
         'contraintes_6axes':  sg('contraintes_6axes'),
         'triangle_tensions':  sg('triangle_tensions'),
         'arbitrage':          sg('arbitrage'),
     }
 
-    code = sg('code', f'PRJ{projet_id}')
+
+def charger_donnees_fiche_pg(projet_id: int, db) -> dict:
+    """
+    Charge depuis PostgreSQL le dict attendu par generer_fiche_projet().
+    db : instance DatabaseService
+    """
+    bundle = prefetch_fiches_pg([projet_id], db).get(int(projet_id))
+    if not bundle:
+        raise ValueError(f"Projet {projet_id} introuvable")
+    return donnees_fiche_depuis_bundle(bundle)
+
+
+def generer_fiche_depuis_id_pg(projet_id: int, output_dir: str, db) -> str:
+    """
+    Charge le projet depuis PostgreSQL et génère la fiche Word sur disque.
+    db         : instance DatabaseService
+    output_dir : dossier de sortie
+    Retourne le chemin du fichier .docx créé.
+    """
+    data = charger_donnees_fiche_pg(projet_id, db)
+    code = data.get('code') or f'PRJ{projet_id}'
     out_path = os.path.join(output_dir, f"fiche_projet_{code}.docx")
     return generer_fiche_projet(data, out_path)
+
+
+def generer_fiche_docx_bytes(projet_id: int, db) -> bytes:
+    """Génère la fiche Word en mémoire (aucun fichier temporaire) et retourne son contenu."""
+    buf = io.BytesIO()
+    generer_fiche_projet(charger_donnees_fiche_pg(projet_id, db), buf)
+    return buf.getvalue()
@@ -0,0 +1,67 @@
+# Projection des colonnes des listes (?fields=)
+"""
+Les listes ne sélectionnent plus `alias.*` : la liste SELECT est construite
+à partir d'une liste blanche de champs propre à chaque ressource (déclarée
+dans le service : colonnes de la table + colonnes calculées par jointure).
+
+    ?fields=id,code,nom,statut   champs demandés (id toujours inclus)
+    ?fields=*                     tous les champs de la liste blanche
+    (absent)                      projection compacte de la vue liste
+
+Les grandes colonnes TEXT (stockées en TOAST) ne sont lues que sur demande ;
+les routes de détail renvoient toujours l'enregistrement complet.
+Une jointure dont aucune colonne n'est sélectionnée est éliminée par
+PostgreSQL (LEFT JOIN sur clé unique).
+"""
+
+
+class Projection:
+    def __init__(self, alias, colonnes, calculees, defaut):
+        self.alias = alias
+        self.colonnes = tuple(colonnes)        # colonnes de la table (alias.col)
+        self.calculees = dict(calculees)       # nom → expression SQL
+        self.defaut = tuple(defaut)
+        inconnus = set(self.defaut) - set(self.champs)
+        if inconnus:
+            raise ValueError(f"Projection par défaut : champs inconnus {sorted(inconnus)}")
+
+    @property
+    def champs(self):
+        return self.colonnes + tuple(self.calculees)
+
+    def parse(self, fields):
+        """
+        Liste de champs de ?fields= (None si absent) ; ValueError si un champ
+        n'est pas dans la liste blanche.
+        """
+        if fields is None or not fields.strip():
+            return None
+        if fields.strip() == '*':
+            return list(self.champs)
+        demandes = []
+        for f in fields.split(','):
+            f = f.strip()
+            if f and f not in demandes:
+                demandes.append(f)
+        inconnus = [f for f in demandes if f not in self.champs]
+        if inconnus:
+            raise ValueError(f"Champ(s) inconnu(s) : {', '.join(inconnus)} "
+                             f"(autorisés : {', '.join(self.champs)})")
+        if 'id' not in demandes:
+            demandes.insert(0, 'id')
+        return demandes
+
+    def select(self, champs=None):
+        """Liste SELECT pour les champs donnés (None → projection par défaut)."""
+        out = []
+        for f in (champs or self.defaut):
+            if f in self.calculees:
+                out.append(f"{self.calculees[f]} AS {f}")
+            else:
+                out.append(f"{self.alias}.{f}")
+        return ', '.join(out)
+
+    def tout(self):
+        """`alias.*` + colonnes calculées : appelants internes (dashboard, référentiels)."""
+        return ', '.join([f"{self.alias}.*"] +
+                         [f"{expr} AS {nom}" for nom, expr in self.calculees.items()])
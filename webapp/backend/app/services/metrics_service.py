@@ -0,0 +1,205 @@
+# Métriques Prometheus pour usage web
+"""
+Télémétrie exposée sur /api/metrics (format texte Prometheus).
+
+Sous Gunicorn, les valeurs de tous les workers sont agrégées via le mode
+multiprocessus de prometheus_client : PROMETHEUS_MULTIPROC_DIR est créé et
+vidé par gunicorn.conf.py, et les fichiers d'un worker arrêté sont retirés
+par child_exit(). Sans cette variable (serveur de dev), registre du processus.
+
+Dépendance optionnelle : sans prometheus_client, les hooks sont inactifs et
+/api/metrics répond 501.
+"""
+import ipaddress
+import logging
+import os
+import time
+
+from flask import g, request
+
+from app.services import database_service
+from app.services.cache_service import all_caches
+
+logger = logging.getLogger(__name__)
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+    from prometheus_client import multiprocess
+    ENABLED = True
+except ImportError:  # pragma: no cover
+    ENABLED = False
+
+MULTIPROC = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+# Réseaux autorisés sans authentification (scraper interne, accès direct au
+# conteneur). Une requête relayée par nginx (X-Forwarded-For) exige un admin.
+METRICS_ALLOWED_NETS = [
+    ipaddress.ip_network(n.strip())
+    for n in os.getenv(
+        'METRICS_ALLOWED_NETS', '127.0.0.0/8,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16'
+    ).split(',') if n.strip()
+]
+
+if ENABLED:
+    # Registre propre au module (hors mode multiprocessus) : un rechargement du
+    # module, comme dans les tests, ne réenregistre pas les mêmes métriques.
+    REGISTRY = prometheus_client.CollectorRegistry()
+    HTTP_REQUESTS = Counter(
+        'bmp_http_requests_total', "Requêtes HTTP traitées",
+        ['route', 'method', 'status'], registry=REGISTRY)
+    HTTP_LATENCY = Histogram(
+        'bmp_http_request_duration_seconds', "Durée de traitement des requêtes HTTP",
+        ['route', 'method'], registry=REGISTRY,
+        buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+    HTTP_IN_FLIGHT = Gauge(
+        'bmp_http_requests_in_flight', "Requêtes HTTP en cours",
+        registry=REGISTRY, multiprocess_mode='livesum')
+    DB_QUERIES = Counter(
+        'bmp_db_queries_total', "Requêtes SQL exécutées, par route",
+        ['route'], registry=REGISTRY)
+    DB_QUERY_TIME = Counter(
+        'bmp_db_query_seconds_total', "Temps cumulé des requêtes SQL, par route",
+        ['route'], registry=REGISTRY)
+    DB_POOL_WAIT = Histogram(
+        'bmp_db_pool_wait_seconds', "Attente d'une connexion du pool",
+        registry=REGISTRY, buckets=(.0001, .001, .005, .01, .05, .1, .5, 1))
+    DB_POOL_SIZE = Gauge(
+        'bmp_db_pool_max_connections', "Taille maximale des pools",
+        registry=REGISTRY, multiprocess_mode='livesum')
+    DB_POOL_OPEN = Gauge(
+        'bmp_db_pool_open_connections', "Connexions ouvertes",
+        registry=REGISTRY, multiprocess_mode='livesum')
+    DB_POOL_IN_USE = Gauge(
+        'bmp_db_pool_in_use_connections', "Connexions empruntées",
+        registry=REGISTRY, multiprocess_mode='livesum')
+    CACHE_HITS = Gauge(
+        'bmp_cache_hits', "Succès cumulés des caches mémoire",
+        ['cache'], registry=REGISTRY, multiprocess_mode='livesum')
+    CACHE_MISSES = Gauge(
+        'bmp_cache_misses', "Échecs cumulés des caches mémoire",
+        ['cache'], registry=REGISTRY, multiprocess_mode='livesum')
+    CACHE_ENTRIES = Gauge(
+        'bmp_cache_entries', "Entrées des caches mémoire",
+        ['cache'], registry=REGISTRY, multiprocess_mode='livesum')
+    EXPORT_PENDING = Gauge(
+        'bmp_export_renders_pending', "Rendus de fiches en file (export ZIP)",
+        registry=REGISTRY, multiprocess_mode='livesum')
+    ADMISSION_ACTIVE = Gauge(
+        'bmp_admission_active', "Traitements lourds en cours, par classe",
+        ['classe'], registry=REGISTRY, multiprocess_mode='livesum')
+    ADMISSION_WAITING = Gauge(
+        'bmp_admission_waiting', "Traitements lourds en file d'attente, par classe",
+        ['classe'], registry=REGISTRY, multiprocess_mode='livesum')
+    PROCESS_RSS = Gauge(
+        'bmp_process_resident_memory_bytes', "Mémoire résidente du worker",
+        registry=REGISTRY, multiprocess_mode='all')
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+# ── Hooks ───────────────────────────────────────────────────────────────────
+
+def _on_db_event(event, duree, query):
+    if event == 'pool_wait':
+        DB_POOL_WAIT.observe(duree)
+        return
+    try:
+        m = g._metrics
+    except (AttributeError, RuntimeError):
+        return  # hors requête (préchauffage, migrations)
+    m['queries'] += 1
+    m['db_time'] += duree
+
+
+def _before():
+    g._metrics = {'debut': time.perf_counter(), 'queries': 0, 'db_time': 0.0}
+    HTTP_IN_FLIGHT.inc()
+
+
+def _after(response):
+    m = g.pop('_metrics', None)
+    if m is None:
+        return response
+    HTTP_IN_FLIGHT.dec()
+    route, method = _route_label(), request.method
+    HTTP_REQUESTS.labels(route, method, str(response.status_code)).inc()
+    HTTP_LATENCY.labels(route, method).observe(time.perf_counter() - m['debut'])
+    if m['queries']:
+        DB_QUERIES.labels(route).inc(m['queries'])
+        DB_QUERY_TIME.labels(route).inc(m['db_time'])
+    _refresh_gauges()
+    return response
+
+
+def _teardown(exc):
+    # Requête interrompue avant after_request : ne pas laisser la jauge gonflée
+    if g.pop('_metrics', None) is not None:
+        HTTP_IN_FLIGHT.dec()
+
+
+def _refresh_gauges():
+    """Jauges d'état du worker (pool, caches, exports, admission, mémoire)."""
+    pool = database_service.DatabaseService.pool_stats()
+    if pool:
+        DB_POOL_SIZE.set(pool['max'])
+        DB_POOL_OPEN.set(pool['open'])
+        DB_POOL_IN_USE.set(pool['in_use'])
+    for name, cache in all_caches().items():
+        st = cache.stats()
+        CACHE_HITS.labels(name).set(st['hits'])
+        CACHE_MISSES.labels(name).set(st['misses'])
+        CACHE_ENTRIES.labels(name).set(st['entries'])
+    from app.services.fiche_export_service import rendus_en_attente
+    EXPORT_PENDING.set(rendus_en_attente())
+    from app.services.admission_service import etat
+    for classe, (actifs, en_file) in etat().items():
+        ADMISSION_ACTIVE.labels(classe).set(actifs)
+        ADMISSION_WAITING.labels(classe).set(en_file)
+    PROCESS_RSS.set(_rss_bytes())
+
+
+def register_metrics(bp):
+    """Branche la collecte sur un blueprint (before/after_request)."""
+    if not ENABLED:
+        return
+    database_service.add_listener(_on_db_event)
+    bp.before_request(_before)
+    bp.after_request(_after)
+    bp.teardown_request(_teardown)
+
+
+# ── Exposition ──────────────────────────────────────────────────────────────
+
+def acces_interne():
+    """Vrai si la requête vient directement d'un réseau interne autorisé."""
+    if request.headers.get('X-Forwarded-For') or request.headers.get('X-Real-IP'):
+        return False
+    try:
+        addr = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(addr in net for net in METRICS_ALLOWED_NETS)
+
+
+def exposition():
+    """(corps, content_type) au format texte Prometheus."""
+    _refresh_gauges()
+    if MULTIPROC:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
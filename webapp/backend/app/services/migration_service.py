@@ -0,0 +1,334 @@
+# Migrations versionnées du schéma PostgreSQL (usage web)
+"""
+Fichiers numérotés dans webapp/backend/migrations/ :
+  - NNNN_nom.sql : instructions SQL séparées par ';'
+  - NNNN_nom.py  : module exposant upgrade(cur)
+
+Chaque migration appliquée est enregistrée dans schema_migrations avec la
+somme SHA-256 de son fichier. Une instruction en échec fait échouer la
+migration : sa transaction est annulée et elle n'est pas enregistrée.
+
+Étapes répétables R_nom.sql / R_nom.py (même format : recalage des
+séquences, compte admin de secours…) : exécutées après les migrations,
+chacune dans sa transaction, quand une migration vient d'être appliquée,
+quand l'étape est nouvelle ou modifiée (somme enregistrée dans
+schema_repetables), ou sur demande (python migrate.py --repetables).
+
+Un verrou consultatif PostgreSQL garantit qu'un seul processus migre à la
+fois ; si rien n'est à appliquer ni à relancer, une seule requête SELECT
+est exécutée.
+
+Lancement : python migrate.py  (avant le démarrage des workers Gunicorn)
+"""
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+import time
+
+import psycopg2
+import psycopg2.errors
+
+from app.services.database_service import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASS
+
+logger = logging.getLogger('migrations')
+
+MIGRATIONS_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..', 'migrations')
+)
+# Clé du verrou consultatif (pg_advisory_lock) réservée aux migrations
+LOCK_KEY = 5_100_001
+
+_FICHIER_RE = re.compile(r'^(\d{4})_([\w-]+)\.(sql|py)$')
+_REPETABLE_RE = re.compile(r'^R_([\w-]+)\.(sql|py)$')
+
+# Migrations corrigées après leur diffusion, sans rien à rejouer sur les bases
+# qui les ont déjà appliquées : somme d'origine encore acceptée.
+#   0010 : noms de séquences résolus par pg_get_serial_sequence()
+SOMMES_ACCEPTEES = {
+    10: {'0ded4df0f814cdbfd0965ca946da52a5c4c77d17ad4b078c1689b254c0a89bf8'},
+}
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration:
+    def __init__(self, version, nom, path):
+        self.version = version
+        self.nom = nom
+        self.path = path
+        with open(path, 'rb') as f:
+            self.contenu = f.read()
+        self.checksum = hashlib.sha256(self.contenu).hexdigest()
+
+    def __repr__(self):
+        if self.version is None:
+            return f"<Migration R_{self.nom}>"
+        return f"<Migration {self.version:04d} {self.nom}>"
+
+
+def lister_migrations(dossier=MIGRATIONS_DIR):
+    """Migrations du dossier, triées par numéro (numéros uniques)."""
+    migrations = []
+    for f in sorted(os.listdir(dossier)):
+        m = _FICHIER_RE.match(f)
+        if m:
+            migrations.append(Migration(int(m.group(1)), m.group(2), os.path.join(dossier, f)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError("Numéro de migration en double dans " + dossier)
+    return migrations
+
+
+def lister_repetables(dossier=MIGRATIONS_DIR):
+    """Étapes répétables du dossier (R_nom.sql|py), triées par nom."""
+    return [Migration(None, m.group(1), os.path.join(dossier, f))
+            for f in sorted(os.listdir(dossier))
+            for m in [_REPETABLE_RE.match(f)] if m]
+
+
+def decouper_sql(sql):
+    """
+    Découpe un script en instructions sur ';' en respectant les chaînes
+    ('…'), les blocs dollar-quotés ($$…$$, $tag$…$tag$) et les commentaires --.
+    """
+    instructions, courant = [], []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if c == '-' and sql.startswith('--', i):
+            j = sql.find('\n', i)
+            i = n if j < 0 else j + 1
+            courant.append('\n')
+            continue
+        if c == "'":
+            j = i + 1
+            while j < n:
+                if sql[j] == "'":
+                    if j + 1 < n and sql[j + 1] == "'":
+                        j += 2
+                        continue
+                    break
+                j += 1
+            courant.append(sql[i:j + 1])
+            i = j + 1
+            continue
+        if c == '$':
+            m = re.match(r'\$[A-Za-z_]*\$', sql[i:])
+            if m:
+                tag = m.group(0)
+                j = sql.find(tag, i + len(tag))
+                j = n if j < 0 else j + len(tag)
+                courant.append(sql[i:j])
+                i = j
+                continue
+        if c == ';':
+            stmt = ''.join(courant).strip()
+            if stmt:
+                instructions.append(stmt)
+            courant = []
+            i += 1
+            continue
+        courant.append(c)
+        i += 1
+    stmt = ''.join(courant).strip()
+    if stmt:
+        instructions.append(stmt)
+    return instructions
+
+
+def _connexion():
+    return psycopg2.connect(
+        host=DB_HOST, port=int(DB_PORT), dbname=DB_NAME,
+        user=DB_USER, password=DB_PASS, connect_timeout=10,
+    )
+
+
+def _appliquees(cur):
+    """({version: checksum} des migrations, {nom: checksum} des étapes répétables)."""
+    cur.execute(
+        "SELECT version, NULL, checksum FROM schema_migrations "
+        "UNION ALL SELECT NULL, nom, checksum FROM schema_repetables"
+    )
+    versions, repetables = {}, {}
+    for version, nom, checksum in cur.fetchall():
+        if version is None:
+            repetables[nom] = checksum
+        else:
+            versions[int(version)] = checksum
+    return versions, repetables
+
+
+def _verifier(migrations, appliquees):
+    """Retourne les migrations en attente ; erreur si un fichier appliqué a changé."""
+    en_attente = []
+    for m in migrations:
+        checksum = appliquees.get(m.version)
+        if checksum is None:
+            en_attente.append(m)
+        elif checksum != m.checksum and checksum not in SOMMES_ACCEPTEES.get(m.version, ()):
+            raise MigrationError(
+                f"Migration {m.version:04d}_{m.nom} modifiée après application "
+                f"(checksum {checksum[:12]}… ≠ {m.checksum[:12]}…)"
+            )
+    return en_attente
+
+
+def _executer(cur, m):
+    """Exécute le contenu d'une migration ; la première erreur est propagée."""
+    if m.path.endswith('.py'):
+        spec = importlib.util.spec_from_file_location(f"migration_{m.version or m.nom}", m.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(cur)
+    else:
+        for stmt in decouper_sql(m.contenu.decode('utf-8')):
+            cur.execute(stmt)
+
+
+def _appliquer(conn, m):
+    """Applique une migration dans sa propre transaction et l'enregistre."""
+    debut = time.monotonic()
+    with conn.cursor() as cur:
+        _executer(cur, m)
+        duree_ms = int((time.monotonic() - debut) * 1000)
+        cur.execute(
+            "INSERT INTO schema_migrations (version, nom, checksum, duree_ms) "
+            "VALUES (%s, %s, %s, %s)",
+            [m.version, m.nom, m.checksum, duree_ms]
+        )
+    conn.commit()
+    logger.info("Migration %04d_%s appliquée (%d ms)", m.version, m.nom, duree_ms)
+
+
+def _a_relancer(repetables, enregistrees, forcer):
+    """Étapes répétables nouvelles ou modifiées (toutes si forcer)."""
+    return [m for m in repetables if forcer or enregistrees.get(m.nom) != m.checksum]
+
+
+def _repeter(conn, m):
+    """Exécute une étape répétable dans sa propre transaction et enregistre sa somme."""
+    debut = time.monotonic()
+    with conn.cursor() as cur:
+        _executer(cur, m)
+        cur.execute(
+            "INSERT INTO schema_repetables (nom, checksum) VALUES (%s, %s) "
+            "ON CONFLICT (nom) DO UPDATE SET checksum = EXCLUDED.checksum, executee_le = NOW()",
+            [m.nom, m.checksum]
+        )
+    conn.commit()
+    logger.info("Étape R_%s exécutée (%d ms)", m.nom, int((time.monotonic() - debut) * 1000))
+
+
+def run_migrations(dossier=MIGRATIONS_DIR, conn=None, forcer_repetables=False):
+    """
+    Applique les migrations en attente puis les étapes répétables à relancer
+    (toutes si une migration a été appliquée ou si forcer_repetables).
+    Retourne le nombre de migrations appliquées. Lève MigrationError si une
+    migration déjà appliquée a été modifiée ou si une étape échoue.
+    """
+    migrations = lister_migrations(dossier)
+    repetables = lister_repetables(dossier)
+    propre = conn is None
+    conn = conn or _connexion()
+    try:
+        # ── Chemin rapide : un seul SELECT si tout est à jour ──────────────
+        try:
+            with conn.cursor() as cur:
+                appliquees, enregistrees = _appliquees(cur)
+            conn.rollback()
+            if (not _verifier(migrations, appliquees)
+                    and not _a_relancer(repetables, enregistrees, forcer_repetables)):
+                return 0
+        except psycopg2.errors.UndefinedTable:
+            conn.rollback()
+
+        # ── Chemin lent : verrou, puis re-lecture sous verrou ──────────────
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", [LOCK_KEY])
+        conn.commit()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version    INTEGER PRIMARY KEY,
+                        nom        VARCHAR(200) NOT NULL,
+                        checksum   CHAR(64) NOT NULL,
+                        duree_ms   INTEGER,
+                        applied_at TIMESTAMP DEFAULT NOW()
+                    )
+                """)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_repetables (
+                        nom         VARCHAR(200) PRIMARY KEY,
+                        checksum    CHAR(64) NOT NULL,
+                        executee_le TIMESTAMP DEFAULT NOW()
+                    )
+                """)
+                conn.commit()
+                appliquees, enregistrees = _appliquees(cur)
+                en_attente = _verifier(migrations, appliquees)
+            conn.commit()
+            for m in en_attente:
+                try:
+                    _appliquer(conn, m)
+                except Exception as e:
+                    conn.rollback()
+                    raise MigrationError(f"Migration {m.version:04d}_{m.nom} en échec : {e}") from e
+            for m in _a_relancer(repetables, enregistrees,
+                                     forcer_repetables or bool(en_attente)):
+                try:
+                    _repeter(conn, m)
+                except Exception as e:
+                    conn.rollback()
+                    raise MigrationError(f"Étape R_{m.nom} en échec : {e}") from e
+            return len(en_attente)
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", [LOCK_KEY])
+            conn.commit()
+    finally:
+        if propre:
+            conn.close()
+
+
+def statut(dossier=MIGRATIONS_DIR):
+    """
+    [(version, nom, état), …] : 'appliquée' | 'en attente' | 'modifiée' pour
+    les migrations, 'à jour' | 'à relancer' pour les étapes répétables
+    (version None).
+    """
+    migrations = lister_migrations(dossier)
+    conn = _connexion()
+    try:
+        with conn.cursor() as cur:
+            try:
+                appliquees, enregistrees = _appliquees(cur)
+            except psycopg2.errors.UndefinedTable:
+                # Base migrée avant schema_repetables (ou jamais migrée)
+                conn.rollback()
+                enregistrees = {}
+                try:
+                    cur.execute("SELECT version, checksum FROM schema_migrations")
+                    appliquees = {int(v): c for v, c in cur.fetchall()}
+                except psycopg2.errors.UndefinedTable:
+                    appliquees = {}
+    finally:
+        conn.close()
+    out = []
+    for m in migrations:
+        c = appliquees.get(m.version)
+        if c is None:
+            etat = 'en attente'
+        elif c == m.checksum or c in SOMMES_ACCEPTEES.get(m.version, ()):
+            etat = 'appliquée'
+        else:
+            etat = 'modifiée'
+        out.append((m.version, m.nom, etat))
+    repetables = lister_repetables(dossier)
+    a_relancer = {m.nom for m in _a_relancer(repetables, enregistrees, False)}
+    return out + [(None, m.nom, 'à relancer' if m.nom in a_relancer else 'à jour')
+                  for m in repetables]
@@ -0,0 +1,236 @@
+# Profilage à la demande des requêtes (usage web)
+"""
+Profileur statistique en pur Python : un thread échantillonne la pile du
+thread qui traite la requête toutes les PROFILE_INTERVAL_MS millisecondes.
+Résultat au format « collapsed stacks » (une ligne « f1;f2;f3 N » par pile),
+directement exploitable par flamegraph.pl ou speedscope, accompagné d'un
+relevé tracemalloc des allocations de la requête.
+
+Déclenchement :
+  - en-tête X-Profile: 1 (ou ?profile=1) envoyé par un administrateur ;
+  - échantillonnage aléatoire : PROFILE_SAMPLE_RATE (0 = désactivé, 0.01 = 1 %)
+    appliqué aux endpoints de PROFILE_SAMPLE_ENDPOINTS (vide = tous).
+
+Fichiers dans PROFILE_DIR (logs/profiles par défaut), consultables via
+/api/admin/profiles. Seuls les PROFILE_MAX_FILES profils les plus récents
+sont conservés.
+"""
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..', 'logs', 'profiles')
+)
+PROFILE_INTERVAL_MS  = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_SAMPLE_RATE  = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SAMPLE_ENDPOINTS = [
+    e.strip() for e in os.getenv(
+        'PROFILE_SAMPLE_ENDPOINTS', 'routes.export_budget,routes.parse_bc_pdf'
+    ).split(',') if e.strip()
+]
+PROFILE_MAX_FILES    = int(os.getenv('PROFILE_MAX_FILES', '200'))
+TRACEMALLOC_FRAMES   = 10
+TOP_ALLOCATIONS      = 30
+
+# Nom des fichiers : 20260101-120000_<pid>_<endpoint>_<declencheur>_<ms>ms.collapsed
+_NOM_RE = re.compile(
+    r'^(\d{8}-\d{6})_(\d+)_([\w.-]+)_(admin|echantillon)_(\d+)ms\.(collapsed|alloc\.txt)$'
+)
+
+# Un seul profil à la fois par processus (tracemalloc est global)
+_actif = threading.Lock()
+
+
+class Sampler:
+    """Échantillonne la pile d'un thread jusqu'à stop()."""
+
+    def __init__(self, thread_id, interval_ms=PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.piles = Counter()
+        self.echantillons = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.piles[_pile(frame)] += 1
+                self.echantillons += 1
+
+    def collapsed(self):
+        return ''.join(f"{pile} {n}\n" for pile, n in self.piles.most_common())
+
+
+def _pile(frame):
+    noms = []
+    while frame is not None:
+        code = frame.f_code
+        noms.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    # Racine à gauche ; ';' et espaces de fin sont réservés au format
+    return ';'.join(reversed(noms)).replace('\n', ' ')
+
+
+# ── Hooks ───────────────────────────────────────────────────────────────────
+
+def _declencheur(est_admin):
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    if flag == '1' and est_admin():
+        return 'admin'
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        if not PROFILE_SAMPLE_ENDPOINTS or request.endpoint in PROFILE_SAMPLE_ENDPOINTS:
+            return 'echantillon'
+    return None
+
+
+def _demarrer(declencheur):
+    if not _actif.acquire(blocking=False):
+        logger.info("Profil ignoré (%s) : un profil est déjà en cours", request.path)
+        return
+    deja_trace = tracemalloc.is_tracing()
+    if not deja_trace:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    g._profil = {
+        'declencheur': declencheur,
+        'debut':       time.perf_counter(),
+        'avant':       tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, __file__, all_frames=True)]),
+        'deja_trace':  deja_trace,
+        'sampler':     Sampler(threading.get_ident()).start(),
+    }
+
+
+def _terminer():
+    """Arrête le profil en cours ; retourne le nom du fichier écrit (ou None)."""
+    p = g.pop('_profil', None)
+    if p is None:
+        return None
+    try:
+        sampler = p['sampler'].stop()
+        duree_ms = int((time.perf_counter() - p['debut']) * 1000)
+        # Sans les allocations du profileur lui-même (thread d'échantillonnage)
+        apres = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, __file__, all_frames=True)])
+        pic = tracemalloc.get_traced_memory()[1]
+        if not p['deja_trace']:
+            tracemalloc.stop()
+        return _ecrire(sampler, apres.compare_to(p['avant'], 'traceback'), pic,
+                       p['declencheur'], duree_ms)
+    except Exception as e:
+        logger.warning("Profil non enregistré : %s", e)
+        return None
+    finally:
+        _actif.release()
+
+
+def _ecrire(sampler, diffs, pic, declencheur, duree_ms):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = re.sub(r'[^\w.-]', '-', request.endpoint or 'inconnu')
+    base = (f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{endpoint}"
+            f"_{declencheur}_{duree_ms}ms")
+    with open(os.path.join(PROFILE_DIR, base + '.collapsed'), 'w', encoding='utf-8') as f:
+        f.write(sampler.collapsed())
+
+    lignes = [
+        f"{request.method} {request.full_path.rstrip('?')}",
+        f"durée {duree_ms} ms, {sampler.echantillons} échantillon(s) "
+        f"à {sampler.interval * 1000:g} ms, pic mémoire tracé {pic / 1024:.0f} Kio",
+        "",
+        f"Allocations nettes (top {TOP_ALLOCATIONS}) :",
+    ]
+    for d in diffs[:TOP_ALLOCATIONS]:
+        lignes.append(f"{d.size_diff / 1024:+10.1f} Kio  {d.count_diff:+7d} blocs")
+        lignes.extend(f"      {l}" for l in d.traceback.format())
+    with open(os.path.join(PROFILE_DIR, base + '.alloc.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lignes) + '\n')
+
+    _purger()
+    logger.info("Profil %s enregistré (%d échantillons)", base, sampler.echantillons)
+    return base + '.collapsed'
+
+
+def _purger():
+    profils = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith('.collapsed'))
+    for f in profils[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else []:
+        for nom in (f, f[:-len('.collapsed')] + '.alloc.txt'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, nom))
+            except OSError:
+                pass
+
+
+def register_profiling(bp, est_admin):
+    """
+    Branche le profilage sur un blueprint. est_admin() indique si la requête
+    en cours porte un jeton administrateur (appelé seulement si X-Profile est présent).
+    """
+    def _before():
+        declencheur = _declencheur(est_admin)
+        if declencheur:
+            _demarrer(declencheur)
+
+    def _after(response):
+        nom = _terminer()
+        if nom:
+            response.headers['X-Profile-Id'] = nom
+        return response
+
+    def _teardown(exc):
+        if g.get('_profil') is not None:
+            _terminer()
+
+    bp.before_request(_before)
+    bp.after_request(_after)
+    bp.teardown_request(_teardown)
+
+
+# ── Consultation ────────────────────────────────────────────────────────────
+
+def lister():
+    """Profils enregistrés, du plus récent au plus ancien."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    out = []
+    for f in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        m = _NOM_RE.match(f)
+        if not m or m.group(6) != 'collapsed':
+            continue
+        alloc = f[:-len('.collapsed')] + '.alloc.txt'
+        out.append({
+            'nom':         f,
+            'allocations': alloc if os.path.exists(os.path.join(PROFILE_DIR, alloc)) else None,
+            'date':        time.strftime('%Y-%m-%dT%H:%M:%S',
+                                         time.strptime(m.group(1), '%Y%m%d-%H%M%S')),
+            'pid':         int(m.group(2)),
+            'endpoint':    m.group(3),
+            'declencheur': m.group(4),
+            'duree_ms':    int(m.group(5)),
+            'taille':      os.path.getsize(os.path.join(PROFILE_DIR, f)),
+        })
+    return out
+
+
+def nom_valide(nom):
+    return bool(_NOM_RE.match(nom or ''))
@@ -1,6 +1,9 @@
 import logging
+from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
 from app.services.database_service import DatabaseService
+from app.services.etag_service import empreinte, horodatage, version_sql
+from app.services.fields_service import Projection
 
 
 def _dec(v):
@@ -10,20 +13,105 @@ def _dec(v):
     except InvalidOperation:
         return Decimal(0)
 
+
+def _types_imbriques(lignes, dates=(), instants=(), nombres=()):
+    """
+    Lignes agrégées par json_agg ramenées aux types d'une requête directe
+    (date, datetime, Decimal) : la réponse JSON et le rendu des fiches restent
+    ceux de l'ancien chargement en plusieurs requêtes. Les colonnes NUMERIC et
+    horodatées sont agrégées en texte (::text, to_char) pour ne rien perdre.
+    """
+    for ligne in lignes:
+        for k in dates:
+            if ligne.get(k) is not None:
+                ligne[k] = date.fromisoformat(ligne[k])
+        for k in instants:
+            if ligne.get(k) is not None:
+                ligne[k] = datetime.fromisoformat(ligne[k])
+        for k in nombres:
+            if ligne.get(k) is not None:
+                ligne[k] = Decimal(ligne[k])
+    return lignes
+
+
+# Nom affiché d'un membre d'équipe ; sans la colonne membre_label (base
+# antérieure à la migration 0003), nom de l'utilisateur seul
+_MEMBRE_NOM = "COALESCE(pe.membre_label, TRIM(COALESCE(u.prenom,'') || ' ' || COALESCE(u.nom,'')))"
+_MEMBRE_NOM_SANS_LABEL = "TRIM(COALESCE(u.prenom,'') || ' ' || COALESCE(u.nom,''))"
+_INSTANT = 'YYYY-MM-DD"T"HH24:MI:SS.US'
+
 logger = logging.getLogger(__name__)
 
+# Liste des projets (GET /projet, ?fields=) : les textes longs de la fiche
+# (description, objectifs, risques…) ne sont lus que sur demande.
+LISTE = Projection(
+    'p',
+    colonnes=('id', 'code', 'nom', 'description', 'type_projet', 'phase', 'statut', 'priorite',
+              'statut_rag', 'service_id', 'date_debut', 'date_fin_prevue', 'date_fin_reelle',
+              'budget_initial', 'budget_estime', 'budget_actuel', 'avancement',
+              'chef_projet_contact_id', 'responsable_contact_id', 'objectifs', 'enjeux',
+              'gains', 'risques', 'contraintes', 'solutions', 'financement',
+              'registre_risques', 'contraintes_6axes', 'triangle_tensions', 'arbitrage',
+              'note', 'created_by_id', 'date_creation', 'updated_at'),
+    calculees={
+        'service_nom':  's.nom',
+        'service_code': 's.code',
+    },
+    defaut=('id', 'code', 'nom', 'type_projet', 'phase', 'statut', 'priorite', 'statut_rag',
+            'service_id', 'service_nom', 'service_code', 'date_debut', 'date_fin_prevue',
+            'date_fin_reelle', 'budget_initial', 'budget_estime', 'budget_actuel',
+            'avancement', 'chef_projet_contact_id', 'responsable_contact_id',
+            'created_by_id', 'date_creation', 'updated_at'),
+)
+LISTE_FROM = (
+    "FROM projets p "
+    "LEFT JOIN services s ON s.id = p.service_id "
+)
+
+# Version de la fiche (GET /projet/<id>, ETag) : projet, service, contacts
+# responsable / chef de projet et listes agrégées par get_by_id
+VERSION = version_sql(
+    horodatage('p.updated_at'),
+    empreinte(horodatage('s.date_maj'), "services s WHERE s.id = p.service_id"),
+    empreinte(horodatage('c.date_maj'),
+              "contacts c WHERE c.id IN (p.responsable_contact_id, p.chef_projet_contact_id)"),
+    empreinte(horodatage('t.updated_at'), "taches t WHERE t.projet_id = p.id"),
+    empreinte(f"{horodatage('bc.date_maj')} + {horodatage('f.date_maj')}",
+              "bons_commande bc LEFT JOIN fournisseurs f ON f.id = bc.fournisseur_id "
+              "WHERE bc.projet_id = p.id"),
+    empreinte(f"pe.id + {horodatage('u.date_maj')}",
+              "projet_equipe pe LEFT JOIN utilisateurs u ON u.id = pe.utilisateur_id "
+              "WHERE pe.projet_id = p.id"),
+    empreinte(f"pp.id + {horodatage('f.date_maj')}",
+              "projet_prestataires pp LEFT JOIN fournisseurs f ON f.id = pp.fournisseur_id "
+              "WHERE pp.projet_id = p.id"),
+    empreinte(f"pc.id + {horodatage('c.date_maj')}",
+              "projet_contacts pc LEFT JOIN contacts c ON c.id = pc.contact_id "
+              "WHERE pc.projet_id = p.id"),
+    empreinte('d.id', "projet_documents d WHERE d.projet_id = p.id"),
+)
+
+
 class ProjetService:
     def __init__(self):
         self.db = DatabaseService()
 
-    def get_all(self, filters=None):
+    def version(self, projet_id, acces='true', params=()):
+        """
+        Sonde de version de la fiche (etag_service) : {'version', 'autorise'},
+        None si la ligne n'existe pas. acces : condition SQL sur p.
+        """
+        return self.db.fetch_one(
+            f"SELECT {VERSION} AS version, COALESCE(({acces}), false) AS autorise "
+            "FROM projets p WHERE p.id = %s",
+            list(params) + [projet_id]
+        )
+
+    def get_all(self, filters=None, champs=None):
+        """champs : projection LISTE (None = enregistrement complet)."""
         try:
-            query = (
-                "SELECT p.*, s.nom as service_nom, s.code as service_code "
-                "FROM projets p "
-                "LEFT JOIN services s ON s.id = p.service_id "
-                "WHERE 1=1"
-            )
+            cols = LISTE.select(champs) if champs else LISTE.tout()
+            query = f"SELECT {cols} {LISTE_FROM}WHERE 1=1"
             params = []
             if filters:
                 if filters.get('statut'):
@@ -37,130 +125,128 @@ class ProjetService:
             return []
 
     def get_by_id(self, projet_id):
+        """
+        Détail complet du projet en un seul aller-retour : les listes liées sont
+        agrégées en JSON (json_agg) et les statistiques calculées côté SQL.
+        """
         try:
-            row = self.db.fetch_one(
-                "SELECT p.*, s.nom as service_nom, s.code as service_code "
-                "FROM projets p "
-                "LEFT JOIN services s ON s.id = p.service_id "
-                "WHERE p.id = %s",
-                [projet_id]
-            )
+            try:
+                row = self._detail(projet_id, _MEMBRE_NOM)
+            except Exception as e:
+                if 'membre_label' not in str(e):
+                    raise
+                row = self._detail(projet_id, _MEMBRE_NOM_SANS_LABEL)
             if not row:
                 return None
             p = dict(row)
-            taches = self.db.fetch_all(
-                "SELECT id, titre, statut, priorite, date_echeance, "
-                "estimation_heures, heures_reelles, avancement FROM taches WHERE projet_id=%s "
-                "ORDER BY date_echeance ASC NULLS LAST",
-                [projet_id]
-            )
-            p['taches'] = [dict(t) for t in taches] if taches else []
-            # Stats tâches par statut
-            stats_taches = {}
-            for t in p['taches']:
-                s = t.get('statut', 'Inconnu')
-                stats_taches[s] = stats_taches.get(s, 0) + 1
-            p['taches_stats'] = stats_taches
-            p['heures_estimees'] = float(sum(_dec(t.get('estimation_heures')) for t in p['taches']))
-            p['heures_reelles']  = float(sum(_dec(t.get('heures_reelles'))  for t in p['taches']))
-            bcs = self.db.fetch_all(
-                "SELECT bc.id, bc.numero_bc, bc.objet, bc.montant_ht, bc.montant_ttc, "
-                "bc.statut, bc.date_creation, f.nom as fournisseur_nom "
-                "FROM bons_commande bc "
-                "LEFT JOIN fournisseurs f ON f.id = bc.fournisseur_id "
-                "WHERE bc.projet_id=%s ORDER BY bc.id DESC",
-                [projet_id]
-            )
-            p['bons_commande'] = [dict(b) for b in bcs] if bcs else []
-            # Budget consommé calculé depuis les BCs (IMPUTE + SOLDE + VALIDE)
-            # Utilisation de Decimal pour éviter les erreurs d'arrondi float
-            bc_consomme = sum(
-                _dec(b.get('montant_ttc'))
-                for b in p['bons_commande']
-                if b.get('statut') in ('IMPUTE', 'SOLDE', 'VALIDE')
-            )
-            p['budget_consomme_calcule'] = float(round(bc_consomme, 2))
-            p['montant_bc_total'] = float(round(
-                sum(_dec(b.get('montant_ttc')) for b in p['bons_commande']), 2
-            ))
-
-            # ── Équipe : membres (projet_equipe → utilisateurs) ─────────────
-            try:
-                membres = self.db.fetch_all(
-                    "SELECT pe.id as membre_id, "
-                    "  COALESCE(pe.membre_label, TRIM(COALESCE(u.prenom,'') || ' ' || COALESCE(u.nom,''))) as nom_complet, "
-                    "  COALESCE(u.email, '') as email, "
-                    "  COALESCE(u.fonction, '') as fonction, "
-                    "  COALESCE(u.telephone, '') as telephone "
-                    "FROM projet_equipe pe "
-                    "LEFT JOIN utilisateurs u ON u.id = pe.utilisateur_id "
-                    "WHERE pe.projet_id = %s",
-                    [projet_id]
-                )
-            except Exception:
-                membres = self.db.fetch_all(
-                    "SELECT pe.id as membre_id, "
-                    "  TRIM(COALESCE(u.prenom,'') || ' ' || COALESCE(u.nom,'')) as nom_complet, "
-                    "  COALESCE(u.email, '') as email, "
-                    "  COALESCE(u.fonction, '') as fonction, "
-                    "  COALESCE(u.telephone, '') as telephone "
-                    "FROM projet_equipe pe "
-                    "LEFT JOIN utilisateurs u ON u.id = pe.utilisateur_id "
-                    "WHERE pe.projet_id = %s",
-                    [projet_id]
-                )
-            p['equipe'] = [dict(m) for m in membres] if membres else []
-
-            # ── Prestataires ────────────────────────────────────────────────
-            prest = self.db.fetch_all(
-                "SELECT f.nom as fournisseur_nom, f.email, f.telephone, f.contact_principal "
-                "FROM projet_prestataires pp "
-                "JOIN fournisseurs f ON f.id = pp.fournisseur_id "
-                "WHERE pp.projet_id = %s",
-                [projet_id]
-            )
-            p['prestataires'] = [dict(pr) for pr in prest] if prest else []
-
-            # ── Contacts externes (projet_contacts) ─────────────────────────
-            contacts_ext = self.db.fetch_all(
-                "SELECT pc.contact_id, pc.role, "
-                "  COALESCE(pc.contact_libre, TRIM(COALESCE(c.prenom,'') || ' ' || COALESCE(c.nom,''))) as nom_affiche, "
-                "  COALESCE(c.nom,'') as nom, COALESCE(c.prenom,'') as prenom, "
-                "  COALESCE(c.email,'') as email, COALESCE(c.telephone,'') as telephone, "
-                "  COALESCE(c.organisation,'') as organisation "
-                "FROM projet_contacts pc "
-                "LEFT JOIN contacts c ON c.id = pc.contact_id "
-                "WHERE pc.projet_id = %s",
-                [projet_id]
-            )
-            p['contacts_externes'] = [dict(ce) for ce in contacts_ext] if contacts_ext else []
-
-            # ── Documents ──────────────────────────────────────────────────
-            docs = self.db.fetch_all(
-                "SELECT nom_fichier, type_document, taille, date_ajout "
-                "FROM projet_documents WHERE projet_id = %s ORDER BY date_ajout DESC",
-                [projet_id]
-            )
-            p['documents'] = [dict(d) for d in docs] if docs else []
-
-            # ── Responsable / Chef projet ──────────────────────────────────
-            for role, col in [('responsable_nom', 'responsable_contact_id'),
-                               ('chef_projet_nom', 'chef_projet_contact_id')]:
-                cid = p.get(col)
-                if cid:
-                    cr = self.db.fetch_one(
-                        "SELECT nom, prenom, email, telephone FROM contacts WHERE id = %s", [cid]
-                    )
-                    if cr:
-                        p[role] = f"{cr.get('prenom') or ''} {cr.get('nom') or ''}".strip()
-                        p[role + '_email'] = cr.get('email')
-                        p[role + '_tel']   = cr.get('telephone')
-
+            _types_imbriques(p['taches'], dates=('date_echeance',),
+                             nombres=('estimation_heures', 'heures_reelles'))
+            _types_imbriques(p['bons_commande'], instants=('date_creation',),
+                             nombres=('montant_ht', 'montant_ttc'))
+            _types_imbriques(p['documents'], instants=('date_ajout',))
+            p['heures_estimees'] = float(_dec(p.get('heures_estimees')))
+            p['heures_reelles']  = float(_dec(p.get('heures_reelles')))
+            p['budget_consomme_calcule'] = float(_dec(p.get('budget_consomme_calcule')))
+            p['montant_bc_total']        = float(_dec(p.get('montant_bc_total')))
+            # Responsable / chef de projet : clés absentes si pas de contact lié
+            for role in ('responsable_nom', 'chef_projet_nom'):
+                if p.get(role) is None:
+                    for k in (role, role + '_email', role + '_tel'):
+                        p.pop(k, None)
             return p
         except Exception as e:
             logger.error(f"Erreur get_by_id projet {projet_id}: {e}")
             return None
 
+    def _detail(self, projet_id, nom_membre):
+        return self.db.fetch_one(
+            "SELECT p.*, s.nom as service_nom, s.code as service_code, "
+            "  COALESCE(tx.taches, '[]') AS taches, "
+            "  COALESCE(ts.taches_stats, '{}') AS taches_stats, "
+            "  tx.heures_estimees, tx.heures_reelles, "
+            "  COALESCE(bx.bons_commande, '[]') AS bons_commande, "
+            "  bx.budget_consomme_calcule, bx.montant_bc_total, "
+            "  COALESCE(eq.equipe, '[]') AS equipe, "
+            "  COALESCE(pr.prestataires, '[]') AS prestataires, "
+            "  COALESCE(ce.contacts_externes, '[]') AS contacts_externes, "
+            "  COALESCE(dx.documents, '[]') AS documents, "
+            "  NULLIF(TRIM(COALESCE(cr.prenom,'') || ' ' || COALESCE(cr.nom,'')), '') AS responsable_nom, "
+            "  cr.email AS responsable_nom_email, cr.telephone AS responsable_nom_tel, "
+            "  NULLIF(TRIM(COALESCE(cc.prenom,'') || ' ' || COALESCE(cc.nom,'')), '') AS chef_projet_nom, "
+            "  cc.email AS chef_projet_nom_email, cc.telephone AS chef_projet_nom_tel "
+            "FROM projets p "
+            "LEFT JOIN services s ON s.id = p.service_id "
+            "LEFT JOIN contacts cr ON cr.id = p.responsable_contact_id "
+            "LEFT JOIN contacts cc ON cc.id = p.chef_projet_contact_id "
+            # ── Tâches + heures ─────────────────────────────────────────
+            "LEFT JOIN LATERAL ( "
+            "  SELECT json_agg(t ORDER BY t.date_echeance ASC NULLS LAST) AS taches, "
+            "    COALESCE(SUM(t.estimation_heures::numeric), 0) AS heures_estimees, "
+            "    COALESCE(SUM(t.heures_reelles::numeric), 0) AS heures_reelles "
+            "  FROM (SELECT id, titre, statut, priorite, date_echeance, "
+            "          estimation_heures::text, heures_reelles::text, avancement "
+            "        FROM taches WHERE projet_id = p.id) t "
+            ") tx ON true "
+            "LEFT JOIN LATERAL ( "
+            "  SELECT json_object_agg(x.statut, x.n) AS taches_stats "
+            "  FROM (SELECT COALESCE(statut, 'Inconnu') AS statut, COUNT(*) AS n "
+            "        FROM taches WHERE projet_id = p.id GROUP BY 1) x "
+            ") ts ON true "
+            # ── Bons de commande + budget consommé (IMPUTE + SOLDE + VALIDE) ─
+            "LEFT JOIN LATERAL ( "
+            "  SELECT json_agg(b ORDER BY b.id DESC) AS bons_commande, "
+            "    ROUND(COALESCE(SUM(b.montant_ttc::numeric) FILTER ("
+            "      WHERE b.statut IN ('IMPUTE', 'SOLDE', 'VALIDE')), 0), 2) AS budget_consomme_calcule, "
+            "    ROUND(COALESCE(SUM(b.montant_ttc::numeric), 0), 2) AS montant_bc_total "
+            "  FROM (SELECT bc.id, bc.numero_bc, bc.objet, bc.montant_ht::text, bc.montant_ttc::text, "
+            f"          bc.statut, to_char(bc.date_creation, '{_INSTANT}') AS date_creation, "
+            "          f.nom as fournisseur_nom "
+            "        FROM bons_commande bc "
+            "        LEFT JOIN fournisseurs f ON f.id = bc.fournisseur_id "
+            "        WHERE bc.projet_id = p.id) b "
+            ") bx ON true "
+            # ── Équipe : membres (projet_equipe → utilisateurs) ─────────
+            "LEFT JOIN LATERAL ( "
+            "  SELECT json_agg(m) AS equipe FROM ( "
+            "    SELECT pe.id as membre_id, "
+            f"      {nom_membre} as nom_complet, "
+            "      COALESCE(u.email, '') as email, "
+            "      COALESCE(u.fonction, '') as fonction, "
+            "      COALESCE(u.telephone, '') as telephone "
+            "    FROM projet_equipe pe "
+            "    LEFT JOIN utilisateurs u ON u.id = pe.utilisateur_id "
+            "    WHERE pe.projet_id = p.id) m "
+            ") eq ON true "
+            # ── Prestataires ────────────────────────────────────────────
+            "LEFT JOIN LATERAL ( "
+            "  SELECT json_agg(x) AS prestataires FROM ( "
+            "    SELECT f.nom as fournisseur_nom, f.email, f.telephone, f.contact_principal "
+            "    FROM projet_prestataires pp "
+            "    JOIN fournisseurs f ON f.id = pp.fournisseur_id "
+            "    WHERE pp.projet_id = p.id) x "
+            ") pr ON true "
+            # ── Contacts externes (projet_contacts) ─────────────────────
+            "LEFT JOIN LATERAL ( "
+            "  SELECT json_agg(x) AS contacts_externes FROM ( "
+            "    SELECT pc.contact_id, pc.role, "
+            "      COALESCE(pc.contact_libre, TRIM(COALESCE(c.prenom,'') || ' ' || COALESCE(c.nom,''))) as nom_affiche, "
+            "      COALESCE(c.nom,'') as nom, COALESCE(c.prenom,'') as prenom, "
+            "      COALESCE(c.email,'') as email, COALESCE(c.telephone,'') as telephone, "
+            "      COALESCE(c.organisation,'') as organisation "
+            "    FROM projet_contacts pc "
+            "    LEFT JOIN contacts c ON c.id = pc.contact_id "
+            "    WHERE pc.projet_id = p.id) x "
+            ") ce ON true "
+            # ── Documents ───────────────────────────────────────────────
+            "LEFT JOIN LATERAL ( "
+            "  SELECT json_agg(d ORDER BY d.date_ajout DESC) AS documents FROM ( "
+            f"    SELECT nom_fichier, type_document, taille, to_char(date_ajout, '{_INSTANT}') AS date_ajout "
+            "    FROM projet_documents WHERE projet_id = p.id) d "
+            ") dx ON true "
+            "WHERE p.id = %s",
+            [projet_id]
+        )
+
     def add_equipe_membre(self, projet_id, utilisateur_id=None, membre_label=None):
         self.db.execute(
             "INSERT INTO projet_equipe (projet_id, utilisateur_id, membre_label) VALUES (%s, %s, %s)",
@@ -1,6 +1,7 @@
 # Service organigramme (services) pour usage web
 import logging
 from app.services.database_service import DatabaseService
+from app.services.cache_service import get_cache
 
 def _d(row):
     if row is None:
@@ -9,6 +10,24 @@ def _d(row):
 
 logger = logging.getLogger(__name__)
 
+# Comptes propres par service (une agrégation par table, pas de sous-requête
+# par ligne) : CTE à placer après WITH
+_COMPTES = (
+    "nb_projets AS (SELECT service_id, COUNT(*) AS n FROM projets GROUP BY service_id), "
+    "nb_membres AS (SELECT service_id, COUNT(*) AS n FROM utilisateurs "
+    "  WHERE actif = true GROUP BY service_id), "
+    "nb_taches AS (SELECT p.service_id, COUNT(*) AS n FROM taches t "
+    "  JOIN projets p ON p.id = t.projet_id "
+    "  WHERE t.statut NOT IN ('Terminé', 'Annulé') GROUP BY p.service_id), "
+    "engage AS (SELECT p.service_id, SUM(b.montant_ttc) AS m FROM bons_commande b "
+    "  JOIN projets p ON p.id = b.projet_id "
+    "  WHERE b.statut IN ('IMPUTE', 'SOLDE', 'VALIDE') GROUP BY p.service_id)"
+)
+
+# Arbres calculés, par racine : valides jusqu'au prochain changement de
+# l'organisation ou des données comptées (arbre_version)
+_arbre_cache = get_cache('services_arbre', max_entries=32)
+
 
 class ServiceOrgService:
     def __init__(self):
@@ -17,14 +36,17 @@ class ServiceOrgService:
     def get_all(self):
         try:
             rows = self.db.fetch_all(
+                "WITH " + _COMPTES + " "
                 "SELECT s.*, "
                 "c.nom || ' ' || c.prenom as responsable_nom, "
                 "p.nom as parent_nom, "
-                "(SELECT COUNT(*) FROM projets pr WHERE pr.service_id = s.id) as nb_projets, "
-                "(SELECT COUNT(*) FROM utilisateurs u WHERE u.service_id = s.id AND u.actif = true) as nb_membres "
+                "COALESCE(np.n, 0) as nb_projets, "
+                "COALESCE(nm.n, 0) as nb_membres "
                 "FROM services s "
                 "LEFT JOIN contacts c ON c.id = s.responsable_id "
                 "LEFT JOIN services p ON p.id = s.parent_id "
+                "LEFT JOIN nb_projets np ON np.service_id = s.id "
+                "LEFT JOIN nb_membres nm ON nm.service_id = s.id "
                 "ORDER BY s.parent_id NULLS FIRST, s.code"
             )
             return [_d(r) for r in rows] if rows else []
@@ -32,6 +54,98 @@ class ServiceOrgService:
             logger.warning(f"Erreur services: {ex}")
             return []
 
+    def arbre_version(self):
+        """
+        Jeton de version de l'arbre : services (ajout, modification,
+        suppression), rattachement des membres actifs, projets, tâches et BC
+        (horodatages par trigger, suppressions : deleted_rows).
+        """
+        row = self.db.fetch_one(
+            "SELECT (SELECT COUNT(*) || '/' || COALESCE(MAX(date_maj)::text, '') FROM services) AS org, "
+            "(SELECT md5(COALESCE(string_agg(id || ':' || COALESCE(service_id, 0), ',' ORDER BY id), '')) "
+            " FROM utilisateurs WHERE actif = true) AS membres, "
+            "(SELECT MAX(updated_at) FROM projets) AS projets, "
+            "(SELECT MAX(updated_at) FROM taches) AS taches, "
+            "(SELECT MAX(date_maj) FROM bons_commande) AS bc, "
+            "(SELECT MAX(id) FROM deleted_rows) AS suppressions"
+        )
+        if not row:
+            return None
+        return tuple(str(v) for v in dict(row).values())
+
+    def get_arbre(self, racine=None):
+        """
+        Arbre de l'organisation (racine : sous-arbre d'un service, ex. les
+        unités d'une direction), ou None si la racine n'existe pas.
+
+        Une requête WITH RECURSIVE sur services.parent_id donne le chemin de
+        chaque service depuis la racine ; les comptes propres de chaque
+        service (projets, membres actifs, tâches ouvertes, montant engagé des
+        BC validés / imputés / soldés) sont cumulés sur chacun de ses
+        ancêtres (unnest du chemin) dans la même requête. Cycle dans
+        parent_id : le service déjà rencontré n'est pas repris.
+        """
+        version = self.arbre_version()
+        cached = _arbre_cache.get(racine, version)
+        if cached is not None:
+            return cached
+
+        rows = self.db.fetch_all(
+            "WITH RECURSIVE arbre AS ( "
+            "  SELECT s.id, 0 AS niveau, ARRAY[s.id] AS chemin FROM services s "
+            "  WHERE " + ("s.id = %s" if racine else "s.parent_id IS NULL") + " "
+            "  UNION ALL "
+            "  SELECT s.id, a.niveau + 1, a.chemin || s.id FROM services s "
+            "  JOIN arbre a ON s.parent_id = a.id "
+            "  WHERE s.id <> ALL(a.chemin) "
+            "), " + _COMPTES + ", "
+            "propres AS ( "
+            "  SELECT a.id, a.chemin, COALESCE(np.n, 0) AS nb_projets, COALESCE(nm.n, 0) AS nb_membres, "
+            "    COALESCE(nt.n, 0) AS nb_taches_ouvertes, COALESCE(e.m, 0) AS montant_engage "
+            "  FROM arbre a "
+            "  LEFT JOIN nb_projets np ON np.service_id = a.id "
+            "  LEFT JOIN nb_membres nm ON nm.service_id = a.id "
+            "  LEFT JOIN nb_taches nt ON nt.service_id = a.id "
+            "  LEFT JOIN engage e ON e.service_id = a.id "
+            "), "
+            "cumuls AS ( "
+            "  SELECT x.id, SUM(p.nb_projets)::int AS nb_projets, SUM(p.nb_membres)::int AS nb_membres, "
+            "    SUM(p.nb_taches_ouvertes)::int AS nb_taches_ouvertes, SUM(p.montant_engage) AS montant_engage, "
+            "    (COUNT(*) - 1)::int AS nb_descendants "
+            "  FROM propres p CROSS JOIN LATERAL unnest(p.chemin) AS x(id) "
+            "  GROUP BY x.id "
+            ") "
+            "SELECT s.id, s.code, s.nom, s.parent_id, s.is_direction, s.is_unite, "
+            "s.nb_personnes, c.nom || ' ' || c.prenom AS responsable_nom, a.niveau, "
+            "p.nb_projets, p.nb_membres, p.nb_taches_ouvertes, p.montant_engage, "
+            "k.nb_projets AS total_projets, k.nb_membres AS total_membres, "
+            "k.nb_taches_ouvertes AS total_taches_ouvertes, k.montant_engage AS total_engage, "
+            "k.nb_descendants "
+            "FROM arbre a "
+            "JOIN services s ON s.id = a.id "
+            "JOIN propres p ON p.id = a.id "
+            "JOIN cumuls k ON k.id = a.id "
+            "LEFT JOIN contacts c ON c.id = s.responsable_id "
+            "ORDER BY a.niveau, s.code NULLS LAST, s.nom",
+            [racine] if racine else []
+        ) or []
+        if racine and not rows:
+            return None
+
+        noeuds = {}
+        arbre = []
+        for r in rows:
+            n = _d(r)
+            for k in ('montant_engage', 'total_engage'):
+                n[k] = float(n[k] or 0)
+            n['enfants'] = []
+            noeuds[n['id']] = n
+            parent = noeuds.get(n['parent_id']) if n['niveau'] else None
+            (parent['enfants'] if parent else arbre).append(n)
+        result = {'count': len(rows), 'arbre': arbre}
+        _arbre_cache.set(racine, version, result)
+        return result
+
     def get_membres(self, service_id):
         try:
             rows = self.db.fetch_all(
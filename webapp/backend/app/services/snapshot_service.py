@@ -0,0 +1,353 @@
+# Instantanés en colonnes (Parquet) pour l'analyse hors base
+"""
+Export complet des tables financières et projets en fichiers Parquet,
+partitionnés par exercice (arborescence Hive), pour les analyses
+pluriannuelles hors de la base de production (DuckDB, pandas, Power BI) :
+
+    <SNAPSHOT_DIR>/<AAAAMMJJ-HHMMSS>/
+        manifest.json
+        bons_commande/exercice=2025/part-0.parquet
+        …
+
+    -- DuckDB
+    SELECT exercice, statut, SUM(montant_ttc)
+    FROM read_parquet('<instantané>/bons_commande/*/*.parquet', hive_partitioning = true)
+    GROUP BY ALL;
+
+Lancement planifié (cron, timer systemd, CronJob) : `python snapshot.py`.
+Téléchargement : GET /api/admin/snapshots (routes admin).
+
+Lecture en une transaction REPEATABLE READ READ ONLY (tables cohérentes
+entre elles), par curseurs côté serveur (SNAPSHOT_BATCH lignes par FETCH) :
+mémoire bornée quel que soit le volume. Colonnes typées d'après les types
+PostgreSQL ; statuts, natures et autres colonnes à faible cardinalité en
+dictionnaire Arrow (catégories), encodage dictionnaire Parquet pour toutes
+les colonnes. Écriture dans un répertoire temporaire renommé à la fin :
+un instantané listé est toujours complet. Les SNAPSHOT_KEEP plus récents
+sont conservés.
+
+Exercice d'une ligne : colonne exercice du budget (budgets, lignes, BC
+imputés), sinon année de la date de début ou de création ; 0 si inconnu.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+
+from app.services.database_service import DatabaseService
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR       = os.getenv('SNAPSHOT_DIR') or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'snapshots'))
+SNAPSHOT_KEEP      = int(os.getenv('SNAPSHOT_KEEP', '7'))
+SNAPSHOT_BATCH     = int(os.getenv('SNAPSHOT_BATCH', '10000'))       # lignes par FETCH
+SNAPSHOT_ROW_GROUP = int(os.getenv('SNAPSHOT_ROW_GROUP', '100000'))  # lignes par row group
+
+_NOM = re.compile(r'^\d{8}-\d{6}$')
+_PARTITION = '_exercice'
+
+# Table → (requête, colonnes en dictionnaire). La requête expose l'exercice
+# de partition sous _exercice.
+TABLES = {
+    'budgets_annuels': (
+        "SELECT b.*, b.exercice AS _exercice FROM budgets_annuels b",
+        ('nature', 'statut'),
+    ),
+    'lignes_budgetaires': (
+        "SELECT l.*, COALESCE(ba.exercice, EXTRACT(YEAR FROM l.date_creation)::int, 0) AS _exercice "
+        "FROM lignes_budgetaires l "
+        "LEFT JOIN budgets_annuels ba ON ba.id = l.budget_id",
+        ('nature', 'statut'),
+    ),
+    'bons_commande': (
+        "SELECT bc.*, COALESCE(ba.exercice, EXTRACT(YEAR FROM bc.date_creation)::int, 0) AS _exercice "
+        "FROM bons_commande bc "
+        "LEFT JOIN lignes_budgetaires lb ON lb.id = bc.ligne_budgetaire_id "
+        "LEFT JOIN budgets_annuels ba ON ba.id = lb.budget_id",
+        ('statut',),
+    ),
+    'contrats': (
+        "SELECT c.*, COALESCE(EXTRACT(YEAR FROM COALESCE(c.date_debut, c.date_creation))::int, 0) "
+        "AS _exercice FROM contrats c",
+        ('statut', 'type_marche'),
+    ),
+    'projets': (
+        "SELECT p.*, COALESCE(EXTRACT(YEAR FROM COALESCE(p.date_debut, p.date_creation))::int, 0) "
+        "AS _exercice FROM projets p",
+        ('statut', 'priorite', 'phase', 'type_projet', 'statut_rag'),
+    ),
+    'taches': (
+        "SELECT t.*, COALESCE(EXTRACT(YEAR FROM "
+        "COALESCE(t.date_debut, t.date_echeance, t.date_creation))::int, 0) AS _exercice "
+        "FROM taches t",
+        ('statut', 'priorite', 'type_tache'),
+    ),
+}
+
+
+class SnapshotIndisponible(RuntimeError):
+    """pyarrow absent ou instantané inconnu."""
+
+
+# ── Types PostgreSQL → Arrow ────────────────────────────────────────────────
+
+def _decimal_ou_float(precision, scale):
+    if precision and 0 < precision <= 38 and scale is not None and scale >= 0:
+        return pa.decimal128(precision, scale), None
+    return pa.float64(), lambda v: None if v is None else float(v)   # NUMERIC sans précision
+
+
+def _type_arrow(col, categorie):
+    """(type Arrow, conversion des valeurs ou None) d'une colonne de cursor.description."""
+    oid = col.type_code
+    if categorie:
+        return pa.dictionary(pa.int32(), pa.string()), _texte
+    if oid == 16:
+        return pa.bool_(), None
+    if oid in (20, 21, 23):
+        return {20: pa.int64(), 21: pa.int16(), 23: pa.int32()}[oid], None
+    if oid in (700, 701):
+        return pa.float64(), None
+    if oid == 1700:
+        return _decimal_ou_float(col.precision, col.scale)
+    if oid == 1082:
+        return pa.date32(), None
+    if oid == 1114:
+        return pa.timestamp('us'), None
+    if oid == 1184:
+        return pa.timestamp('us', tz='UTC'), None
+    if oid in (114, 3802):
+        return pa.string(), lambda v: None if v is None else json.dumps(v, ensure_ascii=False, default=str)
+    return pa.string(), _texte
+
+
+def _texte(v):
+    return None if v is None else str(v)
+
+
+def schema_arrow(description, categories=()):
+    """
+    (schéma Arrow, conversions) des colonnes. Sans la colonne de partition ni
+    la colonne exercice (budgets_annuels) : la valeur est dans le chemin
+    exercice=AAAA, un doublon dans le fichier gênerait hive_partitioning.
+    """
+    champs, conversions = [], []
+    for col in description:
+        if col.name in (_PARTITION, 'exercice'):
+            continue
+        typ, conv = _type_arrow(col, col.name in categories)
+        champs.append(pa.field(col.name, typ))
+        conversions.append(conv)
+    return pa.schema(champs), conversions
+
+
+# ── Écriture ────────────────────────────────────────────────────────────────
+
+class _Partitions:
+    """Un ParquetWriter par exercice, alimenté par lots de lignes."""
+
+    def __init__(self, dossier, schema, conversions, indices):
+        self.dossier = dossier
+        self.schema = schema
+        self.conversions = conversions
+        self.indices = indices            # position de chaque colonne du schéma dans la ligne
+        self.tampons = {}                 # exercice → [lignes]
+        self.writers = {}
+        self.lignes = {}
+
+    def ajouter(self, exercice, ligne):
+        tampon = self.tampons.setdefault(exercice, [])
+        tampon.append(ligne)
+        if len(tampon) >= SNAPSHOT_ROW_GROUP:
+            self._vider(exercice)
+
+    def _vider(self, exercice):
+        lignes = self.tampons.pop(exercice, None)
+        if not lignes:
+            return
+        colonnes = []
+        for field, conv, i in zip(self.schema, self.conversions, self.indices):
+            valeurs = [r[i] for r in lignes]
+            if conv is not None:
+                valeurs = [conv(v) for v in valeurs]
+            colonnes.append(pa.array(valeurs, type=field.type))
+        table = pa.Table.from_arrays(colonnes, schema=self.schema)
+        writer = self.writers.get(exercice)
+        if writer is None:
+            dossier = os.path.join(self.dossier, f"exercice={exercice}")
+            os.makedirs(dossier, exist_ok=True)
+            writer = self.writers[exercice] = pq.ParquetWriter(
+                os.path.join(dossier, 'part-0.parquet'), self.schema,
+                compression='zstd', use_dictionary=True)
+        writer.write_table(table)
+        self.lignes[exercice] = self.lignes.get(exercice, 0) + len(lignes)
+
+    def fermer(self):
+        for exercice in list(self.tampons):
+            self._vider(exercice)
+        for writer in self.writers.values():
+            writer.close()
+        return dict(sorted(self.lignes.items()))
+
+
+def _exporter_table(conn, dossier, nom, sql, categories):
+    """Lignes par exercice de la table, écrite sous dossier/<nom>/."""
+    with conn.cursor(name=f"snapshot_{nom}") as cur:
+        cur.itersize = SNAPSHOT_BATCH
+        cur.execute(sql)
+        lignes = cur.fetchmany(SNAPSHOT_BATCH)
+        schema, conversions = schema_arrow(cur.description, categories)
+        noms = [c.name for c in cur.description]
+        p = noms.index(_PARTITION)
+        parts = _Partitions(os.path.join(dossier, nom), schema, conversions,
+                            [noms.index(f.name) for f in schema])
+        try:
+            while lignes:
+                for ligne in lignes:
+                    parts.ajouter(ligne[p], ligne)
+                lignes = cur.fetchmany(SNAPSHOT_BATCH)
+        finally:
+            par_exercice = parts.fermer()
+    return par_exercice
+
+
+def creer(tables=None):
+    """
+    Nouvel instantané des tables (toutes par défaut). Retourne le manifeste.
+    SnapshotIndisponible si pyarrow n'est pas installé.
+    """
+    if pa is None:
+        raise SnapshotIndisponible("pyarrow non installé : export Parquet indisponible")
+    tables = list(tables or TABLES)
+    inconnues = [t for t in tables if t not in TABLES]
+    if inconnues:
+        raise ValueError(f"Table(s) inconnue(s) : {', '.join(inconnues)}")
+
+    nom = datetime.now().strftime('%Y%m%d-%H%M%S')
+    final = os.path.join(SNAPSHOT_DIR, nom)
+    tmp = final + '.tmp'
+    os.makedirs(tmp, exist_ok=True)
+    debut = time.monotonic()
+    db = DatabaseService()
+    conn = db._get_conn()
+    manifeste = {'nom': nom, 'tables': {}}
+    try:
+        conn.rollback()
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        try:
+            with conn.cursor() as cur:
+                # Export long : pas de statement_timeout de 20 s par FETCH
+                cur.execute("SET LOCAL statement_timeout = 0")
+                cur.execute("SELECT now()::timestamp")
+                manifeste['date'] = cur.fetchone()[0].isoformat(timespec='seconds')
+            for t in tables:
+                d = time.monotonic()
+                par_exercice = _exporter_table(conn, tmp, t, *TABLES[t])
+                manifeste['tables'][t] = {
+                    'lignes': sum(par_exercice.values()),
+                    'exercices': {str(k): v for k, v in par_exercice.items()},
+                }
+                logger.info("Instantané %s : %s, %d ligne(s) en %.1f s", nom, t,
+                            manifeste['tables'][t]['lignes'], time.monotonic() - d)
+        finally:
+            conn.rollback()
+            conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+    except Exception:
+        db._put_conn(conn, broken=True)
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    db._put_conn(conn)
+
+    manifeste['duree_s'] = round(time.monotonic() - debut, 1)
+    manifeste['octets'] = _taille(tmp)
+    with open(os.path.join(tmp, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifeste, f, ensure_ascii=False, indent=2)
+    os.rename(tmp, final)
+    purger()
+    return manifeste
+
+
+def _taille(dossier):
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(dossier) for f in fs)
+
+
+# ── Consultation ────────────────────────────────────────────────────────────
+
+def lister():
+    """Manifestes des instantanés complets, du plus récent au plus ancien."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    out = []
+    for nom in sorted(os.listdir(SNAPSHOT_DIR), reverse=True):
+        if not _NOM.match(nom):
+            continue
+        try:
+            with open(os.path.join(SNAPSHOT_DIR, nom, 'manifest.json'), encoding='utf-8') as f:
+                out.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def dossier(nom):
+    """Répertoire de l'instantané nom ; SnapshotIndisponible s'il n'existe pas."""
+    chemin = os.path.join(SNAPSHOT_DIR, nom or '')
+    if not _NOM.match(nom or '') or not os.path.isfile(os.path.join(chemin, 'manifest.json')):
+        raise SnapshotIndisponible(f"Instantané introuvable : {nom}")
+    return chemin
+
+
+def fichiers(nom):
+    """[(chemin relatif, chemin absolu)] des fichiers de l'instantané, triés."""
+    racine = dossier(nom)
+    out = []
+    for rep, _, fs in os.walk(racine):
+        for f in fs:
+            absolu = os.path.join(rep, f)
+            out.append((os.path.relpath(absolu, racine).replace(os.sep, '/'), absolu))
+    return sorted(out)
+
+
+def purger():
+    """Supprime les instantanés au-delà des SNAPSHOT_KEEP plus récents."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+    noms = sorted((n for n in os.listdir(SNAPSHOT_DIR) if _NOM.match(n)), reverse=True)
+    for nom in noms[max(1, SNAPSHOT_KEEP):]:
+        shutil.rmtree(os.path.join(SNAPSHOT_DIR, nom), ignore_errors=True)
+
+
+def iter_zip(nom, bloc=1 << 20):
+    """
+    Générateur des octets d'une archive ZIP de l'instantané, produite en flux
+    (mémoire bornée à un bloc). Entrées non compressées : les fichiers
+    Parquet le sont déjà (zstd).
+    """
+    import zipfile
+    from app.services.fiche_export_service import _ZipSink
+
+    entrees = fichiers(nom)
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for relatif, absolu in entrees:
+            info = zipfile.ZipInfo.from_file(absolu, f"{nom}/{relatif}")
+            info.compress_type = zipfile.ZIP_STORED
+            with open(absolu, 'rb') as src, zf.open(info, 'w') as dst:
+                while True:
+                    data = src.read(bloc)
+                    if not data:
+                        break
+                    dst.write(data)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,223 @@
+# Traçage des requêtes SQL et budgets d'allers-retours (détection N+1)
+"""
+SqlTrace enregistre, pour le thread courant (et les threads qui travaillent
+pour lui, cf. relais), chaque requête exécutée par DatabaseService avec son
+empreinte (requête normalisée : littéraux et paramètres remplacés par ?,
+listes IN repliées). Une même empreinte répétée dans une requête HTTP ou un
+appel de service signale un N+1.
+
+    with SqlTrace() as t:
+        service.methode()
+    t.count, t.repetitions()
+
+    @max_queries(4, repetitions=3)      # ou : with max_queries(4): …
+    def test_route(client): …
+
+SQL_TRACE=1 : trace chaque requête HTTP et journalise les empreintes
+répétées au moins SQL_TRACE_SEUIL fois (mode test / recette, pas en production).
+
+Module partagé avec l'application bureau (app/services/sql_trace_service.py
+à la racine du dépôt l'exécute tel quel) : les requêtes arrivent par
+database_service.add_listener(), présent dans les deux DatabaseService
+(PostgreSQL ici, SQLite côté bureau) ; Flask n'est importé que par le mode
+requête.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from contextlib import ContextDecorator, contextmanager
+
+from app.services import database_service
+
+logger = logging.getLogger(__name__)
+
+SQL_TRACE       = os.getenv('SQL_TRACE', '0') == '1'
+SQL_TRACE_SEUIL = int(os.getenv('SQL_TRACE_SEUIL', '5'))
+
+_COMMENT = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING  = re.compile(r"'(?:[^']|'')*'")
+_NUMBER  = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM   = re.compile(r'%\(\w+\)s|%s|\$\d+|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WS      = re.compile(r'\s+')
+
+# Fichiers ignorés pour situer l'appelant d'une requête
+_INTERNES = ('database_service', 'sql_trace_service', 'psycopg2', 'sqlite3', 'contextlib')
+
+
+def fingerprint(sql):
+    """Empreinte d'une requête : même forme ⇒ même empreinte, quelles que soient les valeurs."""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    s = _COMMENT.sub(' ', str(sql))
+    s = _STRING.sub('?', s)
+    s = _NUMBER.sub('?', s)
+    s = _PARAM.sub('?', s)
+    s = _IN_LIST.sub('(?+)', s)
+    return _WS.sub(' ', s).strip().lower()
+
+
+def _appelant():
+    f = sys._getframe(2)
+    while f is not None and any(m in f.f_code.co_filename for m in _INTERNES):
+        f = f.f_back
+    if f is None:
+        return '?'
+    return f"{os.path.basename(f.f_code.co_filename)}:{f.f_lineno} {f.f_code.co_name}"
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# Traces ouvertes (tous threads confondus ; chacune filtre sur son thread)
+_actives = []
+_actives_lock = threading.Lock()
+
+
+# Threads qui exécutent des requêtes pour le compte d'un autre
+# (concurrence_service) : thread exécutant → thread de la requête HTTP
+_relais = {}
+
+
+@contextmanager
+def relais(thread_id):
+    """Requêtes du thread courant attribuées aux traces de thread_id."""
+    moi = threading.get_ident()
+    _relais[moi] = thread_id
+    try:
+        yield
+    finally:
+        _relais.pop(moi, None)
+
+
+def _on_db_event(event, duree, query):
+    if event != 'query' or not _actives:
+        return
+    tid = threading.get_ident()
+    tid = _relais.get(tid, tid)
+    for trace in list(_actives):
+        if trace.thread_id == tid:
+            trace._record(query, duree)
+
+
+class SqlTrace:
+    """Requêtes SQL exécutées par le thread courant entre __enter__ et __exit__."""
+
+    def __init__(self):
+        self.requetes = []     # [(empreinte, durée_s)]
+        self.appelants = {}    # empreinte → premier appelant
+        self.thread_id = None
+
+    def __enter__(self):
+        database_service.add_listener(_on_db_event)
+        self.thread_id = threading.get_ident()
+        with _actives_lock:
+            _actives.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        with _actives_lock:
+            if self in _actives:
+                _actives.remove(self)
+        return False
+
+    def _record(self, query, duree):
+        fp = fingerprint(query)
+        self.requetes.append((fp, duree))
+        if fp not in self.appelants:
+            self.appelants[fp] = _appelant()
+
+    @property
+    def count(self):
+        return len(self.requetes)
+
+    @property
+    def duree(self):
+        return sum(d or 0 for _, d in self.requetes)
+
+    def repetitions(self, seuil=2):
+        """[(empreinte, n)] des empreintes exécutées au moins `seuil` fois, plus fréquentes d'abord."""
+        return [(fp, n) for fp, n in Counter(fp for fp, _ in self.requetes).most_common()
+                if n >= seuil]
+
+    def rapport(self, seuil=2, limite=5):
+        lignes = [f"{self.count} requête(s) SQL, {self.duree * 1000:.1f} ms"]
+        for fp, n in self.repetitions(seuil)[:limite]:
+            lignes.append(f"  {n:>4}×  {fp[:160]}")
+            lignes.append(f"         ← {self.appelants.get(fp, '?')}")
+        return '\n'.join(lignes)
+
+
+class max_queries(ContextDecorator):
+    """
+    Budget d'allers-retours SQL (décorateur ou context manager).
+    n : nombre maximal de requêtes ; repetitions : nombre maximal d'exécutions
+    d'une même empreinte (None = pas de contrôle N+1).
+    """
+
+    def __init__(self, n, repetitions=None):
+        self.n = n
+        self.max_repetitions = repetitions
+        self.trace = None
+
+    def __enter__(self):
+        self.trace = SqlTrace().__enter__()
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.__exit__(exc_type, exc, tb)
+        if exc_type is not None:
+            return False
+        t = self.trace
+        if t.count > self.n:
+            raise QueryBudgetExceeded(
+                f"Budget SQL dépassé : {t.count} > {self.n}\n{t.rapport()}")
+        if self.max_repetitions is not None:
+            pire = t.repetitions(self.max_repetitions + 1)
+            if pire:
+                raise QueryBudgetExceeded(
+                    f"N+1 : requête exécutée {pire[0][1]}× (max {self.max_repetitions})\n"
+                    f"{t.rapport(self.max_repetitions + 1)}")
+        return False
+
+
+# ── Mode requête (SQL_TRACE=1) ──────────────────────────────────────────────
+
+def _before():
+    from flask import g
+    g._sql_trace = SqlTrace().__enter__()
+
+
+def _after(response):
+    from flask import g, request
+    trace = g.pop('_sql_trace', None)
+    if trace is None:
+        return response
+    trace.__exit__(None, None, None)
+    response.headers['X-SQL-Queries'] = str(trace.count)
+    if trace.repetitions(SQL_TRACE_SEUIL):
+        rule = request.url_rule
+        logger.warning("N+1 probable sur %s %s\n%s", request.method,
+                       rule.rule if rule is not None else request.path,
+                       trace.rapport(SQL_TRACE_SEUIL))
+    return response
+
+
+def _teardown(exc):
+    from flask import g
+    trace = g.pop('_sql_trace', None)
+    if trace is not None:
+        trace.__exit__(None, None, None)
+
+
+def register_sql_trace(bp):
+    """Trace chaque requête HTTP du blueprint si SQL_TRACE=1 (sinon sans effet)."""
+    if not SQL_TRACE:
+        return
+    bp.before_request(_before)
+    bp.after_request(_after)
+    bp.teardown_request(_teardown)
@@ -0,0 +1,87 @@
+# Synchronisation incrémentale des listes (?since=<curseur>)
+"""
+Les listes BC / contrats / projets / tâches acceptent ?since= : seules les
+lignes modifiées depuis le curseur sont renvoyées, avec les id à retirer du
+cache client (lignes supprimées, ou sorties du périmètre / des filtres).
+
+    ?since=0          liste complète + curseur (premier chargement)
+    ?since=<curseur>  {"list": [modifiées], "deleted": [id], "cursor": …}
+
+L'horodatage date_maj / updated_at est posé par trigger (migration 0015) avec
+now(), c'est-à-dire le début de la transaction d'écriture : une transaction
+encore ouverte peut valider plus tard une ligne datée d'avant la lecture. Le
+curseur est donc le début de la plus ancienne transaction en cours (toutes
+les connexions de l'application utilisent le même rôle et sont visibles dans
+pg_stat_activity), calculé AVANT la lecture des lignes. Le chevauchement qui
+en résulte ne fait que renvoyer quelques lignes déjà connues ; la fusion
+côté client est idempotente.
+"""
+import logging
+import os
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SYNC_RETENTION = int(os.getenv('SYNC_RETENTION', str(30 * 86400)))   # secondes ; purge : events_service
+
+
+def parse_since(valeur):
+    """
+    Curseur de ?since= : None pour un chargement complet ('0' ou vide),
+    datetime sinon. ValueError si le curseur est illisible.
+    """
+    valeur = (valeur or '').strip()
+    if valeur in ('', '0'):
+        return None
+    try:
+        return datetime.fromisoformat(valeur)
+    except ValueError:
+        raise ValueError(f"since : curseur invalide ({valeur!r})")
+
+
+def curseur(db):
+    """
+    (curseur, borne) : curseur à renvoyer au client, et plus ancien curseur
+    encore exploitable (tombstones purgées au-delà de SYNC_RETENTION).
+    """
+    row = db.fetch_one(
+        "SELECT (LEAST(now(), MIN(xact_start)) - INTERVAL '1 second')::timestamp AS curseur, "
+        "       (now() - %s * INTERVAL '1 second')::timestamp AS borne "
+        "FROM pg_stat_activity "
+        "WHERE datname = current_database() AND xact_start IS NOT NULL",
+        [SYNC_RETENTION]
+    )
+    return row['curseur'], row['borne']
+
+
+def delta(db, select, from_sql, table, alias, col, where, params, perimetre, perimetre_params,
+          since, order_by):
+    """
+    (lignes, supprimés) depuis since :
+      lignes     modifiées (col >= since) et visibles (where)
+      supprimés  id supprimés ou changés de propriétaire depuis since
+                 (deleted_rows), ou modifiés mais hors des filtres
+    from_sql/where : mêmes jointures et conditions que la liste complète.
+    perimetre : condition de propriété seule (sans les filtres), appliquée
+    aux supprimés : un id n'est renvoyé qu'à qui pouvait détenir la ligne,
+    jamais celui d'une ligne d'un autre périmètre. Les tombstones portent
+    created_by_id / assignee_id (migration 0018), évalués sous l'alias.
+    """
+    rows = db.fetch_all(
+        f"SELECT {select} {from_sql}"
+        f"WHERE {alias}.{col} >= %s AND ({where}) ORDER BY {order_by}",
+        [since] + list(params)
+    )
+    sortis = db.fetch_all(
+        f"SELECT {alias}.id FROM (SELECT row_id AS id, created_by_id, assignee_id "
+        "FROM deleted_rows WHERE table_name = %s AND deleted_at >= %s) "
+        f"{alias} WHERE ({perimetre}) "
+        "UNION "
+        f"SELECT {alias}.id {from_sql}"
+        f"WHERE {alias}.{col} >= %s AND ({perimetre}) AND NOT COALESCE(({where}), false)",
+        [table, since] + list(perimetre_params) + [since] + list(perimetre_params) + list(params)
+    )
+    lignes = [dict(r) for r in (rows or [])]
+    # Changement de propriétaire sans sortie du périmètre : la ligne est renvoyée
+    presents = {r['id'] for r in lignes}
+    return lignes, sorted({r['id'] for r in (sortis or [])} - presents)
@@ -1,6 +1,8 @@
 # Service tache pour usage web
 import logging
 from app.services.database_service import DatabaseService
+from app.services.etag_service import empreinte, horodatage, version_sql
+from app.services.fields_service import Projection
 
 def _d(row):
     if row is None:
@@ -9,22 +11,64 @@ def _d(row):
 
 logger = logging.getLogger(__name__)
 
+# Liste des tâches (GET /tache, ?fields=) : description et compte rendu de
+# réunion ne sont lus que sur demande (détail GET /tache/<id>).
+LISTE = Projection(
+    't',
+    colonnes=('id', 'projet_id', 'titre', 'description', 'statut', 'priorite', 'date_echeance',
+              'estimation_heures', 'heures_reelles', 'avancement', 'date_creation',
+              'updated_at', 'date_debut', 'responsable_label', 'assignee_id', 'type_tache',
+              'rapport_reunion', 'created_by_id'),
+    calculees={
+        'projet_nom':            'p.nom',
+        'projet_code':           'p.code',
+        'assignee_nom':          "u.nom || ' ' || u.prenom",
+        'assignee_user_id':      'u.id',
+        'assignee_service_nom':  's.nom',
+        'assignee_service_code': 's.code',
+        'assignee_is_unite':     's.is_unite',
+    },
+    defaut=('id', 'projet_id', 'titre', 'statut', 'priorite', 'date_echeance',
+            'estimation_heures', 'heures_reelles', 'avancement', 'date_creation', 'updated_at',
+            'date_debut', 'responsable_label', 'assignee_id', 'type_tache', 'created_by_id',
+            'projet_nom', 'projet_code', 'assignee_nom', 'assignee_user_id',
+            'assignee_service_nom', 'assignee_service_code', 'assignee_is_unite'),
+)
+LISTE_FROM = (
+    "FROM taches t "
+    "LEFT JOIN projets p ON p.id = t.projet_id "
+    "LEFT JOIN utilisateurs u ON u.id = t.assignee_id "
+    "LEFT JOIN services s ON s.id = u.service_id "
+)
+
+# Version de la fiche (GET /tache/<id>, ETag) : tâche + nom du projet
+VERSION = version_sql(
+    horodatage('t.updated_at'),
+    empreinte(horodatage('p.updated_at'), "projets p WHERE p.id = t.projet_id"),
+)
+
+
 class TacheService:
     def __init__(self):
         self.db = DatabaseService()
 
-    def get_all(self):
+    def version(self, tache_id, acces='true', params=()):
+        """
+        Sonde de version de la fiche (etag_service) : {'version', 'autorise'},
+        None si la ligne n'existe pas. acces : condition SQL sur t.
+        """
+        return self.db.fetch_one(
+            f"SELECT {VERSION} AS version, COALESCE(({acces}), false) AS autorise "
+            "FROM taches t WHERE t.id = %s",
+            list(params) + [tache_id]
+        )
+
+    def get_all(self, champs=None):
+        """champs : projection LISTE (None = enregistrement complet)."""
         try:
+            cols = LISTE.select(champs) if champs else LISTE.tout()
             rows = self.db.fetch_all(
-                "SELECT t.*, p.nom as projet_nom, p.code as projet_code, "
-                "u.nom || ' ' || u.prenom as assignee_nom, "
-                "u.id as assignee_user_id, "
-                "s.nom as assignee_service_nom, s.code as assignee_service_code, "
-                "s.is_unite as assignee_is_unite "
-                "FROM taches t "
-                "LEFT JOIN projets p ON p.id = t.projet_id "
-                "LEFT JOIN utilisateurs u ON u.id = t.assignee_id "
-                "LEFT JOIN services s ON s.id = u.service_id "
+                f"SELECT {cols} {LISTE_FROM}"
                 "ORDER BY t.date_echeance ASC NULLS LAST, t.id DESC"
             )
             return [_d(r) for r in rows] if rows else []
@@ -0,0 +1,127 @@
+# Mesure du temps de traitement par requête (Server-Timing + journal d'accès)
+"""
+Accumulateur g.timing ouvert par before_request et alimenté par :
+  - DatabaseService (temps SQL, nombre d'allers-retours, attente du pool)
+  - le fournisseur JSON de l'application (temps de sérialisation)
+  - VersionedCache (succès / échec de cache)
+  - admission_service (attente d'une place sur les routes lourdes)
+Restitué dans l'en-tête Server-Timing (onglet Réseau → Timing des devtools)
+et, si ACCESS_LOG=1, dans une ligne JSON du logger 'access'.
+ACCESS_LOG_MIN_MS : ne journaliser que les requêtes plus lentes que ce seuil.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+
+from app.services import cache_service, database_service
+
+access_logger = logging.getLogger('access')
+
+ACCESS_LOG        = os.getenv('ACCESS_LOG', '0') == '1'
+ACCESS_LOG_MIN_MS = float(os.getenv('ACCESS_LOG_MIN_MS', '0'))
+
+_lock = threading.Lock()
+
+
+def current():
+    """Accumulateur de la requête en cours, ou None (hors requête)."""
+    try:
+        return g.get('timing')
+    except RuntimeError:
+        return None
+
+
+# ── Sources ─────────────────────────────────────────────────────────────────
+
+def _on_db_event(event, duree, query):
+    t = current()
+    if t is None:
+        return  # préchauffage, migrations
+    with _lock:   # requêtes d'une même requête HTTP en parallèle (concurrence_service)
+        if event == 'pool_wait':
+            t['pool'] += duree
+        else:
+            t['db'] += duree
+            t['queries'] += 1
+
+
+def _on_cache(name, hit):
+    t = current()
+    if t is not None:
+        t['cache'].append(f"{name}={'hit' if hit else 'miss'}")
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Fournisseur JSON Flask qui mesure le temps de sérialisation."""
+
+    def dumps(self, obj, **kwargs):
+        debut = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            t = current()
+            if t is not None:
+                t['json'] += time.perf_counter() - debut
+
+
+# ── Hooks ───────────────────────────────────────────────────────────────────
+
+def _before():
+    g.timing = {'debut': time.perf_counter(), 'db': 0.0, 'queries': 0,
+                'pool': 0.0, 'json': 0.0, 'cache': []}
+
+
+def _server_timing(t, total):
+    # Valeur d'en-tête HTTP : ASCII uniquement
+    parts = [
+        f"total;dur={total * 1000:.1f}",
+        f'db;dur={t["db"] * 1000:.1f};desc="{t["queries"]} allers-retours SQL"',
+        f"pool;dur={t['pool'] * 1000:.1f}",
+        f"json;dur={t['json'] * 1000:.1f}",
+    ]
+    if 'admission' in t:
+        parts.append(f"admission;dur={t['admission'] * 1000:.1f}")
+    if t['cache']:
+        parts.append(f'cache;desc="{" ".join(t["cache"])}"')
+    return ', '.join(parts)
+
+
+def _after(response):
+    t = current()
+    if t is None:
+        return response
+    total = time.perf_counter() - t['debut']
+    t['total'] = total
+    response.headers['Server-Timing'] = _server_timing(t, total)
+    if ACCESS_LOG and total * 1000 >= ACCESS_LOG_MIN_MS:
+        rule = request.url_rule
+        user = getattr(g, 'user', None) or {}
+        access_logger.info(json.dumps({
+            'ts':       time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'method':   request.method,
+            'path':     request.path,
+            'route':    rule.rule if rule is not None else None,
+            'status':   response.status_code,
+            'user_id':  user.get('sub'),
+            'total_ms': round(total * 1000, 1),
+            'db_ms':    round(t['db'] * 1000, 1),
+            'queries':  t['queries'],
+            'pool_ms':  round(t['pool'] * 1000, 1),
+            'json_ms':  round(t['json'] * 1000, 1),
+            'cache':    t['cache'],
+            'bytes':    response.calculate_content_length(),
+        }, ensure_ascii=False))
+    return response
+
+
+def register_timing(bp):
+    """Branche l'accumulateur sur un blueprint (à enregistrer avant les métriques)."""
+    database_service.add_listener(_on_db_event)
+    cache_service.add_listener(_on_cache)
+    bp.before_request(_before)
+    bp.after_request(_after)
@@ -1,12 +1,113 @@
 """
 tpe_service.py — CRUD + export + import pour le module TPE.
 """
+import csv
+import io
 import json
 import logging
 import os
 
+import psycopg2.extras
+
 logger = logging.getLogger(__name__)
 
+# Colonnes de la fiche TPE alimentées par create / update / import
+_CHAMPS = [
+    'service', 'regisseur_prenom', 'regisseur_nom', 'regisseur_telephone',
+    'regisseur_email',
+    'regisseurs_suppleants', 'shop_id', 'backoffice_actif', 'backoffice_email',
+    'modele_tpe', 'type_ethernet', 'type_4_5g',
+    'reseau_ip', 'reseau_masque', 'reseau_passerelle',
+    'nombre_tpe',
+]
+_BOOLEENS = {'backoffice_actif', 'type_ethernet', 'type_4_5g'}
+_DEFAUTS  = {'shop_id': 0, 'nombre_tpe': 1}
+
+
+def _valeurs(data):
+    """Valeurs de _CHAMPS (dans l'ordre) pour une fiche au format plat."""
+    return [
+        bool(data.get(c)) if c in _BOOLEENS else data.get(c, _DEFAUTS.get(c))
+        for c in _CHAMPS
+    ]
+
+
+def _cartes_valides(cartes):
+    """Cartes normalisées (numéro obligatoire) : [(numero, serie, modele), …]."""
+    out = []
+    for c in (cartes or []):
+        numero = (c.get('numero') or '').strip()
+        if numero:
+            out.append((numero, c.get('numero_serie_tpe'), c.get('modele_tpe')))
+    return out
+
+
+# Contraintes des colonnes (migration 0008) vérifiées avant le COPY de
+# l'import : une valeur refusée par PostgreSQL ferait échouer tout le lot
+_LONGUEURS = {
+    'service': 300, 'regisseur_prenom': 100, 'regisseur_nom': 100,
+    'regisseur_telephone': 30, 'regisseur_email': 200, 'backoffice_email': 200,
+    'modele_tpe': 100, 'reseau_ip': 20, 'reseau_masque': 20, 'reseau_passerelle': 20,
+}
+_ENTIERS = {'shop_id': 2 ** 63 - 1, 'nombre_tpe': 2 ** 31 - 1}
+_CARTE_LONGUEUR = 100
+
+
+def _texte(champ, v, longueur=None):
+    if v is None:
+        return None
+    if isinstance(v, (list, tuple)):
+        v = ', '.join(str(x) for x in v if x is not None)
+    v = str(v).replace('\x00', '').strip()
+    if longueur and len(v) > longueur:
+        raise ValueError(f"{champ} : {len(v)} caractères (maximum {longueur})")
+    return v
+
+
+def _fiche_import(flat):
+    """
+    Valeurs de _CHAMPS converties aux types des colonnes et cartes valides
+    d'une fiche à importer ; ValueError si la fiche serait refusée par la base.
+    """
+    valeurs = []
+    for champ, v in zip(_CHAMPS, _valeurs(flat)):
+        if champ in _ENTIERS:
+            if v is None or v == '':
+                v = _DEFAUTS[champ]
+            try:
+                if isinstance(v, float) and v.is_integer():
+                    v = int(v)
+                v = int(v) if isinstance(v, int) else int(str(v).strip())
+            except ValueError:
+                raise ValueError(f"{champ} : entier attendu ({v!r})") from None
+            if abs(v) > _ENTIERS[champ]:
+                raise ValueError(f"{champ} : {v} hors limites")
+        elif champ not in _BOOLEENS:
+            v = _texte(champ, v, _LONGUEURS.get(champ))
+        valeurs.append(v)
+    if not valeurs[_CHAMPS.index('service')]:
+        raise ValueError("service manquant")
+    cartes = []
+    for c in (flat.get('cartes') or []):
+        if not isinstance(c, dict):
+            continue
+        numero = _texte('numero', c.get('numero'), _CARTE_LONGUEUR)
+        if numero:
+            cartes.append({
+                'numero': numero,
+                'numero_serie_tpe': _texte('numero_serie_tpe', c.get('numero_serie_tpe'), _CARTE_LONGUEUR),
+                'modele_tpe': _texte('modele_tpe', c.get('modele_tpe'), _CARTE_LONGUEUR),
+            })
+    return valeurs, cartes
+
+
+_NULL = r'\N'
+
+
+def _csv(v):
+    """Valeur pour COPY csv (NULL explicite, chaîne vide conservée)."""
+    return _NULL if v is None else v
+
 
 class TpeService:
     def __init__(self):
@@ -80,87 +181,27 @@ class TpeService:
 
     # ── Créer ──────────────────────────────────────────────────────────────
     def create(self, data, created_by_id=None):
-        row = self.db.execute_returning("""
-            INSERT INTO tpe (
-                service, regisseur_prenom, regisseur_nom, regisseur_telephone,
-                regisseur_email,
-                regisseurs_suppleants, shop_id, backoffice_actif, backoffice_email,
-                modele_tpe, type_ethernet, type_4_5g,
-                reseau_ip, reseau_masque, reseau_passerelle,
-                nombre_tpe, created_by_id, date_maj
-            ) VALUES (
-                %s,%s,%s,%s,
-                %s,
-                %s,%s,%s,%s,
-                %s,%s,%s,
-                %s,%s,%s,
-                %s,%s,NOW()
-            ) RETURNING id
-        """, [
-            data.get('service'),
-            data.get('regisseur_prenom'),
-            data.get('regisseur_nom'),
-            data.get('regisseur_telephone'),
-            data.get('regisseur_email'),
-            data.get('regisseurs_suppleants'),
-            data.get('shop_id', 0),
-            bool(data.get('backoffice_actif')),
-            data.get('backoffice_email'),
-            data.get('modele_tpe'),
-            bool(data.get('type_ethernet')),
-            bool(data.get('type_4_5g')),
-            data.get('reseau_ip'),
-            data.get('reseau_masque'),
-            data.get('reseau_passerelle'),
-            data.get('nombre_tpe', 1),
-            created_by_id,
-        ])
-        tpe_id = row[0]
-        self._save_cartes(tpe_id, data.get('cartes', []))
+        cols = ', '.join(_CHAMPS)
+        marks = ', '.join(['%s'] * len(_CHAMPS))
+        with self.db.transaction() as cur:
+            cur.execute(
+                f"INSERT INTO tpe ({cols}, created_by_id, date_maj) "
+                f"VALUES ({marks}, %s, NOW()) RETURNING id",
+                _valeurs(data) + [created_by_id]
+            )
+            tpe_id = cur.fetchone()['id']
+            self._save_cartes(cur, tpe_id, data.get('cartes', []))
         return tpe_id
 
     # ── Mettre à jour ──────────────────────────────────────────────────────
     def update(self, tpe_id, data):
-        self.db.execute("""
-            UPDATE tpe SET
-                service               = %s,
-                regisseur_prenom      = %s,
-                regisseur_nom         = %s,
-                regisseur_telephone   = %s,
-                regisseur_email       = %s,
-                regisseurs_suppleants = %s,
-                shop_id               = %s,
-                backoffice_actif      = %s,
-                backoffice_email      = %s,
-                modele_tpe            = %s,
-                type_ethernet         = %s,
-                type_4_5g             = %s,
-                reseau_ip             = %s,
-                reseau_masque         = %s,
-                reseau_passerelle     = %s,
-                nombre_tpe            = %s,
-                date_maj              = NOW()
-            WHERE id = %s
-        """, [
-            data.get('service'),
-            data.get('regisseur_prenom'),
-            data.get('regisseur_nom'),
-            data.get('regisseur_telephone'),
-            data.get('regisseur_email'),
-            data.get('regisseurs_suppleants'),
-            data.get('shop_id', 0),
-            bool(data.get('backoffice_actif')),
-            data.get('backoffice_email'),
-            data.get('modele_tpe'),
-            bool(data.get('type_ethernet')),
-            bool(data.get('type_4_5g')),
-            data.get('reseau_ip'),
-            data.get('reseau_masque'),
-            data.get('reseau_passerelle'),
-            data.get('nombre_tpe', 1),
-            tpe_id,
-        ])
-        self._save_cartes(tpe_id, data.get('cartes', []))
+        sets = ', '.join(f"{c} = %s" for c in _CHAMPS)
+        with self.db.transaction() as cur:
+            cur.execute(
+                f"UPDATE tpe SET {sets}, date_maj = NOW() WHERE id = %s",
+                _valeurs(data) + [tpe_id]
+            )
+            self._save_cartes(cur, tpe_id, data.get('cartes', []))
 
     # ── Supprimer ──────────────────────────────────────────────────────────
     def delete(self, tpe_id):
@@ -241,15 +282,28 @@ class TpeService:
             max_len = max((len(str(c.value or '')) for c in col), default=10)
             ws.column_dimensions[col[0].column_letter].width = min(max_len + 4, 50)
 
-        import io
         buf = io.BytesIO()
         wb.save(buf)
         return buf.getvalue()
 
     # ── Import JSON (idempotent) ───────────────────────────────────────────
-    def import_from_json(self, path):
-        count = self.db.fetch_one("SELECT COUNT(*) AS n FROM tpe")
-        if count and int(count['n']) > 0:
+    def import_from_json(self, path, cur=None):
+        """
+        Chargement initial en une transaction : les fiches normalisées sont
+        copiées (COPY) dans une table temporaire, puis insérées dans tpe et
+        tpe_cartes par deux INSERT … SELECT. Les fiches sont converties aux
+        types des colonnes avant le COPY ; celles qui ne peuvent pas l'être
+        sont écartées et signalées sans bloquer les autres.
+        cur : curseur d'une transaction en cours (migration), validée par
+        l'appelant ; sinon transaction propre sur une connexion du pool.
+        """
+        if cur is None:
+            count = self.db.fetch_one("SELECT COUNT(*) AS n FROM tpe")
+            deja = count and int(count['n']) > 0
+        else:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM tpe)")
+            deja = cur.fetchone()[0]
+        if deja:
             return 0  # déjà peuplé
 
         with open(path, encoding='utf-8') as f:
@@ -258,16 +312,65 @@ class TpeService:
         # Support format imbriqué (TpeComplet-v2) ou format plat
         records = raw.get('tpes', raw) if isinstance(raw, dict) else raw
 
+        buf = io.StringIO()
+        writer = csv.writer(buf)
         imported = 0
-        for rec in records:
+        ecartees = 0
+        for i, rec in enumerate(records):
             try:
-                flat = self._normalize_import(rec)
-                self.create(flat)
-                imported += 1
-            except Exception as e:
-                logger.warning("TPE import skipped: %s", e)
+                valeurs, cartes = _fiche_import(self._normalize_import(rec))
+            except (ValueError, TypeError, AttributeError) as e:
+                ecartees += 1
+                logger.warning("TPE import : fiche %d écartée (%s)", i, e)
+                continue
+            writer.writerow(
+                [imported] + [_csv(v) for v in valeurs] + [json.dumps(cartes)]
+            )
+            imported += 1
+        if ecartees:
+            logger.warning("TPE import : %d fiche(s) écartée(s) sur %d", ecartees, len(records))
+        if not imported:
+            return 0
+        buf.seek(0)
+        if cur is not None:
+            self._copier_import(cur, buf)
+        else:
+            with self.db.transaction() as cur:
+                self._copier_import(cur, buf)
         return imported
 
+    @staticmethod
+    def _copier_import(cur, buf):
+        """COPY des fiches préparées puis insertion dans tpe et tpe_cartes."""
+        cols = ', '.join(_CHAMPS)
+        cur.execute(
+            "CREATE TEMP TABLE tpe_import_stage ON COMMIT DROP AS "
+            f"SELECT 0 AS ordre, id, {cols}, NULL::jsonb AS cartes "
+            "FROM tpe WITH NO DATA"
+        )
+        cur.copy_expert(
+            f"COPY tpe_import_stage (ordre, {cols}, cartes) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '{_NULL}')",
+            buf
+        )
+        # Identifiants réservés avant l'insertion pour rattacher les cartes
+        cur.execute(
+            "UPDATE tpe_import_stage "
+            "SET id = nextval(pg_get_serial_sequence('tpe', 'id'))"
+        )
+        cur.execute(
+            f"INSERT INTO tpe (id, {cols}, date_maj) "
+            f"SELECT id, {cols}, NOW() FROM tpe_import_stage ORDER BY ordre"
+        )
+        cur.execute(
+            "INSERT INTO tpe_cartes (tpe_id, numero, numero_serie_tpe, modele_tpe) "
+            "SELECT s.id, c->>'numero', c->>'numero_serie_tpe', c->>'modele_tpe' "
+            "FROM tpe_import_stage s "
+            "CROSS JOIN LATERAL jsonb_array_elements(s.cartes) "
+            "  WITH ORDINALITY AS x(c, n) "
+            "ORDER BY s.ordre, x.n"
+        )
+
     @staticmethod
     def _normalize_import(rec):
         """Convertit le format imbriqué TpeComplet-v2 vers le format plat."""
@@ -310,14 +413,47 @@ class TpeService:
         }
 
     # ── Cartes (helper interne) ────────────────────────────────────────────
-    def _save_cartes(self, tpe_id, cartes):
-        self.db.execute("DELETE FROM tpe_cartes WHERE tpe_id = %s", [tpe_id])
-        for c in (cartes or []):
-            numero = (c.get('numero') or '').strip()
-            if not numero:
+    @staticmethod
+    def _save_cartes(cur, tpe_id, cartes):
+        """
+        Synchronise les cartes du TPE par différence, dans la transaction de
+        l'appelant : les cartes identiques sont conservées, les autres sont
+        modifiées, ajoutées ou supprimées en lot.
+        Rapprochement par numéro de carte (le formulaire n'envoie pas d'id).
+        """
+        cur.execute(
+            "SELECT id, numero, numero_serie_tpe, modele_tpe FROM tpe_cartes "
+            "WHERE tpe_id = %s ORDER BY id FOR UPDATE",
+            [tpe_id]
+        )
+        existantes = {}
+        for r in cur.fetchall():
+            existantes.setdefault(r['numero'], []).append(r)
+
+        inserts, updates = [], []
+        for numero, serie, modele in _cartes_valides(cartes):
+            pool = existantes.get(numero)
+            if not pool:
+                inserts.append((tpe_id, numero, serie, modele))
                 continue
-            self.db.execute(
+            r = pool.pop(0)
+            if (r['numero_serie_tpe'], r['modele_tpe']) != (serie, modele):
+                updates.append((serie, modele, r['id']))
+        deletes = [r['id'] for pool in existantes.values() for r in pool]
+
+        if deletes:
+            cur.execute("DELETE FROM tpe_cartes WHERE id = ANY(%s)", [deletes])
+        if updates:
+            psycopg2.extras.execute_batch(
+                cur,
+                "UPDATE tpe_cartes SET numero_serie_tpe = %s, modele_tpe = %s "
+                "WHERE id = %s",
+                updates
+            )
+        if inserts:
+            psycopg2.extras.execute_values(
+                cur,
                 "INSERT INTO tpe_cartes (tpe_id, numero, numero_serie_tpe, modele_tpe) "
-                "VALUES (%s, %s, %s, %s)",
-                [tpe_id, numero, c.get('numero_serie_tpe'), c.get('modele_tpe')]
+                "VALUES %s",
+                inserts
             )
@@ -0,0 +1,311 @@
+"""
+Test de charge par scénarios : rejoue les rafales d'appels de la SPA.
+
+    python -m bench.charge --utilisateurs 20 --duree 60
+    python -m bench.charge --serveur --workers 4 --worker-class gthread --threads 4 \\
+                           --pool-max 20 --utilisateurs 50 --duree 120 --json charge.json
+
+Chaque utilisateur virtuel se connecte (comptes du banc, voir bench.seed),
+fait comme app.js au chargement : initRefs() puis dashboard + notifications
+en parallèle (+ génération des notifications en tâche de fond), puis ouvre
+des onglets au hasard avec un temps de réflexion entre deux onglets. Les
+appels d'une même étape partent ensemble, comme les Promise.all du front :
+en un POST /api/batch comme app.js, ou en GET séparés avec --sans-batch.
+
+--serveur démarre gunicorn sur la base du banc (BENCH_DB_NAME) avec les
+réglages demandés, attend /api/health/ready, puis l'arrête à la fin : même
+jeu de scénarios pour comparer DB_POOL_MAX, nombre et type de workers,
+SQL_PARALLELE (requêtes des routes d'agrégation en parallèle ou en séquence).
+
+Rapport : débit, percentiles de latence et erreurs par endpoint, et temps
+d'attente du pool lus dans l'en-tête Server-Timing (pool;dur=…).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import date
+
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+COMPTES = ['bench_admin', 'bench_gest', 'bench_lect']
+
+# Onglets de la SPA : [étapes], chaque étape = appels lancés en parallèle.
+# Poids ≈ fréquence d'ouverture de l'onglet.
+ONGLETS = {
+    'dashboard':     (4, [['/dashboard', '/notifications']]),
+    'bons_commande': (5, [['/bon_commande', '/bon_commande/stats']]),
+    'projets':       (4, [['/projet', '/service_org']]),
+    'taches':        (3, [['/tache']]),
+    'kanban':        (2, [['/kanban']]),
+    'contrats':      (3, [['/contrat']]),
+    'budget':        (2, [[f'/budget?exercice={date.today().year}']]),
+    'lignes':        (2, [['/lignes']]),
+    'gantt':         (1, [['/service_org'], ['/gantt']]),
+    'etp':           (1, [['/etp?mode=projet']]),
+    'services':      (1, [['/service_org', '/contact?limit=500']]),
+}
+
+_POOL_RE = re.compile(r'\bpool;dur=([\d.]+)')
+_DB_RE   = re.compile(r'\bdb;dur=([\d.]+)')
+
+
+def _endpoint(chemin):
+    """/budget?exercice=2026 → /budget (regroupement du rapport)."""
+    return chemin.split('?', 1)[0]
+
+
+def percentile(valeurs, q):
+    """Percentile par rang le plus proche."""
+    if not valeurs:
+        return 0.0
+    v = sorted(valeurs)
+    return v[max(0, min(len(v) - 1, math.ceil(q / 100 * len(v)) - 1))]
+
+
+class Statistiques:
+    def __init__(self):
+        self.latences = defaultdict(list)   # endpoint → [ms]
+        self.pool     = defaultdict(list)   # endpoint → [ms]
+        self.db       = defaultdict(list)
+        self.erreurs  = defaultdict(lambda: defaultdict(int))  # endpoint → {statut: n}
+        self.debut = self.fin = None
+        self.abandons = 0       # appels de fond non terminés à la fin du test
+
+    def ajouter(self, endpoint, ms, statut, server_timing):
+        self.latences[endpoint].append(ms)
+        if statut >= 400 or statut == 0:
+            self.erreurs[endpoint][statut] += 1
+        m = _POOL_RE.search(server_timing or '')
+        if m:
+            self.pool[endpoint].append(float(m.group(1)))
+        m = _DB_RE.search(server_timing or '')
+        if m:
+            self.db[endpoint].append(float(m.group(1)))
+
+    def rapport(self):
+        duree = (self.fin or time.monotonic()) - self.debut
+        total = sum(len(v) for v in self.latences.values())
+        erreurs = sum(sum(e.values()) for e in self.erreurs.values())
+        lignes = {}
+        for ep in sorted(self.latences, key=lambda e: -len(self.latences[e])):
+            lat = self.latences[ep]
+            lignes[ep] = {
+                'requetes':    len(lat),
+                'rps':         round(len(lat) / duree, 2),
+                'p50_ms':      round(percentile(lat, 50), 1),
+                'p95_ms':      round(percentile(lat, 95), 1),
+                'p99_ms':      round(percentile(lat, 99), 1),
+                'max_ms':      round(max(lat), 1),
+                'db_p50_ms':   round(percentile(self.db[ep], 50), 1),
+                'pool_p95_ms': round(percentile(self.pool[ep], 95), 1),
+                'pool_max_ms': round(max(self.pool[ep] or [0]), 1),
+                'erreurs':     dict(self.erreurs[ep]),
+                'taux_erreur': round(sum(self.erreurs[ep].values()) / len(lat) * 100, 2),
+            }
+        toutes = [ms for v in self.latences.values() for ms in v]
+        return {
+            'duree_s':     round(duree, 1),
+            'requetes':    total,
+            'rps':         round(total / duree, 2) if duree else 0,
+            'p50_ms':      round(percentile(toutes, 50), 1),
+            'p95_ms':      round(percentile(toutes, 95), 1),
+            'taux_erreur': round(erreurs / total * 100, 2) if total else 0,
+            'abandons':    self.abandons,
+            'pool_attente_p95_ms': round(percentile(
+                [ms for v in self.pool.values() for ms in v], 95), 1),
+            'endpoints':   lignes,
+        }
+
+
+def afficher(r, params):
+    print('\n' + ', '.join(f"{k}={v}" for k, v in params.items()))
+    print(f"{r['requetes']} requêtes en {r['duree_s']} s — {r['rps']} req/s, "
+          f"p50 {r['p50_ms']} ms, p95 {r['p95_ms']} ms, erreurs {r['taux_erreur']} %, "
+          f"attente pool p95 {r['pool_attente_p95_ms']} ms, "
+          f"appels de fond abandonnés {r['abandons']}\n")
+    print(f"{'endpoint':<24}{'req':>7}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}"
+          f"{'max':>9}{'db p50':>9}{'pool p95':>10}{'err %':>7}")
+    for ep, l in r['endpoints'].items():
+        print(f"{ep:<24}{l['requetes']:>7}{l['rps']:>8}{l['p50_ms']:>9}{l['p95_ms']:>9}"
+              f"{l['p99_ms']:>9}{l['max_ms']:>9}{l['db_p50_ms']:>9}{l['pool_p95_ms']:>10}"
+              f"{l['taux_erreur']:>7}")
+
+
+# ── Utilisateur virtuel ─────────────────────────────────────────────────────
+
+class Utilisateur:
+    def __init__(self, client, stats, login, mot_de_passe, pause, rnd, batch=True):
+        self.client = client
+        self.stats = stats
+        self.login = login
+        self.mot_de_passe = mot_de_passe
+        self.pause = pause
+        self.rnd = rnd
+        self.headers = {}
+        self.fond = []
+        self.batch = batch
+
+    async def appel(self, methode, chemin, **kwargs):
+        debut = time.perf_counter()
+        try:
+            r = await self.client.request(methode, '/api' + chemin, headers=self.headers, **kwargs)
+            statut, timing = r.status_code, r.headers.get('Server-Timing')
+        except httpx.HTTPError:
+            statut, timing = 0, None
+        self.stats.ajouter(f"{methode} {_endpoint(chemin)}" if methode != 'GET' else _endpoint(chemin),
+                           (time.perf_counter() - debut) * 1000, statut, timing)
+        return statut
+
+    async def etape(self, chemins):
+        if self.batch and len(chemins) > 1:
+            # app.js : GET lancés ensemble → un seul POST /api/batch
+            await self.appel('POST', '/batch', json={'requests': chemins, 'parallele': True})
+        else:
+            await asyncio.gather(*(self.appel('GET', c) for c in chemins))
+
+    async def connexion(self):
+        r = await self.client.post('/api/auth/login',
+                                   json={'login': self.login, 'password': self.mot_de_passe})
+        r.raise_for_status()
+        self.headers = {'Authorization': f"Bearer {r.json()['token']}"}
+        # app.js : loadModules() ; initRefs().then(() => { loadDashboard(); loadNotifications(); })
+        #          + _bgPost('/notifications/generate'), jamais attendu par la SPA.
+        # Avec /batch, dashboard et notifications sont préchargés dans le même lot.
+        self.fond.append(asyncio.ensure_future(
+            self.appel('POST', '/notifications/generate', json={})))
+        if self.batch:
+            await self.etape(['/modules', '/referentiels', '/dashboard', '/notifications'])
+        else:
+            await self.etape(['/modules', '/referentiels'])
+            await self.etape(['/dashboard', '/notifications'])
+
+    async def reflechir(self):
+        await asyncio.sleep(self.rnd.uniform(*self.pause))
+
+    async def session(self, fin):
+        await self.connexion()
+        noms = list(ONGLETS)
+        poids = [ONGLETS[n][0] for n in noms]
+        while time.monotonic() < fin:
+            await self.reflechir()
+            for chemins in ONGLETS[self.rnd.choices(noms, poids)[0]][1]:
+                await self.etape(chemins)
+
+
+async def lancer(url, utilisateurs, duree, montee, pause, mot_de_passe, graine, batch=True):
+    stats = Statistiques()
+    rnd = random.Random(graine)
+    limits = httpx.Limits(max_connections=utilisateurs * 4, max_keepalive_connections=utilisateurs * 4)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+        stats.debut = time.monotonic()
+        fin = stats.debut + duree
+        taches, utilisateurs_ = [], []
+        for i in range(utilisateurs):
+            u = Utilisateur(client, stats, COMPTES[i % len(COMPTES)], mot_de_passe, pause,
+                            random.Random(rnd.random()), batch)
+            utilisateurs_.append(u)
+            taches.append(asyncio.ensure_future(u.session(fin)))
+            if montee:
+                await asyncio.sleep(montee / utilisateurs)
+        await asyncio.gather(*taches)
+        stats.fin = time.monotonic()
+        # Appels de fond encore en cours à la fin du test : abandonnés
+        en_cours = [t for u in utilisateurs_ for t in u.fond if not t.done()]
+        for t in en_cours:
+            t.cancel()
+        await asyncio.gather(*en_cours, return_exceptions=True)
+        stats.abandons = len(en_cours)
+    return stats.rapport()
+
+
+# ── Serveur local ───────────────────────────────────────────────────────────
+
+def demarrer_serveur(args):
+    env = dict(os.environ,
+               DB_NAME=os.getenv('BENCH_DB_NAME', 'bmp_bench'),
+               GUNICORN_BIND=args.bind, GUNICORN_WORKERS=str(args.workers),
+               DB_POOL_MAX=str(args.pool_max), SQL_PARALLELE=str(args.sql_parallele))
+    # gunicorn.conf.py fixe threads : 1 explicite, sinon sync devient gthread
+    threads = args.threads if args.worker_class == 'gthread' else 1
+    cmd = [sys.executable, '-m', 'gunicorn', 'server:app', '-k', args.worker_class,
+           '--threads', str(threads)]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://{args.bind}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn s'est arrêté (code {proc.returncode})")
+        try:
+            if httpx.get(url + '/api/health/ready', timeout=2).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit("gunicorn non prêt après 60 s")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Test de charge par scénarios de la SPA")
+    p.add_argument('--url', default='http://127.0.0.1:5000')
+    p.add_argument('--utilisateurs', type=int, default=10)
+    p.add_argument('--duree', type=float, default=60, help="secondes")
+    p.add_argument('--montee', type=float, default=10, help="montée en charge, secondes")
+    p.add_argument('--pause', default='1-3', help="temps de réflexion min-max, secondes")
+    p.add_argument('--mot-de-passe', default=os.getenv('BENCH_PASSWORD', 'Bench1234!'))
+    p.add_argument('--graine', type=int, default=42)
+    p.add_argument('--json', help="écrire le rapport dans ce fichier")
+    p.add_argument('--sans-batch', action='store_true',
+                   help="un GET par appel, sans regrouper les Promise.all dans /api/batch")
+    srv = p.add_argument_group('serveur local (--serveur)')
+    srv.add_argument('--serveur', action='store_true', help="démarrer gunicorn sur la base du banc")
+    srv.add_argument('--bind', default='127.0.0.1:5098')
+    srv.add_argument('--workers', type=int, default=2)
+    srv.add_argument('--worker-class', default='sync', choices=['sync', 'gthread'])
+    srv.add_argument('--threads', type=int, default=4)
+    srv.add_argument('--pool-max', type=int, default=10)
+    srv.add_argument('--sql-parallele', type=int, default=4,
+                     help="threads SQL par worker des routes d'agrégation (0 = en séquence)")
+    args = p.parse_args(argv)
+
+    pause = tuple(float(x) for x in args.pause.split('-', 1)) if '-' in args.pause \
+        else (float(args.pause),) * 2
+    params = {'utilisateurs': args.utilisateurs, 'duree_s': args.duree, 'pause_s': pause,
+              'batch': not args.sans_batch}
+    proc, url = None, args.url
+    if args.serveur:
+        proc, url = demarrer_serveur(args)
+        params.update(workers=args.workers, worker_class=args.worker_class,
+                      threads=args.threads if args.worker_class == 'gthread' else 1,
+                      db_pool_max=args.pool_max, sql_parallele=args.sql_parallele)
+    try:
+        r = asyncio.run(lancer(url, args.utilisateurs, args.duree, args.montee, pause,
+                               args.mot_de_passe, args.graine, not args.sans_batch))
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=35)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    r['parametres'] = params
+    afficher(r, params)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(r, f, indent=2, ensure_ascii=False)
+    return 1 if r['taux_erreur'] > 1 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
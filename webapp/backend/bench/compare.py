@@ -0,0 +1,64 @@
+"""
+Compare deux résultats du banc (fichiers --benchmark-json de pytest-benchmark).
+
+    python -m bench.compare .benchmarks/<machine>/0001_….json .benchmarks/<machine>/0002_….json [--seuil 20]
+
+Code retour 1 si une route régresse : p95 au-delà du seuil (%) ou davantage
+d'allers-retours SQL.
+"""
+import argparse
+import json
+import sys
+
+
+def charger(chemin):
+    with open(chemin, encoding='utf-8') as f:
+        data = json.load(f)
+    out = {}
+    for b in data.get('benchmarks', []):
+        info = b.get('extra_info', {})
+        out[b['name']] = {
+            'p50': info.get('p50_ms'),
+            'p95': info.get('p95_ms'),
+            'sql': info.get('sql_round_trips'),
+        }
+    return data.get('commit_info', {}).get('id', '')[:10], out
+
+
+def comparer(avant, apres, seuil=20.0):
+    """[(nom, avant, apres, delta_p95_pct, regression)] pour les routes communes."""
+    lignes = []
+    for nom in sorted(set(avant) & set(apres)):
+        a, b = avant[nom], apres[nom]
+        delta = ((b['p95'] - a['p95']) / a['p95'] * 100) if a['p95'] else 0.0
+        regression = delta > seuil or (b['sql'] or 0) > (a['sql'] or 0)
+        lignes.append((nom, a, b, delta, regression))
+    return lignes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Comparaison de deux runs du banc")
+    parser.add_argument('avant')
+    parser.add_argument('apres')
+    parser.add_argument('--seuil', type=float, default=20.0,
+                        help="régression tolérée sur le p95, en %% (défaut 20)")
+    args = parser.parse_args(argv)
+
+    commit_a, avant = charger(args.avant)
+    commit_b, apres = charger(args.apres)
+    lignes = comparer(avant, apres, args.seuil)
+
+    print(f"{'route':<55} {'p50':>15} {'p95':>17} {'Δp95':>7} {'SQL':>9}")
+    print(f"{'':<55} {commit_a:>7}→{commit_b:<7}")
+    for nom, a, b, delta, regression in lignes:
+        print(f"{nom:<55} {a['p50']:>7.1f}→{b['p50']:<7.1f} {a['p95']:>8.1f}→{b['p95']:<8.1f}"
+              f"{delta:>+6.0f}% {a['sql']:>4}→{b['sql']:<4}{'  ✗' if regression else ''}")
+    regressions = [l[0] for l in lignes if l[4]]
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) (seuil p95 {args.seuil:g} %, ou SQL en hausse)")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Banc de performance des routes web (pytest-benchmark).
+
+    python -m bench.seed --db bmp_bench
+    BENCH_DB_NAME=bmp_bench python -m pytest bench/ --benchmark-autosave
+    python -m bench.compare .benchmarks/<machine>/0001_<commit>.json .benchmarks/<machine>/0002_<commit>.json
+
+--benchmark-autosave enregistre un JSON par run (nommé d'après le commit)
+dans .benchmarks/ ; bench.compare signale les régressions de p95 et
+d'allers-retours SQL entre deux runs.
+
+Les routes sont appelées via le client de test Flask avec les comptes
+bench_admin / bench_gest / bench_lect créés par bench.seed. Pour chaque
+route : p50/p95 (ms) et nombre d'allers-retours SQL dans extra_info.
+
+test_bench_sql.py vérifie les budgets d'allers-retours SQL de ces routes
+(détection N+1, voir app/services/sql_trace_service.py).
+
+Test de charge (utilisateurs concurrents, scénarios de la SPA, gunicorn
+réel) : python -m bench.charge, hors pytest.
+
+Sans BENCH_DB_NAME (ou sans pytest-benchmark), le banc n'est pas collecté :
+`python -m pytest` reste limité aux tests unitaires. Lancer le banc seul
+(`pytest bench/`) : DB_NAME doit être fixé avant l'import du serveur.
+"""
+import os
+
+import pytest
+
+BENCH_DB_NAME = os.getenv('BENCH_DB_NAME')
+
+collect_ignore = []
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    collect_ignore.append('test_bench_routes.py')
+if not BENCH_DB_NAME:
+    collect_ignore += ['test_bench_routes.py', 'test_bench_sql.py']
+else:
+    os.environ['DB_NAME'] = BENCH_DB_NAME
+    os.environ.setdefault('DB_HOST', 'localhost')
+
+ROLES = {'admin': 'bench_admin', 'gestionnaire': 'bench_gest', 'lecteur': 'bench_lect'}
+
+
+@pytest.fixture(scope='session')
+def client():
+    from server import app
+    app.testing = True
+    return app.test_client()
+
+
+@pytest.fixture(scope='session')
+def auth(client):
+    """En-têtes Authorization par rôle."""
+    from bench.seed import BENCH_PASSWORD
+    headers = {}
+    for role, login in ROLES.items():
+        r = client.post('/api/auth/login', json={'login': login, 'password': BENCH_PASSWORD})
+        assert r.status_code == 200, f"connexion {login} impossible : lancer python -m bench.seed"
+        headers[role] = {'Authorization': f"Bearer {r.get_json()['token']}"}
+    return headers
+
+
+@pytest.fixture(scope='session')
+def ids(client):
+    """Identifiants d'objets existants pour les routes de détail."""
+    from app.services.database_service import DatabaseService
+    db = DatabaseService()
+    bench = db.fetch_one("SELECT id FROM utilisateurs WHERE login = 'bench_gest'")['id']
+
+    def premier(sql, params=None):
+        row = db.fetch_one(sql, params or [])
+        return row['id'] if row else 0
+
+    return {
+        'projet_id':  premier("SELECT id FROM projets WHERE created_by_id = %s ORDER BY id LIMIT 1", [bench]),
+        'bc_id':      premier("SELECT id FROM bons_commande WHERE created_by_id = %s ORDER BY id LIMIT 1", [bench]),
+        'contrat_id': premier("SELECT id FROM contrats WHERE created_by_id = %s ORDER BY id LIMIT 1", [bench]),
+        'tache_id':   premier("SELECT id FROM taches WHERE created_by_id = %s ORDER BY id LIMIT 1", [bench]),
+        'budget_id':  premier("SELECT budget_id AS id FROM budget_permissions WHERE user_id = %s "
+                              "ORDER BY budget_id LIMIT 1", [bench]),
+    }
+
+
+@pytest.fixture
+def sql_trace():
+    """Requêtes SQL exécutées pendant le test (voir sql_trace_service)."""
+    from app.services.sql_trace_service import SqlTrace
+    with SqlTrace() as trace:
+        yield trace
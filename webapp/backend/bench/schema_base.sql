@@ -0,0 +1,206 @@
+-- Schéma de départ d'une base vierge pour le banc de performance.
+-- Tables historiques (créées avant l'application web, que les migrations
+-- de migrations/ complètent par ALTER TABLE … ADD COLUMN IF NOT EXISTS).
+
+CREATE TABLE IF NOT EXISTS services (
+    id             SERIAL PRIMARY KEY,
+    code           VARCHAR(50),
+    nom            VARCHAR(200) NOT NULL,
+    parent_id      INTEGER REFERENCES services(id) ON DELETE SET NULL,
+    responsable_id INTEGER,
+    ordre          INTEGER DEFAULT 0,
+    date_creation  TIMESTAMP DEFAULT NOW(),
+    date_maj       TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS utilisateurs (
+    id            SERIAL PRIMARY KEY,
+    nom           VARCHAR(100) NOT NULL,
+    prenom        VARCHAR(100),
+    email         VARCHAR(200),
+    fonction      VARCHAR(200),
+    telephone     VARCHAR(50),
+    actif         BOOLEAN DEFAULT TRUE,
+    date_creation TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS contacts (
+    id            SERIAL PRIMARY KEY,
+    nom           VARCHAR(100) NOT NULL,
+    prenom        VARCHAR(100),
+    email         VARCHAR(200),
+    telephone     VARCHAR(50),
+    organisation  VARCHAR(200),
+    fonction      VARCHAR(200),
+    service_id    INTEGER,
+    type          VARCHAR(50),
+    date_creation TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS fournisseurs (
+    id                SERIAL PRIMARY KEY,
+    nom               VARCHAR(200) NOT NULL,
+    email             VARCHAR(200),
+    telephone         VARCHAR(50),
+    adresse           TEXT,
+    ville             VARCHAR(100),
+    contact_principal VARCHAR(200),
+    statut            VARCHAR(20) DEFAULT 'ACTIF',
+    date_creation     TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS entites (
+    id            SERIAL PRIMARY KEY,
+    code          VARCHAR(20) NOT NULL,
+    nom           VARCHAR(200) NOT NULL,
+    siret         VARCHAR(20),
+    actif         BOOLEAN DEFAULT TRUE,
+    date_creation TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS applications (
+    id             SERIAL PRIMARY KEY,
+    nom            VARCHAR(200) NOT NULL,
+    entite_id      INTEGER REFERENCES entites(id),
+    fournisseur_id INTEGER REFERENCES fournisseurs(id),
+    statut         VARCHAR(20) DEFAULT 'ACTIF',
+    date_creation  TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS budgets_annuels (
+    id                   SERIAL PRIMARY KEY,
+    entite_id            INTEGER REFERENCES entites(id),
+    exercice             INTEGER NOT NULL,
+    nature               VARCHAR(20) NOT NULL,
+    montant_previsionnel NUMERIC(15,2) DEFAULT 0,
+    montant_vote         NUMERIC(15,2) DEFAULT 0,
+    montant_engage       NUMERIC(15,2) DEFAULT 0,
+    montant_solde        NUMERIC(15,2) DEFAULT 0,
+    statut               VARCHAR(20) DEFAULT 'PREVISIONNEL',
+    date_creation        TIMESTAMP DEFAULT NOW(),
+    date_maj             TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS projets (
+    id              SERIAL PRIMARY KEY,
+    code            VARCHAR(50),
+    nom             VARCHAR(300) NOT NULL,
+    description     TEXT,
+    type_projet     VARCHAR(50),
+    phase           VARCHAR(50),
+    statut          VARCHAR(50) DEFAULT 'ACTIF',
+    priorite        VARCHAR(20),
+    service_id      INTEGER,
+    date_debut      DATE,
+    date_fin_prevue DATE,
+    date_fin_reelle DATE,
+    budget_initial  NUMERIC(15,2),
+    budget_estime   NUMERIC(15,2),
+    budget_actuel   NUMERIC(15,2),
+    avancement      INTEGER DEFAULT 0,
+    date_creation   TIMESTAMP DEFAULT NOW(),
+    updated_at      TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS lignes_budgetaires (
+    id               SERIAL PRIMARY KEY,
+    budget_id        INTEGER REFERENCES budgets_annuels(id) ON DELETE CASCADE,
+    application_id   INTEGER REFERENCES applications(id),
+    projet_id        INTEGER,
+    fournisseur_id   INTEGER,
+    libelle          VARCHAR(300) NOT NULL,
+    nature           VARCHAR(20),
+    montant_prevu    NUMERIC(15,2) DEFAULT 0,
+    montant_vote     NUMERIC(15,2) DEFAULT 0,
+    montant_engage   NUMERIC(15,2) DEFAULT 0,
+    montant_solde    NUMERIC(15,2) DEFAULT 0,
+    seuil_alerte_pct INTEGER DEFAULT 80,
+    note             TEXT,
+    statut           VARCHAR(20) DEFAULT 'ACTIF',
+    date_creation    TIMESTAMP DEFAULT NOW(),
+    date_maj         TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS taches (
+    id                SERIAL PRIMARY KEY,
+    projet_id         INTEGER REFERENCES projets(id) ON DELETE CASCADE,
+    titre             VARCHAR(300) NOT NULL,
+    description       TEXT,
+    statut            VARCHAR(50) DEFAULT 'A faire',
+    priorite          VARCHAR(20),
+    date_echeance     DATE,
+    estimation_heures NUMERIC(8,2),
+    heures_reelles    NUMERIC(8,2),
+    avancement        INTEGER DEFAULT 0,
+    date_creation     TIMESTAMP DEFAULT NOW(),
+    updated_at        TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS contrats (
+    id                   SERIAL PRIMARY KEY,
+    numero_contrat       VARCHAR(100),
+    objet                TEXT,
+    fournisseur_id       INTEGER REFERENCES fournisseurs(id),
+    projet_id            INTEGER,
+    montant_initial_ht   NUMERIC(15,2),
+    montant_total_ht     NUMERIC(15,2),
+    montant_ttc          NUMERIC(15,2),
+    montant_engage       NUMERIC(15,2) DEFAULT 0,
+    nombre_reconductions INTEGER DEFAULT 0,
+    date_debut           DATE,
+    date_fin             DATE,
+    statut               VARCHAR(20) DEFAULT 'ACTIF',
+    date_creation        TIMESTAMP DEFAULT NOW(),
+    date_maj             TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS bons_commande (
+    id                  SERIAL PRIMARY KEY,
+    numero_bc           VARCHAR(100),
+    objet               TEXT,
+    fournisseur_id      INTEGER REFERENCES fournisseurs(id),
+    projet_id           INTEGER,
+    contrat_id          INTEGER,
+    entite_id           INTEGER,
+    ligne_budgetaire_id INTEGER,
+    montant_ht          NUMERIC(15,2),
+    montant_ttc         NUMERIC(15,2),
+    montant_engage      NUMERIC(15,2) DEFAULT 0,
+    statut              VARCHAR(20) DEFAULT 'BROUILLON',
+    valide              BOOLEAN DEFAULT FALSE,
+    impute              BOOLEAN DEFAULT FALSE,
+    budget_impute       VARCHAR(20),
+    date_validation     TIMESTAMP,
+    date_imputation     TIMESTAMP,
+    date_solde          TIMESTAMP,
+    date_creation       TIMESTAMP DEFAULT NOW(),
+    date_maj            TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS projet_equipe (
+    id             SERIAL PRIMARY KEY,
+    projet_id      INTEGER REFERENCES projets(id) ON DELETE CASCADE,
+    utilisateur_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS projet_prestataires (
+    id             SERIAL PRIMARY KEY,
+    projet_id      INTEGER REFERENCES projets(id) ON DELETE CASCADE,
+    fournisseur_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS projet_contacts (
+    id         SERIAL PRIMARY KEY,
+    projet_id  INTEGER REFERENCES projets(id) ON DELETE CASCADE,
+    contact_id INTEGER NOT NULL,
+    role       VARCHAR(50)
+);
+
+CREATE TABLE IF NOT EXISTS projet_documents (
+    id            SERIAL PRIMARY KEY,
+    projet_id     INTEGER REFERENCES projets(id) ON DELETE CASCADE,
+    nom_fichier   VARCHAR(300),
+    type_document VARCHAR(50),
+    taille        INTEGER,
+    date_ajout    TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,434 @@
+"""
+Jeu de données synthétique pour le banc de performance (volumes réalistes).
+
+    python -m bench.seed --db bmp_bench [--echelle 1.0] [--graine 42]
+
+La base est recréée sur le serveur DB_HOST/DB_PORT (localhost:5432 par
+défaut, jamais le serveur de production implicite) : schéma de départ
+(bench/schema_base.sql), puis migrations de migrations/, puis remplissage
+par COPY. Une base existante n'est supprimée que si elle a été créée par ce
+script (table bench_meta).
+
+Comptes créés (mot de passe BENCH_PASSWORD, « Bench1234! » par défaut) :
+    bench_admin (admin), bench_gest (gestionnaire), bench_lect (lecteur)
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import bcrypt
+import psycopg2
+
+logger = logging.getLogger('bench.seed')
+
+SCHEMA_BASE = os.path.join(os.path.dirname(__file__), 'schema_base.sql')
+BENCH_PASSWORD = os.getenv('BENCH_PASSWORD', 'Bench1234!')
+
+# Volumes pour --echelle 1.0
+VOLUMES = {
+    'utilisateurs':       300,
+    'contacts':           600,
+    'fournisseurs':       400,
+    'applications':       150,
+    'lignes_budgetaires': 2000,
+    'projets':            1500,
+    'taches':             30000,
+    'contrats':           3000,
+    'bons_commande':      50000,
+    'notifications':      5000,
+}
+ENTITES   = [('VILLE', 'Ville'), ('CCAS', "Centre communal d'action sociale"),
+             ('CAISSE', 'Caisse des écoles'), ('SIVU', 'Syndicat intercommunal')]
+NATURES   = ['FONCTIONNEMENT', 'INVESTISSEMENT']
+COMPTES_BENCH = [('bench_admin', 'admin'), ('bench_gest', 'gestionnaire'),
+                 ('bench_lect', 'lecteur')]
+
+STATUTS_PROJET = ['ACTIF'] * 4 + ['En cours'] * 3 + ['EN_ATTENTE', 'Terminé', 'Annulé']
+STATUTS_TACHE  = ['A faire'] * 3 + ['En cours'] * 3 + ['Terminé'] * 3 + ['Bloqué']
+STATUTS_BC     = ['BROUILLON', 'EN_ATTENTE', 'VALIDE', 'VALIDE', 'IMPUTE', 'IMPUTE',
+                  'IMPUTE', 'SOLDE', 'SOLDE', 'REFUSE']
+STATUTS_CONTRAT = ['ACTIF'] * 6 + ['RECONDUIT'] * 2 + ['EXPIRE', 'RESILIE']
+PRIORITES      = ['BASSE', 'NORMALE', 'NORMALE', 'HAUTE', 'CRITIQUE']
+NOMS    = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand',
+           'Leroy', 'Moreau', 'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'David']
+PRENOMS = ['Camille', 'Louis', 'Léa', 'Hugo', 'Chloé', 'Jules', 'Manon', 'Arthur', 'Inès',
+           'Paul', 'Emma', 'Lucas', 'Sarah', 'Nathan', 'Julie', 'Tom']
+OBJETS  = ['Maintenance', 'Licences', 'Hébergement', 'Matériel', 'Prestation',
+           'Formation', 'Support', 'Infogérance', 'Télécom', 'Audit']
+
+
+def _copy(cur, table, cols, rows):
+    """COPY … FROM STDIN (csv) ; None → NULL."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    n = 0
+    for r in rows:
+        w.writerow([r'\N' if v is None else v for v in r])
+        n += 1
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf
+    )
+    logger.info("%-20s %7d ligne(s)", table, n)
+
+
+def _prochain_id(cur, table):
+    cur.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cur.fetchone()[0]
+
+
+class Generateur:
+    def __init__(self, cur, echelle=1.0, graine=42):
+        self.cur = cur
+        self.rnd = random.Random(graine)
+        self.n = {k: max(1, int(v * echelle)) for k, v in VOLUMES.items()}
+        self.today = date.today()
+
+    def _date(self, de, a):
+        """Date aléatoire entre today+de et today+a jours."""
+        return self.today + timedelta(days=self.rnd.randint(de, a))
+
+    def _personne(self):
+        return self.rnd.choice(NOMS), self.rnd.choice(PRENOMS)
+
+    # ── Organisation ────────────────────────────────────────────────────────
+
+    def services(self):
+        rows, sid = [], _prochain_id(self.cur, 'services')
+        self.directions, self.services_ids, self.unites = [], [], []
+        for d in range(4):
+            rows.append((sid, f'DIR{d + 1}', f'Direction {d + 1}', None, True, False, None))
+            self.directions.append(sid)
+            dir_id, sid = sid, sid + 1
+            for s in range(3):
+                rows.append((sid, f'S{d + 1}{s + 1}', f'Service {d + 1}.{s + 1}',
+                             dir_id, False, False, self.rnd.randint(4, 20)))
+                self.services_ids.append(sid)
+                svc_id, sid = sid, sid + 1
+                for u in range(2):
+                    rows.append((sid, f'U{d + 1}{s + 1}{u + 1}', f'Unité {d + 1}.{s + 1}.{u + 1}',
+                                 svc_id, False, True, self.rnd.randint(2, 8)))
+                    self.unites.append(sid)
+                    sid += 1
+        _copy(self.cur, 'services',
+              ['id', 'code', 'nom', 'parent_id', 'is_direction', 'is_unite', 'nb_personnes'], rows)
+
+    def utilisateurs(self):
+        hashed = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(4)).decode()
+        uid = _prochain_id(self.cur, 'utilisateurs')
+        affectations = self.services_ids + self.unites
+        self.gest_service = self.unites[0]
+        rows = []
+        for login, role in COMPTES_BENCH:
+            service = None if role == 'admin' else self.gest_service
+            rows.append((uid, 'Bench', role, f'{login}@bench.local', login, hashed,
+                         role, service, True))
+            uid += 1
+        for i in range(self.n['utilisateurs']):
+            nom, prenom = self._personne()
+            role = self.rnd.choices(['admin', 'gestionnaire', 'lecteur'], [1, 4, 15])[0]
+            rows.append((uid, nom, prenom, f'user{uid}@bench.local', f'user{uid}', hashed,
+                         role, self.rnd.choice(affectations), self.rnd.random() > 0.05))
+            uid += 1
+        _copy(self.cur, 'utilisateurs',
+              ['id', 'nom', 'prenom', 'email', 'login', 'mot_de_passe', 'role',
+               'service_id', 'actif'], rows)
+        self.cur.execute("SELECT id, login FROM utilisateurs")
+        ids = dict((login, i) for i, login in self.cur.fetchall())
+        self.bench = {login: ids[login] for login, _ in COMPTES_BENCH}
+        self.users = list(ids.values())
+
+    def _createur(self):
+        # Une part des enregistrements appartient aux comptes du banc
+        # (mêmes ordres de grandeur de visibilité que des utilisateurs réels)
+        r = self.rnd.random()
+        if r < 0.02:
+            return self.bench['bench_gest']
+        if r < 0.03:
+            return self.bench['bench_lect']
+        return self.rnd.choice(self.users)
+
+    def contacts(self):
+        cid = _prochain_id(self.cur, 'contacts')
+        rows = []
+        for i in range(self.n['contacts']):
+            nom, prenom = self._personne()
+            rows.append((cid + i, nom, prenom, f'contact{cid + i}@exemple.fr',
+                         f'Organisation {i % 50}', 'Chargé de mission',
+                         self.rnd.choice(self.services_ids),
+                         self.rnd.choice(['INTERNE', 'EXTERNE', 'ELU']), self._createur()))
+        _copy(self.cur, 'contacts',
+              ['id', 'nom', 'prenom', 'email', 'organisation', 'fonction', 'service_id',
+               'type', 'created_by_id'], rows)
+        self.contacts_ids = [r[0] for r in rows]
+
+    def fournisseurs(self):
+        fid = _prochain_id(self.cur, 'fournisseurs')
+        rows = [(fid + i, f'Fournisseur {fid + i}', f'contact@fournisseur{fid + i}.fr',
+                 f'01 23 45 {i % 100:02d} {i % 97:02d}', self.rnd.choice(['Paris', 'Lyon', 'Nantes']),
+                 'ACTIF', self._createur())
+                for i in range(self.n['fournisseurs'])]
+        _copy(self.cur, 'fournisseurs',
+              ['id', 'nom', 'email', 'telephone', 'ville', 'statut', 'created_by_id'], rows)
+        self.fournisseurs_ids = [r[0] for r in rows]
+
+    # ── Budget ──────────────────────────────────────────────────────────────
+
+    def budget(self):
+        eid = _prochain_id(self.cur, 'entites')
+        entites = [(eid + i, code, nom, True) for i, (code, nom) in enumerate(ENTITES)]
+        _copy(self.cur, 'entites', ['id', 'code', 'nom', 'actif'], entites)
+        self.entites_ids = [e[0] for e in entites]
+
+        aid = _prochain_id(self.cur, 'applications')
+        apps = [(aid + i, f'Application {aid + i}', self.rnd.choice(self.entites_ids),
+                 self.rnd.choice(self.fournisseurs_ids)) for i in range(self.n['applications'])]
+        _copy(self.cur, 'applications', ['id', 'nom', 'entite_id', 'fournisseur_id'], apps)
+
+        bid = _prochain_id(self.cur, 'budgets_annuels')
+        budgets = []
+        for e in self.entites_ids:
+            for exercice in range(self.today.year - 3, self.today.year + 2):
+                for nature in NATURES:
+                    vote = self.rnd.randint(200, 5000) * 1000
+                    budgets.append((bid, e, exercice, nature, vote, vote,
+                                    'VOTE' if exercice <= self.today.year else 'PREVISIONNEL'))
+                    bid += 1
+        _copy(self.cur, 'budgets_annuels',
+              ['id', 'entite_id', 'exercice', 'nature', 'montant_previsionnel',
+               'montant_vote', 'statut'], budgets)
+        self.budgets = budgets
+
+        lid = _prochain_id(self.cur, 'lignes_budgetaires')
+        lignes = []
+        for i in range(self.n['lignes_budgetaires']):
+            b = self.rnd.choice(budgets)
+            vote = self.rnd.randint(5, 400) * 1000
+            lignes.append((lid + i, b[0], self.rnd.choice(apps)[0],
+                           self.rnd.choice(self.fournisseurs_ids),
+                           f'{self.rnd.choice(OBJETS)} {lid + i}', b[3], vote, vote, vote,
+                           self.rnd.choice([70, 80, 90]), 'ACTIF'))
+        _copy(self.cur, 'lignes_budgetaires',
+              ['id', 'budget_id', 'application_id', 'fournisseur_id', 'libelle', 'nature',
+               'montant_prevu', 'montant_vote', 'montant_solde', 'seuil_alerte_pct',
+               'statut'], lignes)
+        self.lignes = [(l[0], l[1]) for l in lignes]
+        self.budget_entite = {b[0]: b[1] for b in budgets}
+
+        perms = [(b[0], self.bench[login], role)
+                 for b in budgets[:6]
+                 for login, role in (('bench_gest', 'gestionnaire'), ('bench_lect', 'lecteur'))]
+        _copy(self.cur, 'budget_permissions', ['budget_id', 'user_id', 'role'], perms)
+
+    # ── Projets ─────────────────────────────────────────────────────────────
+
+    def projets(self):
+        pid = _prochain_id(self.cur, 'projets')
+        rows, equipe = [], []
+        for i in range(self.n['projets']):
+            debut = self._date(-900, 120)
+            budget = self.rnd.randint(10, 2000) * 1000
+            rows.append((pid + i, f'PRJ{pid + i:05d}', f'Projet {pid + i}',
+                         self.rnd.choice(STATUTS_PROJET), self.rnd.choice(PRIORITES),
+                         self.rnd.choice(self.services_ids + self.unites),
+                         debut, debut + timedelta(days=self.rnd.randint(60, 720)),
+                         budget, budget, self.rnd.randint(0, 100), self._createur(),
+                         self.rnd.choice(['VERT', 'VERT', 'ORANGE', 'ROUGE']),
+                         self.rnd.choice(self.contacts_ids), self.rnd.choice(self.contacts_ids)))
+            for u in self.rnd.sample(self.users, 3):
+                equipe.append((pid + i, u))
+        _copy(self.cur, 'projets',
+              ['id', 'code', 'nom', 'statut', 'priorite', 'service_id', 'date_debut',
+               'date_fin_prevue', 'budget_initial', 'budget_estime', 'avancement',
+               'created_by_id', 'statut_rag', 'responsable_contact_id',
+               'chef_projet_contact_id'], rows)
+        _copy(self.cur, 'projet_equipe', ['projet_id', 'utilisateur_id'], equipe)
+        self.projets_ids = [r[0] for r in rows]
+
+    def taches(self):
+        tid = _prochain_id(self.cur, 'taches')
+        rows = []
+        for i in range(self.n['taches']):
+            debut = self._date(-400, 90)
+            estim = self.rnd.choice([2, 4, 8, 16, 24, 40])
+            statut = self.rnd.choice(STATUTS_TACHE)
+            assignee = None if self.rnd.random() < 0.1 else self._createur()
+            rows.append((tid + i, self.rnd.choice(self.projets_ids), f'Tâche {tid + i}',
+                         statut, self.rnd.choice(PRIORITES), debut,
+                         debut + timedelta(days=self.rnd.randint(1, 60)), estim,
+                         round(estim * self.rnd.uniform(0, 1.4), 1),
+                         100 if statut == 'Terminé' else self.rnd.randint(0, 90),
+                         assignee, self._createur(),
+                         self.rnd.choice(['dev', 'reunion', 'analyse', 'autre'])))
+        _copy(self.cur, 'taches',
+              ['id', 'projet_id', 'titre', 'statut', 'priorite', 'date_debut',
+               'date_echeance', 'estimation_heures', 'heures_reelles', 'avancement',
+               'assignee_id', 'created_by_id', 'type_tache'], rows)
+
+    # ── Achats ──────────────────────────────────────────────────────────────
+
+    def contrats(self):
+        cid = _prochain_id(self.cur, 'contrats')
+        rows = []
+        for i in range(self.n['contrats']):
+            fin = self._date(-365, 1100)
+            ht = self.rnd.randint(5, 900) * 1000
+            rows.append((cid + i, f'MAR-{cid + i:05d}', f'{self.rnd.choice(OBJETS)} {cid + i}',
+                         self.rnd.choice(self.fournisseurs_ids), ht, ht, round(ht * 1.2, 2),
+                         fin - timedelta(days=self.rnd.choice([365, 730, 1095, 1460])), fin,
+                         self.rnd.choice(STATUTS_CONTRAT),
+                         self.rnd.choice(['MAPA', 'AO', 'ACCORD_CADRE']),
+                         self.rnd.randint(0, 3), self._createur()))
+        _copy(self.cur, 'contrats',
+              ['id', 'numero_contrat', 'objet', 'fournisseur_id', 'montant_initial_ht',
+               'montant_total_ht', 'montant_ttc', 'date_debut', 'date_fin', 'statut',
+               'type_marche', 'nombre_reconductions', 'created_by_id'], rows)
+        self.contrats_ids = [r[0] for r in rows]
+
+    def bons_commande(self):
+        bid = _prochain_id(self.cur, 'bons_commande')
+
+        def rows():
+            for i in range(self.n['bons_commande']):
+                ligne_id, budget_id = self.rnd.choice(self.lignes)
+                statut = self.rnd.choice(STATUTS_BC)
+                ht = round(self.rnd.uniform(50, 40000), 2)
+                cree = self._date(-1400, 0)
+                valide = statut in ('VALIDE', 'IMPUTE', 'SOLDE')
+                yield (bid + i, f'BC{cree.year}-{bid + i:06d}', f'{self.rnd.choice(OBJETS)} {i}',
+                       self.rnd.choice(self.fournisseurs_ids),
+                       self.rnd.choice(self.projets_ids) if self.rnd.random() < 0.5 else None,
+                       self.rnd.choice(self.contrats_ids) if self.rnd.random() < 0.3 else None,
+                       self.budget_entite[budget_id], ligne_id, ht, round(ht * 1.2, 2),
+                       statut, valide, statut in ('IMPUTE', 'SOLDE'),
+                       cree if valide else None, cree, self._createur())
+        _copy(self.cur, 'bons_commande',
+              ['id', 'numero_bc', 'objet', 'fournisseur_id', 'projet_id', 'contrat_id',
+               'entite_id', 'ligne_budgetaire_id', 'montant_ht', 'montant_ttc', 'statut',
+               'valide', 'impute', 'date_validation', 'date_creation', 'created_by_id'], rows())
+
+        # Engagés / soldes cohérents avec les BC
+        self.cur.execute("""
+            UPDATE lignes_budgetaires l
+               SET montant_engage = s.engage,
+                   montant_solde  = l.montant_vote - s.engage
+              FROM (SELECT ligne_budgetaire_id AS id, SUM(montant_ttc) AS engage
+                      FROM bons_commande
+                     WHERE statut IN ('VALIDE', 'IMPUTE', 'SOLDE')
+                     GROUP BY ligne_budgetaire_id) s
+             WHERE s.id = l.id
+        """)
+        self.cur.execute("""
+            UPDATE budgets_annuels b
+               SET montant_engage = s.engage,
+                   montant_solde  = b.montant_vote - s.engage
+              FROM (SELECT budget_id AS id, SUM(montant_engage) AS engage
+                      FROM lignes_budgetaires GROUP BY budget_id) s
+             WHERE s.id = b.id
+        """)
+
+    def notifications(self):
+        cibles = list(self.bench.values()) + self.users[:50]
+        rows = [(self.rnd.choice(cibles), f'Notification {i}', 'Échéance proche',
+                 self.rnd.random() < 0.6, self.rnd.choice(['INFO', 'ATTENTION', 'CRITIQUE']),
+                 'contrat', self.rnd.choice(self.contrats_ids),
+                 f"{self._date(-60, 0)} 08:00:00")
+                for i in range(self.n['notifications'])]
+        _copy(self.cur, 'notifications',
+              ['user_id', 'titre', 'message', 'lue', 'niveau', 'ref_type', 'ref_id',
+               'date_creation'], rows)
+
+    def tout(self):
+        for etape in (self.services, self.utilisateurs, self.contacts, self.fournisseurs,
+                      self.budget, self.projets, self.taches, self.contrats,
+                      self.bons_commande, self.notifications):
+            etape()
+        for table in ('services', 'utilisateurs', 'contacts', 'fournisseurs', 'entites',
+                      'applications', 'budgets_annuels', 'lignes_budgetaires', 'projets',
+                      'taches', 'contrats', 'bons_commande', 'notifications'):
+            self.cur.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+            )
+
+
+# ── Base ────────────────────────────────────────────────────────────────────
+
+def _connexion(dbname):
+    return psycopg2.connect(
+        host=os.getenv('DB_HOST', 'localhost'), port=int(os.getenv('DB_PORT', '5432')),
+        dbname=dbname, user=os.getenv('DB_USER', 'admin'),
+        password=os.getenv('DB_PASS', ''), connect_timeout=10,
+    )
+
+
+def recreer_base(nom):
+    """DROP + CREATE de la base (refusé si elle n'a pas été créée par le banc)."""
+    conn = _connexion('postgres')
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", [nom])
+            if cur.fetchone():
+                try:
+                    with _connexion(nom) as c2, c2.cursor() as cur2:
+                        cur2.execute("SELECT 1 FROM bench_meta LIMIT 1")
+                except psycopg2.Error:
+                    raise SystemExit(f"La base {nom} existe et n'a pas été créée par le banc : abandon")
+                cur.execute(f'DROP DATABASE "{nom}"')
+            cur.execute(f'CREATE DATABASE "{nom}" ENCODING \'UTF8\' TEMPLATE template0')
+    finally:
+        conn.close()
+
+
+def seed(nom, echelle=1.0, graine=42):
+    debut = time.monotonic()
+    recreer_base(nom)
+    conn = _connexion(nom)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CREATE TABLE bench_meta (cle VARCHAR(50) PRIMARY KEY, valeur TEXT)")
+            with open(SCHEMA_BASE, encoding='utf-8') as f:
+                cur.execute(f.read())
+        conn.commit()
+        # Import différé : database_service ouvre son pool sur DB_NAME dès l'import
+        os.environ['DB_NAME'] = nom
+        os.environ.setdefault('DB_HOST', 'localhost')
+        from app.services.migration_service import run_migrations
+        run_migrations(conn=conn)
+        with conn.cursor() as cur:
+            Generateur(cur, echelle, graine).tout()
+            cur.executemany("INSERT INTO bench_meta VALUES (%s, %s)", [
+                ('echelle', str(echelle)), ('graine', str(graine)),
+                ('date', time.strftime('%Y-%m-%d %H:%M:%S')),
+            ])
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE")
+    finally:
+        conn.close()
+    logger.info("Base %s prête en %.1f s", nom, time.monotonic() - debut)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Jeu de données du banc de performance")
+    parser.add_argument('--db', default=os.getenv('BENCH_DB_NAME', 'bmp_bench'),
+                        help="base à (re)créer (défaut : BENCH_DB_NAME ou bmp_bench)")
+    parser.add_argument('--echelle', type=float, default=1.0,
+                        help="multiplicateur des volumes (1.0 = 50 000 BC)")
+    parser.add_argument('--graine', type=int, default=42)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    seed(args.db, args.echelle, args.graine)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Routes chaudes de la SPA, par rôle. Voir bench/conftest.py pour le lancement.
+BENCH_ROUNDS : nombre de mesures par route (défaut 15).
+"""
+import os
+
+import pytest
+
+from app.services.sql_trace_service import SqlTrace
+
+ROUNDS = int(os.getenv('BENCH_ROUNDS', '15'))
+
+ROUTES = [
+    ('dashboard',       '/api/dashboard'),
+    ('notifications',   '/api/notifications'),
+    ('referentiels',    '/api/referentiels'),
+    ('bc_liste',        '/api/bon_commande'),
+    ('bc_stats',        '/api/bon_commande/stats'),
+    ('bc_detail',       '/api/bon_commande/{bc_id}'),
+    ('contrats',        '/api/contrat'),
+    ('contrat_alertes', '/api/contrat/alertes'),
+    ('contrat_detail',  '/api/contrat/{contrat_id}'),
+    ('projets',         '/api/projet'),
+    ('projet_detail',   '/api/projet/{projet_id}'),
+    ('taches',          '/api/tache'),
+    ('kanban',          '/api/kanban'),
+    ('gantt',           '/api/gantt'),
+    ('gantt_annuel',    '/api/gantt?zoom=quarter&date_debut=2026-01-01&date_fin=2026-12-31'),
+    ('gantt_semaine',   '/api/gantt?zoom=week&date_debut=2026-01-01&date_fin=2026-03-31'),
+    ('budget',          '/api/budget'),
+    ('budget_detail',   '/api/budget/{budget_id}/detail'),
+    ('lignes',          '/api/lignes'),
+    ('etp',             '/api/etp'),
+    ('service_org',     '/api/service_org'),
+    ('service_arbre',   '/api/service_org/arbre'),
+]
+
+
+def percentile(valeurs, q):
+    """Percentile par rang le plus proche (valeurs en secondes → ms)."""
+    v = sorted(valeurs)
+    k = max(0, min(len(v) - 1, int(round(q / 100 * len(v) + 0.5)) - 1))
+    return round(v[k] * 1000, 2)
+
+
+@pytest.mark.parametrize('role', ['admin', 'gestionnaire', 'lecteur'])
+@pytest.mark.parametrize('nom,chemin', ROUTES, ids=[r[0] for r in ROUTES])
+def test_route(benchmark, client, auth, ids, nom, chemin, role):
+    url, headers = chemin.format(**ids), auth[role]
+
+    # Premier appel : caches et requêtes préparées chauds, statut vérifié
+    r = client.get(url, headers=headers)
+    assert r.status_code < 500, f"{url} ({role}) : {r.status_code} {r.get_data(as_text=True)[:200]}"
+
+    with SqlTrace() as trace:
+        r = client.get(url, headers=headers)
+
+    benchmark.group = nom
+    benchmark.extra_info.update({
+        'role':                role,
+        'url':                 url,
+        'status':              r.status_code,
+        'octets':              len(r.get_data()),
+        'sql_round_trips':     trace.count,
+        'sql_max_repetitions': max([n for _, n in trace.repetitions(1)] or [0]),
+    })
+    benchmark.pedantic(client.get, args=(url,), kwargs={'headers': headers},
+                       rounds=ROUNDS, warmup_rounds=1)
+
+    donnees = benchmark.stats.stats.data
+    benchmark.extra_info['p50_ms'] = percentile(donnees, 50)
+    benchmark.extra_info['p95_ms'] = percentile(donnees, 95)
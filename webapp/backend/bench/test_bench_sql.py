@@ -0,0 +1,416 @@
+"""
+Budgets d'allers-retours SQL des routes chaudes, sur la base du banc.
+Un dépassement signale un N+1 introduit (requête par ligne dans une boucle).
+
+Budget = (requêtes max, exécutions max d'une même requête) ; la vérification
+du compte actif par require_auth compte pour une requête.
+"""
+import pytest
+
+from app.services.sql_trace_service import max_queries
+from bench.test_bench_routes import ROUTES
+
+BUDGETS = {
+    'dashboard':       (8, 2),
+    'notifications':   (3, 1),     # liste + compte des non lues
+    'referentiels':    (10, 1),
+    'bc_liste':        (2, 1),
+    'bc_stats':        (3, 1),
+    'bc_detail':       (3, 1),
+    'contrats':        (2, 1),
+    'contrat_alertes': (2, 1),
+    'contrat_detail':  (4, 1),
+    'projets':         (2, 1),
+    'projet_detail':   (3, 1),
+    'taches':          (2, 1),
+    'kanban':          (2, 1),
+    'gantt':           (3, 1),
+    'gantt_annuel':    (3, 1),     # fenêtre de projets + agrégats par projet
+    'gantt_semaine':   (3, 1),     # fenêtre de projets + tâches de la fenêtre
+    'budget':          (2, 1),
+    'budget_detail':   (3, 1),
+    'lignes':          (2, 1),
+    'etp':             (2, 1),
+    'service_org':     (2, 1),
+    'service_arbre':   (3, 1),     # version (+ arbre si modifié)
+}
+
+# N+1 connus : à retirer une fois corrigés (strict : le test échoue s'il passe)
+CONNUS = {
+    'budget_detail': "une requête bons_commande par ligne budgétaire",
+}
+
+
+def _params():
+    for nom, chemin in ROUTES:
+        marks = [pytest.mark.xfail(reason=CONNUS[nom], strict=True)] if nom in CONNUS else []
+        yield pytest.param(nom, chemin, id=nom, marks=marks)
+
+
+@pytest.mark.parametrize('role', ['admin', 'gestionnaire', 'lecteur'])
+@pytest.mark.parametrize('nom,chemin', list(_params()))
+def test_budget_sql(client, auth, ids, nom, chemin, role):
+    url, headers = chemin.format(**ids), auth[role]
+    client.get(url, headers=headers)   # caches chauds : on mesure le régime établi
+    n, repetitions = BUDGETS[nom]
+    with max_queries(n, repetitions=repetitions):
+        r = client.get(url, headers=headers)
+    assert r.status_code < 500
+
+
+# ── Détail projet : même réponse que l'ancien chargement en plusieurs requêtes ──
+
+def _detail_ancien(db, projet_id):
+    """get_by_id d'avant l'agrégation json_agg (référence de non-régression)."""
+    from app.services.projet_service import _dec
+    p = dict(db.fetch_one(
+        "SELECT p.*, s.nom as service_nom, s.code as service_code "
+        "FROM projets p LEFT JOIN services s ON s.id = p.service_id WHERE p.id = %s",
+        [projet_id]))
+    p['taches'] = db.fetch_all(
+        "SELECT id, titre, statut, priorite, date_echeance, "
+        "estimation_heures, heures_reelles, avancement FROM taches WHERE projet_id=%s "
+        "ORDER BY date_echeance ASC NULLS LAST", [projet_id])
+    stats = {}
+    for t in p['taches']:
+        stats[t.get('statut') or 'Inconnu'] = stats.get(t.get('statut') or 'Inconnu', 0) + 1
+    p['taches_stats'] = stats
+    p['heures_estimees'] = float(sum(_dec(t.get('estimation_heures')) for t in p['taches']))
+    p['heures_reelles'] = float(sum(_dec(t.get('heures_reelles')) for t in p['taches']))
+    p['bons_commande'] = db.fetch_all(
+        "SELECT bc.id, bc.numero_bc, bc.objet, bc.montant_ht, bc.montant_ttc, "
+        "bc.statut, bc.date_creation, f.nom as fournisseur_nom "
+        "FROM bons_commande bc LEFT JOIN fournisseurs f ON f.id = bc.fournisseur_id "
+        "WHERE bc.projet_id=%s ORDER BY bc.id DESC", [projet_id])
+    p['budget_consomme_calcule'] = float(round(sum(
+        _dec(b.get('montant_ttc')) for b in p['bons_commande']
+        if b.get('statut') in ('IMPUTE', 'SOLDE', 'VALIDE')), 2))
+    p['montant_bc_total'] = float(round(sum(_dec(b.get('montant_ttc')) for b in p['bons_commande']), 2))
+    p['equipe'] = db.fetch_all(
+        "SELECT pe.id as membre_id, "
+        "  COALESCE(pe.membre_label, TRIM(COALESCE(u.prenom,'') || ' ' || COALESCE(u.nom,''))) as nom_complet, "
+        "  COALESCE(u.email, '') as email, COALESCE(u.fonction, '') as fonction, "
+        "  COALESCE(u.telephone, '') as telephone "
+        "FROM projet_equipe pe LEFT JOIN utilisateurs u ON u.id = pe.utilisateur_id "
+        "WHERE pe.projet_id = %s", [projet_id])
+    p['prestataires'] = db.fetch_all(
+        "SELECT f.nom as fournisseur_nom, f.email, f.telephone, f.contact_principal "
+        "FROM projet_prestataires pp JOIN fournisseurs f ON f.id = pp.fournisseur_id "
+        "WHERE pp.projet_id = %s", [projet_id])
+    p['contacts_externes'] = db.fetch_all(
+        "SELECT pc.contact_id, pc.role, "
+        "  COALESCE(pc.contact_libre, TRIM(COALESCE(c.prenom,'') || ' ' || COALESCE(c.nom,''))) as nom_affiche, "
+        "  COALESCE(c.nom,'') as nom, COALESCE(c.prenom,'') as prenom, "
+        "  COALESCE(c.email,'') as email, COALESCE(c.telephone,'') as telephone, "
+        "  COALESCE(c.organisation,'') as organisation "
+        "FROM projet_contacts pc LEFT JOIN contacts c ON c.id = pc.contact_id "
+        "WHERE pc.projet_id = %s", [projet_id])
+    p['documents'] = db.fetch_all(
+        "SELECT nom_fichier, type_document, taille, date_ajout "
+        "FROM projet_documents WHERE projet_id = %s ORDER BY date_ajout DESC", [projet_id])
+    for role, col in [('responsable_nom', 'responsable_contact_id'),
+                      ('chef_projet_nom', 'chef_projet_contact_id')]:
+        if p.get(col):
+            cr = db.fetch_one("SELECT nom, prenom, email, telephone FROM contacts WHERE id = %s", [p[col]])
+            if cr:
+                p[role] = f"{cr.get('prenom') or ''} {cr.get('nom') or ''}".strip()
+                p[role + '_email'] = cr.get('email')
+                p[role + '_tel'] = cr.get('telephone')
+    return p
+
+
+def test_detail_projet_identique(client):
+    """Dates (RFC 822), montants NUMERIC (Decimal) et libellés d'équipe inchangés."""
+    import json
+    from app.services.database_service import DatabaseService
+    from app.services.projet_service import ProjetService
+    db = DatabaseService()
+    projet_id = db.fetch_one(
+        "SELECT p.id FROM projets p WHERE EXISTS (SELECT 1 FROM taches t WHERE t.projet_id = p.id) "
+        "AND EXISTS (SELECT 1 FROM bons_commande b WHERE b.projet_id = p.id) "
+        "AND EXISTS (SELECT 1 FROM projet_equipe e WHERE e.projet_id = p.id) ORDER BY p.id LIMIT 1")['id']
+    fournisseur = db.fetch_one("SELECT id FROM fournisseurs ORDER BY id LIMIT 1")['id']
+    contact = db.fetch_one("SELECT id FROM contacts ORDER BY id LIMIT 1")['id']
+    membre = db.fetch_one("SELECT id, membre_label FROM projet_equipe WHERE projet_id = %s "
+                          "ORDER BY id LIMIT 1", [projet_id])
+    db.execute("UPDATE projet_equipe SET membre_label = 'Renfort externe' WHERE id = %s", [membre['id']])
+    db.execute("INSERT INTO projet_documents (projet_id, nom_fichier, type_document, taille, date_ajout) "
+               "VALUES (%s, 'cahier.pdf', 'pdf', 1234, '2026-03-04 05:06:07.891'), "
+               "(%s, 'annexe.xlsx', 'xlsx', NULL, NULL)", [projet_id, projet_id])
+    db.execute("INSERT INTO projet_prestataires (projet_id, fournisseur_id) VALUES (%s, %s)",
+               [projet_id, fournisseur])
+    db.execute("INSERT INTO projet_contacts (projet_id, contact_id, role) VALUES (%s, %s, 'MOA'), "
+               "(%s, NULL, 'Autre')", [projet_id, contact, projet_id])
+    try:
+        ancien, nouveau = _detail_ancien(db, projet_id), ProjetService().get_by_id(projet_id)
+    finally:
+        db.execute("UPDATE projet_equipe SET membre_label = %s WHERE id = %s",
+                   [membre['membre_label'], membre['id']])
+        for table in ('projet_documents', 'projet_prestataires', 'projet_contacts'):
+            db.execute(f"DELETE FROM {table} WHERE projet_id = %s", [projet_id])
+
+    def normaliser(p):
+        # Listes sans ORDER BY (ou à égalités) : comparées sans tenir compte de l'ordre
+        p = json.loads(client.application.json.dumps(p))
+        for k in ('taches', 'equipe', 'prestataires', 'contacts_externes'):
+            p[k] = sorted(p[k], key=lambda x: json.dumps(x, sort_keys=True))
+        return p
+
+    assert normaliser(nouveau) == normaliser(ancien)
+    bc = client.application.json.dumps(nouveau['bons_commande'][0])
+    assert 'GMT' in bc and '"montant_ttc": "' in bc.replace('":"', '": "')
+
+
+# ── Écritures groupées : génération des notifications, duplication budget ─────
+
+def test_budget_generation_notifications(client, auth):
+    """Une lecture par source, une des non lues, un INSERT multi-lignes ; idempotente."""
+    from app.services.database_service import DatabaseService
+    db = DatabaseService()
+    dernier = db.fetch_one("SELECT COALESCE(MAX(id), 0) AS id FROM notifications")['id']
+    # Quelques tâches en retard dont la notification a été lue : à recréer
+    with db.transaction() as cur:
+        cur.execute(
+            "UPDATE notifications SET lue = true WHERE lue = false AND ref_type = 'tache' AND ref_id IN ("
+            "  SELECT id FROM taches WHERE date_echeance < CURRENT_DATE "
+            "  AND statut NOT IN ('Terminé','ANNULE') ORDER BY id LIMIT 20) RETURNING id")
+        lues = [r['id'] for r in cur.fetchall()]
+    try:
+        with max_queries(6, repetitions=1):
+            r = client.post('/api/notifications/generate', headers=auth['admin'])
+        assert r.status_code == 200 and r.get_json()['created'] > 0
+        r = client.post('/api/notifications/generate', headers=auth['admin'])
+        assert r.get_json()['created'] == 0
+    finally:
+        db.execute("DELETE FROM notifications WHERE id > %s", [dernier])
+        db.execute("UPDATE notifications SET lue = false WHERE id = ANY(%s)", [lues])
+
+
+def test_budget_duplication(client, auth):
+    """Budgets et lignes copiés en une instruction, montants revalorisés."""
+    from app.services.database_service import DatabaseService
+    db = DatabaseService()
+    source, cible = 2026, 2999
+    attendu = db.fetch_one(
+        "SELECT COUNT(DISTINCT b.id) AS budgets, COUNT(l.id) AS lignes, "
+        "SUM(ROUND(CASE WHEN COALESCE(l.montant_engage, 0) > 0 THEN l.montant_engage "
+        "ELSE COALESCE(l.montant_vote, 0) END * 1.1, 2)) AS prevu "
+        "FROM budgets_annuels b LEFT JOIN lignes_budgetaires l "
+        "ON l.budget_id = b.id AND l.statut != 'ANNULEE' WHERE b.exercice = %s", [source])
+    try:
+        with max_queries(3, repetitions=1):
+            r = client.post('/api/budget/dupliquer', headers=auth['admin'], json={
+                'source_exercice': source, 'target_exercice': cible, 'taux_revalorisation': 10})
+        assert r.status_code == 200
+        assert (r.get_json()['budgets_crees'], r.get_json()['lignes_creees']) == \
+            (attendu['budgets'], attendu['lignes'])
+        copie = db.fetch_one(
+            "SELECT COALESCE(SUM(l.montant_prevu), 0) AS prevu FROM lignes_budgetaires l "
+            "JOIN budgets_annuels b ON b.id = l.budget_id WHERE b.exercice = %s", [cible])
+        assert copie['prevu'] == (attendu['prevu'] or 0)
+        r = client.post('/api/budget/dupliquer', headers=auth['admin'], json={
+            'source_exercice': source, 'target_exercice': cible})
+        assert r.status_code == 400
+    finally:
+        db.execute("DELETE FROM lignes_budgetaires WHERE budget_id IN "
+                   "(SELECT id FROM budgets_annuels WHERE exercice = %s)", [cible])
+        db.execute("DELETE FROM budgets_annuels WHERE exercice = %s", [cible])
+
+
+# ── Fiche projet : cache invalidé par toute modification du projet ────────────
+
+def test_fiche_version_et_cache(client, auth, ids, monkeypatch):
+    from app.services import fiche_projet_html_service as fh
+    from app.services.database_service import DatabaseService
+    from app.services.fiche_projet_web_service import fiche_version_pg
+    db = DatabaseService()
+    pid = ids['projet_id']
+    rendus = []
+    rendu_reel = fh.generer_fiche_html_depuis_id_pg
+
+    def rendu(projet_id, db_):
+        rendus.append(projet_id)
+        return rendu_reel(projet_id, db_)
+
+    monkeypatch.setattr(fh, 'generer_fiche_html_depuis_id_pg', rendu)
+
+    def fiche():
+        # Place d'admission 'document' rendue à la fermeture de la réponse
+        with client.get(f'/api/projet/{pid}/fiche_html', headers=auth['admin']) as r:
+            assert r.status_code == 200
+            return r.data
+
+    v1 = fiche_version_pg(pid, db)
+    premier = fiche()
+    # Projet inchangé : même jeton, fiche relue depuis le cache
+    assert fiche_version_pg(pid, db) == v1
+    assert fiche() == premier
+    assert len(rendus) <= 1
+    description = db.fetch_one("SELECT description FROM projets WHERE id = %s", [pid])['description']
+    tache = db.fetch_one("SELECT id, titre FROM taches WHERE projet_id = %s ORDER BY id LIMIT 1", [pid])
+    service = db.fetch_one("SELECT s.id, s.nom FROM services s JOIN projets p ON p.service_id = s.id "
+                           "WHERE p.id = %s", [pid])
+    fournisseur = db.fetch_one(
+        "SELECT id, nom FROM fournisseurs f WHERE NOT EXISTS (SELECT 1 FROM projet_prestataires pp "
+        "WHERE pp.projet_id = %s AND pp.fournisseur_id = f.id) ORDER BY id LIMIT 1", [pid])
+    try:
+        db.execute("UPDATE projets SET description = 'Fiche modifiée' WHERE id = %s", [pid])
+        v2 = fiche_version_pg(pid, db)
+        assert v2 != v1
+        avant = len(rendus)
+        assert 'Fiche modifiée' in fiche().decode()
+        assert len(rendus) == avant + 1
+        if tache:
+            db.execute("UPDATE taches SET titre = titre || ' *' WHERE id = %s", [tache['id']])
+            assert fiche_version_pg(pid, db) != v2
+        # Lignes référencées affichées par la fiche : service, prestataire
+        v3 = fiche_version_pg(pid, db)
+        db.execute("UPDATE services SET nom = nom || ' *' WHERE id = %s", [service['id']])
+        v4 = fiche_version_pg(pid, db)
+        assert v4 != v3
+        db.execute("INSERT INTO projet_prestataires (projet_id, fournisseur_id) VALUES (%s, %s)",
+                   [pid, fournisseur['id']])
+        v5 = fiche_version_pg(pid, db)
+        assert v5 != v4
+        db.execute("UPDATE fournisseurs SET nom = nom || ' *' WHERE id = %s", [fournisseur['id']])
+        assert fiche_version_pg(pid, db) != v5
+        assert f"{fournisseur['nom']} *" in fiche().decode()
+    finally:
+        db.execute("UPDATE projets SET description = %s WHERE id = %s", [description, pid])
+        if tache:
+            db.execute("UPDATE taches SET titre = %s WHERE id = %s", [tache['titre'], tache['id']])
+        db.execute("UPDATE services SET nom = %s WHERE id = %s", [service['nom'], service['id']])
+        db.execute("UPDATE fournisseurs SET nom = %s WHERE id = %s", [fournisseur['nom'], fournisseur['id']])
+        db.execute("DELETE FROM projet_prestataires WHERE projet_id = %s AND fournisseur_id = %s",
+                   [pid, fournisseur['id']])
+
+
+# ── Alertes contrats : niveaux aux jours limites et comptage ?counts=1 ────────
+
+def test_alertes_contrats_seuils(client, auth):
+    from app.services.contrat_service import ContratService
+    from app.services.database_service import DatabaseService
+    db = DatabaseService()
+    attendus = {-1: 'EXPIRE', 0: 'CRITIQUE', 30: 'CRITIQUE', 31: 'ATTENTION', 90: 'ATTENTION',
+                91: 'INFO', 180: 'INFO'}
+    jours = sorted(attendus) + [181]
+    db.execute(
+        "INSERT INTO contrats (objet, statut, date_fin) "
+        "SELECT 'seuil-alerte ' || j, 'ACTIF', CURRENT_DATE + j FROM unnest(%s::int[]) j "
+        "UNION ALL SELECT 'seuil-alerte resilie', 'RESILIE', CURRENT_DATE", [jours])
+    try:
+        filtre = ("c.objet LIKE %s", ['seuil-alerte %'])
+        alertes = ContratService().get_alertes(*filtre)
+        # Au-delà de 180 jours ou résilié : hors alerte
+        assert {a['jours_restants']: a['niveau_alerte'] for a in alertes} == attendus
+        counts = ContratService().get_alertes_counts(*filtre)
+        assert counts == {'EXPIRE': 1, 'CRITIQUE': 2, 'ATTENTION': 2, 'INFO': 2}
+
+        # ?counts=1 : mêmes niveaux que la liste complète, sans les lignes
+        r = client.get('/api/contrat/alertes?counts=1', headers=auth['admin']).get_json()
+        liste = client.get('/api/contrat/alertes', headers=auth['admin']).get_json()['list']
+        assert 'list' not in r and r['total'] == len(liste)
+        assert r['counts'] == {n: sum(a['niveau_alerte'] == n for a in liste) for n in r['counts']}
+    finally:
+        db.execute("DELETE FROM contrats WHERE objet LIKE 'seuil-alerte %%'")
+
+
+# ── Gantt paginé : chaque projet une seule fois, agrégats cohérents ───────────
+
+def test_gantt_pages_et_agregat(client, auth):
+    complet = client.get('/api/gantt', headers=auth['admin']).get_json()
+    vus, apres, pages = [], '', 0
+    while True:
+        r = client.get(f'/api/gantt?zoom=month&limit=40&apres={apres}', headers=auth['admin'])
+        assert r.status_code == 200
+        page = r.get_json()
+        vus += [p['id'] for p in page['projets']]
+        pages += 1
+        apres = page['page']['suivant']
+        if not apres:
+            break
+    assert pages > 1
+    assert len(vus) == len(set(vus)) and set(vus) == {p['id'] for p in complet['projets']}
+
+    # Agrégat d'un projet : mêmes tâches que la vue détaillée non paginée
+    taches = {}
+    for t in complet['taches']:
+        taches.setdefault(t['projet_id'], []).append(t)
+    pid = max(taches, key=lambda i: len(taches[i]))
+    page = client.get(f'/api/gantt?zoom=quarter&projet_id={pid}&expand={pid}',
+                      headers=auth['admin']).get_json()
+    agregat, detail = page['projets'][0]['agregat'], taches[pid]
+    assert agregat['taches'] == len(detail) == sum(agregat['statuts'].values())
+    assert sorted(t['id'] for t in page['taches']) == sorted(t['id'] for t in detail)
+    assert agregat['fin'] == max(t['date_echeance'] for t in detail)
+    assert agregat['debut'] == min(t['date_debut'] or t['date_echeance'] for t in detail)
+    for statut, nb in agregat['statuts'].items():
+        assert nb == sum((t['statut'] or '') == statut for t in detail)
+
+
+# ── Cube ETP : jeton de version des tables jointes ───────────────────────────
+
+def test_version_cube_etp():
+    from app.services.database_service import DatabaseService
+    from app.services.etp_service import EtpService
+    db, svc = DatabaseService(), EtpService()
+    cellule = next(c for c in svc.get_cube('month', scope='test-version')['cellules']
+                   if c['assignee_id'] and c['service_id'])
+    u = {'id': cellule['assignee_id'], 'service_id': cellule['service_id']}
+    autre = db.fetch_one("SELECT id, nom FROM services WHERE id != %s ORDER BY id LIMIT 1", [u['service_id']])
+    projet = db.fetch_one("SELECT id, nom FROM projets ORDER BY id LIMIT 1")
+    v = svc.taches_version()
+    assert svc.taches_version() == v
+    try:
+        # Changement de service d'un utilisateur (hors déclencheur date_maj) : cube recalculé
+        db.execute("UPDATE utilisateurs SET service_id = %s WHERE id = %s", [autre['id'], u['id']])
+        assert svc.taches_version() != v
+        cube = svc.get_cube('month', scope='test-version')
+        assert {c['service_id'] for c in cube['cellules'] if c['assignee_id'] == u['id']} == {autre['id']}
+        v = svc.taches_version()
+        db.execute("UPDATE services SET nom = nom || ' *' WHERE id = %s", [autre['id']])
+        assert svc.taches_version() != v
+        v = svc.taches_version()
+        db.execute("UPDATE projets SET nom = nom || ' *' WHERE id = %s", [projet['id']])
+        assert svc.taches_version() != v
+    finally:
+        db.execute("UPDATE utilisateurs SET service_id = %s WHERE id = %s", [u['service_id'], u['id']])
+        db.execute("UPDATE services SET nom = %s WHERE id = %s", [autre['nom'], autre['id']])
+        db.execute("UPDATE projets SET nom = %s WHERE id = %s", [projet['nom'], projet['id']])
+
+
+# ── Synchronisation ?since= : id retirés bornés au périmètre ──────────────────
+
+def test_sync_supprimes_du_perimetre(client, auth):
+    from app.services.database_service import DatabaseService
+    db = DatabaseService()
+    lect = db.fetch_one("SELECT id FROM utilisateurs WHERE login = 'bench_lect'")['id']
+    gest = db.fetch_one("SELECT id FROM utilisateurs WHERE login = 'bench_gest'")['id']
+
+    def delta(role, cursor):
+        r = client.get(f'/api/tache?since={cursor}', headers=auth[role])
+        assert r.status_code == 200
+        return r.get_json()
+
+    def tache(proprietaire):
+        return db.execute_returning("INSERT INTO taches (titre, created_by_id, assignee_id) "
+                                    "VALUES ('sync', %s, %s) RETURNING id",
+                                    [proprietaire, proprietaire])[0]
+
+    cursor = {role: delta(role, 0)['cursor'] for role in ('lecteur', 'gestionnaire')}
+    autre, sienne, cedee = tache(gest), tache(lect), tache(lect)
+    try:
+        db.execute("DELETE FROM taches WHERE id IN (%s, %s)", [autre, sienne])
+        db.execute("UPDATE taches SET created_by_id = %s, assignee_id = %s WHERE id = %s",
+                   [gest, gest, cedee])
+        lecteur = delta('lecteur', cursor['lecteur'])
+        # Ni l'id ni la date d'une tâche qu'il n'a jamais pu voir
+        assert autre not in lecteur['deleted']
+        assert sienne in lecteur['deleted'] and cedee in lecteur['deleted']
+        gestionnaire = delta('gestionnaire', cursor['gestionnaire'])
+        assert {autre, sienne} <= set(gestionnaire['deleted'])
+        # Toujours dans son service : renvoyée, pas retirée
+        assert cedee not in gestionnaire['deleted']
+        assert cedee in {t['id'] for t in gestionnaire['list']}
+    finally:
+        db.execute("DELETE FROM taches WHERE id IN (%s, %s, %s)", [autre, sienne, cedee])
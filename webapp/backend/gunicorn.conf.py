@@ -0,0 +1,71 @@
+"""
+Configuration Gunicorn (chargée automatiquement depuis le dossier courant).
+    gunicorn server:app
+Les migrations sont appliquées avant, par `python migrate.py`.
+"""
+import os
+
+bind             = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers          = int(os.getenv('GUNICORN_WORKERS', '4'))
+# Threads : un flux /api/events occupe un thread pendant SSE_DUREE_MAX (un worker
+# sync entier sinon). Les flux sont limités à la moitié des threads, le reste
+# sert les requêtes ; leurs emprunts attendent une connexion libre du pool.
+worker_class     = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads          = int(os.getenv('GUNICORN_THREADS', '16'))
+timeout          = 120
+keepalive        = 5
+graceful_timeout = 30
+
+# Métriques Prometheus partagées entre workers (fichiers mmap, voir metrics_service)
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/bmp_metrics')
+
+
+def on_starting(server):
+    """
+    Réglages hérités par les workers, d'après la configuration effective
+    (variables d'environnement ou options de la ligne de commande) :
+    - budget de connexions PostgreSQL : DB_POOL_MAX est global, chaque worker
+      en reçoit DB_POOL_MAX // workers, dont une pour l'écoute LISTEN des flux
+      SSE. Par défaut, une connexion par thread ; un budget plus petit est
+      refusé au démarrage (voir database_service.pool_bounds) ;
+    - répertoire de métriques vidé à chaque démarrage du maître.
+    """
+    import shutil
+    w, t = server.cfg.workers, server.cfg.threads
+    os.environ['DB_POOL_WORKERS'] = str(w)
+    os.environ['DB_POOL_THREADS'] = str(t)
+    os.environ.setdefault('DB_POOL_MAX', str(w * (t + 1)))
+    os.environ.setdefault('SSE_FLUX_MAX', str(max(1, t // 2)))
+    from app.services.database_service import pool_bounds
+    pool_bounds()
+
+    d = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(d, ignore_errors=True)
+    os.makedirs(d, exist_ok=True)
+
+
+def post_fork(server, worker):
+    """Pool propre au worker, connexions ouvertes et requêtes préparées."""
+    from app.services.database_service import DatabaseService, pool_bounds
+    state = DatabaseService().warm_up()
+    minconn, maxconn = pool_bounds()
+    if state['ready']:
+        server.log.info("Worker %s prêt : pool %d–%d, %d requête(s) préparée(s) en %d ms",
+                        worker.pid, minconn, maxconn, state['prepared'], state['duree_ms'])
+    else:
+        server.log.warning("Worker %s : préchauffage en échec (%s)", worker.pid, state['erreur'])
+
+
+def child_exit(server, worker):
+    """Retire les jauges « live » du worker arrêté (exécuté dans le maître)."""
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
+
+
+def worker_exit(server, worker):
+    from app.services.database_service import DatabaseService
+    if DatabaseService._pool is not None:
+        DatabaseService._pool.closeall()
@@ -0,0 +1,39 @@
+"""
+Migrations du schéma PostgreSQL — à lancer avant le démarrage des workers.
+Usage :
+    python migrate.py               applique les migrations en attente (et les étapes
+                                    répétables, si une migration a été appliquée ou
+                                    si l'étape est nouvelle ou modifiée)
+    python migrate.py --repetables  relance en plus toutes les étapes répétables
+    python migrate.py --status      liste les migrations et leur état
+"""
+import argparse
+import logging
+import sys
+
+from app.services.migration_service import MigrationError, run_migrations, statut
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrations Budget Manager Pro (web)")
+    parser.add_argument('--status', action='store_true', help="afficher l'état des migrations")
+    parser.add_argument('--repetables', action='store_true',
+                        help="relancer toutes les étapes répétables (R_*)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    try:
+        if args.status:
+            for version, nom, etat in statut():
+                print(f"{'R' if version is None else f'{version:04d}':<4}  {nom:<45} {etat}")
+            return 0
+        n = run_migrations(forcer_repetables=args.repetables)
+        print(f"{n} migration(s) appliquée(s)" if n else "Schéma à jour")
+        return 0
+    except MigrationError as e:
+        logging.getLogger('migrations').error("%s", e)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,16 @@
+-- Colonnes projets (fiche projet, contacts liés, statut RAG)
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS objectifs TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS enjeux TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS gains TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS risques TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS contraintes TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS solutions TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS financement TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS registre_risques TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS contraintes_6axes TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS triangle_tensions TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS arbitrage TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS chef_projet_contact_id INTEGER;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS responsable_contact_id INTEGER;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS note TEXT;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS statut_rag VARCHAR(10) DEFAULT 'VERT';
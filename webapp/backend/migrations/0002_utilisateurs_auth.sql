@@ -0,0 +1,7 @@
+-- Colonnes utilisateurs (auth) + email optionnel
+ALTER TABLE utilisateurs ADD COLUMN IF NOT EXISTS login VARCHAR(100) UNIQUE;
+ALTER TABLE utilisateurs ADD COLUMN IF NOT EXISTS mot_de_passe TEXT;
+ALTER TABLE utilisateurs ADD COLUMN IF NOT EXISTS role VARCHAR(20) DEFAULT 'lecteur';
+ALTER TABLE utilisateurs ADD COLUMN IF NOT EXISTS service_id INTEGER;
+ALTER TABLE utilisateurs ALTER COLUMN email DROP NOT NULL;
+UPDATE utilisateurs SET email = NULL WHERE email = '';
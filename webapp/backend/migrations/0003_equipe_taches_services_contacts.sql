@@ -0,0 +1,18 @@
+-- Équipe projet, Gantt, unités, contacts libres
+ALTER TABLE projet_equipe ADD COLUMN IF NOT EXISTS membre_label TEXT;
+
+ALTER TABLE taches ADD COLUMN IF NOT EXISTS date_debut DATE;
+ALTER TABLE taches ADD COLUMN IF NOT EXISTS responsable_label TEXT;
+ALTER TABLE taches ADD COLUMN IF NOT EXISTS assignee_id INTEGER;
+ALTER TABLE taches ADD COLUMN IF NOT EXISTS type_tache VARCHAR(50) DEFAULT 'autre';
+ALTER TABLE taches ADD COLUMN IF NOT EXISTS rapport_reunion TEXT;
+
+ALTER TABLE services ADD COLUMN IF NOT EXISTS nb_personnes INTEGER;
+ALTER TABLE services ADD COLUMN IF NOT EXISTS membres_label TEXT;
+ALTER TABLE services ADD COLUMN IF NOT EXISTS is_unite BOOLEAN DEFAULT FALSE;
+ALTER TABLE services ADD COLUMN IF NOT EXISTS is_direction BOOLEAN DEFAULT FALSE;
+
+ALTER TABLE projet_contacts ADD COLUMN IF NOT EXISTS contact_libre TEXT;
+ALTER TABLE projet_contacts ALTER COLUMN contact_id DROP NOT NULL;
+
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS societe VARCHAR(200);
@@ -0,0 +1,7 @@
+-- Propriété des enregistrements (created_by_id)
+ALTER TABLE bons_commande ADD COLUMN IF NOT EXISTS created_by_id INTEGER;
+ALTER TABLE contrats ADD COLUMN IF NOT EXISTS created_by_id INTEGER;
+ALTER TABLE projets ADD COLUMN IF NOT EXISTS created_by_id INTEGER;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS created_by_id INTEGER;
+ALTER TABLE taches ADD COLUMN IF NOT EXISTS created_by_id INTEGER;
+ALTER TABLE fournisseurs ADD COLUMN IF NOT EXISTS created_by_id INTEGER;
@@ -0,0 +1,18 @@
+-- Contacts liés aux fournisseurs
+CREATE TABLE IF NOT EXISTS fournisseur_contacts (
+    fournisseur_id INTEGER NOT NULL,
+    contact_id     INTEGER NOT NULL,
+    PRIMARY KEY (fournisseur_id, contact_id)
+);
+
+-- Journal d'audit
+CREATE TABLE IF NOT EXISTS audit_log (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER,
+    user_login VARCHAR(100),
+    action VARCHAR(50),
+    table_name VARCHAR(50),
+    record_id INTEGER,
+    details TEXT,
+    date_creation TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,6 @@
+ALTER TABLE bons_commande ADD COLUMN IF NOT EXISTS motif_refus TEXT;
+ALTER TABLE contrats ADD COLUMN IF NOT EXISTS type_marche VARCHAR(50);
+
+-- Index partiel des alertes contrats (échéances actives)
+CREATE INDEX IF NOT EXISTS idx_contrats_alerte_fin ON contrats(date_fin)
+    WHERE statut IN ('ACTIF', 'RECONDUIT');
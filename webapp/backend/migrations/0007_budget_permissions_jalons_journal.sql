@@ -0,0 +1,32 @@
+-- Permissions budgets (accès explicite par utilisateur)
+CREATE TABLE IF NOT EXISTS budget_permissions (
+    id SERIAL PRIMARY KEY,
+    budget_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    role VARCHAR(20) DEFAULT 'lecteur',
+    date_creation TIMESTAMP DEFAULT NOW(),
+    UNIQUE(budget_id, user_id)
+);
+
+-- Jalons projet (dates clés / livrables critiques)
+CREATE TABLE IF NOT EXISTS jalons (
+    id SERIAL PRIMARY KEY,
+    projet_id INTEGER NOT NULL,
+    titre VARCHAR(300) NOT NULL,
+    date_echeance DATE,
+    statut VARCHAR(30) DEFAULT 'A_VENIR',
+    description TEXT,
+    created_by_id INTEGER,
+    date_creation TIMESTAMP DEFAULT NOW()
+);
+
+-- Journal de bord projet
+CREATE TABLE IF NOT EXISTS journal_projet (
+    id SERIAL PRIMARY KEY,
+    projet_id INTEGER NOT NULL,
+    date_entree TIMESTAMP DEFAULT NOW(),
+    auteur VARCHAR(200),
+    type_entree VARCHAR(50) DEFAULT 'EVENEMENT',
+    contenu TEXT NOT NULL,
+    created_by_id INTEGER
+);
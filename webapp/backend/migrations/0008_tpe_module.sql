@@ -0,0 +1,41 @@
+-- TPE MODULE : configuration des modules + tables
+CREATE TABLE IF NOT EXISTS modules_config (
+    module_name VARCHAR(50) PRIMARY KEY,
+    enabled     BOOLEAN DEFAULT FALSE,
+    date_activation TIMESTAMP DEFAULT NOW()
+);
+INSERT INTO modules_config (module_name, enabled)
+VALUES ('tpe', FALSE)
+ON CONFLICT (module_name) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS tpe (
+    id                   SERIAL PRIMARY KEY,
+    service              VARCHAR(300) NOT NULL,
+    regisseur_prenom     VARCHAR(100),
+    regisseur_nom        VARCHAR(100),
+    regisseur_telephone  VARCHAR(30),
+    regisseurs_suppleants TEXT,
+    shop_id              BIGINT DEFAULT 0,
+    backoffice_actif     BOOLEAN DEFAULT FALSE,
+    backoffice_email     VARCHAR(200),
+    modele_tpe           VARCHAR(100),
+    type_ethernet        BOOLEAN DEFAULT FALSE,
+    type_4_5g            BOOLEAN DEFAULT FALSE,
+    reseau_ip            VARCHAR(20),
+    reseau_masque        VARCHAR(20),
+    reseau_passerelle    VARCHAR(20),
+    nombre_tpe           INTEGER DEFAULT 1,
+    created_by_id        INTEGER,
+    date_creation        TIMESTAMP DEFAULT NOW(),
+    date_maj             TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS tpe_cartes (
+    id               SERIAL PRIMARY KEY,
+    tpe_id           INTEGER NOT NULL REFERENCES tpe(id) ON DELETE CASCADE,
+    numero           VARCHAR(100) NOT NULL,
+    numero_serie_tpe VARCHAR(100),
+    modele_tpe       VARCHAR(100)
+);
+
+ALTER TABLE tpe ADD COLUMN IF NOT EXISTS regisseur_email VARCHAR(200);
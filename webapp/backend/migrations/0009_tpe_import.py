@@ -0,0 +1,18 @@
+"""TPE MODULE : import des données initiales si la table tpe est vide."""
+import logging
+import os
+
+logger = logging.getLogger('migrations')
+
+
+def upgrade(cur):
+    path = os.path.join(os.path.dirname(__file__), '..', 'data', 'tpe_import.json')
+    if not os.path.exists(path):
+        return
+    from app.services.tpe_service import TpeService
+    try:
+        n = TpeService().import_from_json(path)
+        if n:
+            logger.info("TPE: %d enregistrements importés", n)
+    except Exception as e:
+        logger.warning("TPE import skipped: %s", e)
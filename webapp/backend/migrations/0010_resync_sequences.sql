@@ -0,0 +1,11 @@
+-- Resync séquences (évite duplicate key après import CSV)
+-- Séquence résolue par pg_get_serial_sequence (séquence renommée, colonne
+-- IDENTITY) ; NULL sans séquence rattachée : setval() n'est alors pas appelée.
+SELECT setval(pg_get_serial_sequence('projets', 'id'),       GREATEST(1, (SELECT COALESCE(MAX(id), 1) FROM projets)));
+SELECT setval(pg_get_serial_sequence('services', 'id'),      GREATEST(1, (SELECT COALESCE(MAX(id), 1) FROM services)));
+SELECT setval(pg_get_serial_sequence('utilisateurs', 'id'),  GREATEST(1, (SELECT COALESCE(MAX(id), 1) FROM utilisateurs)));
+SELECT setval(pg_get_serial_sequence('contacts', 'id'),      GREATEST(1, (SELECT COALESCE(MAX(id), 1) FROM contacts)));
+SELECT setval(pg_get_serial_sequence('taches', 'id'),        GREATEST(1, (SELECT COALESCE(MAX(id), 1) FROM taches)));
+SELECT setval(pg_get_serial_sequence('contrats', 'id'),      GREATEST(1, (SELECT COALESCE(MAX(id), 1) FROM contrats)));
+SELECT setval(pg_get_serial_sequence('bons_commande', 'id'), GREATEST(1, (SELECT COALESCE(MAX(id), 1) FROM bons_commande)));
+SELECT setval(pg_get_serial_sequence('fournisseurs', 'id'),  GREATEST(1, (SELECT COALESCE(MAX(id), 1) FROM fournisseurs)));
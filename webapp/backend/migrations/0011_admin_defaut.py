@@ -0,0 +1,16 @@
+"""Compte admin par défaut (idempotent)."""
+import bcrypt
+
+
+def upgrade(cur):
+    cur.execute("SELECT id FROM utilisateurs WHERE login = %s", ['admin'])
+    if cur.fetchone():
+        return
+    hashed = bcrypt.hashpw(b'Admin1234!', bcrypt.gensalt()).decode('utf-8')
+    cur.execute(
+        "INSERT INTO utilisateurs "
+        "(nom, prenom, email, login, mot_de_passe, role, actif) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        ['Administrateur', 'Système', 'admin@local.fr',
+         'admin', hashed, 'admin', True]
+    )
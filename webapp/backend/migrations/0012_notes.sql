@@ -0,0 +1,12 @@
+-- Notes (post-its et notes de projet)
+CREATE TABLE IF NOT EXISTS notes (
+    id            SERIAL PRIMARY KEY,
+    titre         VARCHAR(200),
+    contenu       TEXT,
+    type          VARCHAR(20)  DEFAULT 'postit',
+    projet_id     INTEGER,
+    couleur       VARCHAR(20)  DEFAULT '#fff9c4',
+    created_by_id INTEGER,
+    created_at    TIMESTAMP    DEFAULT NOW(),
+    updated_at    TIMESTAMP    DEFAULT NOW()
+);
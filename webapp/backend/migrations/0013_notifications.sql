@@ -0,0 +1,12 @@
+-- Table notifications (créer si absente) + colonnes ref_type/ref_id/niveau
+CREATE TABLE IF NOT EXISTS notifications (
+    id            SERIAL PRIMARY KEY,
+    titre         VARCHAR(300),
+    message       TEXT,
+    lue           BOOLEAN DEFAULT FALSE,
+    user_id       INTEGER,
+    date_creation TIMESTAMP DEFAULT NOW()
+);
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS ref_type VARCHAR(50);
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS ref_id INTEGER;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS niveau VARCHAR(20) DEFAULT 'INFO';
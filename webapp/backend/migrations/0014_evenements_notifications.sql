@@ -0,0 +1,65 @@
+-- Notifications par utilisateur + journal d'événements temps réel (/api/events)
+
+-- user_id NULL = notification sans destinataire (données historiques) : admins seulement
+CREATE INDEX IF NOT EXISTS idx_notifications_user_lue
+    ON notifications (user_id, lue, date_creation DESC);
+CREATE INDEX IF NOT EXISTS idx_notifications_ref
+    ON notifications (ref_type, ref_id) WHERE lue = false;
+
+-- Journal court des événements diffusés par NOTIFY : sert à rejouer les
+-- événements manqués à la reconnexion (Last-Event-ID), purgé après SSE_RETENTION.
+CREATE TABLE IF NOT EXISTS evenements (
+    id            BIGSERIAL PRIMARY KEY,
+    type          VARCHAR(30) NOT NULL,   -- notification | bc | tache | contrat
+    op            VARCHAR(10) NOT NULL,   -- INSERT | UPDATE | DELETE
+    ref_id        INTEGER,                -- id de la notification (NULL pour les listes)
+    user_id       INTEGER,                -- destinataire d'une notification
+    date_creation TIMESTAMP DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_evenements_date ON evenements (date_creation);
+
+-- Notification créée ou lue : événement adressé à son destinataire
+CREATE OR REPLACE FUNCTION bmp_evenement_notification() RETURNS trigger AS $$
+DECLARE
+    e evenements%ROWTYPE;
+BEGIN
+    INSERT INTO evenements (type, op, ref_id, user_id)
+    VALUES ('notification', TG_OP, NEW.id, NEW.user_id)
+    RETURNING * INTO e;
+    PERFORM pg_notify('bmp_evenements', row_to_json(e)::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_evenement_notification ON notifications;
+CREATE TRIGGER trg_evenement_notification
+    AFTER INSERT OR UPDATE OF lue ON notifications
+    FOR EACH ROW EXECUTE FUNCTION bmp_evenement_notification();
+
+-- Liste modifiée (BC, tâches, contrats) : un événement par instruction,
+-- pas par ligne (imports, COPY, mises à jour en masse)
+CREATE OR REPLACE FUNCTION bmp_evenement_liste() RETURNS trigger AS $$
+DECLARE
+    e evenements%ROWTYPE;
+BEGIN
+    INSERT INTO evenements (type, op) VALUES (TG_ARGV[0], TG_OP)
+    RETURNING * INTO e;
+    PERFORM pg_notify('bmp_evenements', row_to_json(e)::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_evenement_bc ON bons_commande;
+CREATE TRIGGER trg_evenement_bc
+    AFTER INSERT OR UPDATE OR DELETE ON bons_commande
+    FOR EACH STATEMENT EXECUTE FUNCTION bmp_evenement_liste('bc');
+
+DROP TRIGGER IF EXISTS trg_evenement_tache ON taches;
+CREATE TRIGGER trg_evenement_tache
+    AFTER INSERT OR UPDATE OR DELETE ON taches
+    FOR EACH STATEMENT EXECUTE FUNCTION bmp_evenement_liste('tache');
+
+DROP TRIGGER IF EXISTS trg_evenement_contrat ON contrats;
+CREATE TRIGGER trg_evenement_contrat
+    AFTER INSERT OR UPDATE OR DELETE ON contrats
+    FOR EACH STATEMENT EXECUTE FUNCTION bmp_evenement_liste('contrat');
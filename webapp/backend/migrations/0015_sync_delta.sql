@@ -0,0 +1,86 @@
+-- Synchronisation incrémentale des listes (?since=) : horodatage de
+-- modification garanti par trigger + tombstones des lignes supprimées
+
+ALTER TABLE bons_commande ADD COLUMN IF NOT EXISTS date_maj TIMESTAMP DEFAULT NOW();
+ALTER TABLE contrats      ADD COLUMN IF NOT EXISTS date_maj TIMESTAMP DEFAULT NOW();
+ALTER TABLE projets       ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+ALTER TABLE taches        ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
+-- date_maj / updated_at posés par le serveur à chaque écriture (toutes les
+-- mises à jour ne les renseignent pas, et une valeur fournie par le client
+-- ou un import ne doit pas masquer la ligne au delta suivant)
+CREATE OR REPLACE FUNCTION bmp_touch_date_maj() RETURNS trigger AS $$
+BEGIN
+    NEW.date_maj := now();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bmp_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_touch_bc ON bons_commande;
+CREATE TRIGGER trg_touch_bc
+    BEFORE INSERT OR UPDATE ON bons_commande
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_date_maj();
+
+DROP TRIGGER IF EXISTS trg_touch_contrat ON contrats;
+CREATE TRIGGER trg_touch_contrat
+    BEFORE INSERT OR UPDATE ON contrats
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_date_maj();
+
+DROP TRIGGER IF EXISTS trg_touch_projet ON projets;
+CREATE TRIGGER trg_touch_projet
+    BEFORE INSERT OR UPDATE ON projets
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_touch_tache ON taches;
+CREATE TRIGGER trg_touch_tache
+    BEFORE INSERT OR UPDATE ON taches
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_bons_commande_date_maj ON bons_commande (date_maj);
+CREATE INDEX IF NOT EXISTS idx_contrats_date_maj      ON contrats (date_maj);
+CREATE INDEX IF NOT EXISTS idx_projets_updated_at     ON projets (updated_at);
+CREATE INDEX IF NOT EXISTS idx_taches_updated_at      ON taches (updated_at);
+
+-- Lignes supprimées, conservées SYNC_RETENTION secondes (purge : écoute SSE) ;
+-- un client dont le curseur est plus ancien recharge la liste complète
+CREATE TABLE IF NOT EXISTS deleted_rows (
+    id          BIGSERIAL PRIMARY KEY,
+    table_name  VARCHAR(50) NOT NULL,
+    row_id      INTEGER NOT NULL,
+    deleted_at  TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_deleted_rows_table_date ON deleted_rows (table_name, deleted_at);
+
+CREATE OR REPLACE FUNCTION bmp_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO deleted_rows (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tombstone_bc ON bons_commande;
+CREATE TRIGGER trg_tombstone_bc
+    AFTER DELETE ON bons_commande
+    FOR EACH ROW EXECUTE FUNCTION bmp_tombstone();
+
+DROP TRIGGER IF EXISTS trg_tombstone_contrat ON contrats;
+CREATE TRIGGER trg_tombstone_contrat
+    AFTER DELETE ON contrats
+    FOR EACH ROW EXECUTE FUNCTION bmp_tombstone();
+
+DROP TRIGGER IF EXISTS trg_tombstone_projet ON projets;
+CREATE TRIGGER trg_tombstone_projet
+    AFTER DELETE ON projets
+    FOR EACH ROW EXECUTE FUNCTION bmp_tombstone();
+
+DROP TRIGGER IF EXISTS trg_tombstone_tache ON taches;
+CREATE TRIGGER trg_tombstone_tache
+    AFTER DELETE ON taches
+    FOR EACH ROW EXECUTE FUNCTION bmp_tombstone();
@@ -0,0 +1,52 @@
+-- Requêtes conditionnelles des fiches (ETag) : horodatage par trigger sur les
+-- tables dont les colonnes apparaissent dans les fiches projet / BC / contrat
+-- (bmp_touch_date_maj : migration 0015), et index des clés étrangères lues
+-- par les sondes de version
+
+ALTER TABLE fournisseurs       ADD COLUMN IF NOT EXISTS date_maj TIMESTAMP DEFAULT NOW();
+ALTER TABLE contacts           ADD COLUMN IF NOT EXISTS date_maj TIMESTAMP DEFAULT NOW();
+ALTER TABLE utilisateurs       ADD COLUMN IF NOT EXISTS date_maj TIMESTAMP DEFAULT NOW();
+ALTER TABLE entites            ADD COLUMN IF NOT EXISTS date_maj TIMESTAMP DEFAULT NOW();
+ALTER TABLE services           ADD COLUMN IF NOT EXISTS date_maj TIMESTAMP DEFAULT NOW();
+ALTER TABLE lignes_budgetaires ADD COLUMN IF NOT EXISTS date_maj TIMESTAMP DEFAULT NOW();
+
+DROP TRIGGER IF EXISTS trg_touch_fournisseur ON fournisseurs;
+CREATE TRIGGER trg_touch_fournisseur
+    BEFORE INSERT OR UPDATE ON fournisseurs
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_date_maj();
+
+DROP TRIGGER IF EXISTS trg_touch_contact ON contacts;
+CREATE TRIGGER trg_touch_contact
+    BEFORE INSERT OR UPDATE ON contacts
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_date_maj();
+
+-- Utilisateurs : seules les colonnes affichées dans l'équipe d'un projet (la
+-- connexion et le changement de mot de passe n'invalident pas les fiches)
+DROP TRIGGER IF EXISTS trg_touch_utilisateur ON utilisateurs;
+CREATE TRIGGER trg_touch_utilisateur
+    BEFORE INSERT OR UPDATE OF nom, prenom, email, fonction, telephone ON utilisateurs
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_date_maj();
+
+DROP TRIGGER IF EXISTS trg_touch_entite ON entites;
+CREATE TRIGGER trg_touch_entite
+    BEFORE INSERT OR UPDATE ON entites
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_date_maj();
+
+DROP TRIGGER IF EXISTS trg_touch_service ON services;
+CREATE TRIGGER trg_touch_service
+    BEFORE INSERT OR UPDATE ON services
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_date_maj();
+
+DROP TRIGGER IF EXISTS trg_touch_ligne ON lignes_budgetaires;
+CREATE TRIGGER trg_touch_ligne
+    BEFORE INSERT OR UPDATE ON lignes_budgetaires
+    FOR EACH ROW EXECUTE FUNCTION bmp_touch_date_maj();
+
+-- Clés étrangères des sondes (déjà présentes si la base vient de schema.py)
+CREATE INDEX IF NOT EXISTS idx_taches_projet               ON taches(projet_id);
+CREATE INDEX IF NOT EXISTS idx_bc_projet                   ON bons_commande(projet_id);
+CREATE INDEX IF NOT EXISTS idx_bc_contrat                  ON bons_commande(contrat_id);
+CREATE INDEX IF NOT EXISTS idx_projet_contacts_projet      ON projet_contacts(projet_id);
+CREATE INDEX IF NOT EXISTS idx_projet_equipe_projet        ON projet_equipe(projet_id);
+CREATE INDEX IF NOT EXISTS idx_projet_prestataires_projet  ON projet_prestataires(projet_id);
+CREATE INDEX IF NOT EXISTS idx_projet_documents_projet     ON projet_documents(projet_id);
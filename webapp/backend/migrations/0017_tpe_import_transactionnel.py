@@ -0,0 +1,23 @@
+"""
+TPE MODULE : import des données initiales si la table tpe est vide, dans la
+transaction de la migration (curseur fourni, sous le verrou des migrations).
+Remplace 0009, qui importait sur une connexion du pool et ignorait les
+erreurs : le fichier de données a été renommé, 0009 (inchangée) n'a donc
+plus d'effet ; les bases déjà peuplées par 0009 ne sont pas modifiées.
+Les fiches invalides sont écartées par l'import ; une erreur restante fait
+échouer la migration, qui n'est alors pas enregistrée.
+"""
+import logging
+import os
+
+logger = logging.getLogger('migrations')
+
+
+def upgrade(cur):
+    path = os.path.join(os.path.dirname(__file__), '..', 'data', 'tpe_fiches_initiales.json')
+    if not os.path.exists(path):
+        return
+    from app.services.tpe_service import TpeService
+    n = TpeService().import_from_json(path, cur=cur)
+    if n:
+        logger.info("TPE: %d enregistrements importés", n)
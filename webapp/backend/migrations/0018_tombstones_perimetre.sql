@@ -0,0 +1,44 @@
+-- Tombstones rattachées à leur propriétaire : le delta ?since= ne renvoie
+-- un id supprimé qu'aux utilisateurs qui pouvaient voir la ligne
+-- (created_by_id / assignee_id au moment de la suppression)
+
+ALTER TABLE deleted_rows ADD COLUMN IF NOT EXISTS created_by_id INTEGER;
+ALTER TABLE deleted_rows ADD COLUMN IF NOT EXISTS assignee_id   INTEGER;
+
+-- to_jsonb : assignee_id n'existe que sur taches
+CREATE OR REPLACE FUNCTION bmp_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO deleted_rows (table_name, row_id, created_by_id, assignee_id)
+    VALUES (TG_TABLE_NAME, OLD.id,
+            (to_jsonb(OLD) ->> 'created_by_id')::int,
+            (to_jsonb(OLD) ->> 'assignee_id')::int);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Changement de propriétaire : tombstone au nom de l'ancien, pour que la
+-- ligne sorte du cache des clients qui ne la voient plus
+DROP TRIGGER IF EXISTS trg_sortie_bc ON bons_commande;
+CREATE TRIGGER trg_sortie_bc
+    AFTER UPDATE OF created_by_id ON bons_commande
+    FOR EACH ROW WHEN (OLD.created_by_id IS DISTINCT FROM NEW.created_by_id)
+    EXECUTE FUNCTION bmp_tombstone();
+
+DROP TRIGGER IF EXISTS trg_sortie_contrat ON contrats;
+CREATE TRIGGER trg_sortie_contrat
+    AFTER UPDATE OF created_by_id ON contrats
+    FOR EACH ROW WHEN (OLD.created_by_id IS DISTINCT FROM NEW.created_by_id)
+    EXECUTE FUNCTION bmp_tombstone();
+
+DROP TRIGGER IF EXISTS trg_sortie_projet ON projets;
+CREATE TRIGGER trg_sortie_projet
+    AFTER UPDATE OF created_by_id ON projets
+    FOR EACH ROW WHEN (OLD.created_by_id IS DISTINCT FROM NEW.created_by_id)
+    EXECUTE FUNCTION bmp_tombstone();
+
+DROP TRIGGER IF EXISTS trg_sortie_tache ON taches;
+CREATE TRIGGER trg_sortie_tache
+    AFTER UPDATE OF created_by_id, assignee_id ON taches
+    FOR EACH ROW WHEN (OLD.created_by_id IS DISTINCT FROM NEW.created_by_id
+                       OR OLD.assignee_id IS DISTINCT FROM NEW.assignee_id)
+    EXECUTE FUNCTION bmp_tombstone();
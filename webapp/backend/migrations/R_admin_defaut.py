@@ -0,0 +1,28 @@
+"""
+Compte admin de secours, vérifié à chaque lancement (remplace 0011, exécutée
+une seule fois) : recréé seulement s'il n'existe plus aucun admin actif.
+"""
+import logging
+
+import bcrypt
+
+logger = logging.getLogger('migrations')
+
+
+def upgrade(cur):
+    cur.execute("SELECT 1 FROM utilisateurs WHERE role = 'admin' AND actif LIMIT 1")
+    if cur.fetchone():
+        return
+    cur.execute("SELECT id FROM utilisateurs WHERE login = %s", ['admin'])
+    if cur.fetchone():
+        logger.warning("Aucun admin actif : le compte « admin » existe mais est désactivé")
+        return
+    hashed = bcrypt.hashpw(b'Admin1234!', bcrypt.gensalt()).decode('utf-8')
+    cur.execute(
+        "INSERT INTO utilisateurs "
+        "(nom, prenom, email, login, mot_de_passe, role, actif) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        ['Administrateur', 'Système', 'admin@local.fr',
+         'admin', hashed, 'admin', True]
+    )
+    logger.warning("Aucun admin actif : compte « admin » créé avec le mot de passe par défaut")
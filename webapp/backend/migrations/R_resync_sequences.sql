@@ -0,0 +1,23 @@
+-- Recalage des séquences à chaque lancement (remplace 0010, exécutée une
+-- seule fois) : une ligne insérée avec un id explicite (import CSV, restauration)
+-- ne provoque plus de duplicate key. La séquence n'est jamais reculée, pour ne
+-- pas réattribuer l'id d'une ligne supprimée (tombstones de synchronisation).
+DO $$
+DECLARE
+    r record;
+BEGIN
+    FOR r IN
+        SELECT c.table_name, c.column_name,
+               pg_get_serial_sequence(quote_ident(c.table_name), c.column_name) AS seq
+        FROM information_schema.columns c
+        JOIN information_schema.tables t
+          ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE c.table_schema = 'public' AND t.table_type = 'BASE TABLE'
+          AND pg_get_serial_sequence(quote_ident(c.table_name), c.column_name) IS NOT NULL
+    LOOP
+        EXECUTE format(
+            'SELECT setval(%L, GREATEST((SELECT last_value FROM %s), '
+            '(SELECT COALESCE(MAX(%I), 1) FROM %I)))',
+            r.seq, r.seq, r.column_name, r.table_name);
+    END LOOP;
+END $$;
@@ -1,20 +1,29 @@
 import functools
 import json
+import os
 import time
 from collections import defaultdict
-from flask import Blueprint, jsonify, request, g
+import psycopg2.extras
+from flask import Blueprint, Response, current_app, jsonify, request, g
 
-from app.services.projet_service import ProjetService
+from app.services.projet_service import ProjetService, LISTE as PROJET_LISTE, LISTE_FROM as PROJET_FROM
 from app.services.budget_v5_service import BudgetV5Service
-from app.services.bon_commande_service import BonCommandeService
-from app.services.contrat_service import ContratService
-from app.services.tache_service import TacheService
+from app.services.bon_commande_service import BonCommandeService, LISTE as BC_LISTE, LISTE_FROM as BC_FROM
+from app.services.contrat_service import ContratService, LISTE as CONTRAT_LISTE, LISTE_FROM as CONTRAT_FROM
+from app.services.tache_service import TacheService, LISTE as TACHE_LISTE, LISTE_FROM as TACHE_FROM
 from app.services.referentiel_service import ReferentielService
 from app.services.contact_service import ContactService
 from app.services.service_org_service import ServiceOrgService
-from app.services.auth_service import AuthService
+from app.services.auth_service import AuthService, TICKET_SECONDES
+from app.services.etp_service import EtpService
+from app.services.cache_service import get_cache
+from app.services import admission_service, batch_service, concurrence_service, deadline_service, etag_service, events_service, metrics_service, profiling_service, snapshot_service, sql_trace_service, sync_service, timing_service
 
 routes = Blueprint('routes', __name__)
+timing_service.register_timing(routes)
+metrics_service.register_metrics(routes)
+sql_trace_service.register_sql_trace(routes)
+deadline_service.register_deadline(routes)
 
 # ── Helpers réponses standardisées ──────────────────────────────────────────
 
@@ -81,6 +90,7 @@ tache_service       = TacheService()
 contact_service     = ContactService()
 service_org_service = ServiceOrgService()
 auth_service        = AuthService()
+etp_service         = EtpService()
 
 
 # ─────────────────────────────────────────────
@@ -96,6 +106,13 @@ def require_auth(*roles):
     def decorator(f):
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
+            # Sous-requête de /api/batch : jeton et compte déjà vérifiés par le lot
+            payload = request.environ.get(batch_service.ENVIRON_USER)
+            if payload is not None:
+                if roles and payload.get('role') not in roles:
+                    return jsonify({"error": "Accès interdit"}), 403
+                g.user = payload
+                return f(*args, **kwargs)
             auth_header = request.headers.get('Authorization', '')
             if not auth_header.startswith('Bearer '):
                 return jsonify({"error": "Token manquant"}), 401
@@ -119,6 +136,19 @@ def require_auth(*roles):
     return decorator
 
 
+def _jeton_admin():
+    """Vrai si la requête porte un jeton admin valide (sans passer par g.user)."""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return False
+    payload = auth_service.verify_token(auth_header[7:])
+    return bool(payload) and payload.get('role') == 'admin'
+
+
+# Profilage à la demande : X-Profile: 1 (admin) ou échantillonnage aléatoire
+profiling_service.register_profiling(routes, _jeton_admin)
+
+
 # ─────────────────────────────────────────────
 # AUTH
 # ─────────────────────────────────────────────
@@ -137,6 +167,7 @@ def _check_login_rate(ip: str) -> bool:
     return True
 
 @routes.route('/auth/login', methods=['POST'])
+@deadline_service.budget(5)
 def login():
     ip = request.headers.get('X-Forwarded-For', request.remote_addr or '').split(',')[0].strip()
     if not _check_login_rate(ip):
@@ -148,11 +179,13 @@ def login():
     return jsonify(result)
 
 @routes.route('/auth/me', methods=['GET'])
+@deadline_service.budget(5)
 @require_auth()
 def me():
     return jsonify(g.user)
 
 @routes.route('/auth/refresh', methods=['POST'])
+@deadline_service.budget(5)
 @require_auth()
 def refresh_token():
     """Émet un nouveau token JWT si le token actuel est encore valide."""
@@ -263,35 +296,92 @@ def get_audit_log():
     return jsonify({"list": [dict(r) for r in rows] if rows else []})
 
 
+# ─────────────────────────────────────────────
+# SANTÉ (sonde de disponibilité, sans authentification)
+# ─────────────────────────────────────────────
+
+@routes.route('/health/ready', methods=['GET'])
+@deadline_service.budget(5)
+def health_ready():
+    """200 quand le pool du worker est préchauffé, 503 sinon."""
+    from app.services.database_service import DatabaseService, pool_bounds, warmup_state
+    state = dict(warmup_state)
+    if not state['ready'] or state['pid'] != os.getpid():
+        # Hors Gunicorn (serveur de dev) ou préchauffage en échec : nouvel essai
+        state = DatabaseService().warm_up()
+    minconn, maxconn = pool_bounds()
+    body = {
+        "ready":      state['ready'],
+        "pid":        os.getpid(),
+        "pool":       {"min": minconn, "max": maxconn},
+        "connexions": state['connexions'],
+        "prepared":   state['prepared'],
+        "duree_ms":   state['duree_ms'],
+    }
+    if not state['ready']:
+        body['error'] = state['erreur']
+        return jsonify(body), 503
+    return jsonify(body)
+
+
+@routes.route('/metrics', methods=['GET'])
+@batch_service.hors_lot
+def metrics():
+    """Métriques Prometheus : réseau interne direct, ou administrateur."""
+    if not metrics_service.ENABLED:
+        return _err("prometheus_client non installé (pip install prometheus_client)", 501)
+
+    def _serve():
+        body, content_type = metrics_service.exposition()
+        return Response(body, content_type=content_type)
+
+    if metrics_service.acces_interne():
+        return _serve()
+    return require_auth('admin')(_serve)()
+
+
 # ─────────────────────────────────────────────
 # DASHBOARD
 # ─────────────────────────────────────────────
 
+def _ou(valeur, defaut):
+    """Résultat de concurrence_service.rassembler(…, return_exceptions=True), ou defaut si en échec."""
+    return defaut if isinstance(valeur, Exception) else valeur
+
+
 @routes.route('/dashboard', methods=['GET'])
 @require_auth()
 def dashboard():
-    try: projets = projet_service.get_all()
-    except Exception: projets = []
-    try: budget = budget_service.get_budget()
-    except Exception: budget = []
-    try: bons_commande = bc_service.get_all_bons_commande()
-    except Exception: bons_commande = []
-    try: contrats = contrat_service.get_all()
-    except Exception: contrats = []
-    try: alertes = contrat_service.get_alertes()
-    except Exception: alertes = []
-
-    bc_attente = [b for b in bons_commande if b.get('statut') in ('BROUILLON', 'EN_ATTENTE')]
-
-    # Lignes budgétaires en alerte (taux_engagement >= 80%)
-    try:
-        row_alerte = bc_service.db.fetch_one(
+    # Requêtes indépendantes en parallèle ; une source en échec → valeur vide.
+    # Projets et BC : compteurs calculés en SQL, pas la liste complète.
+    (row_proj, budget, row_bc, row_ctr, alertes_counts, alertes,
+     row_alerte) = concurrence_service.rassembler(
+        lambda: projet_service.db.fetch_one(
+            "SELECT COUNT(*) FILTER (WHERE statut = 'ACTIF') AS actifs FROM projets"
+        ),
+        budget_service.get_budget,
+        lambda: bc_service.db.fetch_one(
+            "SELECT COUNT(*) AS cnt, COALESCE(SUM(montant_ttc), 0) AS montant, "
+            "COUNT(*) FILTER (WHERE statut IN ('BROUILLON', 'EN_ATTENTE')) AS attente "
+            "FROM bons_commande"
+        ),
+        lambda: contrat_service.db.fetch_one(
+            "SELECT COUNT(*) as cnt FROM contrats WHERE statut = 'ACTIF'"
+        ),
+        contrat_service.get_alertes_counts,
+        lambda: contrat_service.get_alertes(limit=5),
+        # Lignes budgétaires en alerte (taux_engagement >= 80%)
+        lambda: bc_service.db.fetch_one(
             "SELECT COUNT(*) as cnt FROM lignes_budgetaires "
             "WHERE montant_vote > 0 AND montant_engage::numeric * 100 / montant_vote::numeric >= 80"
-        )
-        kpi_alertes_lignes = int(row_alerte['cnt']) if row_alerte else 0
-    except Exception:
-        kpi_alertes_lignes = 0
+        ),
+        return_exceptions=True,
+    )
+    budget         = _ou(budget, [])
+    alertes_counts = _ou(alertes_counts, {})
+    alertes        = _ou(alertes, [])
+    row_proj, row_bc, row_ctr, row_alerte = (
+        _ou(r, None) or {} for r in (row_proj, row_bc, row_ctr, row_alerte))
 
     # Répartition par nature (pour doughnut chart)
     nature_map = {}
@@ -312,15 +402,15 @@ def dashboard():
         entite_map[e]['engage'] += float(b.get('montant_engage', 0) or 0)
 
     return jsonify({
-        "kpi_projets":        len([p for p in projets if p.get('statut') == 'ACTIF']),
+        "kpi_projets":        int(row_proj.get('actifs') or 0),
         "kpi_budget":         sum(b.get('montant_vote', 0) or 0 for b in budget),
-        "kpi_bons_commande":  len(bons_commande),
-        "kpi_montant_bc":     sum(b.get('montant_ttc', 0) or 0 for b in bons_commande),
-        "kpi_contrats":       len([c for c in contrats if c.get('statut') == 'ACTIF']),
-        "kpi_alertes_contrats": len(alertes),
-        "kpi_bc_attente":     len(bc_attente),
-        "alertes_contrats":   alertes[:5],
-        "kpi_alertes_lignes": kpi_alertes_lignes,
+        "kpi_bons_commande":  int(row_bc.get('cnt') or 0),
+        "kpi_montant_bc":     row_bc.get('montant') or 0,
+        "kpi_contrats":       int(row_ctr.get('cnt') or 0),
+        "kpi_alertes_contrats": sum(alertes_counts.values()),
+        "kpi_bc_attente":     int(row_bc.get('attente') or 0),
+        "alertes_contrats":   alertes,
+        "kpi_alertes_lignes": int(row_alerte.get('cnt') or 0),
         "repartition_nature": [{"nature": k, "vote": v['vote'], "engage": v['engage']}
                                 for k, v in nature_map.items()],
         "engagement_entite":  sorted(
@@ -644,7 +734,6 @@ def dupliquer_budget():
     source_exercice = data.get('source_exercice')
     target_exercice = data.get('target_exercice')
     taux            = float(data.get('taux_revalorisation') or 0)
-    coeff           = 1 + taux / 100
     if not source_exercice or not target_exercice:
         return jsonify({"error": "source_exercice et target_exercice requis"}), 400
     try:
@@ -654,48 +743,36 @@ def dupliquer_budget():
         if existing and int(existing['n'] or 0) > 0:
             return jsonify({"error": f"Des budgets {target_exercice} existent déjà ({existing['n']}). Supprimez-les avant de dupliquer."}), 400
 
-        source_budgets = budget_service.db.fetch_all(
-            "SELECT * FROM budgets_annuels WHERE exercice=%s ORDER BY id", [source_exercice]
-        ) or []
-        if not source_budgets:
+        # Budgets et lignes copiés en une instruction : identifiants des
+        # nouveaux budgets réservés (nextval) pour y rattacher les lignes
+        base = ("ROUND(CASE WHEN COALESCE({t}.montant_engage, 0) > 0 THEN {t}.montant_engage "
+                "ELSE COALESCE({t}.montant_vote, 0) END * (1 + %(taux)s::numeric / 100), 2)")
+        res = budget_service.db.execute_returning(
+            "WITH src AS ( "
+            "  SELECT b.id, b.entite_id, b.nature, "
+            f"   {base.format(t='b')} AS previsionnel, "
+            "    nextval(pg_get_serial_sequence('budgets_annuels', 'id')) AS nouvel_id "
+            "  FROM budgets_annuels b WHERE b.exercice = %(source)s), "
+            "budgets AS ( "
+            "  INSERT INTO budgets_annuels (id, entite_id, exercice, nature, montant_previsionnel, statut) "
+            "  SELECT nouvel_id, entite_id, %(cible)s, nature, previsionnel, 'BROUILLON' "
+            "  FROM src ORDER BY id RETURNING id), "
+            "lignes AS ( "
+            "  INSERT INTO lignes_budgetaires "
+            "  (budget_id, libelle, application_id, fournisseur_id, "
+            "   montant_prevu, montant_vote, montant_solde, nature, note, statut) "
+            "  SELECT src.nouvel_id, l.libelle, l.application_id, l.fournisseur_id, "
+            f"   {base.format(t='l')}, 0, 0, COALESCE(l.nature, 'FONCTIONNEMENT'), l.note, 'ACTIF' "
+            "  FROM lignes_budgetaires l JOIN src ON src.id = l.budget_id "
+            "  WHERE l.statut != 'ANNULEE' ORDER BY l.budget_id, l.id RETURNING id) "
+            "SELECT (SELECT COUNT(*) FROM budgets)::int AS nb_budgets, "
+            "       (SELECT COUNT(*) FROM lignes)::int AS nb_lignes",
+            {'taux': str(taux), 'source': source_exercice, 'cible': target_exercice}
+        )
+        nb_budgets, nb_lignes = res[0], res[1]
+        if not nb_budgets:
             return jsonify({"error": f"Aucun budget trouvé pour l'exercice {source_exercice}"}), 404
 
-        nb_budgets = 0
-        nb_lignes  = 0
-        for b in source_budgets:
-            engage = float(b.get('montant_engage') or 0)
-            vote   = float(b.get('montant_vote') or 0)
-            base   = engage if engage > 0 else vote
-            previsionnel = round(base * coeff, 2)
-
-            new_budget_row = budget_service.db.execute_returning(
-                "INSERT INTO budgets_annuels (entite_id, exercice, nature, montant_previsionnel, statut) "
-                "VALUES (%s, %s, %s, %s, 'BROUILLON') RETURNING id",
-                [b['entite_id'], target_exercice, b['nature'], previsionnel]
-            )
-            new_budget_id = new_budget_row[0]
-            nb_budgets += 1
-
-            lignes = budget_service.db.fetch_all(
-                "SELECT * FROM lignes_budgetaires WHERE budget_id=%s AND statut != 'ANNULEE' ORDER BY id",
-                [b['id']]
-            ) or []
-            for l in lignes:
-                engage_l = float(l.get('montant_engage') or 0)
-                vote_l   = float(l.get('montant_vote') or 0)
-                base_l   = engage_l if engage_l > 0 else vote_l
-                prevu    = round(base_l * coeff, 2)
-                budget_service.db.execute(
-                    "INSERT INTO lignes_budgetaires "
-                    "(budget_id, libelle, application_id, fournisseur_id, "
-                    "montant_prevu, montant_vote, montant_solde, nature, note, statut) "
-                    "VALUES (%s, %s, %s, %s, %s, 0, 0, %s, %s, 'ACTIF')",
-                    [new_budget_id, l['libelle'],
-                     l.get('application_id'), l.get('fournisseur_id'),
-                     prevu, l.get('nature') or 'FONCTIONNEMENT', l.get('note')]
-                )
-                nb_lignes += 1
-
         return jsonify({"success": True, "budgets_crees": nb_budgets, "lignes_creees": nb_lignes})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -794,6 +871,43 @@ def _ownership_where(user_id, role, service_id, alias='bc'):
         return f"{p}created_by_id = %s", [user_id]
 
 
+def _acces_fiche(user_id, role, service_id, alias):
+    """
+    Condition d'accès d'une fiche pour sa sonde de version (etag_service) :
+    même règle que les routes de détail, les lignes sans created_by_id
+    restent lisibles.
+    """
+    if role == 'admin':
+        return "true", []
+    where, params = _ownership_where(user_id, role, service_id, alias)
+    return f"{alias}.created_by_id IS NULL OR {where}", params
+
+
+def _liste_sync(proj, from_sql, table, alias, col, champs, where, params, perimetre, order_by):
+    """
+    Liste en mode synchronisation (?since=, cf. sync_service) : liste complète
+    si since=0 ou curseur trop ancien, sinon lignes modifiées + id à retirer.
+    where/params/order_by : ceux de la liste complète (périmètre + filtres) ;
+    perimetre : (clause, params) de propriété seule, qui borne les id retirés.
+    """
+    try:
+        since = sync_service.parse_since(request.args.get('since'))
+    except ValueError as e:
+        return _err(e)
+    db = bc_service.db
+    cursor, borne = sync_service.curseur(db)   # avant la lecture des lignes
+    select = proj.select(champs)
+    full = since is None or since < borne
+    if full:
+        rows = db.fetch_all(f"SELECT {select} {from_sql}WHERE {where} ORDER BY {order_by}", params)
+        lst, deleted = [dict(r) for r in (rows or [])], []
+    else:
+        lst, deleted = sync_service.delta(db, select, from_sql, table, alias, col,
+                                          where, params, *perimetre, since, order_by)
+    return jsonify({"count": len(lst), "list": lst, "deleted": deleted,
+                    "cursor": cursor.isoformat(), "full": full})
+
+
 def _audit(action, table_name, record_id=None, details=None):
     """Enregistre une action dans le journal d'audit. N'interrompt jamais l'opération principale."""
     try:
@@ -815,9 +929,13 @@ def get_bon_commande():
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
     filters    = {k: v for k, v in request.args.items() if v}
+    try:
+        champs = BC_LISTE.parse(request.args.get('fields')) or list(BC_LISTE.defaut)
+    except ValueError as e:
+        return _err(e)
 
-    if role == 'admin':
-        bc_list = bc_service.get_all_bons_commande(filters)
+    if role == 'admin' and 'since' not in request.args:
+        bc_list = bc_service.get_all_bons_commande(filters, champs)
     else:
         # Récupérer tous les BCs accessibles puis appliquer filtres supplémentaires
         where, params = _ownership_where(user_id, role, service_id, 'bc')
@@ -829,16 +947,19 @@ def get_bon_commande():
         if filters.get('entite_id'):
             extra_where.append("bc.entite_id = %s")
             extra_params.append(filters['entite_id'])
+        if filters.get('fournisseur_id'):
+            extra_where.append("bc.fournisseur_id = %s")
+            extra_params.append(filters['fournisseur_id'])
+        if filters.get('search'):
+            s = '%' + filters['search'] + '%'
+            extra_where.append("(bc.numero_bc ILIKE %s OR bc.objet ILIKE %s OR f.nom ILIKE %s)")
+            extra_params.extend([s, s, s])
+        if 'since' in request.args:
+            return _liste_sync(BC_LISTE, BC_FROM, 'bons_commande', 'bc', 'date_maj', champs,
+                               ' AND '.join(extra_where), extra_params, (where, params),
+                               'bc.date_creation DESC')
         rows = bc_service.db.fetch_all(
-            "SELECT bc.*, f.nom as fournisseur_nom, e.code as entite_code, "
-            "e.nom as entite_nom, p.nom as projet_nom, c.numero_contrat, "
-            "u.nom || ' ' || COALESCE(u.prenom,'') as createur_nom "
-            "FROM bons_commande bc "
-            "LEFT JOIN fournisseurs f ON f.id = bc.fournisseur_id "
-            "LEFT JOIN entites e ON e.id = bc.entite_id "
-            "LEFT JOIN projets p ON p.id = bc.projet_id "
-            "LEFT JOIN contrats c ON c.id = bc.contrat_id "
-            "LEFT JOIN utilisateurs u ON u.id = bc.created_by_id "
+            f"SELECT {BC_LISTE.select(champs)} {BC_FROM}"
             f"WHERE {' AND '.join(extra_where)} ORDER BY bc.date_creation DESC",
             extra_params
         )
@@ -873,20 +994,18 @@ def get_bon_commande_by_id(bc_id):
     user_id    = g.user.get('sub')
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
+    v = bc_service.version(bc_id, *_acces_fiche(user_id, role, service_id, 'bc'))
+    if not v:
+        return jsonify({"error": "BC introuvable"}), 404
+    if not v['autorise']:
+        return jsonify({"error": "Accès interdit"}), 403
+    resp = etag_service.non_modifie(v['version'])
+    if resp is not None:
+        return resp
     bc = bc_service.get_by_id(bc_id)
     if not bc:
         return jsonify({"error": "BC introuvable"}), 404
-    if role != 'admin':
-        creator = bc.get('created_by_id')
-        if creator is not None:
-            where, params = _ownership_where(user_id, role, service_id, 'bc')
-            row = bc_service.db.fetch_one(
-                f"SELECT id FROM bons_commande bc WHERE bc.id=%s AND {where}",
-                [bc_id] + params
-            )
-            if not row:
-                return jsonify({"error": "Accès interdit"}), 403
-    return jsonify(bc)
+    return etag_service.marquer(jsonify(bc), v['version'])
 
 
 @routes.route('/bon_commande/<int:bc_id>/valider', methods=['POST'])
@@ -934,7 +1053,9 @@ def refuser_bon_commande(bc_id):
 
 
 @routes.route('/bon_commande/parse_pdf', methods=['POST'])
+@deadline_service.budget(60)
 @require_auth('admin', 'gestionnaire')
+@admission_service.limite('pdf')
 def parse_bc_pdf():
     import io, re
     from difflib import get_close_matches
@@ -1215,16 +1336,21 @@ def get_contrats():
     user_id    = g.user.get('sub')
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
+    try:
+        champs = CONTRAT_LISTE.parse(request.args.get('fields')) or list(CONTRAT_LISTE.defaut)
+    except ValueError as e:
+        return _err(e)
+    if 'since' in request.args:
+        where, params = _ownership_where(user_id, role, service_id, 'c')
+        return _liste_sync(CONTRAT_LISTE, CONTRAT_FROM, 'contrats', 'c', 'date_maj', champs,
+                           where, params, (where, params),
+                           'c.date_fin ASC' if role == 'admin' else 'c.date_creation DESC')
     if role == 'admin':
-        contrats = contrat_service.get_all()
+        contrats = contrat_service.get_all(champs)
     else:
         where, params = _ownership_where(user_id, role, service_id, 'c')
         rows = contrat_service.db.fetch_all(
-            "SELECT c.*, f.nom as fournisseur_nom, "
-            "u.nom || ' ' || COALESCE(u.prenom,'') as createur_nom "
-            "FROM contrats c "
-            "LEFT JOIN fournisseurs f ON f.id = c.fournisseur_id "
-            "LEFT JOIN utilisateurs u ON u.id = c.created_by_id "
+            f"SELECT {CONTRAT_LISTE.select(champs)} {CONTRAT_FROM}"
             f"WHERE {where} ORDER BY c.date_creation DESC",
             params
         )
@@ -1238,36 +1364,35 @@ def get_contrat_by_id(contrat_id):
     user_id    = g.user.get('sub')
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
+    v = contrat_service.version(contrat_id, *_acces_fiche(user_id, role, service_id, 'c'))
+    if not v:
+        return jsonify({"error": "Contrat introuvable"}), 404
+    if not v['autorise']:
+        return jsonify({"error": "Accès interdit"}), 403
+    resp = etag_service.non_modifie(v['version'])
+    if resp is not None:
+        return resp
     c = contrat_service.get_by_id(contrat_id)
     if not c:
         return jsonify({"error": "Contrat introuvable"}), 404
-    if role != 'admin' and c.get('created_by_id') is not None:
-        where, params = _ownership_where(user_id, role, service_id, 'c')
-        row = contrat_service.db.fetch_one(
-            f"SELECT id FROM contrats c WHERE c.id=%s AND {where}", [contrat_id] + params
-        )
-        if not row:
-            return jsonify({"error": "Accès interdit"}), 403
-    return jsonify(c)
+    return etag_service.marquer(jsonify(c), v['version'])
 
 
 @routes.route('/contrat/alertes', methods=['GET'])
 @require_auth()
 def get_contrat_alertes():
+    """?counts=1 : uniquement le nombre de contrats par niveau d'alerte."""
     user_id    = g.user.get('sub')
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
     if role == 'admin':
-        return jsonify({"list": contrat_service.get_alertes()})
-    where, params = _ownership_where(user_id, role, service_id, 'c')
-    rows = contrat_service.db.fetch_all(
-        "SELECT c.*, f.nom as fournisseur_nom FROM contrats c "
-        "LEFT JOIN fournisseurs f ON f.id = c.fournisseur_id "
-        f"WHERE c.date_fin IS NOT NULL AND c.date_fin <= NOW() + INTERVAL '60 days' AND {where} "
-        "ORDER BY c.date_fin",
-        params
-    )
-    return jsonify({"list": [dict(r) for r in (rows or [])]})
+        where, params = '1=1', []
+    else:
+        where, params = _ownership_where(user_id, role, service_id, 'c')
+    if request.args.get('counts') in ('1', 'true'):
+        counts = contrat_service.get_alertes_counts(where, params)
+        return jsonify({"total": sum(counts.values()), "counts": counts})
+    return jsonify({"list": contrat_service.get_alertes(where, params)})
 
 
 @routes.route('/contrat/<int:contrat_id>/reconduire', methods=['POST'])
@@ -1379,21 +1504,27 @@ def get_projets():
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
     filters    = request.args.to_dict()
+    try:
+        champs = PROJET_LISTE.parse(filters.get('fields')) or list(PROJET_LISTE.defaut)
+    except ValueError as e:
+        return _err(e)
 
-    if role == 'admin':
-        projets = projet_service.get_all(filters)
+    if role == 'admin' and 'since' not in filters:
+        projets = projet_service.get_all(filters, champs)
     else:
         where, params = _ownership_where(user_id, role, service_id, 'p')
+        # Inclure aussi les projets sans created_by_id (cohérent avec GET /projet/<id>)
+        perimetre = (f"({where} OR p.created_by_id IS NULL)", list(params))
         extra = []
         if filters.get('statut'):
             extra.append("p.statut = %s")
             params.append(filters['statut'])
-        # Inclure aussi les projets sans created_by_id (cohérent avec GET /projet/<id>)
-        clause = f"({where} OR p.created_by_id IS NULL)" + (" AND " + " AND ".join(extra) if extra else "")
+        clause = perimetre[0] + (" AND " + " AND ".join(extra) if extra else "")
+        if 'since' in filters:
+            return _liste_sync(PROJET_LISTE, PROJET_FROM, 'projets', 'p', 'updated_at', champs,
+                               clause, params, perimetre, 'p.date_creation DESC')
         rows = projet_service.db.fetch_all(
-            "SELECT p.*, s.nom as service_nom, s.code as service_code "
-            "FROM projets p "
-            "LEFT JOIN services s ON s.id = p.service_id "
+            f"SELECT {PROJET_LISTE.select(champs)} {PROJET_FROM}"
             f"WHERE {clause} ORDER BY p.date_creation DESC",
             params
         )
@@ -1407,17 +1538,18 @@ def get_projet(projet_id):
     user_id    = g.user.get('sub')
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
+    v = projet_service.version(projet_id, *_acces_fiche(user_id, role, service_id, 'p'))
+    if not v:
+        return jsonify({"error": "Projet introuvable"}), 404
+    if not v['autorise']:
+        return jsonify({"error": "Accès interdit"}), 403
+    resp = etag_service.non_modifie(v['version'])
+    if resp is not None:
+        return resp
     p = projet_service.get_by_id(projet_id)
     if not p:
         return jsonify({"error": "Projet introuvable"}), 404
-    if role != 'admin' and p.get('created_by_id') is not None:
-        where, params = _ownership_where(user_id, role, service_id, 'p')
-        row = projet_service.db.fetch_one(
-            f"SELECT id FROM projets p WHERE p.id=%s AND {where}", [projet_id] + params
-        )
-        if not row:
-            return jsonify({"error": "Accès interdit"}), 403
-    return jsonify(p)
+    return etag_service.marquer(jsonify(p), v['version'])
 
 _PROJET_RULES = {
     'code': {'label': 'Code projet', 'required': True, 'max': 50},
@@ -1513,35 +1645,65 @@ def delete_projet(projet_id):
         return jsonify({"success": False, "error": str(e)}), 400
 
 
-@routes.route('/projet/<int:projet_id>/fiche_word', methods=['GET'])
-@require_auth()
-def export_fiche_projet_word(projet_id):
-    """Génère et télécharge la fiche projet en .docx"""
-    import tempfile
-    from flask import send_file
-    from app.services.fiche_projet_web_service import generer_fiche_depuis_id_pg
+# Fiches rendues (docx / html), partagées entre utilisateurs : le contrôle
+# d'accès est fait avant la lecture du cache.
+_fiche_cache = get_cache('fiches_projet', max_entries=64)
+
 
+def _fiche_projet_access(projet_id):
+    """Retourne (projet, None) ou (None, réponse d'erreur) — requête légère."""
     user_id    = g.user.get('sub')
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
-
-    p = projet_service.get_by_id(projet_id)
+    p = projet_service.db.fetch_one(
+        "SELECT id, code, created_by_id FROM projets WHERE id=%s", [projet_id]
+    )
     if not p:
-        return jsonify({"error": "Projet introuvable"}), 404
+        return None, (jsonify({"error": "Projet introuvable"}), 404)
     if role != 'admin' and p.get('created_by_id') is not None:
         where, params = _ownership_where(user_id, role, service_id, 'p')
         row = projet_service.db.fetch_one(
             f"SELECT id FROM projets p WHERE p.id=%s AND {where}", [projet_id] + params
         )
         if not row:
-            return jsonify({"error": "Accès interdit"}), 403
+            return None, (jsonify({"error": "Accès interdit"}), 403)
+    return p, None
+
+
+def _fiche_rendue(projet_id, fmt, render):
+    """Rendu de fiche mis en cache, invalidé par fiche_version_pg()."""
+    from app.services.fiche_projet_web_service import fiche_version_pg
+    version = fiche_version_pg(projet_id, projet_service.db)
+    key = (fmt, projet_id)
+    content = _fiche_cache.get(key, version)
+    if content is None:
+        content = render()
+        _fiche_cache.set(key, version, content)
+    return content
+
+
+@routes.route('/projet/<int:projet_id>/fiche_word', methods=['GET'])
+@deadline_service.budget(60)
+@require_auth()
+@admission_service.limite('document')
+def export_fiche_projet_word(projet_id):
+    """Génère (ou relit depuis le cache) et télécharge la fiche projet en .docx"""
+    import io
+    from flask import send_file
+    from app.services.fiche_projet_web_service import generer_fiche_docx_bytes
+
+    p, err = _fiche_projet_access(projet_id)
+    if err:
+        return err
 
     try:
-        tmpdir = tempfile.mkdtemp()
-        out_path = generer_fiche_depuis_id_pg(projet_id, tmpdir, projet_service.db)
-        code = p.get('code', f'PRJ{projet_id}')
+        content = _fiche_rendue(
+            projet_id, 'docx',
+            lambda: generer_fiche_docx_bytes(projet_id, projet_service.db)
+        )
+        code = p.get('code') or f'PRJ{projet_id}'
         return send_file(
-            out_path,
+            io.BytesIO(content),
             as_attachment=True,
             download_name=f"fiche_projet_{code}.docx",
             mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
@@ -1551,29 +1713,23 @@ def export_fiche_projet_word(projet_id):
 
 
 @routes.route('/projet/<int:projet_id>/fiche_html', methods=['GET'])
+@deadline_service.budget(60)
 @require_auth()
+@admission_service.limite('document')
 def export_fiche_projet_html(projet_id):
-    """Génère et retourne la fiche projet en HTML."""
+    """Génère (ou relit depuis le cache) et retourne la fiche projet en HTML."""
     from flask import make_response
     from app.services.fiche_projet_html_service import generer_fiche_html_depuis_id_pg
 
-    user_id    = g.user.get('sub')
-    role       = g.user.get('role')
-    service_id = g.user.get('service_id')
-
-    p = projet_service.get_by_id(projet_id)
-    if not p:
-        return jsonify({"error": "Projet introuvable"}), 404
-    if role != 'admin' and p.get('created_by_id') is not None:
-        where, params = _ownership_where(user_id, role, service_id, 'p')
-        row = projet_service.db.fetch_one(
-            f"SELECT id FROM projets p WHERE p.id=%s AND {where}", [projet_id] + params
-        )
-        if not row:
-            return jsonify({"error": "Accès interdit"}), 403
+    p, err = _fiche_projet_access(projet_id)
+    if err:
+        return err
 
     try:
-        html_content = generer_fiche_html_depuis_id_pg(projet_id, projet_service.db)
+        html_content = _fiche_rendue(
+            projet_id, 'html',
+            lambda: generer_fiche_html_depuis_id_pg(projet_id, projet_service.db)
+        )
         resp = make_response(html_content)
         resp.headers['Content-Type'] = 'text/html; charset=utf-8'
         return resp
@@ -1581,6 +1737,51 @@ def export_fiche_projet_html(projet_id):
         return jsonify({"error": str(e)}), 500
 
 
+@routes.route('/projets/fiches.zip', methods=['GET'])
+@deadline_service.budget(120)
+@require_auth()
+@admission_service.limite('export')
+def export_fiches_projets_zip():
+    """Export groupé : ?ids=1,2,3&format=docx|html → archive ZIP en flux."""
+    from flask import Response, stream_with_context
+    from app.services.fiche_projet_web_service import prefetch_fiches_pg
+    from app.services.fiche_export_service import FORMATS, FICHES_ZIP_MAX, iter_fiches_zip
+
+    user_id    = g.user.get('sub')
+    role       = g.user.get('role')
+    service_id = g.user.get('service_id')
+    fmt        = request.args.get('format', 'docx')
+    if fmt not in FORMATS:
+        return _err("format attendu : docx ou html")
+    try:
+        ids = sorted({int(i) for i in request.args.get('ids', '').split(',') if i.strip()})
+    except ValueError:
+        return _err("ids invalides")
+    if not ids:
+        return _err("ids requis")
+    if len(ids) > FICHES_ZIP_MAX:
+        return _err(f"Au plus {FICHES_ZIP_MAX} projets par export")
+
+    # Contrôle d'accès en une requête (même règle que GET /projet/<id>)
+    if role != 'admin':
+        where, params = _ownership_where(user_id, role, service_id, 'p')
+        rows = projet_service.db.fetch_all(
+            "SELECT p.id FROM projets p WHERE p.id = ANY(%s) "
+            f"AND (p.created_by_id IS NULL OR {where})",
+            [ids] + params
+        ) or []
+        ids = [r['id'] for r in rows]
+
+    bundles = prefetch_fiches_pg(ids, projet_service.db)
+    if not bundles:
+        return jsonify({"error": "Aucun projet accessible"}), 404
+
+    resp = Response(stream_with_context(iter_fiches_zip(bundles, fmt)),
+                    mimetype='application/zip')
+    resp.headers['Content-Disposition'] = f'attachment; filename="fiches_projets_{fmt}.zip"'
+    return resp
+
+
 @routes.route('/projet/<int:projet_id>/equipe', methods=['POST'])
 @require_auth('admin', 'gestionnaire')
 def add_projet_equipe(projet_id):
@@ -1806,20 +2007,21 @@ def get_taches():
     user_id    = g.user.get('sub')
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
+    try:
+        champs = TACHE_LISTE.parse(request.args.get('fields')) or list(TACHE_LISTE.defaut)
+    except ValueError as e:
+        return _err(e)
+    if 'since' in request.args:
+        where, params = _tache_visibility_where(user_id, role, service_id)
+        return _liste_sync(TACHE_LISTE, TACHE_FROM, 'taches', 't', 'updated_at', champs,
+                           where, params, (where, params),
+                           't.date_echeance ASC NULLS LAST, t.id DESC')
     if role == 'admin':
-        taches = tache_service.get_all()
+        taches = tache_service.get_all(champs)
     else:
         where, params = _tache_visibility_where(user_id, role, service_id)
         rows = tache_service.db.fetch_all(
-            "SELECT t.*, p.nom as projet_nom, p.code as projet_code, "
-            "u.nom || ' ' || u.prenom as assignee_nom, "
-            "u.id as assignee_user_id, "
-            "s.nom as assignee_service_nom, s.code as assignee_service_code, "
-            "s.is_unite as assignee_is_unite "
-            "FROM taches t "
-            "LEFT JOIN projets p ON p.id = t.projet_id "
-            "LEFT JOIN utilisateurs u ON u.id = t.assignee_id "
-            "LEFT JOIN services s ON s.id = u.service_id "
+            f"SELECT {TACHE_LISTE.select(champs)} {TACHE_FROM}"
             f"WHERE {where} "
             "ORDER BY t.date_echeance ASC NULLS LAST, t.id DESC",
             params
@@ -1858,22 +2060,20 @@ def get_tache_by_id(tache_id):
     role       = g.user.get('role')
     service_id = g.user.get('service_id')
     try:
-        if role != 'admin':
-            vis_w, vis_p = _tache_visibility_where(user_id, role, service_id)
-            row = tache_service.db.fetch_one(
-                "SELECT t.*, p.nom as projet_nom FROM taches t "
-                "LEFT JOIN projets p ON p.id = t.projet_id "
-                f"WHERE t.id = %s AND ({vis_w})",
-                [tache_id] + vis_p
-            )
-        else:
-            row = tache_service.db.fetch_one(
-                "SELECT t.*, p.nom as projet_nom FROM taches t "
-                "LEFT JOIN projets p ON p.id = t.projet_id WHERE t.id = %s",
-                [tache_id]
-            )
+        vis_w, vis_p = _tache_visibility_where(user_id, role, service_id)
+        v = tache_service.version(tache_id, vis_w, vis_p)
+        if not v or not v['autorise']:
+            return jsonify({"error": "Tâche introuvable"}), 404
+        resp = etag_service.non_modifie(v['version'])
+        if resp is not None:
+            return resp
+        row = tache_service.db.fetch_one(
+            "SELECT t.*, p.nom as projet_nom FROM taches t "
+            "LEFT JOIN projets p ON p.id = t.projet_id WHERE t.id = %s",
+            [tache_id]
+        )
         if row:
-            return jsonify(dict(row))
+            return etag_service.marquer(jsonify(dict(row)), v['version'])
         return jsonify({"error": "Tâche introuvable"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -2145,6 +2345,16 @@ def get_services_org():
     services = service_org_service.get_all()
     return jsonify({"count": len(services), "list": services})
 
+@routes.route('/service_org/arbre', methods=['GET'])
+@require_auth()
+def get_services_arbre():
+    """Organisation en arbre, comptes propres et cumulés par sous-arbre (?racine=<id>)."""
+    racine = request.args.get('racine', type=int)
+    arbre = service_org_service.get_arbre(racine)
+    if arbre is None:
+        return _err("Service introuvable", 404)
+    return jsonify({"racine": racine, **arbre})
+
 @routes.route('/service_org', methods=['POST'])
 @require_auth('admin')
 def create_service_org():
@@ -2212,16 +2422,19 @@ def get_service_membres(service_id):
 @require_auth()
 def get_referentiels():
     try:
-        etp          = referentiel_service.get_etp()
-        fournisseurs = referentiel_service.get_fournisseurs()
-        contacts     = referentiel_service.get_contacts()
-        services     = referentiel_service.get_services()
-        entites      = budget_service.get_entites()
-        projets      = projet_service.get_all()
-        lignes       = budget_service.get_lignes()
-        applications = budget_service.get_all_applications()
-        contrats_ref = contrat_service.db.fetch_all(
-            "SELECT id, numero_contrat, objet FROM contrats ORDER BY numero_contrat"
+        (etp, fournisseurs, contacts, services, entites, projets, lignes, applications,
+         contrats_ref) = concurrence_service.rassembler(
+            referentiel_service.get_etp,
+            referentiel_service.get_fournisseurs,
+            referentiel_service.get_contacts,
+            referentiel_service.get_services,
+            budget_service.get_entites,
+            projet_service.get_all,
+            budget_service.get_lignes,
+            budget_service.get_all_applications,
+            lambda: contrat_service.db.fetch_all(
+                "SELECT id, numero_contrat, objet FROM contrats ORDER BY numero_contrat"
+            ),
         )
         contrats_ref = [dict(c) for c in contrats_ref] if contrats_ref else []
         return jsonify({
@@ -2365,7 +2578,27 @@ def etp():
         return jsonify({"list": [], "error": str(e)})
 
 
+@routes.route('/etp/cube', methods=['GET'])
+@require_auth()
+def etp_cube():
+    """Charge répartie par période (week|month|quarter) × personne × service × projet."""
+    user_id    = g.user.get('sub')
+    role       = g.user.get('role')
+    service_id = g.user.get('service_id')
+    grain      = request.args.get('grain', 'month')
+    annee      = request.args.get('annee', type=int)
+    where, params = _tache_visibility_where(user_id, role, service_id)
+    scope = 'admin' if role == 'admin' else (role, user_id, service_id)
+    try:
+        return jsonify(etp_service.get_cube(grain, annee, where, params, scope))
+    except ValueError as e:
+        return _err(e)
+    except Exception as e:
+        return _err(e, 500)
+
+
 @routes.route('/users/actifs', methods=['GET'])
+@deadline_service.budget(5)
 @require_auth()
 def get_users_actifs():
     """Tous les utilisateurs actifs — pour les selects tâches/équipe."""
@@ -2384,68 +2617,100 @@ def get_users_actifs():
         return jsonify({"list": [], "error": str(e)})
 
 
+# ─────────────────────────────────────────────
+# BATCH
+# ─────────────────────────────────────────────
+
+@routes.route('/batch', methods=['POST'])
+@require_auth()
+def batch():
+    """
+    Plusieurs GET en une requête (chargement initial de la SPA, Promise.all) :
+        {"requests": ["/dashboard", {"id": "n", "path": "/notifications"}], "parallele": true}
+    → {"responses": [{"id": …, "path": …, "status": 200, "body": {…}}, …]}
+    Authentification faite une fois pour tout le lot (voir batch_service).
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        items = batch_service.valider(data.get('requests'), current_app)
+    except ValueError as e:
+        return _err(str(e))
+    headers = {'Authorization': request.headers.get('Authorization', '')}
+    resultats = batch_service.executer(current_app._get_current_object(), items, g.user,
+                                       headers, parallele=bool(data.get('parallele')))
+    return Response(batch_service.serialiser(resultats), mimetype='application/json')
+
+
 # ─────────────────────────────────────────────
 # NOTIFICATIONS
 # ─────────────────────────────────────────────
 
+def _notif_where():
+    """Notifications de l'utilisateur courant (sans destinataire : admins seulement)."""
+    return ("(user_id = %s OR (user_id IS NULL AND %s))",
+            [g.user.get('sub'), g.user.get('role') == 'admin'])
+
+
 @routes.route('/notifications', methods=['GET'])
+@deadline_service.budget(5)
 @require_auth()
 def get_notifications():
+    where, params = _notif_where()
     try:
         rows = budget_service.db.fetch_all(
-            "SELECT * FROM notifications ORDER BY date_creation DESC LIMIT 50"
+            f"SELECT * FROM notifications WHERE {where} ORDER BY date_creation DESC LIMIT 50",
+            params
+        )
+        non_lues = budget_service.db.fetch_one(
+            f"SELECT COUNT(*) AS n FROM notifications WHERE {where} AND lue = false", params
         )
         result = [dict(r) for r in rows] if rows else []
-        non_lues = sum(1 for r in result if not r.get('lue'))
-        return jsonify({"list": result, "non_lues": non_lues})
+        return jsonify({"list": result, "non_lues": non_lues['n'] if non_lues else 0})
     except Exception as e:
         return jsonify({"list": [], "non_lues": 0})
 
 @routes.route('/notifications/<int:notif_id>/lire', methods=['POST'])
+@deadline_service.budget(5)
 @require_auth()
 def lire_notification(notif_id):
+    where, params = _notif_where()
     try:
-        budget_service.db.execute("UPDATE notifications SET lue=true WHERE id=%s", [notif_id])
+        budget_service.db.execute(
+            f"UPDATE notifications SET lue=true WHERE id=%s AND {where}", [notif_id] + params
+        )
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
 
 
 @routes.route('/notifications/generate', methods=['POST'])
+@deadline_service.budget(120)
 @require_auth()
 def generate_notifications():
     """Génère automatiquement les notifications pour tâches en retard,
-    contrats expirant bientôt et BC en attente trop longtemps."""
+    contrats expirant bientôt et BC en attente trop longtemps.
+    Destinataire : assigné (à défaut créateur) de la tâche, créateur du
+    contrat ou du BC ; sans propriétaire, la notification va aux admins."""
     db = budget_service.db
-    created = 0
     today = __import__('datetime').date.today()
+    candidates = []
 
-    def _upsert(ref_type, ref_id, titre, message, niveau):
-        """Insère une notif uniquement si elle n'existe pas déjà (non lue)."""
-        nonlocal created
-        existing = db.fetch_one(
-            "SELECT id FROM notifications WHERE ref_type=%s AND ref_id=%s AND lue=false",
-            [ref_type, ref_id]
-        )
-        if not existing:
-            db.execute(
-                "INSERT INTO notifications (titre, message, lue, ref_type, ref_id, niveau) "
-                "VALUES (%s, %s, false, %s, %s, %s)",
-                [titre, message, ref_type, ref_id, niveau]
-            )
-            created += 1
+    def _upsert(ref_type, ref_id, user_id, titre, message, niveau):
+        """Notification à créer pour son destinataire, si elle n'existe pas déjà (non lue)."""
+        candidates.append((ref_type, ref_id, user_id, titre, message, niveau))
 
     # ── Tâches en retard ──────────────────────────────────────────
     try:
         rows = db.fetch_all(
-            "SELECT t.id, t.titre, t.date_echeance, p.nom as projet_nom "
+            "SELECT t.id, t.titre, t.date_echeance, p.nom as projet_nom, "
+            "COALESCE(t.assignee_id, t.created_by_id) AS dest "
             "FROM taches t LEFT JOIN projets p ON p.id = t.projet_id "
             "WHERE t.date_echeance < %s AND t.statut NOT IN ('Terminé','ANNULE')",
             [today]
         )
         for r in (rows or []):
             _upsert(
-                'tache', r['id'],
+                'tache', r['id'], r['dest'],
                 f"Tâche en retard : {r['titre']}",
                 f"Échéance dépassée ({r['date_echeance']}) — Projet : {r['projet_nom'] or '—'}",
                 'URGENT'
@@ -2456,13 +2721,13 @@ def generate_notifications():
     # ── Contrats expirant dans les 30 jours ───────────────────────
     try:
         rows = db.fetch_all(
-            "SELECT id, objet, date_fin FROM contrats "
+            "SELECT id, objet, date_fin, created_by_id AS dest FROM contrats "
             "WHERE date_fin BETWEEN %s AND %s AND statut IN ('ACTIF','RECONDUIT')",
             [today, today + __import__('datetime').timedelta(days=30)]
         )
         for r in (rows or []):
             _upsert(
-                'contrat', r['id'],
+                'contrat', r['id'], r['dest'],
                 f"Contrat expirant bientôt : {r['objet']}",
                 f"Date de fin : {r['date_fin']}",
                 'ALERTE'
@@ -2473,13 +2738,13 @@ def generate_notifications():
     # ── BC en attente depuis plus de 15 jours ─────────────────────
     try:
         rows = db.fetch_all(
-            "SELECT id, objet, date_creation FROM bons_commande "
+            "SELECT id, objet, date_creation, created_by_id AS dest FROM bons_commande "
             "WHERE statut = 'EN_ATTENTE' AND date_creation < %s",
             [today - __import__('datetime').timedelta(days=15)]
         )
         for r in (rows or []):
             _upsert(
-                'bc', r['id'],
+                'bc', r['id'], r['dest'],
                 f"BC en attente depuis plus de 15 jours : {r['objet']}",
                 f"Créé le {r['date_creation']} — en attente de validation",
                 'ALERTE'
@@ -2487,17 +2752,127 @@ def generate_notifications():
     except Exception as _e:
         pass
 
+    # ── Insertion groupée : une lecture des non lues, un INSERT multi-lignes ─
+    created = 0
+    if candidates:
+        try:
+            existantes = {
+                (r['ref_type'], r['ref_id'], r['user_id']) for r in db.fetch_all(
+                    "SELECT ref_type, ref_id, user_id FROM notifications "
+                    "WHERE lue = false AND ref_type = ANY(%s) AND ref_id = ANY(%s)",
+                    [sorted({c[0] for c in candidates}), sorted({c[1] for c in candidates})]
+                ) or []
+            }
+            nouvelles = []
+            for ref_type, ref_id, user_id, titre, message, niveau in candidates:
+                if (ref_type, ref_id, user_id) not in existantes:
+                    existantes.add((ref_type, ref_id, user_id))
+                    nouvelles.append((titre, message, False, ref_type, ref_id, niveau, user_id))
+            if nouvelles:
+                with db.transaction() as cur:
+                    psycopg2.extras.execute_values(
+                        cur,
+                        "INSERT INTO notifications (titre, message, lue, ref_type, ref_id, niveau, user_id) "
+                        "VALUES %s",
+                        nouvelles, page_size=len(nouvelles)
+                    )
+                created = len(nouvelles)
+        except Exception as _e:
+            pass
+
     return jsonify({"success": True, "created": created})
 
 
+@routes.route('/events/ticket', methods=['POST'])
+@require_auth()
+def events_ticket():
+    """Ticket court (SSE_TICKET_SECONDES) pour ouvrir un flux /api/events."""
+    return jsonify({"ticket": auth_service.emettre_ticket(g.user),
+                    "expires_in": TICKET_SECONDES})
+
+
+@routes.route('/events', methods=['GET'])
+def events_stream():
+    """
+    Flux Server-Sent Events de l'utilisateur : notifications et modifications
+    des listes BC / tâches / contrats (voir events_service).
+    EventSource ne peut pas envoyer d'en-tête Authorization : le navigateur
+    passe en ?ticket= un ticket obtenu par POST /api/events/ticket (jamais le
+    jeton de session, qui finirait dans les journaux d'accès), et Last-Event-ID
+    en ?last_event_id= (nouvel EventSource, nouveau ticket).
+    """
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        payload = auth_service.verify_token(auth_header[7:])
+    else:
+        ticket = request.args.get('ticket', '')
+        payload = auth_service.verifier_ticket(ticket) if ticket else None
+    if not payload:
+        return jsonify({"error": "Ticket invalide ou expiré"}), 401
+    try:
+        user_row = auth_service.db.fetch_one(
+            "SELECT actif FROM utilisateurs WHERE id=%s", [payload.get('sub')]
+        )
+        if not user_row or not user_row.get('actif'):
+            return jsonify({"error": "Compte désactivé"}), 401
+    except Exception:
+        pass
+    dernier = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        dernier = int(dernier) if dernier else None
+    except ValueError:
+        dernier = None
+    ab = events_service.abonner(payload.get('sub'), payload.get('role') == 'admin')
+    if ab is None:
+        # Worker plein : threads réservés aux requêtes ordinaires
+        return Response(f"retry: {events_service.SSE_PLEIN_MS}\n\n", status=503,
+                        mimetype='text/event-stream', headers={
+                            'Retry-After': str(events_service.SSE_PLEIN_MS // 1000),
+                            'Cache-Control': 'no-cache',
+                        })
+    return Response(events_service.flux(ab, dernier), mimetype='text/event-stream', headers={
+        'Cache-Control':     'no-cache',
+        'X-Accel-Buffering': 'no',     # pas de mise en tampon par nginx
+    })
+
+
 # ─────────────────────────────────────────────
 # GANTT
 # ─────────────────────────────────────────────
 
+# Zoom du Gantt : True → vue agrégée par projet (une barre par projet : bornes,
+# avancement pondéré par la durée, tâches par statut), tâches détaillées
+# seulement pour les projets de ?expand=
+_GANTT_ZOOMS    = {'day': False, 'week': False, 'month': True, 'quarter': True}
+_GANTT_PAGE     = 200   # projets par fenêtre (?zoom= ou ?limit=)
+_GANTT_PAGE_MAX = 500
+
+
+def _str(v):
+    return str(v) if v is not None else None
+
+
+def _gantt_curseur(valeur):
+    """Curseur de pagination 'AAAA-MM-JJ:id' → (date, id), ou None."""
+    if not valeur:
+        return None
+    from datetime import date
+    jour, _, pid = valeur.partition(':')
+    return date.fromisoformat(jour), int(pid)
+
+
 @routes.route('/gantt', methods=['GET'])
 @require_auth()
 def get_gantt():
-    """Retourne projets + tâches pour le diagramme de Gantt."""
+    """
+    Retourne projets + tâches pour le diagramme de Gantt.
+
+    Sans zoom ni limit : tous les projets et toutes les tâches datées de la
+    période. Avec ?zoom=day|week|month|quarter (ou ?limit=) : fenêtre de
+    projets triés par date (limit, curseur apres → page.suivant) et tâches
+    de ces projets seulement ; aux zooms month et quarter, agrégat par projet
+    à la place des tâches, détaillées pour les projets de ?expand=1,2.
+    """
     user_id    = g.user.get('sub')
     role       = g.user.get('role')
     svc_id     = g.user.get('service_id')
@@ -2507,6 +2882,18 @@ def get_gantt():
     date_fin   = request.args.get('date_fin')     # YYYY-MM-DD
     projet_id  = request.args.get('projet_id', type=int)
 
+    zoom = request.args.get('zoom')
+    if zoom is not None and zoom not in _GANTT_ZOOMS:
+        return _err("zoom attendu : day, week, month ou quarter")
+    agrege = _GANTT_ZOOMS.get(zoom, False)
+    pagine = zoom is not None or 'limit' in request.args
+    try:
+        limit  = min(max(int(request.args.get('limit', _GANTT_PAGE)), 1), _GANTT_PAGE_MAX)
+        apres  = _gantt_curseur(request.args.get('apres'))
+        expand = {int(i) for i in request.args.get('expand', '').split(',') if i.strip()}
+    except ValueError:
+        return _err("limit, apres ou expand invalide")
+
     db = budget_service.db
 
     # ── Projets ─────────────────────────────────────────────
@@ -2526,18 +2913,25 @@ def get_gantt():
     if date_fin:
         proj_where.append("(p.date_debut IS NULL OR p.date_debut <= %s)")
         proj_params.append(date_fin)
+    if pagine:
+        # Fenêtre triée sur (date de début ou de fin, id) : curseur stable
+        if projet_id:
+            proj_where.append("p.id = %s")
+            proj_params.append(projet_id)
+        if apres:
+            proj_where.append("(COALESCE(p.date_debut, p.date_fin_prevue), p.id) > (%s, %s)")
+            proj_params.extend(apres)
+        ordre = " ORDER BY COALESCE(p.date_debut, p.date_fin_prevue), p.id LIMIT %s"
+        proj_params.append(limit + 1)
+    else:
+        ordre = " ORDER BY p.date_debut NULLS LAST"
     proj_sql = (
         "SELECT p.id, p.code, p.nom, p.date_debut, p.date_fin_prevue, "
         "p.avancement, p.statut, s.nom as service_nom "
         "FROM projets p "
         "LEFT JOIN services s ON s.id = p.service_id "
-        "WHERE " + " AND ".join(proj_where) +
-        " ORDER BY p.date_debut NULLS LAST"
+        "WHERE " + " AND ".join(proj_where) + ordre
     )
-    try:
-        projets = db.fetch_all(proj_sql, proj_params) or []
-    except Exception:
-        projets = []
 
     # ── Tâches ──────────────────────────────────────────────
     tache_where = ["t.date_echeance IS NOT NULL"]
@@ -2559,27 +2953,83 @@ def get_gantt():
     if date_fin:
         tache_where.append("(t.date_debut IS NULL OR t.date_debut <= %s)")
         tache_params.append(date_fin)
-    tache_sql = (
-        "SELECT t.id, t.titre, t.statut, t.priorite, t.avancement, "
-        "t.date_debut, t.date_echeance, t.responsable_label, "
-        "t.projet_id, p.nom as projet_nom, p.code as projet_code "
-        "FROM taches t "
-        "JOIN projets p ON p.id = t.projet_id "
-        "WHERE " + " AND ".join(tache_where) +
-        " ORDER BY t.date_debut NULLS LAST, t.date_echeance"
-    )
-    try:
-        taches = db.fetch_all(tache_sql, tache_params) or []
-    except Exception:
-        taches = []
 
-    def _str(v):
-        return str(v) if v is not None else None
+    def _tache_sql(where):
+        return (
+            "SELECT t.id, t.titre, t.statut, t.priorite, t.avancement, "
+            "t.date_debut, t.date_echeance, t.responsable_label, "
+            "t.projet_id, p.nom as projet_nom, p.code as projet_code "
+            "FROM taches t "
+            "JOIN projets p ON p.id = t.projet_id "
+            "WHERE " + " AND ".join(where) +
+            " ORDER BY t.date_debut NULLS LAST, t.date_echeance"
+        )
 
-    return jsonify({
+    page = agregats = None
+    if not pagine:
+        # Les deux requêtes sont indépendantes : en parallèle
+        projets, taches = concurrence_service.rassembler(
+            lambda: db.fetch_all(proj_sql, proj_params),
+            lambda: db.fetch_all(_tache_sql(tache_where), tache_params),
+            return_exceptions=True,
+        )
+        projets = _ou(projets, None) or []
+        taches  = _ou(taches, None) or []
+    else:
+        # Comme sans pagination : une requête en échec → liste vide, pas de 500
+        (projets,) = concurrence_service.rassembler(
+            lambda: db.fetch_all(proj_sql, proj_params), return_exceptions=True)
+        projets = _ou(projets, None) or []
+        suivant = None
+        if len(projets) > limit:
+            projets = projets[:limit]
+            dernier = projets[-1]
+            suivant = f"{dernier.get('date_debut') or dernier.get('date_fin_prevue')}:{dernier['id']}"
+        page = {"limit": limit, "suivant": suivant}
+        ids = [r['id'] for r in projets]
+        detail = [i for i in ids if i in expand] if agrege else ids
+
+        def _detail():
+            if not detail:
+                return []
+            return db.fetch_all(_tache_sql(tache_where + ["t.projet_id = ANY(%s)"]),
+                                tache_params + [detail])
+
+        def _agregats():
+            if not agrege or not ids:
+                return []
+            return db.fetch_all(
+                "SELECT t.projet_id, t.statut, GROUPING(t.statut) AS total, COUNT(*) AS nb, "
+                "MIN(COALESCE(t.date_debut, t.date_echeance)) AS debut, "
+                "MAX(t.date_echeance) AS fin, "
+                "ROUND(SUM(COALESCE(t.avancement, 0) * d.jours)::numeric "
+                "/ NULLIF(SUM(d.jours), 0)) AS avancement "
+                "FROM taches t "
+                "JOIN projets p ON p.id = t.projet_id "
+                "CROSS JOIN LATERAL (SELECT GREATEST(t.date_echeance "
+                "- COALESCE(t.date_debut, t.date_echeance), 0) + 1 AS jours) d "
+                "WHERE " + " AND ".join(tache_where + ["t.projet_id = ANY(%s)"]) +
+                " GROUP BY GROUPING SETS ((t.projet_id), (t.projet_id, t.statut))",
+                tache_params + [ids])
+
+        taches, lignes = concurrence_service.rassembler(_detail, _agregats, return_exceptions=True)
+        taches = _ou(taches, None) or []
+        lignes = _ou(lignes, None)
+        if agrege:
+            agregats = {}
+            for r in lignes or []:
+                a = agregats.setdefault(r['projet_id'], {"statuts": {}})
+                if r['total']:
+                    a.update(debut=_str(r['debut']), fin=_str(r['fin']), taches=r['nb'],
+                             avancement=int(r['avancement'] or 0))
+                else:
+                    a["statuts"][r['statut'] or ''] = r['nb']
+
+    out = {
         "projets": [
             {**dict(r), "date_debut": _str(r.get("date_debut")),
-             "date_fin_prevue": _str(r.get("date_fin_prevue"))}
+             "date_fin_prevue": _str(r.get("date_fin_prevue")),
+             **({"agregat": agregats.get(r['id'])} if agregats is not None else {})}
             for r in projets
         ],
         "taches": [
@@ -2587,7 +3037,10 @@ def get_gantt():
              "date_echeance": _str(r.get("date_echeance"))}
             for r in taches
         ],
-    })
+    }
+    if pagine:
+        out.update(zoom=zoom, page=page)
+    return jsonify(out)
 
 
 # ─────────────────────────────────────────────
@@ -2595,7 +3048,9 @@ def get_gantt():
 # ─────────────────────────────────────────────
 
 @routes.route('/export/budget', methods=['GET'])
+@deadline_service.budget(120)
 @require_auth()
+@admission_service.limite('export')
 def export_budget():
     import io
     import traceback
@@ -2884,6 +3339,7 @@ def export_budget():
 # ─────────────────────────────────────────────
 
 @routes.route('/modules', methods=['GET'])
+@deadline_service.budget(5)
 def get_modules_public():
     """Public : retourne les modules et leur statut (utilisé par le frontend au login)."""
     try:
@@ -2921,6 +3377,62 @@ def toggle_module(module_name):
         return _err(e)
 
 
+# ── Profils de requêtes (X-Profile: 1) ───────────────────────────────────────
+
+@routes.route('/admin/profiles', methods=['GET'])
+@require_auth('admin')
+def list_profiles():
+    return jsonify({"list": profiling_service.lister()})
+
+
+@routes.route('/admin/profiles/<string:nom>', methods=['GET'])
+@require_auth('admin')
+@batch_service.hors_lot
+def download_profile(nom):
+    from flask import send_from_directory
+    if not profiling_service.nom_valide(nom):
+        return _err("Profil introuvable", 404)
+    return send_from_directory(profiling_service.PROFILE_DIR, nom,
+                               as_attachment=True, mimetype='text/plain')
+
+
+# ── Instantanés Parquet (python snapshot.py) ─────────────────────────────────
+
+@routes.route('/admin/snapshots', methods=['GET'])
+@require_auth('admin')
+def list_snapshots():
+    return jsonify({"list": snapshot_service.lister()})
+
+
+@routes.route('/admin/snapshots/<string:nom>.zip', methods=['GET'])
+@deadline_service.budget(600)
+@require_auth('admin')
+@admission_service.limite('export')
+def download_snapshot(nom):
+    from flask import stream_with_context
+    try:
+        snapshot_service.dossier(nom)
+    except snapshot_service.SnapshotIndisponible as e:
+        return _err(str(e), 404)
+    resp = Response(stream_with_context(snapshot_service.iter_zip(nom)),
+                    mimetype='application/zip')
+    resp.headers['Content-Disposition'] = f'attachment; filename="snapshot_{nom}.zip"'
+    return resp
+
+
+@routes.route('/admin/snapshots/<string:nom>/<path:fichier>', methods=['GET'])
+@require_auth('admin')
+@batch_service.hors_lot
+def download_snapshot_file(nom, fichier):
+    """Un fichier de l'instantané (manifest.json, <table>/exercice=AAAA/part-0.parquet)."""
+    from flask import send_from_directory
+    try:
+        racine = snapshot_service.dossier(nom)
+    except snapshot_service.SnapshotIndisponible as e:
+        return _err(str(e), 404)
+    return send_from_directory(racine, fichier, as_attachment=True)
+
+
 # ── SMTP config & test ─────────────────────────────────────────────────────────
 
 @routes.route('/admin/smtp/config', methods=['GET'])
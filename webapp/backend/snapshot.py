@@ -0,0 +1,42 @@
+"""
+Instantané Parquet des tables financières et projets (analyse hors base).
+Usage :
+    python snapshot.py                 crée un instantané de toutes les tables
+    python snapshot.py --tables a,b    crée un instantané des tables a et b
+    python snapshot.py --list          liste les instantanés conservés
+
+À planifier hors des workers web (cron, timer systemd, CronJob), par exemple :
+    15 2 * * *  cd /app && python snapshot.py
+"""
+import argparse
+import logging
+import sys
+
+from app.services import snapshot_service
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Instantanés Parquet Budget Manager Pro (web)")
+    parser.add_argument('--list', action='store_true', help="lister les instantanés")
+    parser.add_argument('--tables', help="tables à exporter, séparées par des virgules "
+                                         f"(défaut : {', '.join(snapshot_service.TABLES)})")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    if args.list:
+        for m in snapshot_service.lister():
+            lignes = sum(t['lignes'] for t in m['tables'].values())
+            print(f"{m['nom']}  {m['date']}  {lignes:>10} ligne(s)  {m['octets'] / 1e6:8.1f} Mo")
+        return 0
+    tables = [t.strip() for t in args.tables.split(',') if t.strip()] if args.tables else None
+    try:
+        m = snapshot_service.creer(tables)
+    except (snapshot_service.SnapshotIndisponible, ValueError) as e:
+        logging.getLogger('snapshot').error("%s", e)
+        return 1
+    print(f"Instantané {m['nom']} : {m['octets'] / 1e6:.1f} Mo en {m['duree_s']} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1271 @@
+"""
+Tests unitaires des services web (sans base : DatabaseService mocké).
+Usage : cd webapp/backend && pytest tests/ -v
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+
+
+@pytest.fixture(autouse=True)
+def _no_db():
+    """Empêche toute connexion PostgreSQL réelle à l'import des services."""
+    with patch('psycopg2.connect') as mock_conn:
+        mock_conn.return_value = MagicMock()
+        yield
+
+
+def _mock_db():
+    db = MagicMock()
+    db.fetch_all.return_value = []
+    db.fetch_one.return_value = None
+    return db
+
+
+# ─── Cache versionné ────────────────────────────────────────
+
+class TestVersionedCache:
+    def test_hit_and_version_change(self):
+        from app.services.cache_service import VersionedCache
+        c = VersionedCache('test_hit')
+        assert c.get('k', 1) is None
+        c.set('k', 1, {'a': 1})
+        assert c.get('k', 1) == {'a': 1}
+        assert c.get('k', 2) is None
+        assert c.stats()['hits'] == 1
+
+    def test_lru_bound(self):
+        from app.services.cache_service import VersionedCache
+        c = VersionedCache('test_lru', max_entries=2)
+        for i in range(3):
+            c.set(i, 0, i)
+        assert c.get(0, 0) is None
+        assert c.get(2, 0) == 2
+
+
+# ─── ETP / cube de charge ───────────────────────────────────
+
+class TestEtpCube:
+    def test_invalid_grain(self):
+        from app.services.etp_service import EtpService
+        svc = EtpService()
+        svc.db = _mock_db()
+        with pytest.raises(ValueError):
+            svc.get_cube('day', 2026)
+
+    def test_cube_cached_per_version(self):
+        from app.services.etp_service import EtpService
+        svc = EtpService()
+        svc.db = _mock_db()
+        svc.db.fetch_one.return_value = {'n': 3, 'max_id': 9, 'maj': '2026-01-01'}
+        svc.db.fetch_all.return_value = [
+            {'periode': '2026-01-01', 'assignee_id': 1, 'personne': 'A B',
+             'service_id': None, 'service_code': None, 'service_nom': None,
+             'projet_id': 2, 'projet_code': 'P', 'projet_nom': 'Projet',
+             'heures': 7, 'nb_taches': 1},
+        ]
+        first = svc.get_cube('month', 2031, scope='admin')
+        second = svc.get_cube('month', 2031, scope='admin')
+        assert first is second
+        assert svc.db.fetch_all.call_count == 1
+        assert first['periodes'] == [{'periode': '2026-01-01', 'heures': 7.0}]
+
+        svc.db.fetch_one.return_value = {'n': 4, 'max_id': 10, 'maj': '2026-01-02'}
+        svc.get_cube('month', 2031, scope='admin')
+        assert svc.db.fetch_all.call_count == 2
+
+
+# ─── TPE : synchronisation des cartes ───────────────────────
+
+class TestTpeCartes:
+    def test_save_cartes_diff(self):
+        from app.services.tpe_service import TpeService
+        cur = MagicMock()
+        cur.fetchall.return_value = [
+            {'id': 1, 'numero': 'A', 'numero_serie_tpe': 'S1', 'modele_tpe': None},
+            {'id': 2, 'numero': 'B', 'numero_serie_tpe': None, 'modele_tpe': 'M'},
+            {'id': 3, 'numero': 'C', 'numero_serie_tpe': None, 'modele_tpe': None},
+        ]
+        cartes = [
+            {'numero': 'A', 'numero_serie_tpe': 'S1'},   # inchangée
+            {'numero': 'B', 'modele_tpe': 'N'},          # modifiée
+            {'numero': 'D'},                             # ajoutée
+            {'numero': '  '},                            # ignorée
+        ]
+        with patch('app.services.tpe_service.psycopg2.extras.execute_batch') as batch, \
+             patch('app.services.tpe_service.psycopg2.extras.execute_values') as values:
+            TpeService._save_cartes(cur, 7, cartes)
+        cur.execute.assert_any_call("DELETE FROM tpe_cartes WHERE id = ANY(%s)", [[3]])
+        assert batch.call_args[0][2] == [(None, 'N', 2)]
+        assert values.call_args[0][2] == [(7, 'D', None, None)]
+
+    def test_import_fiches_invalides_ecartees(self, tmp_path):
+        """Une fiche invalide est écartée avant le COPY au lieu de faire échouer l'import."""
+        import csv
+        import io
+        import json
+        from app.services.tpe_service import TpeService, _CHAMPS
+        path = tmp_path / 'tpe.json'
+        path.write_text(json.dumps({'tpes': [
+            {'service': 'Piscine', 'regisseur_nom': 'A', 'nombre_tpe': '2',
+             'shop_id': 12.0, 'cartes': [{'numero': 4970}, 'x']},
+            {'service': 'Musée', 'regisseur_nom': 'B', 'nombre_tpe': 'deux'},
+            {'service': 'S' * 301, 'regisseur_nom': 'C'},
+            {'regisseur_nom': 'D'},
+            {'service': 'Mairie', 'regisseur_nom': 'E',
+             'regisseurs_suppleants': ['F', 'G'], 'nombre_tpe': None},
+        ]}), encoding='utf-8')
+        svc = TpeService()
+        svc.db = _mock_db()
+        svc.db.fetch_one.return_value = {'n': 0}
+        cur = svc.db.transaction.return_value.__enter__.return_value
+        copie = []
+        cur.copy_expert.side_effect = lambda sql, buf: copie.append(buf.read())
+
+        assert svc.import_from_json(str(path)) == 2
+        lignes = list(csv.reader(io.StringIO(copie[0])))
+        fiches = [dict(zip(['ordre'] + _CHAMPS + ['cartes'], l)) for l in lignes]
+        assert [f['service'] for f in fiches] == ['Piscine', 'Mairie']
+        assert fiches[0]['nombre_tpe'] == '2' and fiches[0]['shop_id'] == '12'
+        assert json.loads(fiches[0]['cartes'])[0]['numero'] == '4970'
+        assert fiches[1]['regisseurs_suppleants'] == 'F, G' and fiches[1]['nombre_tpe'] == '1'
+
+    def test_import_dans_la_transaction_de_migration(self, tmp_path):
+        import json
+        from app.services.tpe_service import TpeService
+        path = tmp_path / 'tpe.json'
+        path.write_text(json.dumps([{'service': 'Piscine', 'regisseur_nom': 'A'}]), encoding='utf-8')
+        svc = TpeService()
+        svc.db = _mock_db()
+        cur = MagicMock()
+        cur.fetchone.return_value = (False,)
+        assert svc.import_from_json(str(path), cur=cur) == 1
+        # Curseur fourni : ni connexion du pool, ni commit propre
+        svc.db.fetch_one.assert_not_called()
+        svc.db.transaction.assert_not_called()
+        assert cur.copy_expert.called and cur.execute.call_count == 5
+        cur.fetchone.return_value = (True,)
+        assert svc.import_from_json(str(path), cur=cur) == 0
+
+
+# ─── Migrations versionnées ─────────────────────────────────
+
+class TestMigrations:
+    def test_decouper_sql(self):
+        from app.services.migration_service import decouper_sql
+        sql = (
+            "-- commentaire ; ignoré\n"
+            "ALTER TABLE t ADD COLUMN IF NOT EXISTS a TEXT;\n"
+            "INSERT INTO t (a) VALUES ('x;y''z');\n"
+            "CREATE FUNCTION f() RETURNS trigger AS $$ BEGIN RETURN NEW; END; $$ LANGUAGE plpgsql;"
+        )
+        stmts = decouper_sql(sql)
+        assert len(stmts) == 3
+        assert stmts[1] == "INSERT INTO t (a) VALUES ('x;y''z')"
+        assert stmts[2].endswith("LANGUAGE plpgsql")
+
+    def test_checksum_modifie(self, tmp_path):
+        from app.services.migration_service import (
+            MigrationError, _verifier, lister_migrations)
+        (tmp_path / '0001_a.sql').write_text("SELECT 1;")
+        (tmp_path / '0002_b.sql').write_text("SELECT 2;")
+        (tmp_path / 'notes.txt').write_text("ignoré")
+        m1, m2 = lister_migrations(str(tmp_path))
+        assert _verifier([m1, m2], {1: m1.checksum}) == [m2]
+        with pytest.raises(MigrationError):
+            _verifier([m1, m2], {1: '0' * 64})
+
+    def test_instruction_en_echec_non_enregistree(self, tmp_path):
+        import psycopg2
+        from app.services.migration_service import _appliquer, lister_migrations
+        (tmp_path / '0001_a.sql').write_text("SELECT 1; SELECT * FROM absente; SELECT 3;")
+        m, = lister_migrations(str(tmp_path))
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+
+        def execute(sql, *a):
+            if 'absente' in sql:
+                raise psycopg2.errors.UndefinedTable('relation "absente" does not exist')
+        cur.execute.side_effect = execute
+        with pytest.raises(psycopg2.Error):
+            _appliquer(conn, m)
+        executees = [c[0][0] for c in cur.execute.call_args_list]
+        assert executees == ['SELECT 1', 'SELECT * FROM absente']
+        conn.commit.assert_not_called()
+
+    def test_repetables_relancees_si_necessaire(self, tmp_path):
+        from app.services.migration_service import (
+            lister_migrations, lister_repetables, run_migrations)
+        (tmp_path / '0001_a.sql').write_text("SELECT 1;")
+        (tmp_path / 'R_recalage.sql').write_text("SELECT 2;")
+        m, = lister_migrations(str(tmp_path))
+        r, = lister_repetables(str(tmp_path))
+
+        def lancer(enregistrees, **kw):
+            conn = MagicMock()
+            cur = conn.cursor.return_value.__enter__.return_value
+            cur.fetchall.return_value = enregistrees
+            assert run_migrations(str(tmp_path), conn=conn, **kw) == 0
+            return [c[0][0] for c in cur.execute.call_args_list]
+
+        # Tout est appliqué, étape inchangée : une seule requête, sans verrou
+        executees = lancer([(1, None, m.checksum), (None, 'recalage', r.checksum)])
+        assert len(executees) == 1 and 'schema_repetables' in executees[0]
+        # Étape nouvelle ou modifiée : exécutée et sa somme enregistrée
+        for enregistrees in ([(1, None, m.checksum)], [(1, None, m.checksum), (None, 'recalage', '0' * 64)]):
+            executees = lancer(enregistrees)
+            assert 'SELECT 2' in executees and 'SELECT 1' not in executees
+            assert any('INSERT INTO schema_repetables' in q for q in executees)
+            assert not any('INSERT INTO schema_migrations' in q for q in executees)
+        # Relance demandée (migrate.py --repetables)
+        executees = lancer([(1, None, m.checksum), (None, 'recalage', r.checksum)],
+                           forcer_repetables=True)
+        assert 'SELECT 2' in executees
+
+    def test_repetables_apres_migration(self, tmp_path):
+        from app.services.migration_service import lister_repetables, run_migrations
+        (tmp_path / '0001_a.sql').write_text("SELECT 1;")
+        (tmp_path / 'R_recalage.sql').write_text("SELECT 2;")
+        r, = lister_repetables(str(tmp_path))
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = [(None, 'recalage', r.checksum)]
+        assert run_migrations(str(tmp_path), conn=conn) == 1
+        executees = [c[0][0] for c in cur.execute.call_args_list]
+        assert executees.index('SELECT 1') < executees.index('SELECT 2')
+
+    def test_somme_d_origine_acceptee(self):
+        from app.services.migration_service import SOMMES_ACCEPTEES, _verifier, lister_migrations
+        m = next(m for m in lister_migrations() if m.version == 10)
+        ancienne, = SOMMES_ACCEPTEES[10]
+        assert m.checksum != ancienne
+        assert _verifier([m], {10: ancienne}) == []
+
+
+# ─── Pool PostgreSQL par worker ─────────────────────────────
+
+class TestPoolBounds:
+    def test_budget_reparti_entre_workers(self, monkeypatch):
+        from app.services import database_service as dbs
+        monkeypatch.setenv('DB_POOL_MAX', '10')
+        monkeypatch.setattr(dbs, '_POOL_MIN', 2)
+        monkeypatch.delenv('DB_POOL_THREADS', raising=False)
+        # Une connexion de chaque part est réservée à l'écoute LISTEN (events_service)
+        monkeypatch.setenv('DB_POOL_WORKERS', '4')
+        assert dbs.pool_bounds() == (1, 1)
+        monkeypatch.setenv('DB_POOL_WORKERS', '3')
+        assert dbs.pool_bounds() == (2, 2)
+        monkeypatch.delenv('DB_POOL_WORKERS')
+        assert dbs.pool_bounds() == (2, 9)
+
+    def test_budget_insuffisant_refuse(self, monkeypatch):
+        from app.services import database_service as dbs
+        monkeypatch.setenv('DB_POOL_MAX', '10')
+        # Plus de workers que de parts : pas de plancher au-delà du budget
+        monkeypatch.setenv('DB_POOL_WORKERS', '16')
+        monkeypatch.delenv('DB_POOL_THREADS', raising=False)
+        with pytest.raises(ValueError, match='au moins 32'):
+            dbs.pool_bounds()
+        # Moins de connexions que de threads par worker
+        monkeypatch.setenv('DB_POOL_WORKERS', '4')
+        monkeypatch.setenv('DB_POOL_THREADS', '16')
+        with pytest.raises(ValueError, match='au moins 68'):
+            dbs.pool_bounds()
+        monkeypatch.setenv('DB_POOL_MAX', '68')
+        assert dbs.pool_bounds() == (2, 16)
+
+    def test_defaut_gunicorn(self):
+        """Sans DB_POOL_MAX : une connexion par thread et une d'écoute par worker."""
+        import importlib.util
+        import os
+        from types import SimpleNamespace
+        spec = importlib.util.spec_from_file_location(
+            'gunicorn_conf', os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py'))
+        conf = importlib.util.module_from_spec(spec)
+        with patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': '/tmp/bmp_metrics_test'}):
+            for var in ('DB_POOL_MAX', 'DB_POOL_WORKERS', 'DB_POOL_THREADS', 'SSE_FLUX_MAX'):
+                os.environ.pop(var, None)
+            spec.loader.exec_module(conf)
+            conf.on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=4, threads=16)))
+            assert os.environ['DB_POOL_MAX'] == '68' and os.environ['SSE_FLUX_MAX'] == '8'
+
+    def test_emprunt_bloquant(self):
+        """6 emprunts simultanés sur un pool de 2 : 2 connexions, jamais de reset."""
+        import threading
+        import time
+        import psycopg2
+        from app.services import database_service as dbs
+        ouvertes, pic_ouvertes = [0], [0]
+
+        def connexion(*a, **k):
+            conn = MagicMock(closed=0)
+            ouvertes[0] += 1
+            pic_ouvertes[0] = max(pic_ouvertes[0], ouvertes[0])
+            conn.close.side_effect = lambda: ouvertes.__setitem__(0, ouvertes[0] - 1)
+            return conn
+
+        psycopg2.connect.side_effect = connexion
+        pool = dbs._BlockingPool(0, 2, dsn='')
+        occupees, pic, lock = [0], [0], threading.Lock()
+
+        def emprunt():
+            conn = pool.getconn(timeout=5)
+            with lock:
+                occupees[0] += 1
+                pic[0] = max(pic[0], occupees[0])
+            time.sleep(0.05)
+            with lock:
+                occupees[0] -= 1
+            pool.putconn(conn)
+
+        threads = [threading.Thread(target=emprunt) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert pic[0] == 2
+        assert pic_ouvertes[0] == 2                          # jamais plus de maxconn
+
+        a, b = pool.getconn(), pool.getconn()
+        with pytest.raises(dbs.PoolSature):
+            pool.getconn(timeout=0.05)
+        pool.putconn(a)
+        assert pool.getconn(timeout=0.05) is not None          # place rendue
+
+    def test_pas_de_reset_sur_saturation(self, monkeypatch):
+        import psycopg2
+        from app.services import database_service as dbs
+        psycopg2.connect.side_effect = lambda *a, **k: MagicMock(closed=0)
+        monkeypatch.setattr(dbs, '_POOL_ATTENTE', 0.05)
+        monkeypatch.setenv('DB_POOL_WORKERS', '1')
+        monkeypatch.delenv('DB_POOL_THREADS', raising=False)
+        monkeypatch.setenv('DB_POOL_MAX', '2')
+        monkeypatch.setattr(dbs.DatabaseService, '_pool', None)
+        db = dbs.DatabaseService()
+        db._get_conn()
+        pool = dbs.DatabaseService._pool
+        with pytest.raises(dbs.PoolSature):
+            db._get_conn()
+        assert dbs.DatabaseService._pool is pool            # pool conservé
+        monkeypatch.setattr(dbs.DatabaseService, '_pool_pid', -1)   # après fork
+        db._get_conn()
+        assert dbs.DatabaseService._pool is not pool
+
+
+# ─── Métriques Prometheus ───────────────────────────────────
+
+class TestMetrics:
+    def test_hooks_blueprint(self):
+        pytest.importorskip('prometheus_client')
+        from flask import Blueprint, Flask
+        from app.services import metrics_service as ms
+        bp = Blueprint('test_metrics', __name__)
+        ms.register_metrics(bp)
+
+        @bp.route('/ping/<int:n>')
+        def ping(n):
+            return 'pong'
+
+        app = Flask(__name__)
+        app.register_blueprint(bp, url_prefix='/api')
+        before = ms.HTTP_REQUESTS.labels('/api/ping/<int:n>', 'GET', '200')._value.get()
+        with app.test_client() as c:
+            assert c.get('/api/ping/1').status_code == 200
+            assert c.get('/api/ping/2').status_code == 200
+        after = ms.HTTP_REQUESTS.labels('/api/ping/<int:n>', 'GET', '200')._value.get()
+        assert after - before == 2
+
+    def test_acces_interne(self):
+        from flask import Flask
+        from app.services.metrics_service import acces_interne
+        app = Flask(__name__)
+        with app.test_request_context('/', environ_base={'REMOTE_ADDR': '10.1.2.3'}):
+            assert acces_interne()
+        with app.test_request_context('/', environ_base={'REMOTE_ADDR': '10.1.2.3'},
+                                      headers={'X-Forwarded-For': '8.8.8.8'}):
+            assert not acces_interne()
+        with app.test_request_context('/', environ_base={'REMOTE_ADDR': '8.8.8.8'}):
+            assert not acces_interne()
+
+
+class TestServerTiming:
+    def test_en_tete(self):
+        from flask import Blueprint, Flask, jsonify
+        from app.services import timing_service as ts
+        from app.services import database_service
+        from app.services.cache_service import get_cache
+        bp = Blueprint('test_timing', __name__)
+        ts.register_timing(bp)
+        cache = get_cache('test_timing', max_entries=4)
+
+        @bp.route('/t')
+        def t():
+            database_service._notify('query', 0.002, 'SELECT 1')
+            database_service._notify('query', 0.003, 'SELECT 2')
+            cache.get('k', 1)
+            return jsonify({'ok': True})
+
+        app = Flask(__name__)
+        app.json = ts.TimedJSONProvider(app)
+        app.register_blueprint(bp, url_prefix='/api')
+        with app.test_client() as c:
+            h = c.get('/api/t').headers['Server-Timing']
+        assert h.startswith('total;dur=')
+        assert 'db;dur=5.0;desc="2 allers-retours SQL"' in h
+        assert 'json;dur=' in h
+        assert 'cache;desc="test_timing=miss"' in h
+
+
+class TestProfiling:
+    def test_profil_admin(self, tmp_path, monkeypatch):
+        import time
+        from flask import Blueprint, Flask
+        from app.services import profiling_service as ps
+        monkeypatch.setattr(ps, 'PROFILE_DIR', str(tmp_path))
+        bp = Blueprint('test_profiling', __name__)
+        ps.register_profiling(bp, lambda: True)
+
+        @bp.route('/lent')
+        def lent():
+            fin = time.perf_counter() + 0.05
+            while time.perf_counter() < fin:
+                pass
+            return 'ok'
+
+        app = Flask(__name__)
+        app.register_blueprint(bp, url_prefix='/api')
+        with app.test_client() as c:
+            assert 'X-Profile-Id' not in c.get('/api/lent').headers
+            nom = c.get('/api/lent', headers={'X-Profile': '1'}).headers['X-Profile-Id']
+
+        assert ps.nom_valide(nom)
+        contenu = (tmp_path / nom).read_text()
+        assert 'lent (test_services.py:' in contenu
+        assert all(l.rsplit(' ', 1)[1].isdigit() for l in contenu.splitlines())
+        profils = ps.lister()
+        assert [p['nom'] for p in profils] == [nom]
+        assert profils[0]['declencheur'] == 'admin'
+        assert profils[0]['endpoint'] == 'test_profiling.lent'
+        assert not ps.nom_valide('../secret.collapsed')
+
+
+class TestBenchCompare:
+    def test_regressions(self):
+        from bench.compare import comparer
+        avant = {'a': {'p50': 10, 'p95': 20, 'sql': 2}, 'b': {'p50': 5, 'p95': 10, 'sql': 3},
+                 'c': {'p50': 5, 'p95': 10, 'sql': 3}}
+        apres = {'a': {'p50': 10, 'p95': 30, 'sql': 2}, 'b': {'p50': 5, 'p95': 11, 'sql': 3},
+                 'c': {'p50': 5, 'p95': 9, 'sql': 4}}
+        res = {nom: regression for nom, _, _, _, regression in comparer(avant, apres, 20)}
+        assert res == {'a': True, 'b': False, 'c': True}
+
+    def test_charge_statistiques(self):
+        import pytest
+        pytest.importorskip('httpx')
+        from bench.charge import Statistiques, _endpoint
+        stats = Statistiques()
+        stats.debut, stats.fin = 0.0, 2.0
+        for i in range(10):
+            stats.ajouter(_endpoint('/budget?exercice=2026'), 10.0 * (i + 1),
+                          200 if i else 503, f'total;dur=5, db;dur=2.5, pool;dur={i}')
+        r = stats.rapport()
+        ep = r['endpoints']['/budget']
+        assert (r['requetes'], r['rps'], r['taux_erreur']) == (10, 5.0, 10.0)
+        assert (ep['p50_ms'], ep['p95_ms'], ep['pool_max_ms'], ep['db_p50_ms']) == (50.0, 100.0, 9.0, 2.5)
+        assert ep['erreurs'] == {503: 1}
+
+
+class TestSqlTrace:
+    def test_fingerprint(self):
+        from app.services.sql_trace_service import fingerprint
+        a = fingerprint("SELECT * FROM bons_commande  WHERE ligne_budgetaire_id = %s -- x")
+        b = fingerprint("select * from bons_commande where ligne_budgetaire_id = 42")
+        assert a == b == "select * from bons_commande where ligne_budgetaire_id = ?"
+        assert fingerprint("SELECT 1 FROM t WHERE id IN (1, 2, 3) AND nom = 'l''a'") == \
+            "select ? from t where id in (?+) and nom = ?"
+
+    def test_max_queries(self):
+        import pytest
+        from app.services import database_service
+        from app.services.sql_trace_service import QueryBudgetExceeded, max_queries
+
+        def n_plus_un(n):
+            database_service._notify('query', 0.001, "SELECT * FROM lignes_budgetaires")
+            for i in range(n):
+                database_service._notify('query', 0.001, f"SELECT * FROM bons_commande WHERE id = {i}")
+
+        with max_queries(4, repetitions=3) as trace:
+            n_plus_un(3)
+        assert trace.count == 4
+        with pytest.raises(QueryBudgetExceeded, match="N\\+1"):
+            with max_queries(10, repetitions=3):
+                n_plus_un(5)
+        with pytest.raises(QueryBudgetExceeded, match="6 > 5"):
+            max_queries(5)(n_plus_un)(5)
+
+
+class TestEvents:
+    def test_filtrage(self):
+        from app.services.events_service import Abonnement
+        admin, lecteur = Abonnement(1, True), Abonnement(2, False)
+        for evt in ({'id': 1, 'type': 'notification', 'user_id': 2},
+                    {'id': 2, 'type': 'notification', 'user_id': None},
+                    {'id': 3, 'type': 'bc', 'user_id': None}):
+            admin.pousser(evt)
+            lecteur.pousser(evt)
+        assert [admin.file.get_nowait()['id'] for _ in range(admin.file.qsize())] == [2, 3]
+        assert [lecteur.file.get_nowait()['id'] for _ in range(lecteur.file.qsize())] == [1, 3]
+
+    def test_flux(self, monkeypatch):
+        from app.services import events_service as ev
+        monkeypatch.setattr(ev, 'SSE_HEARTBEAT', 0.01)
+        monkeypatch.setattr(ev, 'SSE_DUREE_MAX', 0.2)
+        ab = ev.Abonnement(2, False)
+        ev._abonnements.add(ab)
+        ab.pousser({'id': 7, 'type': 'tache', 'op': 'UPDATE'})
+        sortie = ''.join(ev.flux(ab))
+        assert 'id: 7\nevent: tache\ndata: {"id":7,"type":"tache","op":"UPDATE"}\n\n' in sortie
+        assert ': ping' in sortie and 'retry: ' in sortie
+        assert ab not in ev._abonnements
+
+        # File saturée : un seul resync à la place des événements en attente
+        monkeypatch.setattr(ev, 'SSE_FILE_MAX', 1)
+        ab = ev.Abonnement(2, False)
+        ab.pousser({'id': 8, 'type': 'bc'})
+        ab.pousser({'id': 9, 'type': 'bc'})
+        assert ab.resync
+        sortie = ''.join(ev.flux(ab))
+        assert 'id: 8\nevent: resync' in sortie and 'event: bc' not in sortie
+
+    def test_flux_limites(self, monkeypatch):
+        from app.services import events_service as ev
+        monkeypatch.setattr(ev, 'demarrer_ecoute', lambda: None)
+        monkeypatch.setattr(ev, 'SSE_FLUX_MAX', 2)
+        monkeypatch.setattr(ev, '_abonnements', set())
+        a, b = ev.abonner(1, False), ev.abonner(2, False)
+        assert a and b and ev.abonner(3, False) is None
+        ev.desabonner(a)
+        assert ev.abonner(3, False) is not None
+
+    def test_ticket(self, monkeypatch):
+        from app.services import auth_service as auth
+        svc = auth.AuthService()
+        user = {'sub': 7, 'role': 'lecteur', 'login': 'x'}
+        ticket = svc.emettre_ticket(user)
+        assert svc.verifier_ticket(ticket)['sub'] == 7
+        # Ticket refusé comme jeton de session, jeton de session refusé comme ticket
+        assert svc.verify_token(ticket) is None
+        session = auth.jwt.encode({'sub': '7', 'role': 'lecteur'}, auth.SECRET_KEY, algorithm='HS256')
+        assert svc.verifier_ticket(session) is None
+        monkeypatch.setattr(auth, 'TICKET_SECONDES', -1)
+        assert svc.verifier_ticket(svc.emettre_ticket(user)) is None
+
+    def test_route_ticket_et_plein(self, monkeypatch):
+        from flask import Flask
+        import routes
+        from app.services import events_service as ev
+        app = Flask(__name__)
+        app.register_blueprint(routes.routes, url_prefix='/api')
+        client = app.test_client()
+        monkeypatch.setattr(routes.auth_service, 'db', _mock_db())
+        routes.auth_service.db.fetch_one.return_value = {'actif': True}
+        ticket = routes.auth_service.emettre_ticket({'sub': 1, 'role': 'admin'})
+        # Jeton de session en ?token= : plus accepté
+        assert client.get('/api/events?token=' + ticket).status_code == 401
+        monkeypatch.setattr(ev, 'abonner', lambda *a: None)
+        r = client.get('/api/events?ticket=' + ticket)
+        assert r.status_code == 503 and r.headers['Retry-After']
+        assert r.get_data(as_text=True).startswith('retry: ')
+
+
+class TestBatch:
+    def test_valider(self):
+        import pytest
+        from app.services.batch_service import valider
+        assert valider(['/dashboard', {'id': 'n', 'path': '/notifications?x=1'}]) == \
+            [('/dashboard', '/dashboard'), ('n', '/notifications?x=1')]
+        for items in ([], ['dashboard'], ['//evil.example/x'], ['/events'], ['/batch'],
+                      [{'path': '/projet', 'method': 'DELETE'}], ['/a'] * 21):
+            with pytest.raises(ValueError):
+                valider(items)
+
+    def test_valider_routes_json(self):
+        import pytest
+        from flask import Flask, jsonify
+        from app.services import admission_service, batch_service
+
+        app = Flask(__name__)
+
+        @app.route('/api/liste')
+        def liste():
+            return jsonify(list=[])
+
+        @app.route('/api/export.zip')
+        @admission_service.limite('export')
+        def export():
+            return b'PK'
+
+        @app.route('/api/fichiers/<path:nom>')
+        @batch_service.hors_lot
+        def fichier(nom):
+            return b''
+
+        assert batch_service.valider(['/liste', '/absente'], app) == \
+            [('/liste', '/liste'), ('/absente', '/absente')]
+        for chemin in ('/export.zip', '/export.zip?fmt=html', '/fichiers/a/b.parquet'):
+            with pytest.raises(ValueError, match='groupable'):
+                batch_service.valider(['/liste', chemin], app)
+
+    def test_executer(self):
+        import json
+        from flask import Flask, g, jsonify, request
+        from app.services import batch_service
+
+        app = Flask(__name__)
+
+        @app.before_request
+        def _marque():
+            assert 'marque' not in g      # g propre à chaque sous-requête
+            g.marque = True
+
+        @app.route('/api/echo')
+        def echo():
+            return jsonify(user=request.environ.get(batch_service.ENVIRON_USER),
+                           q=request.args.get('q'), auth=request.headers.get('Authorization'))
+
+        @app.route('/api/texte')
+        def texte():
+            return 'ok'
+
+        items = batch_service.valider(['/echo?q=é', '/texte', '/absente'])
+        with app.test_request_context('/api/batch', method='POST'):
+            g.marque = True
+            res = batch_service.executer(app, items, {'sub': 3}, {'Authorization': 'Bearer t'})
+            assert batch_service.executer(app, items, {'sub': 3}, {'Authorization': 'Bearer t'},
+                                          parallele=True) == res
+        out = json.loads(batch_service.serialiser(res))['responses']
+        assert out[0] == {'id': '/echo?q=é', 'path': '/echo?q=é', 'status': 200,
+                          'body': {'user': {'sub': 3}, 'q': 'é', 'auth': 'Bearer t'}}
+        assert (out[1]['status'], out[1]['body'], out[1]['error']) == (200, None, "Réponse non JSON")
+        assert out[2]['status'] == 404
+
+
+class TestFields:
+    def test_parse_select(self):
+        from app.services.fields_service import Projection
+        proj = Projection('t', ('id', 'titre', 'description'), {'projet_nom': 'p.nom'},
+                          defaut=('id', 'titre', 'projet_nom'))
+        assert proj.parse(None) is None and proj.parse(' ') is None
+        assert proj.parse('titre, titre,projet_nom') == ['id', 'titre', 'projet_nom']
+        assert proj.parse('*') == ['id', 'titre', 'description', 'projet_nom']
+        assert proj.select() == 't.id, t.titre, p.nom AS projet_nom'
+        assert proj.select(['id', 'description']) == 't.id, t.description'
+        assert proj.tout() == 't.*, p.nom AS projet_nom'
+        with pytest.raises(ValueError, match='inconnu'):
+            proj.parse('titre,mot_de_passe')
+        with pytest.raises(ValueError):
+            Projection('t', ('id',), {}, defaut=('id', 'nom'))
+
+    def test_listes(self):
+        from app.services import bon_commande_service, contrat_service, projet_service, tache_service
+        for mod in (bon_commande_service, contrat_service, projet_service, tache_service):
+            assert 'id' in mod.LISTE.defaut
+        assert 'description' not in projet_service.LISTE.defaut
+        assert 'rapport_reunion' not in tache_service.LISTE.defaut
+
+        db = MagicMock()
+        db.fetch_all.return_value = []
+        with patch('app.services.tache_service.DatabaseService', return_value=db):
+            tache_service.TacheService().get_all(['id', 'titre'])
+        sql = db.fetch_all.call_args[0][0]
+        assert sql.startswith('SELECT t.id, t.titre FROM taches t ') and 't.*' not in sql
+
+
+class TestSync:
+    def test_parse_since(self):
+        from datetime import datetime
+        from app.services.sync_service import parse_since
+        assert parse_since(None) is None and parse_since('0') is None and parse_since(' ') is None
+        assert parse_since('2026-03-01T10:00:00.5') == datetime(2026, 3, 1, 10, 0, 0, 500000)
+        with pytest.raises(ValueError, match='curseur'):
+            parse_since('hier')
+
+    def test_delta(self):
+        from datetime import datetime
+        from app.services import sync_service
+        db = MagicMock()
+        db.fetch_all.side_effect = [[{'id': 3, 'titre': 'a'}], [{'id': 9}, {'id': 4}, {'id': 3}]]
+        since = datetime(2026, 3, 1)
+        rows, deleted = sync_service.delta(db, 't.id, t.titre', 'FROM taches t ', 'taches', 't',
+                                           'updated_at', 't.assignee_id = %s AND t.statut = %s',
+                                           [5, 'A faire'], 't.assignee_id = %s', [5], since, 't.id')
+        # 3 : changé de propriétaire mais toujours visible → renvoyé, pas retiré
+        assert rows == [{'id': 3, 'titre': 'a'}] and deleted == [4, 9]
+        (sql1, p1), (sql2, p2) = [c[0] for c in db.fetch_all.call_args_list]
+        assert 't.updated_at >= %s AND (t.assignee_id = %s AND t.statut = %s)' in sql1
+        assert p1 == [since, 5, 'A faire']
+        # Supprimés bornés au périmètre, y compris les tombstones
+        assert 'FROM deleted_rows WHERE table_name = %s AND deleted_at >= %s) t WHERE (t.assignee_id = %s)' in sql2
+        assert 'AND (t.assignee_id = %s) AND NOT COALESCE((t.assignee_id = %s AND t.statut = %s), false)' in sql2
+        assert p2 == ['taches', since, 5, since, 5, 5, 'A faire']
+
+
+class TestAdmission:
+    def _app(self, monkeypatch, tmp_path, config):
+        from flask import Flask, g, jsonify, request
+        from app.services import admission_service
+        monkeypatch.setattr(admission_service, 'ADMISSION_DIR', str(tmp_path))
+        monkeypatch.setattr(admission_service, 'ADMISSION_ATTENTE', 0.3)
+        monkeypatch.setitem(admission_service.CLASSES, 'export', config)
+
+        app = Flask(__name__)
+
+        @app.before_request
+        def _user():
+            g.user = {'sub': int(request.args.get('u', 1))}
+
+        @app.route('/export')
+        @admission_service.limite('export')
+        def export():
+            return jsonify(ok=True)
+        return app, admission_service
+
+    def test_refus_et_liberation(self, monkeypatch, tmp_path):
+        app, adm = self._app(monkeypatch, tmp_path, (1, 0, 1))
+        client = app.test_client()
+        execution, perso = adm.admettre('export', 1)
+        # Même utilisateur : plafond personnel atteint, refus immédiat
+        resp = client.get('/export?u=1', buffered=True)
+        assert resp.status_code == 429 and int(resp.headers['Retry-After']) >= 1
+        # Autre utilisateur : pas de place, pas de file → refus
+        assert client.get('/export?u=2', buffered=True).status_code == 429
+        execution.rendre()
+        perso.rendre()
+        assert client.get('/export?u=2', buffered=True).status_code == 200
+        # La place est rendue à la fermeture de la réponse (buffered : fermée aussitôt)
+        assert client.get('/export?u=2', buffered=True).status_code == 200
+        assert adm.etat()['export'] == (0, 0)
+
+    def test_file_attente(self, monkeypatch, tmp_path):
+        import threading
+        app, adm = self._app(monkeypatch, tmp_path, (1, 1, 1))
+        execution, perso = adm.admettre('export', 1)
+        threading.Timer(0.1, lambda: (execution.rendre(), perso.rendre())).start()
+        # En file, admis dès que la place se libère
+        assert app.test_client().get('/export?u=2', buffered=True).status_code == 200
+        execution, perso = adm.admettre('export', 1)
+        try:
+            assert app.test_client().get('/export?u=2', buffered=True).status_code == 429   # délai dépassé
+        finally:
+            execution.rendre()
+            perso.rendre()
+
+
+class TestDeadline:
+    def _app(self):
+        from flask import Blueprint, Flask, jsonify
+        from app.services import deadline_service
+        bp = Blueprint('t', __name__)
+        deadline_service.register_deadline(bp)
+
+        @bp.route('/court')
+        @deadline_service.budget(2)
+        def court():
+            return jsonify(ok=True)
+
+        app = Flask(__name__)
+        app.register_blueprint(bp)
+        return app, deadline_service
+
+    def test_prefixe_et_echeance(self):
+        app, dl = self._app()
+        garde = dl._Garde()
+        assert garde.debut(MagicMock()) is None          # hors requête
+        with app.test_request_context('/court'):
+            app.preprocess_request()
+            prefixe = garde.debut(MagicMock())
+            garde.fin()
+            ms = int(prefixe.split('=')[1].strip(' ;'))
+            assert prefixe.startswith('SET LOCAL statement_timeout') and 1500 < ms <= 2000
+            dl.courante().echeance -= 5
+            with pytest.raises(dl.DelaiDepasse):
+                garde.debut(MagicMock())
+            app.do_teardown_request()
+        assert dl.courante() is None
+
+    def test_annulation_client_deconnecte(self):
+        import socket
+        app, dl = self._app()
+        serveur, client = socket.socketpair()
+        conn = MagicMock()
+        try:
+            r = dl._Requete('/court', float('inf'), serveur)
+            dl._en_vol[-1] = dl._EnVol(r, conn)
+            dl._examiner()
+            conn.cancel.assert_not_called()              # client toujours là
+            client.close()
+            dl._examiner()
+            dl._examiner()
+            conn.cancel.assert_called_once()
+            assert r.abandonnee
+        finally:
+            dl._en_vol.pop(-1, None)
+            serveur.close()
+
+
+class TestEtag:
+    def _app(self):
+        from flask import Flask, jsonify
+        from app.services import etag_service
+        app = Flask(__name__)
+        app.construites = 0
+
+        @app.route('/fiche/<version>')
+        def fiche(version):
+            resp = etag_service.non_modifie(version)
+            if resp is not None:
+                return resp
+            app.construites += 1
+            return etag_service.marquer(jsonify(id=1), version)
+        return app
+
+    def test_304_sans_assemblage(self):
+        app = self._app()
+        client = app.test_client()
+        r = client.get('/fiche/abc')
+        assert r.status_code == 200 and r.headers['ETag'] == 'W/"abc"'
+        assert r.headers['Cache-Control'] == 'private, no-cache'
+        r = client.get('/fiche/abc', headers={'If-None-Match': 'W/"abc"'})
+        assert r.status_code == 304 and r.data == b'' and r.headers['ETag'] == 'W/"abc"'
+        assert client.get('/fiche/abc', headers={'If-None-Match': '"x", "abc"'}).status_code == 304
+        assert client.get('/fiche/def', headers={'If-None-Match': 'W/"abc"'}).status_code == 200
+        assert app.construites == 2
+
+    def test_version_sql(self):
+        from app.services.etag_service import empreinte, horodatage, version_sql
+        sql = version_sql(horodatage('p.updated_at'),
+                          empreinte('d.id', "projet_documents d WHERE d.projet_id = p.id"))
+        assert sql.startswith("md5(concat_ws(':', ")
+        assert "COALESCE((COALESCE(EXTRACT(EPOCH FROM p.updated_at), 0))::text, '-')" in sql
+        assert "SELECT COUNT(*) || '/' || COALESCE(SUM(d.id), 0) FROM projet_documents d" in sql
+
+    def test_sonde_projet(self):
+        from app.services.projet_service import ProjetService
+        svc = ProjetService.__new__(ProjetService)
+        svc.db = MagicMock()
+        svc.db.fetch_one.return_value = {'version': 'v1', 'autorise': True}
+        assert svc.version(7, 'p.created_by_id = %s', [3]) == {'version': 'v1', 'autorise': True}
+        sql, params = svc.db.fetch_one.call_args[0]
+        assert 'COALESCE((p.created_by_id = %s), false) AS autorise' in sql
+        assert sql.endswith('FROM projets p WHERE p.id = %s') and params == [3, 7]
+        for enfant in ('taches t', 'bons_commande bc', 'projet_equipe pe', 'projet_documents d'):
+            assert enfant in sql
+
+
+class TestConcurrence:
+    def test_parallele_ordre_et_contexte(self):
+        import threading
+        import time
+        from flask import Flask, g
+        from app.services import concurrence_service, database_service, deadline_service
+        from app.services.sql_trace_service import SqlTrace
+        app = Flask(__name__)
+        requete = deadline_service._Requete('/dashboard', time.monotonic() + 5, None)
+
+        def appel(n):
+            def f():
+                time.sleep(0.2)
+                database_service._notify('query', 0.001, f'SELECT {n}')
+                return n, g.timing is timing, deadline_service.courante() is requete, \
+                    threading.get_ident() != parent
+            return f
+
+        with app.app_context(), deadline_service.heritee(requete), SqlTrace() as trace:
+            g.timing = timing = {'db': 0.0, 'queries': 0}
+            parent = threading.get_ident()
+            debut = time.monotonic()
+            res = concurrence_service.rassembler(appel(1), appel(2), appel(3))
+            duree = time.monotonic() - debut
+        assert res == [(n, True, True, True) for n in (1, 2, 3)]
+        assert duree < 0.5                      # 3 × 0.2 s en séquence
+        assert trace.count == 3                 # requêtes des threads attribuées à la requête
+
+    def test_exceptions(self):
+        from flask import Flask
+        from app.services import concurrence_service
+        fini = []
+
+        def ko():
+            raise ValueError('ko')
+
+        def ok():
+            fini.append(1)
+            return 'ok'
+
+        with Flask(__name__).app_context():
+            res = concurrence_service.rassembler(ko, ok, return_exceptions=True)
+            assert isinstance(res[0], ValueError) and res[1] == 'ok'
+            with pytest.raises(ValueError, match='ko'):
+                concurrence_service.rassembler(ko, ok)
+        assert fini == [1, 1]                   # tous les appels vont à leur terme
+        # Hors contexte Flask : en séquence, même résultat
+        assert concurrence_service.rassembler(ok, lambda: 2) == ['ok', 2]
+
+    def test_requetes_simultanees_pool_reduit(self, monkeypatch):
+        """
+        6 requêtes × 3 appels parallèles sur un pool de 2 connexions : les
+        emprunts attendent leur tour, jamais plus de 2 connexions ouvertes,
+        jamais de reconstruction du pool.
+        """
+        import os
+        import threading
+        import time
+        import psycopg2
+        from flask import Flask
+        from app.services import concurrence_service, database_service as dbs
+        ouvertes, pic, lock = [0], [0], threading.Lock()
+
+        def connexion(*a, **k):
+            conn = MagicMock(closed=0)
+            cur = conn.cursor.return_value.__enter__.return_value
+            cur.execute.side_effect = lambda *a: time.sleep(0.02)
+            cur.fetchall.return_value = [{'n': 1}]
+            with lock:
+                ouvertes[0] += 1
+                pic[0] = max(pic[0], ouvertes[0])
+
+            def fermer():
+                with lock:
+                    ouvertes[0] -= 1
+            conn.close.side_effect = fermer
+            return conn
+
+        psycopg2.connect.side_effect = connexion
+        pool = dbs._BlockingPool(0, 2, dsn='')
+        monkeypatch.setattr(dbs.DatabaseService, '_pool', pool)
+        monkeypatch.setattr(dbs.DatabaseService, '_pool_pid', os.getpid())
+        monkeypatch.setattr(concurrence_service, '_executor', None)
+        monkeypatch.setattr(concurrence_service, 'SQL_PARALLELE', 4)
+        app = Flask(__name__)
+        db = dbs.DatabaseService()
+        resultats, erreurs = [], []
+
+        def requete():
+            try:
+                with app.app_context():
+                    resultats.append(concurrence_service.rassembler(
+                        *[lambda: db.fetch_all("SELECT 1 AS n")] * 3))
+            except Exception as e:
+                erreurs.append(e)
+
+        threads = [threading.Thread(target=requete) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        concurrence_service._executor.shutdown()
+        assert not erreurs
+        assert resultats == [[[{'n': 1}]] * 3] * 6
+        assert pic[0] <= 2
+        assert dbs.DatabaseService._pool is pool and not pool._used
+
+
+# ─── Instantanés Parquet ────────────────────────────────────
+
+class TestSnapshot:
+    @staticmethod
+    def _col(name, oid, precision=None, scale=None):
+        from collections import namedtuple
+        return namedtuple('Column', 'name type_code precision scale')(name, oid, precision, scale)
+
+    def test_schema(self):
+        pa = pytest.importorskip('pyarrow')
+        from app.services import snapshot_service
+        schema, conv = snapshot_service.schema_arrow([
+            self._col('id', 23), self._col('montant_ttc', 1700, 15, 2),
+            self._col('ratio', 1700), self._col('statut', 1043),
+            self._col('date_debut', 1082), self._col('exercice', 23),
+            self._col('_exercice', 23),
+        ], categories=('statut',))
+        assert schema.names == ['id', 'montant_ttc', 'ratio', 'statut', 'date_debut']
+        assert schema.field('montant_ttc').type == pa.decimal128(15, 2)
+        assert schema.field('ratio').type == pa.float64()       # NUMERIC sans précision
+        assert pa.types.is_dictionary(schema.field('statut').type)
+        assert conv[2](__import__('decimal').Decimal('1.5')) == 1.5
+
+    def test_partitions(self, tmp_path, monkeypatch):
+        pytest.importorskip('pyarrow')
+        import datetime as dt
+        import decimal
+        import pyarrow.parquet as pq
+        from app.services import snapshot_service
+        monkeypatch.setattr(snapshot_service, 'SNAPSHOT_ROW_GROUP', 2)
+        description = [self._col('id', 23), self._col('statut', 1043),
+                       self._col('montant', 1700, 10, 2), self._col('_exercice', 23),
+                       self._col('date_creation', 1114)]
+        schema, conv = snapshot_service.schema_arrow(description, ('statut',))
+        parts = snapshot_service._Partitions(str(tmp_path), schema, conv, [0, 1, 2, 4])
+        for i in range(5):
+            ligne = (i, 'VALIDE' if i % 2 else 'BROUILLON', decimal.Decimal(f'{i}.50'),
+                     2024 + i % 2, dt.datetime(2024, 1, 1 + i))
+            parts.ajouter(ligne[3], ligne)
+        assert parts.fermer() == {2024: 3, 2025: 2}
+        table = pq.read_table(tmp_path / 'exercice=2024' / 'part-0.parquet')
+        assert table.column('id').to_pylist() == [0, 2, 4]
+        assert table.column('statut').to_pylist() == ['BROUILLON'] * 3
+        assert pq.ParquetFile(tmp_path / 'exercice=2024' / 'part-0.parquet').metadata.num_row_groups == 2
+
+    def test_dossier_et_purge(self, tmp_path, monkeypatch):
+        import io
+        import json
+        import zipfile
+        from app.services import snapshot_service
+        monkeypatch.setattr(snapshot_service, 'SNAPSHOT_DIR', str(tmp_path))
+        monkeypatch.setattr(snapshot_service, 'SNAPSHOT_KEEP', 2)
+        for nom in ('20260101-000000', '20260102-000000', '20260103-000000'):
+            (tmp_path / nom / 'projets').mkdir(parents=True)
+            (tmp_path / nom / 'manifest.json').write_text(json.dumps({'nom': nom, 'tables': {}}))
+            (tmp_path / nom / 'projets' / 'part-0.parquet').write_bytes(b'PAR1')
+        (tmp_path / '20260104-000000.tmp').mkdir()              # export en cours : ignoré
+        for nom in ('../etc', '20260104-000000.tmp', '20990101-000000'):
+            with pytest.raises(snapshot_service.SnapshotIndisponible):
+                snapshot_service.dossier(nom)
+        zf = zipfile.ZipFile(io.BytesIO(b''.join(snapshot_service.iter_zip('20260101-000000'))))
+        assert zf.namelist() == ['20260101-000000/manifest.json',
+                                 '20260101-000000/projets/part-0.parquet']
+        snapshot_service.purger()
+        assert [m['nom'] for m in snapshot_service.lister()] == ['20260103-000000', '20260102-000000']
+
+
+# ─── Organisation en arbre ──────────────────────────────────
+
+class TestServiceOrgArbre:
+    @staticmethod
+    def _ligne(id, parent_id, niveau, projets, total):
+        return {'id': id, 'code': f'S{id}', 'nom': f'Service {id}', 'parent_id': parent_id,
+                'niveau': niveau, 'nb_projets': projets, 'total_projets': total,
+                'montant_engage': None, 'total_engage': 12.5}
+
+    def test_arbre_et_cache(self):
+        from app.services import service_org_service as mod
+        mod._arbre_cache.invalidate()
+        svc = mod.ServiceOrgService()
+        svc.db = _mock_db()
+        svc.db.fetch_one.return_value = {'org': '3/x', 'membres': 'm'}
+        svc.db.fetch_all.return_value = [
+            self._ligne(1, None, 0, 0, 5), self._ligne(2, 1, 1, 3, 3), self._ligne(3, 1, 1, 2, 2),
+        ]
+        res = svc.get_arbre()
+        assert res['count'] == 3
+        [direction] = res['arbre']
+        assert [e['id'] for e in direction['enfants']] == [2, 3]
+        assert direction['total_engage'] == 12.5 and direction['montant_engage'] == 0.0
+
+        assert svc.get_arbre() is res                       # même version : cache
+        assert svc.db.fetch_all.call_count == 1
+        svc.db.fetch_one.return_value = {'org': '3/y', 'membres': 'm'}
+        svc.get_arbre()                                      # organisation modifiée
+        assert svc.db.fetch_all.call_count == 2
+
+    def test_racine_inconnue(self):
+        from app.services import service_org_service as mod
+        mod._arbre_cache.invalidate()
+        svc = mod.ServiceOrgService()
+        svc.db = _mock_db()
+        svc.db.fetch_one.return_value = {'org': '0/'}
+        assert svc.get_arbre(racine=42) is None
+        sql, params = svc.db.fetch_all.call_args[0]
+        assert 'WITH RECURSIVE' in sql and params == [42]
+
+
+# ─── Détail projet ──────────────────────────────────────────
+
+class TestProjetDetail:
+    def test_types_et_repli_membre_label(self):
+        from datetime import date, datetime
+        from decimal import Decimal
+        from app.services.projet_service import ProjetService
+        svc = ProjetService()
+        svc.db = _mock_db()
+        svc.db.fetch_one.side_effect = [
+            Exception('column pe.membre_label does not exist'),
+            {'id': 3, 'taches': [{'id': 1, 'date_echeance': '2026-05-01', 'estimation_heures': '7.50',
+                                  'heures_reelles': None}],
+             'bons_commande': [{'id': 9, 'montant_ht': '100.00', 'montant_ttc': '120.00',
+                                'date_creation': '2026-01-02T03:04:05.000006'}],
+             'documents': [{'date_ajout': None}], 'heures_estimees': '7.50', 'heures_reelles': 0,
+             'budget_consomme_calcule': None, 'montant_bc_total': '120.00', 'responsable_nom': None},
+        ]
+        p = svc.get_by_id(3)
+        # Base sans membre_label : seconde requête avec le nom de l'utilisateur seul
+        sql = [c[0][0] for c in svc.db.fetch_one.call_args_list]
+        assert 'membre_label' in sql[0] and 'membre_label' not in sql[1]
+        assert p['taches'][0]['date_echeance'] == date(2026, 5, 1)
+        assert p['taches'][0]['estimation_heures'] == Decimal('7.50')
+        assert p['bons_commande'][0]['date_creation'] == datetime(2026, 1, 2, 3, 4, 5, 6)
+        assert str(p['bons_commande'][0]['montant_ttc']) == '120.00'
+        assert p['heures_estimees'] == 7.5 and 'responsable_nom' not in p
+
+
+# ─── Alertes contrats ───────────────────────────────────────
+
+class TestContratAlertes:
+    def test_counts(self):
+        from app.services.contrat_service import ALERTE_WHERE, ContratService
+        svc = ContratService()
+        svc.db = _mock_db()
+        svc.db.fetch_all.return_value = [{'niveau': 'CRITIQUE', 'n': 2}, {'niveau': 'INFO', 'n': 5}]
+        assert svc.get_alertes_counts('c.created_by_id = %s', [4]) == {
+            'EXPIRE': 0, 'CRITIQUE': 2, 'ATTENTION': 0, 'INFO': 5}
+        sql, params = svc.db.fetch_all.call_args[0]
+        assert ALERTE_WHERE in sql and 'GROUP BY' in sql and params == [4]
+        # Base indisponible : compteurs à zéro plutôt qu'une erreur
+        svc.db.fetch_all.side_effect = Exception('connexion perdue')
+        assert set(svc.get_alertes_counts().values()) == {0}
+
+    def test_route_counts(self, monkeypatch):
+        from flask import Flask
+        import routes
+        app = Flask(__name__)
+        app.register_blueprint(routes.routes, url_prefix='/api')
+        monkeypatch.setattr(routes.auth_service, 'db', _mock_db())
+        routes.auth_service.db.fetch_one.return_value = {'actif': True}
+        monkeypatch.setattr(routes.contrat_service, 'db', _mock_db())
+        routes.contrat_service.db.fetch_all.return_value = [{'niveau': 'EXPIRE', 'n': 3}]
+        from app.services import auth_service as auth
+        token = auth.jwt.encode({'sub': '1', 'role': 'admin'}, auth.SECRET_KEY, algorithm='HS256')
+        r = app.test_client().get('/api/contrat/alertes?counts=1',
+                                  headers={'Authorization': f'Bearer {token}'}).get_json()
+        assert r == {'total': 3, 'counts': {'EXPIRE': 3, 'CRITIQUE': 0, 'ATTENTION': 0, 'INFO': 0}}
+        assert routes.contrat_service.db.fetch_all.call_count == 1
+
+
+# ─── Gantt ──────────────────────────────────────────────────
+
+class TestGantt:
+    @pytest.mark.parametrize('query', ['', '?zoom=month', '?limit=10'])
+    def test_base_en_echec(self, monkeypatch, query):
+        from flask import Flask
+        import routes
+        from app.services import auth_service as auth
+        app = Flask(__name__)
+        app.register_blueprint(routes.routes, url_prefix='/api')
+        monkeypatch.setattr(routes.auth_service, 'db', _mock_db())
+        routes.auth_service.db.fetch_one.return_value = {'actif': True}
+        monkeypatch.setattr(routes.budget_service, 'db', _mock_db())
+        routes.budget_service.db.fetch_all.side_effect = Exception('connexion perdue')
+        token = auth.jwt.encode({'sub': '1', 'role': 'admin'}, auth.SECRET_KEY, algorithm='HS256')
+        # Paginé ou non : requête en échec → listes vides, pas de 500
+        r = app.test_client().get('/api/gantt' + query, headers={'Authorization': f'Bearer {token}'})
+        assert r.status_code == 200
+        assert r.get_json()['projets'] == [] and r.get_json()['taches'] == []
+
+
+# ─── Cache des fiches projet ────────────────────────────────
+
+class TestFicheCache:
+    def test_version_pg(self):
+        from app.services.fiche_projet_web_service import fiche_version_pg
+        db = _mock_db()
+        assert fiche_version_pg(404, db) is None
+        db.fetch_one.return_value = {'version': 'a1b2'}
+        v = fiche_version_pg(3, db)
+        assert v[1] == 'a1b2' and db.fetch_one.call_args[0][1] == [3]
+        # Même empreinte que l'ETag de la fiche projet
+        from app.services.projet_service import VERSION
+        assert VERSION in db.fetch_one.call_args[0][0]
+
+    def test_rendu_en_cache_jusqu_a_modification(self, monkeypatch):
+        import routes
+        from app.services import fiche_projet_web_service as fw
+        versions = iter([('j', '10:00'), ('j', '10:00'), ('j', '10:05')])
+        monkeypatch.setattr(fw, 'fiche_version_pg', lambda pid, db: next(versions))
+        rendus = []
+
+        def rendu():
+            rendus.append(1)
+            return f'fiche v{len(rendus)}'
+
+        # Projet inchangé : servi depuis le cache ; projet modifié : nouveau rendu
+        assert routes._fiche_rendue(-7, 'html', rendu) == 'fiche v1'
+        assert routes._fiche_rendue(-7, 'html', rendu) == 'fiche v1'
+        assert routes._fiche_rendue(-7, 'html', rendu) == 'fiche v2'
+        assert len(rendus) == 2
+
+
+# ─── Export ZIP des fiches ──────────────────────────────────
+
+class TestFichesZip:
+    @staticmethod
+    def _bundle(pid, code):
+        projet = {'id': pid, 'code': code, 'nom': f'Projet {pid}', 'statut': 'En cours',
+                  'avancement': 10, 'service_nom': 'DSI'}
+        return {'projet': projet, 'taches': [], 'bcs': [], 'equipe': [], 'contacts': [],
+                'prestataires': [], 'noms_contacts': {}}
+
+    @pytest.fixture
+    def pool_threads(self, monkeypatch):
+        from concurrent.futures import ThreadPoolExecutor
+        from app.services import fiche_export_service as fe
+        pool = ThreadPoolExecutor(2)
+        monkeypatch.setattr(fe, '_get_pool', lambda: pool)
+        yield pool
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def test_zip_docx_noms_uniques(self, pool_threads):
+        import io
+        import zipfile
+        pytest.importorskip('docx')
+        from app.services.fiche_export_service import iter_fiches_zip
+        bundles = {1: self._bundle(1, 'P/01'), 2: self._bundle(2, 'P/01'), 3: self._bundle(3, None)}
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(iter_fiches_zip(bundles, 'docx'))))
+        assert sorted(archive.namelist()) == [
+            'fiche_projet_PRJ3.docx', 'fiche_projet_P_01.docx', 'fiche_projet_P_01_2.docx']
+        with zipfile.ZipFile(io.BytesIO(archive.read('fiche_projet_P_01.docx'))) as docx:
+            assert 'word/document.xml' in docx.namelist()
+
+    def test_delai_depasse(self, monkeypatch, pool_threads):
+        import io
+        import os
+        import time
+        import zipfile
+        from app.services import fiche_export_service as fe
+        drapeaux = []
+
+        def rendu(fmt, pid, data, arret=None, echeance=None):
+            drapeaux.append(arret)
+            if pid == 2:
+                time.sleep(1)
+            return b'<html></html>'
+
+        monkeypatch.setattr(fe, 'rendre_fiche', rendu)
+        monkeypatch.setattr(fe, 'FICHES_ZIP_TIMEOUT', 0.3)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(
+            fe.iter_fiches_zip({1: self._bundle(1, 'A'), 2: self._bundle(2, 'B')}, 'html'))))
+        assert archive.namelist() == ['fiche_projet_A.html', 'ERREURS.txt']
+        assert archive.read('ERREURS.txt').decode() == 'B : délai dépassé'
+        # Rendu encore en cours : drapeau d'arrêt posé pour le processus fils
+        assert os.path.exists(drapeaux[0])
+        fe._retirer_drapeau(drapeaux[0])
+
+    def test_rendu_interrompu(self, tmp_path, monkeypatch):
+        import time
+        from app.services import fiche_export_service as fe
+        monkeypatch.setattr(fe, '_SCRUTATION', 0.02)
+
+        def rendu_sans_fin():
+            while True:
+                try:
+                    time.sleep(0.005)
+                except Exception:      # les except larges du rendu ne l'arrêtent pas
+                    pass
+
+        arret = tmp_path / 'arret'
+        arret.touch()
+        debut = time.monotonic()
+        with pytest.raises(fe.RenduInterrompu, match='export interrompu'):
+            with fe._interruptible(str(arret)):
+                rendu_sans_fin()
+        with pytest.raises(fe.RenduInterrompu, match='délai'):
+            with fe._interruptible(None, time.time() + 0.1):
+                rendu_sans_fin()
+        assert time.monotonic() - debut < 1
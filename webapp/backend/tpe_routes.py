@@ -12,6 +12,16 @@ import io
 logger = logging.getLogger(__name__)
 tpe_routes = Blueprint("tpe", __name__)
 
+from app.services import admission_service, deadline_service
+from app.services.batch_service import ENVIRON_USER
+from app.services.metrics_service import register_metrics
+from app.services.timing_service import register_timing
+from app.services.sql_trace_service import register_sql_trace
+register_timing(tpe_routes)
+register_metrics(tpe_routes)
+register_sql_trace(tpe_routes)
+deadline_service.register_deadline(tpe_routes)
+
 
 # ── Auth standalone (meme logique que routes.py) ──────────────────────────────
 def _secret():
@@ -26,6 +36,13 @@ def require_auth(*roles):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
+            # Sous-requête de /api/batch : jeton et compte déjà vérifiés par le lot
+            payload = request.environ.get(ENVIRON_USER)
+            if payload is not None:
+                g.user = payload
+                if roles and payload.get("role") not in roles:
+                    return jsonify({"error": "Droits insuffisants"}), 403
+                return f(*args, **kwargs)
             token = request.headers.get("Authorization", "").replace("Bearer ", "")
             if not token:
                 return jsonify({"error": "Non authentifie"}), 401
@@ -92,7 +109,9 @@ def get_tpe_stats():
 
 
 @tpe_routes.route("/tpe/export", methods=["GET"])
+@deadline_service.budget(120)
 @require_auth()
+@admission_service.limite("export")
 def export_tpe_excel():
     if not _module_enabled():
         return jsonify({"error": "Module TPE non active"}), 404
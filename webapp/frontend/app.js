@@ -61,7 +61,9 @@ async function doLogin() {
         hideLoginOverlay();
         applyRoleUI(data.user);
         _bgPost('/notifications/generate');
+        _prefetch(['/dashboard', '/notifications']);   // même lot que /modules et /referentiels
         initRefs().then(() => { loadDashboard(); loadNotifications(); });
+        openEvents();
     } catch (e) {
         errEl.textContent = e.message;
         errEl.style.display = 'block';
@@ -72,6 +74,8 @@ async function doLogin() {
 }
 
 function doLogout() {
+    closeEvents();
+    _syncReset();
     removeToken();
     document.getElementById('user-name').textContent = '';
     document.getElementById('user-info').style.display = 'none';
@@ -230,13 +234,33 @@ let _quillNote    = null;   // instance Quill pour les notes
 let _notesTab     = 'postit'; // onglet actif notes
 let _noteColor    = '#fff9c4'; // couleur sélectionnée pour post-it
 
+const _FICHE = /^\/(projet|bon_commande|contrat|tache)\/\d+$/;
+
 async function apiFetch(path, opts = {}) {
-    const token = getToken();
     const gen = _loginGen; // génération de session au moment de l'appel
+    // Fiches : requête directe, revalidée par le cache HTTP du navigateur (ETag → 304)
+    if (!Object.keys(opts).length && getToken() && !_FICHE.test(path)) {   // GET simple : regroupable
+        const pre = _prefetched.get(path);
+        if (pre) {
+            _prefetched.delete(path);
+            if (Date.now() - pre.t < 10000) return pre.promise;
+        }
+        return _batchGet(path, gen);
+    }
+    return _apiDirect(path, opts, gen);
+}
+
+async function _apiDirect(path, opts, gen) {
+    const token = getToken();
     const headers = { 'Content-Type': 'application/json' };
     if (token) headers['Authorization'] = 'Bearer ' + token;
     const res = await fetch(API + path, { headers, ...opts });
-    if (res.status === 401) {
+    const body = res.ok ? await res.json() : await res.json().catch(() => ({}));
+    return _apiResult(res.status, body, gen);
+}
+
+function _apiResult(status, body, gen) {
+    if (status === 401) {
         // Ignorer si un nouveau login a eu lieu depuis cette requête
         if (!_sessionExpired && gen === _loginGen) {
             _sessionExpired = true;
@@ -245,14 +269,63 @@ async function apiFetch(path, opts = {}) {
         }
         throw new Error('Session expirée, veuillez vous reconnecter');
     }
-    if (res.status === 403) {
+    if (status === 403) {
         throw new Error('Accès interdit — droits insuffisants');
     }
-    if (!res.ok) {
-        const err = await res.json().catch(() => ({}));
-        throw new Error(err.error || `HTTP ${res.status}`);
+    if (status < 200 || status >= 300) {
+        throw new Error((body && body.error) || `HTTP ${status}`);
+    }
+    return body;
+}
+
+// ─── Regroupement des GET (POST /api/batch) ────────────────
+// Les GET lancés dans la même tâche (Promise.all, chargement initial)
+// partent en une seule requête : une authentification, un aller-retour.
+
+let _batchFile = null;
+const _prefetched = new Map();   // chemin → { promise, t } (usage unique)
+
+function _batchGet(path, gen) {
+    return new Promise((resolve, reject) => {
+        if (!_batchFile) {
+            _batchFile = [];
+            queueMicrotask(_batchFlush);
+        }
+        _batchFile.push({ path, gen, resolve, reject });
+    });
+}
+
+async function _batchFlush() {
+    const file = _batchFile;
+    _batchFile = null;
+    if (file.length === 1) {
+        const it = file[0];
+        return _apiDirect(it.path, {}, it.gen).then(it.resolve, it.reject);
+    }
+    let data;
+    try {
+        data = await _apiDirect('/batch', {
+            method: 'POST',
+            body: JSON.stringify({ requests: file.map(it => it.path), parallele: true }),
+        }, file[0].gen);
+    } catch (e) {
+        file.forEach(it => it.reject(e));
+        return;
     }
-    return res.json();
+    file.forEach((it, i) => {
+        const r = data.responses[i];
+        try { it.resolve(_apiResult(r.status, r.body || { error: r.error }, it.gen)); }
+        catch (e) { it.reject(e); }
+    });
+}
+
+/** Lance des GET maintenant (même lot) ; le prochain apiFetch(chemin) les réutilise. */
+function _prefetch(paths) {
+    paths.forEach(path => {
+        const promise = apiFetch(path);
+        promise.catch(() => {});   // erreur remontée à l'appel qui consomme
+        _prefetched.set(path, { promise, t: Date.now() });
+    });
 }
 
 function openModal(id)  { document.getElementById(id).classList.add('open'); }
@@ -380,6 +453,8 @@ function fillSelect(selId, items, valKey, labelFn) {
 
 // ─── Navigation ────────────────────────────────────────────
 
+let _vueCourante = 'dashboard';
+
 const loaders = {
     dashboard:     loadDashboard,
     budget:        loadBudget,
@@ -400,6 +475,7 @@ const loaders = {
 };
 
 function showView(name) {
+    _vueCourante = name;
     document.querySelectorAll('.view').forEach(v => v.classList.remove('active'));
     document.querySelectorAll('nav button').forEach(b => b.classList.remove('active'));
     const view = document.getElementById('view-' + name);
@@ -571,8 +647,12 @@ function exportBudget() {
     fetch(`/api/export/budget?exercice=${exercice}`, {
         headers: { 'Authorization': 'Bearer ' + token }
     })
-    .then(res => {
-        if (!res.ok) throw new Error('Erreur export');
+    .then(async res => {
+        if (!res.ok) {
+            // 429 : exports simultanés plafonnés côté serveur
+            const err = await res.json().catch(() => ({}));
+            throw new Error(err.error || 'Erreur export');
+        }
         return res.blob();
     })
     .then(blob => {
@@ -1062,8 +1142,8 @@ async function loadBC() {
     if (search) params.set('search', search);
 
     try {
-        const [data, stats] = await Promise.all([
-            apiFetch('/bon_commande?' + params),
+        const [list, stats] = await Promise.all([
+            _syncListe('/bon_commande', params),
             apiFetch('/bon_commande/stats')
         ]);
 
@@ -1079,7 +1159,7 @@ async function loadBC() {
             }).join('') +
             `<span>Montant total: <strong class="kpi-num">${fmt(t.total || 0)} €</strong></span>`;
 
-        _bcCache = data.list || [];
+        _bcCache = list;
         _resetPage('bc');
         _renderBcRows();
     } catch (e) { showMsg('Erreur chargement BC', false); }
@@ -1417,8 +1497,7 @@ function _renderContratsRows() {
 async function loadContrats() {
     try {
         _saveFilter('contrat-filter-statut'); _saveFilter('contrat-search');
-        const data = await apiFetch('/contrat');
-        _cache.contrats = data.list || [];
+        _cache.contrats = await _syncListe('/contrat');
         _resetPage('contrats');
         _renderContratsRows();
     } catch (e) { showMsg('Erreur chargement contrats', false); }
@@ -2007,11 +2086,11 @@ function resetProjetFilters() {
 
 async function loadProjets() {
     try {
-        const [data, servData] = await Promise.all([
-            apiFetch('/projet'),
+        const [list, servData] = await Promise.all([
+            _syncListe('/projet'),
             apiFetch('/service_org')
         ]);
-        _cache.projets = data.list || [];
+        _cache.projets = list;
 
         // Populate service filter
         const serviceSel = document.getElementById('proj-filter-service');
@@ -2706,9 +2785,12 @@ async function addProjet() {
     } catch (e) { showMsg(e.message, false); }
 }
 
-function editProjet(id) {
-    const data = _cache.projets?.find(p => p.id === id);
-    if (!data) { showMsg('Données projet non chargées, rechargez', false); return; }
+async function editProjet(id) {
+    // La liste ne porte pas les textes longs (description, objectifs…) : fiche complète
+    let data;
+    try { data = await apiFetch(`/projet/${id}`); }
+    catch (e) { showMsg('Projet introuvable', false); return; }
+    if (!data || data.error) { showMsg(data?.error || 'Projet introuvable', false); return; }
     const d2 = _toISODate;
     document.getElementById('edit-projet-id').value                = data.id;
     document.getElementById('edit-projet-code').value             = data.code || '';
@@ -2783,8 +2865,7 @@ async function loadTaches() {
     const projetId = document.getElementById('tache-filter-projet')?.value;
     const statut   = document.getElementById('tache-filter-statut')?.value;
     try {
-        const data = await apiFetch('/tache');
-        _cache.taches = data.list || [];
+        _cache.taches = await _syncListe('/tache');
         let list = _cache.taches;
         if (projetId) list = list.filter(t => String(t.projet_id) === projetId);
         if (statut)   list = list.filter(t => t.statut === statut);
@@ -2873,12 +2954,11 @@ async function deleteTache(id) {
 }
 
 async function editTache(id) {
-    let data = _cache.taches.find(t => t.id === id);
-    if (!data) {
-        try { data = await apiFetch(`/tache/${id}`); }
-        catch (e) { showMsg('Tâche introuvable', false); return; }
-    }
-    if (!data) { showMsg('Tâche introuvable', false); return; }
+    // Détail complet : description et compte rendu ne sont pas dans la liste
+    let data;
+    try { data = await apiFetch(`/tache/${id}`); }
+    catch (e) { showMsg('Tâche introuvable', false); return; }
+    if (!data || data.error) { showMsg('Tâche introuvable', false); return; }
     document.getElementById('edit-tache-id').value         = data.id;
     document.getElementById('edit-tache-titre').value      = data.titre || '';
     document.getElementById('edit-tache-projet').value     = data.projet_id || '';
@@ -3671,9 +3751,18 @@ async function loadGantt() {
         } catch(e) {}
     }
 
-    const serviceId = serviceSel?.value;
+    _ganttState.expand.clear();
+    await _loadGanttPage(false);
+}
+
+// Zoom serveur par mode d'affichage : month/quarter → une barre agrégée par
+// projet en vue par tâche (tâches détaillées au clic sur le projet)
+const _GANTT_ZOOM = { Day: 'day', Week: 'week', Month: 'month', Year: 'quarter' };
+const _ganttState = { projets: [], taches: [], suivant: null, limit: 200, expand: new Set() };
+
+async function _loadGanttPage(suite) {
+    const serviceId = document.getElementById('gantt-filter-service')?.value;
     const period    = document.getElementById('gantt-filter-period')?.value || 'quarter';
-    const mode      = document.getElementById('gantt-mode')?.value || 'projets';
     const viewMode  = document.getElementById('gantt-view-mode')?.value || 'Week';
 
     const params = new URLSearchParams();
@@ -3683,20 +3772,51 @@ async function loadGantt() {
         params.set('date_debut', dates.start.toISOString().slice(0, 10));
         params.set('date_fin',   dates.end.toISOString().slice(0, 10));
     }
+    params.set('zoom', _GANTT_ZOOM[viewMode] || 'week');
+    if (_ganttState.expand.size) params.set('expand', [..._ganttState.expand].join(','));
+    if (suite && _ganttState.suivant) params.set('apres', _ganttState.suivant);
 
     let data;
     try { data = await apiFetch('/gantt?' + params.toString()); }
     catch (e) { showMsg('Erreur chargement Gantt: ' + e.message, false); return; }
 
-    const emptyEl = document.getElementById('gantt-empty');
-    const wrapEl  = document.getElementById('gantt-wrap');
+    if (!suite) { _ganttState.projets = []; _ganttState.taches = []; }
+    _ganttState.projets.push(...(data.projets || []));
+    _ganttState.taches.push(...(data.taches || []));
+    _ganttState.suivant = data.page?.suivant || null;
+    _ganttState.limit   = data.page?.limit || _ganttState.limit;
+    _renderGantt(viewMode);
+}
+
+async function _toggleGanttProjet(projetId) {
+    // Recharge les fenêtres déjà affichées avec le projet développé ou replié
+    const pages = Math.max(1, Math.ceil(_ganttState.projets.length / _ganttState.limit));
+    if (_ganttState.expand.has(projetId)) _ganttState.expand.delete(projetId);
+    else _ganttState.expand.add(projetId);
+    await _loadGanttPage(false);
+    for (let i = 1; i < pages && _ganttState.suivant; i++) await _loadGanttPage(true);
+}
+
+function _renderGantt(viewMode) {
+    const mode     = document.getElementById('gantt-mode')?.value || 'projets';
+    const emptyEl  = document.getElementById('gantt-empty');
+    const wrapEl   = document.getElementById('gantt-wrap');
     const legendEl = document.getElementById('gantt-legend');
+    const moreEl   = document.getElementById('gantt-more');
 
     const today = new Date().toISOString().slice(0, 10);
+    const tacheBar = t => ({
+        id:       'T' + t.id,
+        name:     `${t.projet_code || t.projet_nom || ''} › ${t.titre}`,
+        start:    t.date_debut    || today,
+        end:      t.date_echeance || today,
+        progress: t.avancement   || 0,
+        custom_class: 'bar-tache',
+    });
 
     let tasks = [];
     if (mode === 'projets') {
-        tasks = (data.projets || [])
+        tasks = _ganttState.projets
             .filter(p => p.date_debut || p.date_fin_prevue)
             .map(p => ({
                 id:         String(p.id),
@@ -3707,18 +3827,31 @@ async function loadGantt() {
                 custom_class: 'bar-projet',
             }));
     } else {
-        tasks = (data.taches || [])
-            .filter(t => t.date_echeance)
-            .map(t => ({
-                id:       'T' + t.id,
-                name:     `${t.projet_code || t.projet_nom || ''} › ${t.titre}`,
-                start:    t.date_debut    || today,
-                end:      t.date_echeance || today,
-                progress: t.avancement   || 0,
-                custom_class: 'bar-tache',
-            }));
+        const parProjet = {};
+        _ganttState.taches.filter(t => t.date_echeance).forEach(t => {
+            (parProjet[t.projet_id] = parProjet[t.projet_id] || []).push(tacheBar(t));
+        });
+        _ganttState.projets.forEach(p => {
+            const a = p.agregat;
+            if (a && a.debut) {
+                const statuts = Object.entries(a.statuts || {}).map(([s, n]) => `${n} ${s}`).join(', ');
+                tasks.push({
+                    id:       'P' + p.id,
+                    name:     `${_ganttState.expand.has(p.id) ? '▾' : '▸'} ${p.code || p.nom} — ${a.taches} tâche(s) (${statuts})`,
+                    start:    a.debut,
+                    end:      a.fin || a.debut,
+                    progress: a.avancement || 0,
+                    custom_class: 'bar-projet',
+                });
+            }
+            tasks.push(...(parProjet[p.id] || []));
+        });
     }
 
+    if (moreEl) {
+        moreEl.style.display = _ganttState.suivant ? '' : 'none';
+        moreEl.textContent = `Projets suivants (${_ganttState.projets.length} affichés)`;
+    }
     if (!tasks.length) {
         if (emptyEl) emptyEl.style.display = '';
         wrapEl.innerHTML = '<svg id="gantt-global"></svg>';
@@ -3737,6 +3870,9 @@ async function loadGantt() {
             language:     'fr',
             bar_height:   24,
             padding:      18,
+            on_click:     task => {
+                if (task.id[0] === 'P') _toggleGanttProjet(parseInt(task.id.slice(1), 10));
+            },
         });
     } catch (e) { showMsg('Erreur rendu Gantt: ' + e.message, false); }
 
@@ -3744,16 +3880,11 @@ async function loadGantt() {
     if (legendEl) {
         legendEl.innerHTML = mode === 'projets'
             ? '<div class="gantt-legend-item"><div class="gantt-legend-dot" style="background:#2563a8"></div>Projets</div>'
-            : '<div class="gantt-legend-item"><div class="gantt-legend-dot" style="background:#27ae60"></div>Tâches</div>';
+            : '<div class="gantt-legend-item"><div class="gantt-legend-dot" style="background:#2563a8"></div>Projets (clic : tâches)</div>'
+              + '<div class="gantt-legend-item"><div class="gantt-legend-dot" style="background:#27ae60"></div>Tâches</div>';
     }
 }
 
-function updateGanttViewMode() {
-    if (!_ganttInstance) return;
-    const vm = document.getElementById('gantt-view-mode')?.value || 'Week';
-    try { _ganttInstance.change_view_mode(vm); } catch(e) {}
-}
-
 async function loadProjetGantt(projetId) {
     const viewMode = document.getElementById('gantt-proj-view-mode')?.value || 'Week';
     const emptyEl  = document.getElementById('gantt-proj-empty');
@@ -3931,6 +4062,117 @@ async function lireNotif(id) {
     } catch (e) { /* silencieux */ }
 }
 
+// ─── SYNCHRONISATION INCRÉMENTALE DES LISTES (?since=) ───
+// Après le premier chargement, une liste ne redemande que les lignes
+// modifiées depuis le curseur renvoyé par le serveur, et retire les id de
+// `deleted` (suppressions, sorties du périmètre ou des filtres).
+
+let _syncEtat = {};   // chemin → { cle: filtres, cursor, liste }
+
+function _syncReset() { _syncEtat = {}; }
+
+function _fusionDelta(liste, data) {
+    const maj  = new Map(data.list.map(r => [r.id, r]));
+    const sup  = new Set(data.deleted || []);
+    const connus = new Set(liste.map(r => r.id));
+    const nouveaux = data.list.filter(r => !connus.has(r.id));
+    return nouveaux.concat(liste.filter(r => !sup.has(r.id)).map(r => maj.get(r.id) || r));
+}
+
+async function _syncListe(chemin, params) {
+    const cle = (params || new URLSearchParams()).toString();
+    const etat = _syncEtat[chemin];
+    const q = new URLSearchParams(params || '');
+    // Filtres changés : liste complète (since=0) avec un nouveau curseur
+    q.set('since', etat && etat.cle === cle ? etat.cursor : '0');
+    const data = await apiFetch(`${chemin}?${q}`);
+    if (!data || !Array.isArray(data.list)) return data?.list || [];
+    const liste = data.full || !etat || etat.cle !== cle ? data.list : _fusionDelta(etat.liste, data);
+    _syncEtat[chemin] = { cle, cursor: data.cursor, liste };
+    return liste;
+}
+
+// ─── ÉVÉNEMENTS TEMPS RÉEL (SSE) ──────────────────────────
+// /api/events pousse les nouvelles notifications et les modifications de
+// listes : plus besoin de recharger pour voir le badge ou les changements.
+
+let _events = null;
+let _eventsLastId = null;
+let _eventsRetry = null;
+let _eventsEchecs = 0;
+const _eventsTimers = {};
+// Type d'événement → vues à recharger si elles sont affichées
+const _eventsVues = {
+    bc:      ['bc'],
+    tache:   ['taches', 'kanban', 'gantt'],
+    contrat: ['contrats'],
+};
+
+function _eventsDebounce(key, fn, delai) {
+    clearTimeout(_eventsTimers[key]);
+    _eventsTimers[key] = setTimeout(fn, delai);
+}
+
+async function openEvents() {
+    closeEvents();
+    if (!getToken() || typeof EventSource === 'undefined') return;
+    // Ticket court propre au flux : le jeton de session ne passe jamais dans l'URL
+    let ticket;
+    try {
+        ticket = (await apiFetch('/events/ticket', { method: 'POST' })).ticket;
+    } catch (e) {
+        _eventsReprendre();
+        return;
+    }
+    if (!ticket || !getToken()) return;
+    let url = API + '/events?ticket=' + encodeURIComponent(ticket);
+    if (_eventsLastId) url += '&last_event_id=' + encodeURIComponent(_eventsLastId);
+    closeEvents();
+    const es = new EventSource(url);
+    _events = es;
+    const suivre = e => { if (e.lastEventId) _eventsLastId = e.lastEventId; };
+
+    es.onopen = () => { _eventsEchecs = 0; };
+    es.addEventListener('notification', e => {
+        suivre(e);
+        _eventsDebounce('notifications', loadNotifications, 300);
+    });
+    Object.keys(_eventsVues).forEach(type => es.addEventListener(type, e => {
+        suivre(e);
+        _eventsVues[type].forEach(vue => _eventsDebounce(vue, () => {
+            if (_vueCourante === vue && loaders[vue]) loaders[vue]();
+        }, 1500));
+    }));
+    // Événements manqués (coupure longue, file saturée) : tout recharger
+    es.addEventListener('resync', e => {
+        suivre(e);
+        _syncReset();
+        loadNotifications();
+        if (loaders[_vueCourante]) loaders[_vueCourante]();
+    });
+    es.onerror = () => {
+        // Le ticket a expiré entre-temps : pas de reconnexion automatique
+        // d'EventSource avec la même URL, mais un nouveau flux et un nouveau
+        // ticket, avec un délai croissant (serveur plein → 503)
+        if (_events !== es) return;
+        es.close();
+        _events = null;
+        _eventsReprendre();
+    };
+}
+
+function _eventsReprendre() {
+    clearTimeout(_eventsRetry);
+    const delai = Math.min(60000, 3000 * 2 ** _eventsEchecs);
+    _eventsEchecs = Math.min(_eventsEchecs + 1, 5);
+    _eventsRetry = setTimeout(openEvents, delai);
+}
+
+function closeEvents() {
+    clearTimeout(_eventsRetry);
+    if (_events) { _events.close(); _events = null; }
+}
+
 // ─── ADMIN UTILISATEURS ────────────────────────────────────
 
 let _adminServicesCache = [];
@@ -4439,7 +4681,9 @@ if (_existingToken) {
         hideLoginOverlay();
         applyRoleUI(_payload);
         _bgPost('/notifications/generate');
+        _prefetch(['/dashboard', '/notifications']);   // même lot que /modules et /referentiels
         initRefs().then(() => { loadDashboard(); loadNotifications(); });
+        openEvents();
     } else {
         removeToken();
         showLoginOverlay();
@@ -4906,7 +5150,10 @@ async function exportTpe() {
         const res = await fetch(`${API}/tpe/export`, {
             headers: { 'Authorization': 'Bearer ' + token }
         });
-        if (!res.ok) throw new Error('Export échoué');
+        if (!res.ok) {
+            const err = await res.json().catch(() => ({}));
+            throw new Error(err.error || 'Export échoué');
+        }
         const blob = await res.blob();
         const url = URL.createObjectURL(blob);
         const link = document.createElement('a');